@@ -0,0 +1,210 @@
+# Attachment uploads and downloads
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+from fastapi import APIRouter, Header, HTTPException, Request, Response
+from multipart.multipart import MultipartParser, parse_options_header
+from ..config import config
+from ..utils.attachment_store import AttachmentTooLarge, AttachmentWriter, attachment_store
+from ..utils.file_response import RangeFileResponse
+
+router = APIRouter()
+
+# Content types a browser may render in place; anything else is downloaded
+_INLINE_TYPES = ("image/png", "image/jpeg", "image/gif", "image/webp", "audio/", "video/", "text/plain")
+
+class _UploadParser:
+    """Feeds a multipart body to `python-multipart`, one file part at a time.
+
+    The parser's callbacks are synchronous, so they only collect what they
+    see; `parse` then writes each piece to the part's attachment writer
+    before reading more of the body. Memory use is bounded by one network
+    chunk plus the writers' buffers, however large the files are.
+    """
+    def __init__(self, boundary: bytes):
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+        self.files = 0
+        self._headers: Dict[bytes, bytes] = {}
+        self._field = self._value = b""
+        self._writer: Optional[AttachmentWriter] = None
+        # Writer operations queued by the callbacks: ("data", writer, bytes) or ("end", writer, None)
+        self._pending: List[tuple] = []
+        self._writers: List[AttachmentWriter] = []
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._writer = None
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._field.lower()] = self._value
+        self._field = self._value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"filename" not in options:
+            return  # plain form fields are ignored
+        self.files += 1
+        if self.files > config.ATTACHMENT_MAX_FILES:
+            raise HTTPException(status_code=400, detail=f"At most {config.ATTACHMENT_MAX_FILES} files per upload")
+        content_type = self._headers.get(b"content-type", b"").decode("latin-1") or None
+        filename = options[b"filename"].decode("utf-8", errors="replace")
+        self._writer = attachment_store.writer(filename, content_type)
+        self._writers.append(self._writer)
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._writer is not None:
+            self._pending.append(("data", self._writer, data[start:end]))
+
+    def _on_part_end(self) -> None:
+        if self._writer is not None:
+            self._pending.append(("end", self._writer, None))
+
+    async def parse(self, stream) -> List[Dict[str, Any]]:
+        """Stores every file in the body.
+
+        Args:
+            stream: The request body's chunks.
+
+        Returns:
+            Each file's metadata, with `deduplicated` set if it was stored
+            already.
+        """
+        results = []
+        try:
+            async for chunk in stream:
+                self.parser.write(chunk)
+                for op, writer, data in self._pending:
+                    if op == "data":
+                        await writer.write(data)
+                    else:
+                        metadata, created = await writer.commit()
+                        self._writers.remove(writer)
+                        results.append({**metadata, "url": f"/api/attachments/{metadata['id']}", "deduplicated": not created})
+                self._pending.clear()
+            self.parser.finalize()
+        finally:
+            for writer in self._writers:
+                await writer.abort()
+        return results
+
+@router.post('/', status_code=201)
+async def upload_attachments(request: Request, content_type: str = Header(...)):
+    """Uploads one or more files as `multipart/form-data`.
+
+    The body is streamed straight to disk and hashed as it arrives, and a
+    file that was uploaded before is stored only once.
+
+    Args:
+        request: The incoming request.
+        content_type: The request's Content-Type header.
+
+    Returns:
+        A dictionary with each file's `id` (its SHA-256), filename, content
+        type, kind, size, URL, and whether it was already stored.
+
+    Raises:
+        HTTPException: If the body is not multipart or holds no files
+            (400), or a file is larger than `ATTACHMENT_MAX_SIZE` (413).
+    """
+    kind, options = parse_options_header(content_type)
+    if kind != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+    try:
+        attachments = await _UploadParser(options[b"boundary"]).parse(request.stream())
+    except AttachmentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if not attachments:
+        raise HTTPException(status_code=400, detail="No files in upload")
+    return {"attachments": attachments}
+
+@router.get('/stats')
+async def attachment_stats():
+    """Gets attachment storage and de-duplication counters.
+
+    Returns:
+        A dictionary of attachment store statistics.
+    """
+    return attachment_store.stats()
+
+async def _get_metadata(attachment_id: str) -> Dict[str, Any]:
+    metadata = await attachment_store.get(attachment_id)
+    if metadata is None:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    return metadata
+
+@router.get('/{attachment_id}/meta')
+async def get_attachment_metadata(attachment_id: str):
+    """Gets an attachment's metadata.
+
+    Args:
+        attachment_id: The attachment's SHA-256.
+
+    Returns:
+        The attachment's ID, filename, content type, kind, size and creation
+        time.
+
+    Raises:
+        HTTPException: If the attachment does not exist (404).
+    """
+    return await _get_metadata(attachment_id)
+
+@router.api_route('/{attachment_id}', methods=["GET", "HEAD"])
+async def download_attachment(
+    attachment_id: str,
+    request: Request,
+    range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+):
+    """Downloads an attachment, or a byte range of it.
+
+    Attachments never change, so they are served with a strong ETag and a
+    long-lived cache lifetime; `Range: bytes=...` requests get a 206 with
+    just those bytes.
+
+    Args:
+        attachment_id: The attachment's SHA-256.
+        request: The incoming request.
+        range: The request's Range header.
+        if_none_match: The request's If-None-Match header.
+
+    Returns:
+        The file, sent with `sendfile` when the server supports zero-copy
+        responses.
+
+    Raises:
+        HTTPException: If the attachment does not exist (404).
+    """
+    metadata = await _get_metadata(attachment_id)
+    etag = f'"{attachment_id}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "X-Content-Type-Options": "nosniff",
+        "Content-Security-Policy": "sandbox",
+    }
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    inline = metadata["content_type"].startswith(_INLINE_TYPES)
+    disposition = "inline" if inline else "attachment"
+    headers["Content-Disposition"] = f"{disposition}; filename*=utf-8''{quote(metadata['filename'])}"
+    return RangeFileResponse(
+        attachment_store.path(attachment_id),
+        metadata["size"],
+        range_header=range,
+        headers=headers,
+        media_type=metadata["content_type"],
+        method=request.method,
+    )
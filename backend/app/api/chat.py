@@ -1,26 +1,32 @@
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from ..models.openai import OpenAIProvider
-from ..models.anthropic import AnthropicProvider
+import time
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from pydantic import BaseModel, ValidationError
+from ..models.admission import AdmissionRejected, admission_controller, overloaded, request_priority
+from ..models.registry import provider_registry
+from ..models.router import model_router
+from .system_prompt import prompt_store
+from ..utils.attachment_store import attachment_store
+from ..utils.history_compactor import history_compactor
+from ..utils.ndjson import DuplexNDJSONResponse, iter_json_records, ndjson_line
+from ..utils.response_cache import parse_cache_control, response_cache, response_key
+from ..utils.semantic_cache import semantic_cache, semantic_scope
+from ..utils.singleflight import SingleFlight, StreamFlights
+from ..utils.sse import EventStreamResponse, event_stream
+from ..utils.token_counter import ContextOverflowError, fit_messages, usage
 from ..config import config
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# Initialize providers (with graceful fallback if API keys missing)
-PROVIDERS = {}
-try:
-    PROVIDERS["openai"] = OpenAIProvider()
-except ValueError as e:
-    logger.warning(f"OpenAI provider disabled: {e}")
+# Shared, process-wide providers (missing API keys disable a provider)
+PROVIDERS = provider_registry
 
-try:
-    PROVIDERS["anthropic"] = AnthropicProvider()
-except ValueError as e:
-    logger.warning(f"Anthropic provider disabled: {e}")
+# Identical chat requests in flight at the same time share one upstream call
+chat_flights = SingleFlight(config.SINGLEFLIGHT_ENABLED)
+stream_flights = StreamFlights(config.SINGLEFLIGHT_ENABLED)
 
 class ChatMessage(BaseModel):
     """Represents a single message in a chat conversation.
@@ -28,9 +34,12 @@ class ChatMessage(BaseModel):
     Attributes:
         role: The role of the message sender (e.g., 'user', 'assistant', 'system').
         content: The text content of the message.
+        attachments: The IDs (SHA-256 hashes) of uploaded attachments the
+            message refers to.
     """
     role: str  # 'user', 'assistant', 'system'
     content: str
+    attachments: List[str] = []
     
 class ChatRequest(BaseModel):
     """Represents a request to the chat endpoint.
@@ -42,6 +51,15 @@ class ChatRequest(BaseModel):
         temperature: The temperature for the generation.
         provider: The provider to use for the chat (e.g., 'openai', 'anthropic').
         stream: Whether to stream the response.
+        hedge: Whether to send a second request to an equivalent model when
+            the first is slower than usual, keeping whichever answers first.
+        fallback: Whether to retry on the configured fallback models when
+            the requested model fails.
+        context_policy: What to do if the messages do not fit the model's
+            context window: "reject" or "trim" the oldest messages. Defaults
+            to `CONTEXT_OVERFLOW_POLICY`.
+        system_prompt_id: The ID of a stored system prompt to put before
+            the messages.
     """
     messages: List[ChatMessage]
     model: str = config.DEFAULT_MODEL
@@ -49,6 +67,10 @@ class ChatRequest(BaseModel):
     temperature: float = config.TEMPERATURE
     provider: str = "openai"
     stream: bool = False
+    hedge: bool = False
+    fallback: bool = False
+    context_policy: Optional[str] = None
+    system_prompt_id: Optional[int] = None
     
 class ChatResponse(BaseModel):
     """Represents a response from the chat endpoint.
@@ -64,20 +86,61 @@ class ChatResponse(BaseModel):
     provider: str
     metadata: Dict[str, Any] = {}
 
+async def _embed_final_turn(messages: List[Dict[str, str]]) -> Optional[List[float]]:
+    """Embeds the final user turn for the semantic cache.
+
+    Args:
+        messages: The conversation.
+
+    Returns:
+        The embedding, or None if the conversation does not end with a user
+        turn or no embedding provider is available.
+    """
+    if not messages or messages[-1]["role"] != "user" or "openai" not in PROVIDERS:
+        return None
+    try:
+        return await PROVIDERS["openai"].get_embedding(messages[-1]["content"])
+    except Exception as e:
+        logger.warning(f"Semantic cache embedding failed: {e}")
+        return None
+
 @router.post("/", response_model=ChatResponse)
-async def chat_endpoint(req: ChatRequest):
+async def chat_endpoint(
+    req: ChatRequest,
+    response: Response,
+    cache_control: Optional[str] = Header(None),
+):
     """Processes a chat request with the selected AI provider.
 
     This endpoint takes a chat request, selects the appropriate provider,
     and then generates a response. It supports both streaming and non-streaming
-    responses.
+    responses. Streamed responses are sent as server-sent events, with
+    upstream chunks coalesced into fewer frames; the provider stream is
+    closed as soon as the client disconnects.
+
+    Requests can opt into hedging (`hedge`) and failover along the
+    configured fallback chain (`fallback`); the response names the provider
+    and model that actually answered.
+
+    Long conversations are compacted first when history compaction is
+    enabled: older turns are replaced by a cached rolling summary.
+
+    When the response caches are enabled, deterministic requests (temperature
+    at or below `RESPONSE_CACHE_MAX_TEMPERATURE`) are answered from the
+    exact-match cache if an identical request was answered before, or else
+    from the semantic cache if a paraphrase of the final user turn was
+    answered under the same system prompt and model. `Cache-Control: no-cache`
+    forces a fresh response that replaces the cached one, and
+    `Cache-Control: no-store` bypasses the caches entirely.
 
     Args:
         req: The chat request.
+        response: The outgoing response, used to set cache headers.
+        cache_control: The request's Cache-Control header.
 
     Returns:
-        A `ChatResponse` object with the generated content, or a
-        `StreamingResponse` if streaming is enabled.
+        A `ChatResponse` object with the generated content, or an
+        `EventStreamResponse` if streaming is enabled.
 
     Raises:
         HTTPException: If the provider is not supported or if an error occurs
@@ -90,54 +153,348 @@ async def chat_endpoint(req: ChatRequest):
             detail=f"Provider '{provider_name}' not supported or not configured."
         )
     
-    provider = PROVIDERS[provider_name]
+    target = (provider_name, req.model)
+    params = {"max_tokens": req.max_tokens, "temperature": req.temperature}
+
+    # Convert messages to dict format, expanding attachment references
+    messages = []
+    for msg in req.messages:
+        content = msg.content
+        if msg.attachments:
+            try:
+                content = await attachment_store.render(content, msg.attachments)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        messages.append({"role": msg.role, "content": content})
+    if req.system_prompt_id is not None:
+        prompt = prompt_store.get_prompt(req.system_prompt_id)
+        if prompt is None:
+            raise HTTPException(status_code=400, detail=f"Unknown system prompt: {req.system_prompt_id}")
+        messages.insert(0, {"role": "system", "content": prompt.content})
+
+    # Replace old turns of long conversations with a cached summary, then
+    # check the prompt fits the context window before paying for a round-trip
+    messages, summarized = await history_compactor.compact(req.model, messages)
+    try:
+        messages, prompt_tokens, dropped = fit_messages(
+            req.model, messages, req.max_tokens, req.context_policy or config.CONTEXT_OVERFLOW_POLICY
+        )
+    except ContextOverflowError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     try:
-        # Convert messages to dict format
-        messages = [{
-            "role": msg.role,
-            "content": msg.content
-        } for msg in req.messages]
+
+        read_cache, write_cache = parse_cache_control(cache_control)
+        # The canonical request hash keys both the cache and single-flight
+        request_hash = response_key(provider_name, req.model, messages, params)
+        cache_key = None
+        if response_cache.cacheable(req.temperature):
+            if not write_cache:
+                response_cache.bypasses += 1
+            else:
+                cache_key = request_hash
+                if not read_cache:
+                    response_cache.refreshes += 1
+        cached = await response_cache.get(cache_key) if read_cache and cache_key else None
+        cache_metadata = {"cache": "exact"} if cached is not None else {}
+        if summarized:
+            cache_metadata["summarized_messages"] = summarized
+        if dropped:
+            cache_metadata["trimmed_messages"] = dropped
+
+        scope = query_vector = None
+        if cached is None and write_cache and semantic_cache.cacheable(req.temperature):
+            query_vector = await _embed_final_turn(messages)
+            if query_vector is not None:
+                scope = semantic_scope(provider_name, req.model, messages)
+                hit = semantic_cache.get(scope, query_vector) if read_cache else None
+                if hit is not None:
+                    cached, similarity = hit
+                    cache_metadata.update(cache="semantic", similarity=round(similarity, 4))
+        caching = cache_key is not None or scope is not None
+        cache_status = "HIT" if cached is not None else ("MISS" if caching else "BYPASS")
+
+        async def store(chunks: List[str], latency: float, answered: Tuple[str, str]):
+            # A fallback model's answer is cached as that model's, never
+            # under the requested model's key or scope
+            if cache_key:
+                key = cache_key if answered == target else response_key(*answered, messages, params)
+                await response_cache.set(key, answered[1], chunks)
+            if scope:
+                answer_scope = scope if answered == target else semantic_scope(*answered, messages)
+                semantic_cache.set(answer_scope, query_vector, chunks, latency)
         
         if req.stream:
-            # Return streaming response
+            # Return streaming response; chunks are kept for caching and
+            # for counting completion tokens
+            streamed: List[str] = []
+            answered = {"target": target}
+            if cached is None:
+                async def open_stream():
+                    routed = await model_router.stream(
+                        target, messages, hedge=req.hedge, fallback=req.fallback, **params
+                    )
+                    answered["target"] = (routed.provider, routed.model)
+                    return routed.value
+
+                # Join an identical stream already in flight, and wait for it
+                # to be routed before responding so that a shed request gets
+                # a proper 503 instead of an error event
+                started = time.perf_counter()
+                subscription, shared = stream_flights.subscribe(request_hash, open_stream)
+                await subscription.ready()
+
             async def generate_stream():
-                async for chunk in await provider.generate(
-                    messages=messages,
-                    model=req.model,
-                    max_tokens=req.max_tokens,
-                    temperature=req.temperature,
-                    stream=True
-                ):
-                    yield f"data: {chunk}\n\n"
-                yield "data: [DONE]\n\n"
+                try:
+                    async for chunk in subscription:
+                        streamed.append(chunk)
+                        yield chunk
+                finally:
+                    # Stops the provider once no client is reading any more
+                    subscription.close()
+                if not shared:
+                    await store(streamed, time.perf_counter() - started, answered["target"])
+
+            async def replay_stream():
+                for chunk in cached:
+                    streamed.append(chunk)
+                    yield chunk
             
-            return StreamingResponse(
-                generate_stream(),
-                media_type="text/plain",
-                headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
+            return EventStreamResponse(
+                event_stream(
+                    replay_stream() if cached is not None else generate_stream(),
+                    max_chars=config.STREAM_CHUNK_SIZE,
+                    max_wait=config.STREAM_FLUSH_INTERVAL_MS / 1000,
+                    idle_timeout=config.STREAM_TIMEOUT,
+                    on_complete=lambda: ("usage", usage(req.model, prompt_tokens, "".join(streamed))),
+                ),
+                headers={"X-Cache": cache_status}
             )
         else:
-            # Non-streaming response
-            content = await provider.generate(
-                messages=messages,
-                model=req.model,
-                max_tokens=req.max_tokens,
-                temperature=req.temperature,
-                stream=False
-            )
+            response.headers["X-Cache"] = cache_status
+            if cached is not None:
+                content = "".join(cached)
+            else:
+                # Non-streaming response
+                started = time.perf_counter()
+                routed, shared = await chat_flights.do(request_hash, lambda: model_router.complete(
+                    target, messages, hedge=req.hedge, fallback=req.fallback, **params
+                ))
+                content = routed.value
+                if shared:
+                    cache_metadata["shared"] = True
+                elif content:
+                    await store([content], time.perf_counter() - started, (routed.provider, routed.model))
+                target = (routed.provider, routed.model)
+                if routed.hedged or routed.attempts:
+                    cache_metadata["route"] = {"hedged": routed.hedged, "failed": routed.attempts}
             
+            token_usage = usage(target[1], prompt_tokens, content)
             return ChatResponse(
                 content=content,
-                model=req.model,
-                provider=provider_name,
-                metadata={"tokens": len(content.split()) if content else 0}
+                model=target[1],
+                provider=target[0],
+                metadata={"tokens": token_usage["completion_tokens"], "usage": token_usage, **cache_metadata}
             )
             
+    except AdmissionRejected as e:
+        raise overloaded(e)
     except Exception as e:
         logger.error(f"Chat error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _run_batch_item(index: int, record: Any, timeout: float) -> Dict[str, Any]:
+    """Runs one batch item through the chat endpoint.
+
+    Args:
+        index: The position of the item in the request body.
+        record: The raw item, shaped like a `ChatRequest`.
+        timeout: The seconds the item may take.
+
+    Returns:
+        The result line, with either the response or an error and its
+        HTTP status.
+    """
+    started = time.perf_counter()
+    try:
+        req = ChatRequest.model_validate(record).model_copy(update={"stream": False})
+        result = await asyncio.wait_for(chat_endpoint(req, Response(), None), timeout)
+        line = {"index": index, "response": result.model_dump()}
+    except ValidationError as e:
+        line = {"index": index, "status": 422, "error": f"Invalid request: {e.errors()[0]['msg']}"}
+    except asyncio.TimeoutError:
+        line = {"index": index, "status": 504, "error": f"Timed out after {timeout} seconds"}
+    except HTTPException as e:
+        line = {"index": index, "status": e.status_code, "error": e.detail}
+    except Exception as e:
+        line = {"index": index, "status": 500, "error": str(e)}
+    line["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return line
+
+async def _run_batch(records: AsyncIterator[Any], parallelism: int, timeout: float) -> AsyncIterator[str]:
+    """Runs batch items concurrently, yielding NDJSON results as they finish.
+
+    Items are read from the body only as fast as slots free up, so at most
+    `parallelism` items are in flight and unread items stay unparsed.
+
+    Args:
+        records: The raw items from the request body.
+        parallelism: The most items run at once.
+        timeout: The seconds each item may take.
+
+    Yields:
+        One NDJSON line per item, in completion order, followed by a
+        summary line with throughput figures.
+    """
+    # Batch work yields upstream capacity to interactive requests; the
+    # response body runs in its own task, so this does not leak elsewhere
+    request_priority.set("batch")
+    started = time.perf_counter()
+    results: asyncio.Queue = asyncio.Queue()
+    slots = asyncio.Semaphore(parallelism)
+    tasks = set()
+
+    async def run(index: int, record: Any):
+        try:
+            await results.put(await _run_batch_item(index, record, timeout))
+        finally:
+            slots.release()
+
+    async def feed():
+        index = 0
+        try:
+            async for record in records:
+                await slots.acquire()
+                task = asyncio.create_task(run(index, record))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                index += 1
+        except ValueError as e:
+            await results.put({"index": index, "status": 400, "error": str(e)})
+        except Exception as e:
+            # e.g. the client disconnected mid-body
+            await results.put({"index": index, "status": 500, "error": f"Reading the batch failed: {e}"})
+        finally:
+            # Always end the stream, or the reader below would wait forever
+            await asyncio.gather(*list(tasks), return_exceptions=True)
+            await results.put(None)
+
+    feeder = asyncio.create_task(feed())
+    succeeded = failed = timed_out = 0
+    prompt_tokens = completion_tokens = 0
+    latencies = []
+    try:
+        while (line := await results.get()) is not None:
+            if "response" in line:
+                succeeded += 1
+                latencies.append(line["latency_ms"])
+                token_usage = line["response"]["metadata"].get("usage", {})
+                prompt_tokens += token_usage.get("prompt_tokens", 0)
+                completion_tokens += token_usage.get("completion_tokens", 0)
+            else:
+                failed += 1
+                timed_out += line["status"] == 504
+            yield ndjson_line(line)
+    finally:
+        # Stop reading and cancel running items if the client goes away
+        feeder.cancel()
+        for task in list(tasks):
+            task.cancel()
+        await asyncio.gather(feeder, *tasks, return_exceptions=True)
+
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    yield ndjson_line({"summary": {
+        "total": succeeded + failed,
+        "succeeded": succeeded,
+        "failed": failed,
+        "timed_out": timed_out,
+        "elapsed_seconds": round(elapsed, 3),
+        "requests_per_sec": round((succeeded + failed) / elapsed, 2) if elapsed else 0.0,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "completion_tokens_per_sec": round(completion_tokens / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": latencies[len(latencies) // 2] if latencies else None,
+            "p95": latencies[min(len(latencies) - 1, len(latencies) * 95 // 100)] if latencies else None,
+        },
+    }})
+
+@router.post("/batch")
+async def chat_batch(
+    request: Request,
+    parallelism: Optional[int] = Query(None, ge=1),
+    timeout: Optional[float] = Query(None, gt=0),
+):
+    """Runs many chat requests concurrently, streaming the results as NDJSON.
+
+    The body is a JSON array or NDJSON stream of `ChatRequest` objects, which
+    are answered without streaming through the same pipeline as `POST /`
+    (caching, routing and admission control included), at batch priority.
+    Each result line carries the item's original `index` and either its
+    `response` or an `error` with an HTTP `status`; one failed item does not
+    affect the others. A final summary line reports throughput.
+
+    Args:
+        request: The incoming request whose body holds the chat requests.
+        parallelism: The most items run at once, capped at
+            `BATCH_MAX_PARALLEL`.
+        timeout: The seconds each item may take, defaulting to
+            `BATCH_ITEM_TIMEOUT`.
+
+    Returns:
+        A streaming response of NDJSON lines in completion order, followed
+        by a summary line.
+    """
+    parallelism = min(parallelism or config.BATCH_MAX_PARALLEL, config.BATCH_MAX_PARALLEL)
+    records = iter_json_records(request.stream(), config.BATCH_MAX_RECORD_BYTES)
+    return DuplexNDJSONResponse(_run_batch(records, parallelism, timeout or config.BATCH_ITEM_TIMEOUT))
+
+@router.get("/cache")
+async def cache_stats():
+    """Gets response cache statistics.
+
+    Returns:
+        A dictionary with exact-match cache hit, miss, bypass and refresh
+        counters, semantic cache hit-rate and latency-saved metrics, and
+        history summary counters.
+    """
+    return {
+        "exact": response_cache.stats(),
+        "semantic": semantic_cache.stats(),
+        "history": history_compactor.stats(),
+    }
+
+@router.get("/routing")
+async def routing_stats():
+    """Gets provider routing statistics.
+
+    Returns:
+        A dictionary with hedge and fallback counters, and rolling p50/p99
+        latency and error rates per provider and model.
+    """
+    return model_router.stats()
+
+@router.get("/singleflight")
+async def singleflight_stats():
+    """Gets single-flight de-duplication statistics.
+
+    Returns:
+        A dictionary with upstream calls made and calls that shared an
+        identical in-flight call, for chat completions and streams.
+    """
+    return {"chat": chat_flights.stats(), "stream": stream_flights.stats()}
+
+@router.get("/admission")
+async def admission_stats():
+    """Gets upstream admission control statistics.
+
+    Returns:
+        A dictionary with in-flight calls, queue depth, shed calls and
+        queue-time metrics per provider or model gate.
+    """
+    return admission_controller.stats()
+
 @router.get("/providers")
 async def list_providers():
     """Lists the available chat model providers and their models.
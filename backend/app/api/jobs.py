@@ -0,0 +1,168 @@
+# Background job submission and status
+import asyncio
+import json
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, HTTPException, Response
+from pydantic import BaseModel, ValidationError
+from ..config import config
+from ..utils.job_queue import Job
+from ..utils.job_workers import JobWorkerPool, PermanentJobError, ReportFn
+from ..utils.sse import DONE, EventStreamResponse, sse_event
+from .chat import ChatRequest, chat_endpoint
+
+router = APIRouter()
+
+class JobRequest(BaseModel):
+    """Represents a job submission.
+
+    Attributes:
+        kind: The kind of job: "chat", or "workflow" (see `api/workflow.py`).
+        payload: The job's input; a `ChatRequest` for chat jobs, or a
+            workflow name and inputs for workflow jobs.
+        max_attempts: The most times the job may be tried. Defaults to
+            `JOB_MAX_ATTEMPTS`.
+    """
+    kind: str
+    payload: Dict[str, Any] = {}
+    max_attempts: Optional[int] = None
+
+async def _run_chat_job(payload: Dict[str, Any], report: ReportFn) -> Dict[str, Any]:
+    """Runs a chat completion as a job.
+
+    Args:
+        payload: The chat request.
+        report: Reports progress.
+
+    Returns:
+        The chat response.
+
+    Raises:
+        PermanentJobError: If the request is invalid or rejected.
+    """
+    try:
+        req = ChatRequest.model_validate(payload).model_copy(update={"stream": False})
+    except ValidationError as e:
+        raise PermanentJobError(f"Invalid chat request: {e.errors()[0]['msg']}")
+    await report({"stage": "generating"})
+    try:
+        result = await chat_endpoint(req, Response(), None)
+    except HTTPException as e:
+        # Overload and upstream errors are worth retrying; bad requests are not
+        if e.status_code < 500:
+            raise PermanentJobError(e.detail)
+        raise Exception(e.detail)
+    return result.model_dump()
+
+job_workers = JobWorkerPool(
+    {"chat": _run_chat_job},
+    concurrency=config.JOB_WORKERS,
+    visibility_timeout=config.JOB_VISIBILITY_TIMEOUT,
+    poll_interval=config.JOB_POLL_INTERVAL_MS / 1000,
+    retry_backoff=config.JOB_RETRY_BACKOFF,
+)
+
+async def submit_job(kind: str, payload: Dict[str, Any], response: Response, max_attempts: Optional[int] = None) -> Dict[str, Any]:
+    """Queues a job and points the client at its status.
+
+    Args:
+        kind: The kind of job.
+        payload: The job's input.
+        response: The outgoing response, used to set the Location header.
+        max_attempts: The most times the job may be tried.
+
+    Returns:
+        The queued job.
+
+    Raises:
+        HTTPException: If the job kind is unknown.
+    """
+    try:
+        job = await job_workers.submit(kind, payload, max_attempts)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers["Location"] = f"/api/jobs/{job.id}"
+    return job.to_dict()
+
+@router.post("/", status_code=202)
+async def create_job(req: JobRequest, response: Response):
+    """Submits a background job.
+
+    The job is only queued here, so this returns immediately; poll
+    `GET /api/jobs/{id}` or subscribe to `GET /api/jobs/{id}/events` for its
+    progress and result.
+
+    Args:
+        req: The job submission.
+        response: The outgoing response.
+
+    Returns:
+        The queued job.
+    """
+    return await submit_job(req.kind, req.payload, response, req.max_attempts)
+
+@router.get("/stats")
+async def job_stats():
+    """Gets job worker and queue statistics.
+
+    Returns:
+        A dictionary with worker counters and queue depth.
+    """
+    return await job_workers.stats()
+
+async def _require_job(job_id: str) -> Job:
+    """Gets a job, failing if it does not exist."""
+    job = await job_workers.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    """Gets a job's status, progress and result.
+
+    Args:
+        job_id: The ID of the job.
+
+    Returns:
+        The job.
+
+    Raises:
+        HTTPException: If the job is not found.
+    """
+    return (await _require_job(job_id)).to_dict()
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: str):
+    """Streams a job's changes as server-sent events.
+
+    Every change is sent as a `job` event with the whole job; the stream
+    ends once the job has succeeded or failed.
+
+    Args:
+        job_id: The ID of the job.
+
+    Returns:
+        A `text/event-stream` response.
+
+    Raises:
+        HTTPException: If the job is not found.
+    """
+    job = await _require_job(job_id)
+
+    async def events():
+        current = job
+        last_update = None
+        while True:
+            if current is None:
+                yield sse_event(json.dumps({"error": "Job expired"}), event="error")
+                break
+            if current.updated_at != last_update:
+                last_update = current.updated_at
+                yield sse_event(json.dumps(current.to_dict(), default=str), event="job")
+            if current.finished:
+                break
+            await asyncio.sleep(config.JOB_EVENTS_POLL_MS / 1000)
+            current = await job_workers.get(job_id)
+        yield sse_event(DONE)
+
+    return EventStreamResponse(events())
@@ -1,12 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, text
-from pydantic import BaseModel
-from typing import List, Optional
+from sqlalchemy import insert, select, tuple_
+from pydantic import BaseModel, ValidationError
+from typing import Any, AsyncIterator, List, Optional, Tuple
+from datetime import datetime
+from ..config import config
 from ..db.config import get_db
 from ..db.memory import MemoryEntry
-from ..models.openai import OpenAIProvider
+from ..db.vector_store import vector_store
+from ..models.admission import AdmissionRejected, overloaded, request_priority
+from ..models.registry import provider_registry
+from ..utils.embedding_cache import embedding_cache
+from ..utils.ndjson import DuplexNDJSONResponse, iter_json_records, ndjson_line
+import asyncio
+import base64
 import json
+import time
+import uuid
 
 router = APIRouter()
 
@@ -25,13 +35,14 @@ class MemoryResponse(BaseModel):
 
     Attributes:
         id: The unique ID of the memory.
-        content: The text content of the memory.
+        content: The text content of the memory, omitted from lightweight
+            timeline listings.
         metadata: A dictionary of metadata for the memory.
         created_at: The timestamp when the memory was created.
         similarity: The similarity score of the memory to a search query.
     """
     id: str
-    content: str
+    content: Optional[str] = None
     metadata: dict
     created_at: str
     similarity: Optional[float] = None
@@ -57,44 +68,213 @@ async def store_memory(
     """
     try:
         # Generate embedding
-        provider = OpenAIProvider()
+        provider = provider_registry.require("openai")
         embedding = await provider.get_embedding(memory.content)
         
         # Create entry
         entry = MemoryEntry(
+            id=uuid.uuid4(),
             user_id=user_id,
             content=memory.content,
-            embedding=embedding,
+            embedding=embedding if vector_store.stores_in_rows else None,
             entry_metadata=json.dumps(memory.metadata) if memory.metadata else None,
         )
         
+        # Index the vector first so a failure leaves no row without one
+        await vector_store.add(user_id, [str(entry.id)], [embedding])
         db.add(entry)
-        await db.commit()
+        try:
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            await vector_store.delete(user_id, [str(entry.id)])
+            raise
         await db.refresh(entry)
         
         return MemoryResponse(
             id=str(entry.id),
             content=entry.content,
-            metadata=json.loads(entry.metadata),
+            metadata=memory.metadata or {},
             created_at=entry.created_at.isoformat()
         )
+    except AdmissionRejected as e:
+        raise overloaded(e)
     except Exception as e:
         raise HTTPException(500, f"Memory storage failed: {str(e)}")
 
+async def _chunked(records: AsyncIterator[Any], size: int) -> AsyncIterator[List[Any]]:
+    """Groups an async stream of records into lists of at most `size`.
+
+    Args:
+        records: The records to group.
+        size: The maximum chunk size.
+
+    Yields:
+        Lists of consecutive records.
+    """
+    chunk = []
+    try:
+        async for record in records:
+            chunk.append(record)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    except ValueError:
+        # Process what was read before the malformed input, then report it
+        if chunk:
+            yield chunk
+        raise
+    if chunk:
+        yield chunk
+
+async def _ingest_memories(
+    records: AsyncIterator[Any],
+    db: AsyncSession,
+    user_id: str,
+    provider
+) -> AsyncIterator[str]:
+    """Embeds and inserts memories chunk by chunk, yielding NDJSON results.
+
+    Args:
+        records: The raw memory records from the request body.
+        db: The database session.
+        user_id: The ID of the user who owns the memories.
+        provider: The embedding provider.
+
+    Yields:
+        One NDJSON line per record with its index and either its new id or
+        an error, followed by a summary line with throughput figures.
+    """
+    # Bulk ingest yields upstream capacity to interactive requests; the
+    # response body runs in its own task, so this does not leak elsewhere
+    request_priority.set("batch")
+    started = time.perf_counter()
+    stored = failed = 0
+    index = 0
+    try:
+        async for chunk in _chunked(records, config.MEMORY_INGEST_CHUNK_SIZE):
+            results = {}
+            valid = []
+            for record in chunk:
+                try:
+                    valid.append((index, MemoryRequest.model_validate(record)))
+                except ValidationError as e:
+                    results[index] = {"index": index, "error": f"Invalid memory: {e.errors()[0]['msg']}"}
+                index += 1
+
+            embeddings = await asyncio.gather(
+                *(provider.get_embedding(memory.content) for _, memory in valid),
+                return_exceptions=True
+            )
+            rows = []
+            vectors = []
+            for (i, memory), embedding in zip(valid, embeddings):
+                if isinstance(embedding, Exception):
+                    results[i] = {"index": i, "error": str(embedding)}
+                    continue
+                row_id = uuid.uuid4()
+                vectors.append(embedding)
+                rows.append({
+                    "id": row_id,
+                    "user_id": user_id,
+                    "content": memory.content,
+                    "embedding": embedding if vector_store.stores_in_rows else None,
+                    "entry_metadata": json.dumps(memory.metadata) if memory.metadata else None,
+                    "created_at": datetime.utcnow(),
+                })
+                results[i] = {"index": i, "id": str(row_id)}
+
+            if rows:
+                ids = [str(row["id"]) for row in rows]
+                try:
+                    # Index the vectors first so a failure leaves no rows without them
+                    await vector_store.add(user_id, ids, vectors)
+                    try:
+                        await db.execute(insert(MemoryEntry), rows)
+                        await db.commit()
+                    except Exception:
+                        await vector_store.delete(user_id, ids)
+                        raise
+                except Exception as e:
+                    await db.rollback()
+                    for i, result in results.items():
+                        if "id" in result:
+                            results[i] = {"index": i, "error": f"Insert failed: {str(e)}"}
+
+            for i in sorted(results):
+                if "id" in results[i]:
+                    stored += 1
+                else:
+                    failed += 1
+                yield ndjson_line(results[i])
+    except ValueError as e:
+        failed += 1
+        yield ndjson_line({"index": index, "error": str(e)})
+
+    elapsed = time.perf_counter() - started
+    yield ndjson_line({"summary": {
+        "stored": stored,
+        "failed": failed,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_sec": round(stored / elapsed, 1) if elapsed else 0.0,
+    }})
+
+@router.post("/store/batch")
+async def store_memories_batch(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    user_id: str = "default"  # TODO: Extract from JWT
+):
+    """Stores many memories from a JSON array or NDJSON request body.
+
+    The body is read incrementally, memories are embedded in batches and
+    inserted with one multi-row insert and commit per chunk, so memory use
+    stays bounded regardless of the upload size.
+
+    Args:
+        request: The incoming request whose body holds the memories, each
+            shaped like a `MemoryRequest`.
+        db: The database session.
+        user_id: The ID of the user who owns the memories.
+
+    Returns:
+        A streaming response of NDJSON lines, one per memory with its index
+        and id or error, followed by a summary line.
+
+    Raises:
+        HTTPException: If no embedding provider is configured.
+    """
+    try:
+        provider = provider_registry.require("openai")
+    except ValueError as e:
+        raise HTTPException(500, f"Memory storage failed: {str(e)}")
+
+    records = iter_json_records(request.stream(), config.MEMORY_INGEST_MAX_RECORD_BYTES)
+    return DuplexNDJSONResponse(_ingest_memories(records, db, user_id, provider))
+
 @router.get("/search", response_model=List[MemoryResponse])
 async def search_memories(
     query: str,
     limit: int = 10,
     threshold: float = 0.8,
+    ef_search: Optional[int] = Query(None, ge=1, le=1000),
+    probes: Optional[int] = Query(None, ge=1, le=10000),
     db: AsyncSession = Depends(get_db),
     user_id: str = "default"  # TODO: Extract from JWT
 ):
     """Performs a vector similarity search for memories.
 
+    Candidates come from the configured vector store (see
+    `db/vector_store.py`), then their rows are loaded by primary key.
+
     Args:
         query: The search query.
         limit: The maximum number of memories to return.
         threshold: The similarity threshold.
+        ef_search: The HNSW candidate list size for this search (pgvector
+            only). Higher values improve recall at the cost of latency.
+        probes: The number of IVFFlat lists to probe for this search
+            (pgvector only).
         db: The database session.
         user_id: The ID of the user who owns the memories.
 
@@ -106,77 +286,142 @@ async def search_memories(
     """
     try:
         # Generate query embedding
-        provider = OpenAIProvider()
+        provider = provider_registry.require("openai")
         query_embedding = await provider.get_embedding(query)
-        
-        # Vector search with similarity
-        sql = text("""
-            SELECT id, content, metadata, created_at,
-                   1 - (embedding <=> :query_embedding) as similarity
-            FROM memory_entries
-            WHERE user_id = :user_id
-              AND 1 - (embedding <=> :query_embedding) > :threshold
-            ORDER BY similarity DESC
-            LIMIT :limit
-        """)
-        
-        result = await db.execute(sql, {
-            "query_embedding": query_embedding,
-            "user_id": user_id,
-            "threshold": threshold,
-            "limit": limit
-        })
+
+        hits = await vector_store.search(
+            db, user_id, query_embedding, limit, threshold,
+            ef_search=ef_search, probes=probes
+        )
+        if not hits:
+            return []
+
+        # Load rows by primary key, skipping the embedding column
+        result = await db.execute(
+            select(
+                MemoryEntry.id,
+                MemoryEntry.content,
+                MemoryEntry.entry_metadata,
+                MemoryEntry.created_at
+            ).where(MemoryEntry.id.in_([uuid.UUID(memory_id) for memory_id, _ in hits]))
+        )
+        entries = {str(entry.id): entry for entry in result}
         
         memories = []
-        for row in result:
+        for memory_id, similarity in hits:
+            entry = entries.get(memory_id)
+            if entry is None:
+                continue
             memories.append(MemoryResponse(
-                id=str(row.id),
-                content=row.content,
-                metadata=json.loads(row.metadata),
-                created_at=row.created_at.isoformat(),
-                similarity=float(row.similarity)
+                id=memory_id,
+                content=entry.content,
+                metadata=json.loads(entry.entry_metadata) if entry.entry_metadata else {},
+                created_at=entry.created_at.isoformat(),
+                similarity=similarity
             ))
         
         return memories
         
+    except AdmissionRejected as e:
+        raise overloaded(e)
     except Exception as e:
         raise HTTPException(500, f"Memory search failed: {str(e)}")
 
+def _encode_cursor(created_at: datetime, memory_id: uuid.UUID) -> str:
+    """Encodes a timeline position as an opaque cursor token.
+
+    Args:
+        created_at: The creation time of the last returned memory.
+        memory_id: The ID of the last returned memory.
+
+    Returns:
+        A URL-safe cursor string.
+    """
+    raw = json.dumps([created_at.isoformat(), str(memory_id)]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """Decodes a cursor token produced by `_encode_cursor`.
+
+    Args:
+        cursor: The cursor string.
+
+    Returns:
+        The (created_at, id) position the cursor points after.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, memory_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), uuid.UUID(memory_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
 @router.get("/timeline", response_model=List[MemoryResponse])
 async def get_timeline(
+    response: Response,
     db: AsyncSession = Depends(get_db),
     user_id: str = "default",  # TODO: Extract from JWT
-    limit: int = 50
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    include_content: bool = True
 ):
     """Gets a chronological timeline of memories.
 
+    Pages are fetched by keyset on `(created_at, id)`, which uses the
+    `(user_id, created_at DESC, id DESC)` index and costs the same at any
+    depth.
+    When more memories remain, the `X-Next-Cursor` response header holds the
+    cursor for the next page.
+
     Args:
+        response: The response, used to set the next-page cursor header.
         db: The database session.
         user_id: The ID of the user who owns the memories.
         limit: The maximum number of memories to return.
+        cursor: The `X-Next-Cursor` value from the previous page, if any.
+        include_content: Whether to include the content body. Set to false
+            for a lightweight listing of ids, metadata and timestamps.
 
     Returns:
         A list of memories in reverse chronological order.
 
     Raises:
-        HTTPException: If the timeline fetch fails.
+        HTTPException: If the cursor is invalid or the timeline fetch fails.
     """
     try:
+        position = _decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    try:
+        columns = [MemoryEntry.id, MemoryEntry.created_at, MemoryEntry.entry_metadata]
+        if include_content:
+            columns.append(MemoryEntry.content)
         stmt = (
-            select(MemoryEntry)
+            select(*columns)
             .where(MemoryEntry.user_id == user_id)
-            .order_by(MemoryEntry.created_at.desc())
-            .limit(limit)
+            .order_by(MemoryEntry.created_at.desc(), MemoryEntry.id.desc())
+            .limit(limit + 1)
         )
+        if position:
+            stmt = stmt.where(tuple_(MemoryEntry.created_at, MemoryEntry.id) < tuple_(*position))
         
         result = await db.execute(stmt)
-        entries = result.scalars().all()
+        entries = result.all()
+
+        if len(entries) > limit:
+            entries = entries[:limit]
+            last = entries[-1]
+            response.headers["X-Next-Cursor"] = _encode_cursor(last.created_at, last.id)
         
         return [
             MemoryResponse(
                 id=str(entry.id),
-                content=entry.content,
-                metadata=json.loads(entry.metadata),
+                content=entry.content if include_content else None,
+                metadata=json.loads(entry.entry_metadata) if entry.entry_metadata else {},
                 created_at=entry.created_at.isoformat()
             )
             for entry in entries
@@ -184,3 +429,19 @@ async def get_timeline(
         
     except Exception as e:
         raise HTTPException(500, f"Timeline fetch failed: {str(e)}")
+
+@router.get("/stats")
+async def memory_stats():
+    """Gets performance counters for the memory subsystem.
+
+    Returns:
+        A dictionary with embedding cache hit and miss counters, embedding
+        batching and de-duplication counters and vector store statistics.
+    """
+    provider = provider_registry.get("openai")
+    return {
+        "embedding_cache": embedding_cache.stats(),
+        "embedding_batches": provider.embedding_stats() if provider else {},
+        "embedding_singleflight": provider.embedding_flights.stats() if provider else {},
+        "vector_store": vector_store.stats(),
+    }
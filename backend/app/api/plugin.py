@@ -1,14 +1,430 @@
-from fastapi import APIRouter
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from ..config import config
+from ..plugins.audio_analysis import analyze_chunk, stream_audio_analysis
+from ..plugins.code_interpreter import SandboxError, interpret_code, sandbox_pool
+from ..plugins.image_analysis import analyze_image
+from ..utils.attachment_store import attachment_store
+from ..utils.cache import TieredCache, stable_hash
+from ..utils.plugin_pool import PluginBusy, PluginError, PluginInputError, PluginPool, PluginTimeout
+from ..utils.singleflight import SingleFlight
+from ..utils.sse import DONE, EventStreamResponse, sse_event
 
 router = APIRouter()
 
+def audio_events(file_path: str, **options: Any) -> AsyncIterator[Dict[str, Any]]:
+    """Analyzes an audio file with its chunks spread across the worker pool.
+
+    Args:
+        file_path: The path to a WAV or raw PCM file.
+        **options: Further `analyze_audio` arguments.
+
+    Returns:
+        An async iterator of the merged analysis after each finished chunk.
+    """
+    async def run_chunk(args: Dict[str, Any]) -> Dict[str, Any]:
+        return await plugin_pool.run(analyze_chunk, args)
+
+    parallel = config.AUDIO_PARALLEL or plugin_pool.workers
+    return stream_audio_analysis(file_path, run_chunk, parallel, **options)
+
+async def analyze_audio_in_pool(file_path: str, **options: Any) -> dict:
+    """Analyzes an audio file with its chunks spread across the worker pool.
+
+    Args:
+        file_path: The path to a WAV or raw PCM file.
+        **options: Further `analyze_audio` arguments.
+
+    Returns:
+        The analysis, as returned by `analyze_audio`.
+    """
+    result: Dict[str, Any] = {}
+    async for result in audio_events(file_path, **options):
+        pass
+    return result
+
+PLUGINS = {
+    "image_analysis": analyze_image,
+    "audio_analysis": analyze_audio_in_pool,
+    "code_interpreter": interpret_code,
+}
+
+plugin_pool = PluginPool(
+    workers=config.PLUGIN_WORKERS,
+    timeout=config.PLUGIN_TIMEOUT,
+    memory_limit_mb=config.PLUGIN_MEMORY_LIMIT_MB,
+    max_queue=config.PLUGIN_MAX_QUEUE,
+    # Async plugins run on the event loop and send only their heavy parts,
+    # such as audio chunks, to the workers
+    modules=sorted({fn.__module__ for fn in [*PLUGINS.values(), analyze_chunk] if not asyncio.iscoroutinefunction(fn)}),
+)
+
+# Plugins whose result depends only on their arguments and the content of
+# their `file_path`, with a version to bump when a plugin's output changes
+CACHEABLE = {"image_analysis": 1, "audio_analysis": 1}
+
+plugin_cache = TieredCache("plugin", max_entries=config.PLUGIN_CACHE_SIZE, ttl=config.PLUGIN_CACHE_TTL or None)
+plugin_flights = SingleFlight()
+
+class FileAccessDenied(Exception):
+    """Raised when a caller passes a `file_path` outside the readable directories."""
+
+class PluginRequest(BaseModel):
+    """Represents a plugin call.
+
+    Attributes:
+        plugin: The name of the plugin.
+        args: The plugin's keyword arguments; files are passed by path, or
+            as an uploaded `attachment` ID.
+        timeout: The seconds the call may run. Defaults to `PLUGIN_TIMEOUT`
+            and cannot exceed it.
+    """
+    plugin: str
+    args: Dict[str, Any] = {}
+    timeout: Optional[float] = Field(None, gt=0)
+
+class CodeRequest(BaseModel):
+    """Represents a code interpreter run.
+
+    Attributes:
+        code: The Python code to run.
+        stdin: The code's standard input.
+        timeout: The seconds the code may run. Defaults to `SANDBOX_TIMEOUT`
+            and cannot exceed it.
+    """
+    code: str
+    stdin: str = ""
+    timeout: Optional[float] = Field(None, gt=0)
+
+class AudioRequest(BaseModel):
+    """Represents an audio analysis.
+
+    Attributes:
+        file_path: The path to a WAV or raw PCM file.
+        attachment: The ID of an uploaded WAV or raw PCM file, instead of
+            `file_path`.
+        options: Further `analyze_audio` arguments, such as `silence_db`,
+            or the `sample_rate`, `channels` and `sample_width` of raw PCM.
+    """
+    file_path: Optional[str] = None
+    attachment: Optional[str] = None
+    options: Dict[str, Any] = {}
+
+def file_digest(path: str) -> str:
+    """Hashes a file's content without reading it into memory at once.
+
+    Args:
+        path: The path to the file.
+
+    Returns:
+        A SHA-256 hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def check_file_path(args: Dict[str, Any]) -> None:
+    """Checks an API caller's `file_path` is one it may have plugins read.
+
+    Callers may read the attachment store and the `PLUGIN_FILE_DIRS`
+    directories; symlinks and `..` are resolved before the check.
+
+    Args:
+        args: A plugin's keyword arguments.
+
+    Raises:
+        FileAccessDenied: If the path is elsewhere or not a string.
+    """
+    if "file_path" not in args:
+        return
+    path = args["file_path"]
+    roots = [attachment_store.directory, *(d.strip() for d in config.PLUGIN_FILE_DIRS.split(",") if d.strip())]
+    if isinstance(path, str):
+        real = os.path.realpath(path)
+        for root in map(os.path.realpath, roots):
+            if os.path.commonpath([real, root]) == root:
+                return
+    raise FileAccessDenied("file_path must be an attachment or lie in PLUGIN_FILE_DIRS; upload the file instead")
+
+async def resolve_attachment(args: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[str]]:
+    """Replaces an `attachment` argument with the stored file's path.
+
+    Args:
+        args: A plugin's keyword arguments.
+
+    Returns:
+        The arguments with `file_path` set, and the attachment's SHA-256, or
+        the arguments unchanged and None if there is no attachment.
+
+    Raises:
+        ValueError: If the attachment does not exist.
+    """
+    if "attachment" not in args:
+        return args, None
+    rest = {k: v for k, v in args.items() if k != "attachment"}
+    attachment_id = args["attachment"]
+    if not isinstance(attachment_id, str) or await attachment_store.get(attachment_id) is None:
+        raise ValueError(f"Unknown attachment: {attachment_id}")
+    return {**rest, "file_path": attachment_store.path(attachment_id)}, attachment_id
+
+async def _cache_key(name: str, args: Dict[str, Any], digest: Optional[str] = None) -> Optional[str]:
+    """Builds the result cache key of a file plugin call, if it has one.
+
+    Attachments are stored under their SHA-256, so their `digest` is passed
+    in rather than hashing the file again.
+    """
+    path = args.get("file_path")
+    if name not in CACHEABLE or not isinstance(path, str):
+        return None
+    if digest is None:
+        try:
+            digest = await asyncio.to_thread(file_digest, path)
+        except OSError:
+            return None  # let the plugin report the missing file
+    rest = {k: v for k, v in args.items() if k != "file_path"}
+    return stable_hash(name, str(CACHEABLE[name]), digest, json.dumps(rest, sort_keys=True, default=str))
+
+async def _call_plugin(name: str, plugin: Callable[..., Any], args: Dict[str, Any], timeout: Optional[float]) -> Any:
+    """Calls a plugin on the event loop or in the worker pool."""
+    if asyncio.iscoroutinefunction(plugin):
+        timeout = timeout or config.PLUGIN_TIMEOUT
+        try:
+            return await asyncio.wait_for(plugin(**args), timeout)
+        except asyncio.TimeoutError:
+            raise PluginTimeout(f"Plugin {name!r} timed out after {timeout}s")
+        except (TypeError, ValueError, OSError) as e:
+            raise PluginInputError(f"{type(e).__name__}: {e}")
+    return await plugin_pool.run(plugin, args, timeout)
+
+async def run_plugin(
+    name: str, args: Dict[str, Any], timeout: Optional[float] = None, restrict_files: bool = False
+) -> Any:
+    """Runs a plugin.
+
+    Synchronous plugins run in the plugin worker pool; async plugins, such
+    as the code interpreter, run on the event loop. Results of file plugins
+    are cached under a hash of the file's content and the other arguments,
+    so the same file uploaded again under any name is served from the
+    cache, and identical calls in flight at the same time run once. An
+    `attachment` argument is replaced by the uploaded file's `file_path`.
+
+    Args:
+        name: The name of the plugin.
+        args: The plugin's keyword arguments.
+        timeout: The seconds the call may run.
+        restrict_files: Whether a `file_path` must pass `check_file_path`,
+            for arguments that come from API callers.
+
+    Returns:
+        The plugin's result.
+
+    Raises:
+        ValueError: If the plugin or attachment is unknown.
+        FileAccessDenied: If `restrict_files` is set and the file may not
+            be read.
+        PluginBusy: If the pool's queue is full.
+        PluginTimeout: If the call runs past its timeout.
+        PluginInputError: If the plugin rejects its arguments or file.
+        PluginError: If the plugin fails.
+        SandboxError: If no code interpreter sandbox could be started.
+    """
+    plugin = PLUGINS.get(name)
+    if plugin is None:
+        raise ValueError(f"Unknown plugin: {name!r}")
+    if restrict_files:
+        check_file_path(args)
+    args, digest = await resolve_attachment(args)
+    key = await _cache_key(name, args, digest)
+    if key is None:
+        return await _call_plugin(name, plugin, args, timeout)
+    cached = await plugin_cache.get(key)
+    if cached is not None:
+        return json.loads(cached)
+
+    async def call() -> Any:
+        result = await _call_plugin(name, plugin, args, timeout)
+        await plugin_cache.set(key, json.dumps(result).encode("utf-8"))
+        return result
+
+    result, _ = await plugin_flights.do(key, call)
+    return result
+
+@router.get('/')
+async def plugin_status():
+    """Lists the plugins and the state of the plugin worker pools.
+
+    Returns:
+        A dictionary with the plugin names, the worker pool's queue depth,
+        worker utilization and task counters, the result cache's hit rate,
+        and the code interpreter's sandbox occupancy, recycling counters and
+        per-run overhead.
+    """
+    return {
+        "plugins": sorted(PLUGINS),
+        "pool": plugin_pool.stats(),
+        "cache": plugin_cache.stats(),
+        "sandboxes": sandbox_pool.stats(),
+    }
+
 @router.post('/')
-def plugin_endpoint():
-    """Plugin endpoint.
+async def plugin_endpoint(req: PluginRequest):
+    """Calls a plugin.
+
+    CPU-bound plugins run in a pool of worker processes so they never block
+    the event loop.
 
-    This is a placeholder endpoint for plugins.
+    Args:
+        req: The plugin call.
 
     Returns:
-        A dictionary with a message indicating that the plugin endpoint was called.
+        A dictionary with the plugin's result and the time it took.
+
+    Raises:
+        HTTPException: If the arguments are invalid (400), the file may not
+            be read (403), the plugin or attachment is unknown (404), the pool is overloaded
+            or no sandbox could be started (503), the call times out (504) or
+            the plugin fails (500).
+    """
+    started = time.perf_counter()
+    timeout = min(req.timeout or config.PLUGIN_TIMEOUT, config.PLUGIN_TIMEOUT)
+    try:
+        result = await run_plugin(req.plugin, req.args, timeout, restrict_files=True)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except FileAccessDenied as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except PluginInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PluginBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except SandboxError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except PluginTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except PluginError as e:
+        raise HTTPException(status_code=500, detail=f"Plugin failed: {e}")
+    return {
+        "plugin": req.plugin,
+        "result": result,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+@router.post('/code_interpreter/stream')
+async def stream_code(req: CodeRequest):
+    """Runs code in a warm sandbox and streams its output.
+
+    Args:
+        req: The code to run.
+
+    Returns:
+        An `EventStreamResponse` with `stdout` and `stderr` events as the
+        code writes, a `result` event with `ok`, `error`, `exec_ms` and
+        `overhead_ms`, and a final `[DONE]` event.
+
+    Raises:
+        HTTPException: If no sandbox could be started (503).
     """
-    return {'message': 'Plugin endpoint'}
+    events = sandbox_pool.run(req.code, req.stdin, req.timeout)
+    try:
+        # Take a sandbox before the response starts so failures get a status
+        first = await events.__anext__()
+    except SandboxError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    async def frames() -> AsyncIterator[str]:
+        try:
+            event = first
+            while True:
+                yield sse_event(json.dumps(event), event["type"])
+                if event["type"] == "result":
+                    break
+                event = await events.__anext__()
+            yield sse_event(DONE)
+        finally:
+            await events.aclose()
+
+    return EventStreamResponse(frames())
+
+async def _replay(analysis: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """Replays a cached analysis as a finished stream."""
+    yield analysis
+
+@router.post('/audio_analysis/stream')
+async def stream_audio(req: AudioRequest):
+    """Analyzes an audio file and streams partial results.
+
+    Chunks of the file are analyzed in parallel across the worker pool, and
+    the merged analysis is sent each time a chunk finishes, so a client can
+    show progress on long recordings. A file analyzed before is answered
+    from the result cache straight away.
+
+    Args:
+        req: The file to analyze.
+
+    Returns:
+        An `EventStreamResponse` with `progress` events carrying the partial
+        analysis, a `result` event with the full analysis, and a final
+        `[DONE]` event. A failure after the stream started is sent as an
+        `error` event.
+
+    Raises:
+        HTTPException: If no file is given or it cannot be read or is not
+            supported (400), the file may not be read (403), the attachment
+            is unknown (404), the pool is overloaded (503), the first chunk
+            times out (504), or its analysis fails (500).
+    """
+    if (req.file_path is None) == (req.attachment is None):
+        raise HTTPException(status_code=400, detail="Pass exactly one of file_path and attachment")
+    source = {"file_path": req.file_path} if req.attachment is None else {"attachment": req.attachment}
+    try:
+        check_file_path({**req.options, **source})
+    except FileAccessDenied as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    try:
+        args, digest = await resolve_attachment({**req.options, **source})
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    key = await _cache_key("audio_analysis", args, digest)
+    cached = await plugin_cache.get(key) if key else None
+    if cached is not None:
+        events: AsyncIterator[Dict[str, Any]] = _replay(json.loads(cached))
+    else:
+        events = audio_events(**args)
+    try:
+        # Probe the file and finish the first chunk before the response starts
+        first = await events.__anext__()
+    except (TypeError, ValueError, OSError, PluginInputError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PluginBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except PluginTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except PluginError as e:
+        raise HTTPException(status_code=500, detail=f"Plugin failed: {e}")
+
+    async def frames() -> AsyncIterator[str]:
+        try:
+            analysis = first
+            while True:
+                done = analysis["progress"] >= 1
+                yield sse_event(json.dumps(analysis), "result" if done else "progress")
+                if done:
+                    if key and cached is None:
+                        await plugin_cache.set(key, json.dumps(analysis).encode("utf-8"))
+                    break
+                analysis = await events.__anext__()
+        except (PluginError, PluginBusy, PluginTimeout) as e:
+            yield sse_event(json.dumps({"detail": str(e)}), "error")
+        finally:
+            await events.aclose()
+        yield sse_event(DONE)
+
+    return EventStreamResponse(frames())
@@ -1,12 +1,21 @@
 # System prompt/context management module
-from typing import List, Optional
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+import json
+import logging
+import queue
 import threading
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+from fastapi import APIRouter, Header, HTTPException, Response
+from pydantic import BaseModel
+from sqlalchemy import create_engine, delete, select
+from sqlalchemy.orm import Session
+from ..config import config
+from ..db.system_prompt import SystemPromptEntry
+from ..utils.cache import stable_hash
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# In-memory storage for system prompts (replace with persistent storage later)
 class SystemPrompt(BaseModel):
     """Represents a system prompt.
 
@@ -21,21 +30,113 @@ class SystemPrompt(BaseModel):
     content: str
     description: Optional[str] = None
 
+class PromptSnapshot(NamedTuple):
+    """An immutable view of every prompt at one point in time.
+
+    Attributes:
+        prompts: The prompts, ordered by ID.
+        by_id: The prompts keyed by ID.
+        by_name: Prompt IDs keyed by name.
+        etag: An entity tag that changes whenever any prompt changes.
+    """
+    prompts: Tuple[SystemPrompt, ...]
+    by_id: Mapping[int, SystemPrompt]
+    by_name: Mapping[str, int]
+    etag: str
+
+    @classmethod
+    def build(cls, by_id: Dict[int, SystemPrompt]) -> "PromptSnapshot":
+        """Builds a snapshot from a dictionary of prompts it takes ownership of.
+
+        Args:
+            by_id: The prompts keyed by ID.
+
+        Returns:
+            The snapshot.
+        """
+        prompts = tuple(by_id[i] for i in sorted(by_id))
+        body = json.dumps([p.model_dump() for p in prompts], sort_keys=True)
+        return cls(
+            prompts=prompts,
+            by_id=MappingProxyType(by_id),
+            by_name=MappingProxyType({p.name: p.id for p in prompts}),
+            etag=f'"{stable_hash(body)[:32]}"',
+        )
+
 class SystemPromptStore:
-    """A thread-safe, in-memory store for system prompts."""
-    def __init__(self):
-        """Initializes the system prompt store."""
-        self._prompts = []
+    """An indexed store for system prompts with durable write-behind.
+
+    Reads never take a lock: every write builds a new immutable snapshot and
+    swaps it in with a single reference assignment, so readers always see a
+    consistent set of prompts. Writes are serialized by a lock, applied to
+    the snapshot immediately and persisted to the database by a background
+    thread, which batches and coalesces them.
+    """
+    def __init__(
+        self,
+        database_url: Optional[str] = None,
+        write_retries: int = 5,
+        retry_delay: float = 1.0,
+        close_timeout: float = 10.0,
+    ):
+        """Initializes the system prompt store.
+
+        Args:
+            database_url: A synchronous SQLAlchemy URL to persist prompts
+                to, or None to keep them in memory only.
+            write_retries: How many times a failed write is retried before
+                its changes are dropped.
+            retry_delay: The seconds to wait between write attempts.
+            close_timeout: The seconds `close` waits for pending writes.
+        """
+        self.database_url = database_url
+        self.write_retries = write_retries
+        self.retry_delay = retry_delay
+        self.close_timeout = close_timeout
+        self._snapshot = PromptSnapshot.build({})
         self._lock = threading.Lock()
         self._next_id = 1
+        self._loaded = False
+        self._engine = None
+        self._pending: "queue.Queue[Optional[Tuple[str, Any]]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+
+    def _ensure_loaded(self):
+        """Loads the persisted prompts on first use."""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if self.database_url:
+                self._engine = create_engine(self.database_url)
+                SystemPromptEntry.__table__.create(self._engine, checkfirst=True)
+                with Session(self._engine) as session:
+                    rows = session.scalars(select(SystemPromptEntry)).all()
+                by_id = {
+                    row.id: SystemPrompt(id=row.id, name=row.name, content=row.content, description=row.description)
+                    for row in rows
+                }
+                self._snapshot = PromptSnapshot.build(by_id)
+                self._next_id = max(by_id, default=0) + 1
+            self._loaded = True
+
+    def snapshot(self) -> PromptSnapshot:
+        """Gets the current snapshot of all prompts.
 
-    def list_prompts(self) -> List[SystemPrompt]:
+        Returns:
+            The current snapshot.
+        """
+        self._ensure_loaded()
+        return self._snapshot
+
+    def list_prompts(self) -> Tuple[SystemPrompt, ...]:
         """Lists all system prompts.
 
         Returns:
-            A list of all system prompts.
+            All system prompts, ordered by ID.
         """
-        return self._prompts.copy()
+        return self.snapshot().prompts
 
     def get_prompt(self, prompt_id: int) -> Optional[SystemPrompt]:
         """Gets a system prompt by its ID.
@@ -46,23 +147,44 @@ class SystemPromptStore:
         Returns:
             The system prompt with the given ID, or None if not found.
         """
-        for p in self._prompts:
-            if p.id == prompt_id:
-                return p
-        return None
+        return self.snapshot().by_id.get(prompt_id)
+
+    def get_prompt_by_name(self, name: str) -> Optional[SystemPrompt]:
+        """Gets a system prompt by its name.
+
+        Args:
+            name: The name of the prompt to get.
+
+        Returns:
+            The system prompt with the given name, or None if not found.
+        """
+        snapshot = self.snapshot()
+        prompt_id = snapshot.by_name.get(name)
+        return snapshot.by_id[prompt_id] if prompt_id is not None else None
 
-    def add_prompt(self, prompt: SystemPrompt):
+    def add_prompt(self, prompt: SystemPrompt) -> SystemPrompt:
         """Adds a system prompt to the store.
 
         Args:
-            prompt: The system prompt to add.
+            prompt: The system prompt to add. Its ID is assigned by the store.
+
+        Returns:
+            The stored prompt.
+
+        Raises:
+            ValueError: If another prompt already has the same name.
         """
+        self._ensure_loaded()
         with self._lock:
-            prompt.id = self._next_id
+            if prompt.name in self._snapshot.by_name:
+                raise ValueError(f"A prompt named '{prompt.name}' already exists")
+            stored = prompt.model_copy(update={"id": self._next_id})
             self._next_id += 1
-            self._prompts.append(prompt)
+            self._publish({**self._snapshot.by_id, stored.id: stored})
+            self._persist("upsert", stored.model_dump())
+        return stored
 
-    def update_prompt(self, prompt_id: int, prompt: SystemPrompt):
+    def update_prompt(self, prompt_id: int, prompt: SystemPrompt) -> Optional[SystemPrompt]:
         """Updates a system prompt.
 
         Args:
@@ -70,14 +192,21 @@ class SystemPromptStore:
             prompt: The updated system prompt.
 
         Returns:
-            True if the prompt was updated, False otherwise.
+            The stored prompt, or None if no prompt has the given ID.
+
+        Raises:
+            ValueError: If another prompt already has the new name.
         """
+        self._ensure_loaded()
         with self._lock:
-            for i, p in enumerate(self._prompts):
-                if p.id == prompt_id:
-                    self._prompts[i] = prompt
-                    return True
-            return False
+            if prompt_id not in self._snapshot.by_id:
+                return None
+            if self._snapshot.by_name.get(prompt.name, prompt_id) != prompt_id:
+                raise ValueError(f"A prompt named '{prompt.name}' already exists")
+            stored = prompt.model_copy(update={"id": prompt_id})
+            self._publish({**self._snapshot.by_id, prompt_id: stored})
+            self._persist("upsert", stored.model_dump())
+        return stored
 
     def delete_prompt(self, prompt_id: int):
         """Deletes a system prompt.
@@ -85,19 +214,169 @@ class SystemPromptStore:
         Args:
             prompt_id: The ID of the prompt to delete.
         """
+        self._ensure_loaded()
         with self._lock:
-            self._prompts = [p for p in self._prompts if p.id != prompt_id]
+            if prompt_id not in self._snapshot.by_id:
+                return
+            by_id = dict(self._snapshot.by_id)
+            del by_id[prompt_id]
+            self._publish(by_id)
+            self._persist("delete", prompt_id)
+
+    def _publish(self, by_id: Dict[int, SystemPrompt]):
+        """Swaps in a new snapshot; must be called with the lock held."""
+        self._snapshot = PromptSnapshot.build(by_id)
+
+    def _persist(self, op: str, value: Any):
+        """Queues a write for the background writer; called with the lock held."""
+        if self._engine is None:
+            return
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_behind, name="prompt-writer", daemon=True)
+            self._writer.start()
+        self._pending.put((op, value))
+
+    def _write_behind(self):
+        """Writes queued changes to the database in coalesced batches.
+
+        Changes that fail to write are kept and retried with whatever was
+        queued since merged over them, so a newer edit always wins. After
+        `write_retries` failed retries in a row the changes are logged and
+        dropped; they stay in the in-memory snapshot. Queue items are only
+        marked done once written or dropped, so `flush` and `close` wait for
+        the retries.
+        """
+        failed: Dict[int, Tuple[str, Any]] = {}
+        unwritten = 0
+        retries = 0
+        stop = False
+        while True:
+            # Block for new work unless there are failed changes to retry
+            batch = [] if failed or stop else [self._pending.get()]
+            while True:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            unwritten += len(batch)
+            stop = stop or None in batch
+            # Only the last change to each prompt needs to be written
+            latest = dict(failed)
+            for item in batch:
+                if item is not None:
+                    op, value = item
+                    latest[value["id"] if op == "upsert" else value] = item
+            try:
+                self._write(latest)
+            except Exception as e:
+                if retries < self.write_retries:
+                    logger.error(f"Persisting system prompts failed, will retry: {e}")
+                    failed = latest
+                    retries += 1
+                    threading.Event().wait(self.retry_delay)
+                    continue
+                logger.error(f"Persisting system prompts failed, dropping {len(latest)} unwritten changes: {e}")
+            failed = {}
+            retries = 0
+            for _ in range(unwritten):
+                self._pending.task_done()
+            unwritten = 0
+            if stop:
+                return
+
+    def _write(self, changes: Dict[int, Tuple[str, Any]]):
+        """Applies a batch of changes in one transaction."""
+        if not changes:
+            return
+        with Session(self._engine) as session, session.begin():
+            deleted = [prompt_id for prompt_id, (op, _) in changes.items() if op == "delete"]
+            upserts = [value for op, value in changes.values() if op == "upsert"]
+            # Clear renamed or deleted rows first so unique names never collide
+            session.execute(delete(SystemPromptEntry).where(
+                SystemPromptEntry.id.in_(deleted + [value["id"] for value in upserts])
+            ))
+            session.flush()
+            session.add_all(SystemPromptEntry(**value) for value in upserts)
+
+    def flush(self):
+        """Blocks until every queued change has been written."""
+        self._pending.join()
+
+    def close(self):
+        """Writes pending changes and stops the background writer.
+
+        Waits at most `close_timeout` seconds for the writer; changes it has
+        not written by then are logged and dropped.
+        """
+        if self._writer is not None:
+            self._pending.put(None)
+            self._writer.join(self.close_timeout)
+            if self._writer.is_alive():
+                logger.error(f"System prompt writer did not finish within {self.close_timeout}s, dropping unwritten changes")
+            self._writer = None
+        if self._engine is not None:
+            self._engine.dispose()
+            self._engine = None
+        self._loaded = False
+
+prompt_store = SystemPromptStore(
+    config.SYSTEM_PROMPT_DATABASE_URL or None,
+    write_retries=config.SYSTEM_PROMPT_WRITE_RETRIES,
+    close_timeout=config.SYSTEM_PROMPT_CLOSE_TIMEOUT,
+)
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Checks an If-None-Match header against an entity tag.
 
-prompt_store = SystemPromptStore()
+    Args:
+        if_none_match: The header value, if any.
+        etag: The current entity tag.
+
+    Returns:
+        True if the client's copy is current.
+    """
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
 
 @router.get("/prompts", response_model=List[SystemPrompt])
-def list_prompts():
+def list_prompts(response: Response, if_none_match: Optional[str] = Header(None)):
     """Lists all system prompts.
 
+    The response carries an ETag; a request whose If-None-Match header
+    matches it gets an empty 304 response instead.
+
+    Args:
+        response: The outgoing response, used to set the ETag.
+        if_none_match: The request's If-None-Match header.
+
     Returns:
         A list of all system prompts.
     """
-    return prompt_store.list_prompts()
+    snapshot = prompt_store.snapshot()
+    if _etag_matches(if_none_match, snapshot.etag):
+        return Response(status_code=304, headers={"ETag": snapshot.etag})
+    response.headers["ETag"] = snapshot.etag
+    return snapshot.prompts
+
+@router.get("/prompts/by-name/{name}", response_model=SystemPrompt)
+def get_prompt_by_name(name: str):
+    """Gets a system prompt by its name.
+
+    Args:
+        name: The name of the prompt to get.
+
+    Returns:
+        The system prompt with the given name.
+
+    Raises:
+        HTTPException: If the prompt is not found.
+    """
+    prompt = prompt_store.get_prompt_by_name(name)
+    if not prompt:
+        raise HTTPException(status_code=404, detail="Prompt not found")
+    return prompt
 
 @router.get("/prompts/{prompt_id}", response_model=SystemPrompt)
 def get_prompt(prompt_id: int):
@@ -126,9 +405,14 @@ def create_prompt(prompt: SystemPrompt):
 
     Returns:
         The created system prompt.
+
+    Raises:
+        HTTPException: If a prompt with the same name exists.
     """
-    prompt_store.add_prompt(prompt)
-    return prompt
+    try:
+        return prompt_store.add_prompt(prompt)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
 @router.put("/prompts/{prompt_id}", response_model=SystemPrompt)
 def update_prompt(prompt_id: int, prompt: SystemPrompt):
@@ -142,11 +426,16 @@ def update_prompt(prompt_id: int, prompt: SystemPrompt):
         The updated system prompt.
 
     Raises:
-        HTTPException: If the prompt is not found.
+        HTTPException: If the prompt is not found, or if another prompt has
+            the new name.
     """
-    if not prompt_store.update_prompt(prompt_id, prompt):
+    try:
+        stored = prompt_store.update_prompt(prompt_id, prompt)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not stored:
         raise HTTPException(status_code=404, detail="Prompt not found")
-    return prompt
+    return stored
 
 @router.delete("/prompts/{prompt_id}")
 def delete_prompt(prompt_id: int):
@@ -1,14 +1,170 @@
-from fastapi import APIRouter
+from typing import Any, Dict, Union
+from fastapi import APIRouter, HTTPException, Response
+from pydantic import BaseModel
+from ..config import config
+from ..db.config import async_session
+from ..utils.cache import TieredCache
+from ..utils.job_workers import PermanentJobError, ReportFn
+from ..utils.workflow_utils import TEMPLATES, WorkflowEngine, load_workflow, parse_agents
+from .chat import ChatMessage, ChatRequest, chat_endpoint
+from .jobs import job_workers, submit_job
+from .memory import search_memories
+from .plugin import run_plugin
 
 router = APIRouter()
 
-@router.post('/')
-def workflow_endpoint():
-    """Workflow endpoint.
+AGENTS = parse_agents(config.WORKFLOW_AGENTS)
 
-    This is a placeholder endpoint for workflows.
+class WorkflowRequest(BaseModel):
+    """Represents a request to run a workflow.
+
+    Attributes:
+        workflow: The name of a built-in template, or an inline workflow
+            with a list of `steps`.
+        inputs: A dictionary of inputs for the workflow.
+    """
+    workflow: Union[str, Dict[str, Any]]
+    inputs: Dict[str, Any] = {}
+
+async def _model_step(params: Dict[str, Any]) -> str:
+    """Asks a model through the chat pipeline.
+
+    Args:
+        params: The `prompt`, an optional `system` message, and either an
+            `agent` or a `provider` and `model`, plus optional `max_tokens`
+            and `temperature`.
+
+    Returns:
+        The model's reply.
+    """
+    provider, model = AGENTS.get(str(params.get("agent", "")).lower(), ("openai", config.DEFAULT_MODEL))
+    messages = [ChatMessage(role="user", content=str(params["prompt"]))]
+    if params.get("system"):
+        messages.insert(0, ChatMessage(role="system", content=str(params["system"])))
+    req = ChatRequest(
+        messages=messages,
+        provider=params.get("provider", provider),
+        model=params.get("model", model),
+        max_tokens=params.get("max_tokens", config.MAX_TOKENS),
+        temperature=params.get("temperature", config.TEMPERATURE),
+        fallback=True,
+    )
+    result = await chat_endpoint(req, Response(), None)
+    return result.content
+
+async def _memory_search_step(params: Dict[str, Any]) -> list:
+    """Searches the user's memories.
+
+    Args:
+        params: The `query`, and optional `limit`, `threshold` and `user_id`.
+
+    Returns:
+        The matching memories' content and similarity.
+    """
+    async with async_session() as db:
+        memories = await search_memories(
+            query=str(params["query"]),
+            limit=int(params.get("limit", 5)),
+            threshold=float(params.get("threshold", 0.8)),
+            ef_search=None,
+            probes=None,
+            db=db,
+            user_id=str(params.get("user_id", "default")),
+        )
+    return [{"content": m.content, "similarity": m.similarity} for m in memories]
+
+async def _plugin_step(params: Dict[str, Any]) -> Any:
+    """Runs a plugin in the plugin worker pool.
+
+    Workflow inputs come from API callers, so a `file_path` is held to the
+    same directories as `POST /api/plugin/`.
+
+    Args:
+        params: The `plugin` name, its keyword `args` and an optional
+            `timeout`.
+
+    Returns:
+        The plugin's result.
+    """
+    return await run_plugin(
+        params.get("plugin"), params.get("args", {}), params.get("timeout"), restrict_files=True
+    )
+
+workflow_engine = WorkflowEngine(
+    {"model": _model_step, "memory_search": _memory_search_step, "plugin": _plugin_step},
+    TieredCache("wf", max_entries=config.WORKFLOW_MEMO_SIZE, ttl=config.WORKFLOW_MEMO_TTL or None),
+    enabled=config.WORKFLOW_MEMO_ENABLED,
+    max_parallel=config.WORKFLOW_MAX_PARALLEL,
+)
+
+async def _run_workflow_job(payload: Dict[str, Any], report: ReportFn) -> Dict[str, Any]:
+    """Runs a workflow as a job.
+
+    A retried job re-executes only the steps that have not succeeded yet;
+    the others come from the memo cache.
+
+    Args:
+        payload: A dictionary with the workflow and its inputs.
+        report: Reports per-step progress.
+
+    Returns:
+        The workflow outputs and per-step timings.
+
+    Raises:
+        PermanentJobError: If the workflow is invalid.
+    """
+    inputs = payload.get("inputs") or {}
+    try:
+        workflow = load_workflow(payload.get("workflow"))
+        workflow_engine.validate(workflow, inputs)
+    except ValueError as e:
+        raise PermanentJobError(f"Invalid workflow: {e}")
+    return await workflow_engine.run(workflow, inputs, report)
+
+job_workers.register("workflow", _run_workflow_job)
+
+@router.post('/', status_code=202)
+async def workflow_endpoint(req: WorkflowRequest, response: Response):
+    """Submits a workflow to run in the background.
+
+    Args:
+        req: The workflow to run and its inputs.
+        response: The outgoing response.
+
+    Returns:
+        The queued job; its status, per-step progress and outputs are served
+        at `/api/jobs/{id}`.
+
+    Raises:
+        HTTPException: If the workflow is invalid.
+    """
+    try:
+        workflow_engine.validate(load_workflow(req.workflow), req.inputs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await submit_job("workflow", req.model_dump(), response)
+
+@router.get('/templates')
+async def list_templates():
+    """Lists the built-in workflow templates.
+
+    Returns:
+        Each template's steps with their dependencies, and its inputs.
+    """
+    templates = {}
+    for name in TEMPLATES:
+        workflow = load_workflow(name)
+        templates[name] = {
+            "inputs": sorted(workflow.inputs),
+            "steps": [{"id": s.id, "type": s.type, "needs": sorted(s.dependencies)} for s in workflow.steps],
+        }
+    return templates
+
+@router.get('/stats')
+async def workflow_stats():
+    """Gets workflow run counters and the memo cache hit rate.
 
     Returns:
-        A dictionary with a message indicating that the workflow endpoint was called.
+        A dictionary of workflow statistics.
     """
-    return {'message': 'Workflow endpoint'}
+    return workflow_engine.stats()
@@ -15,6 +15,134 @@ class Config:
     SQLITE_URL: str = os.getenv("SQLITE_URL", "sqlite:///./mgdi.db")
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379")
     CHROMA_PERSIST_DIR: str = os.getenv("CHROMA_PERSIST_DIR", "./chroma_db")
+    # Synchronous URL system prompts are persisted to (e.g. SQLITE_URL); empty
+    # keeps them in memory only
+    SYSTEM_PROMPT_DATABASE_URL: str = os.getenv("SYSTEM_PROMPT_DATABASE_URL", "")
+    SYSTEM_PROMPT_WRITE_RETRIES: int = int(os.getenv("SYSTEM_PROMPT_WRITE_RETRIES", "5"))
+    SYSTEM_PROMPT_CLOSE_TIMEOUT: float = float(os.getenv("SYSTEM_PROMPT_CLOSE_TIMEOUT", "10"))
+
+    # Database engine profile
+    DB_ECHO: bool = os.getenv("DB_ECHO", "false").lower() == "true"
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+
+    # Caching (persistent tier: "redis" with file fallback, "file", or "none")
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "redis")
+    CACHE_DIR: str = os.getenv("CACHE_DIR", "./cache")
+    EMBEDDING_CACHE_SIZE: int = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+    EMBEDDING_CACHE_TTL: int = int(os.getenv("EMBEDDING_CACHE_TTL", "2592000"))
+
+    # Exact-match chat response cache (only requests at or below the
+    # temperature ceiling are cached; per-model TTLs as "model=seconds,...")
+    RESPONSE_CACHE_ENABLED: bool = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+    RESPONSE_CACHE_SIZE: int = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+    RESPONSE_CACHE_TTL: int = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+    RESPONSE_CACHE_MODEL_TTLS: str = os.getenv("RESPONSE_CACHE_MODEL_TTLS", "")
+    RESPONSE_CACHE_MAX_TEMPERATURE: float = float(os.getenv("RESPONSE_CACHE_MAX_TEMPERATURE", "0"))
+
+    # Semantic chat response cache (paraphrase matching on the final user
+    # turn; shares RESPONSE_CACHE_MAX_TEMPERATURE with the exact-match cache)
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+    SEMANTIC_CACHE_MAX_ENTRIES: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+    SEMANTIC_CACHE_MAX_SCOPES: int = int(os.getenv("SEMANTIC_CACHE_MAX_SCOPES", "10000"))
+    SEMANTIC_CACHE_MAX_AGE: float = float(os.getenv("SEMANTIC_CACHE_MAX_AGE", "86400"))
+
+    # Embedding request coalescing
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "128"))
+    EMBEDDING_BATCH_WINDOW_MS: float = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+    EMBEDDING_BATCH_MAX_TOKENS: int = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+
+    # Bulk memory ingest
+    MEMORY_INGEST_CHUNK_SIZE: int = int(os.getenv("MEMORY_INGEST_CHUNK_SIZE", "256"))
+    MEMORY_INGEST_MAX_RECORD_BYTES: int = int(os.getenv("MEMORY_INGEST_MAX_RECORD_BYTES", str(1 << 20)))
+
+    # Batch chat
+    BATCH_MAX_PARALLEL: int = int(os.getenv("BATCH_MAX_PARALLEL", "16"))
+    BATCH_ITEM_TIMEOUT: float = float(os.getenv("BATCH_ITEM_TIMEOUT", "120"))
+    BATCH_MAX_RECORD_BYTES: int = int(os.getenv("BATCH_MAX_RECORD_BYTES", str(1 << 20)))
+
+    # Background jobs ("redis" with SQLite fallback, or "sqlite")
+    JOB_QUEUE_BACKEND: str = os.getenv("JOB_QUEUE_BACKEND", "redis")
+    JOB_QUEUE_SQLITE_PATH: str = os.getenv("JOB_QUEUE_SQLITE_PATH", "./jobs.db")
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "4"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    JOB_VISIBILITY_TIMEOUT: float = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "60"))
+    JOB_POLL_INTERVAL_MS: float = float(os.getenv("JOB_POLL_INTERVAL_MS", "500"))
+    JOB_RETRY_BACKOFF: float = float(os.getenv("JOB_RETRY_BACKOFF", "2"))
+    JOB_RESULT_TTL: int = int(os.getenv("JOB_RESULT_TTL", "86400"))
+    JOB_EVENTS_POLL_MS: float = float(os.getenv("JOB_EVENTS_POLL_MS", "250"))
+
+    # Plugin worker processes (per-task timeout and address-space limit)
+    PLUGIN_WORKERS: int = int(os.getenv("PLUGIN_WORKERS", str(os.cpu_count() or 2)))
+    PLUGIN_TIMEOUT: float = float(os.getenv("PLUGIN_TIMEOUT", "30"))
+    PLUGIN_MEMORY_LIMIT_MB: int = int(os.getenv("PLUGIN_MEMORY_LIMIT_MB", "1024"))
+    PLUGIN_MAX_QUEUE: int = int(os.getenv("PLUGIN_MAX_QUEUE", "64"))
+    PLUGIN_WARM_START: bool = os.getenv("PLUGIN_WARM_START", "true").lower() == "true"
+    # Results of file plugins, cached under the file's content hash
+    PLUGIN_CACHE_SIZE: int = int(os.getenv("PLUGIN_CACHE_SIZE", "1000"))
+    PLUGIN_CACHE_TTL: int = int(os.getenv("PLUGIN_CACHE_TTL", "604800"))
+    # Comma-separated directories API callers may pass as a plugin `file_path`,
+    # besides the attachment store
+    PLUGIN_FILE_DIRS: str = os.getenv("PLUGIN_FILE_DIRS", "")
+
+    # Image analysis
+    IMAGE_ANALYSIS_SIZE: int = int(os.getenv("IMAGE_ANALYSIS_SIZE", "256"))
+    IMAGE_MAX_PIXELS: int = int(os.getenv("IMAGE_MAX_PIXELS", "50000000"))
+
+    # Audio analysis (frames of AUDIO_FRAME_SIZE samples, chunks analyzed in parallel)
+    AUDIO_FRAME_SIZE: int = int(os.getenv("AUDIO_FRAME_SIZE", "2048"))
+    AUDIO_CHUNK_SECONDS: float = float(os.getenv("AUDIO_CHUNK_SECONDS", "60"))
+    AUDIO_TIMELINE_SECONDS: float = float(os.getenv("AUDIO_TIMELINE_SECONDS", "1"))
+    AUDIO_SILENCE_DB: float = float(os.getenv("AUDIO_SILENCE_DB", "-40"))
+    AUDIO_MIN_SILENCE: float = float(os.getenv("AUDIO_MIN_SILENCE", "0.5"))
+    AUDIO_PARALLEL: int = int(os.getenv("AUDIO_PARALLEL", "0"))
+
+    # Attachments (content-addressed uploads)
+    ATTACHMENT_DIR: str = os.getenv("ATTACHMENT_DIR", "./attachments")
+    ATTACHMENT_MAX_SIZE: int = int(os.getenv("ATTACHMENT_MAX_SIZE", str(100 * 1024 * 1024)))
+    ATTACHMENT_MAX_FILES: int = int(os.getenv("ATTACHMENT_MAX_FILES", "10"))
+    ATTACHMENT_INLINE_BYTES: int = int(os.getenv("ATTACHMENT_INLINE_BYTES", "32768"))
+
+    # Code interpreter sandboxes ("local" processes, or "docker" containers)
+    SANDBOX_BACKEND: str = os.getenv("SANDBOX_BACKEND", "local")
+    SANDBOX_POOL_SIZE: int = int(os.getenv("SANDBOX_POOL_SIZE", "4"))
+    SANDBOX_MAX_RUNS: int = int(os.getenv("SANDBOX_MAX_RUNS", "100"))
+    SANDBOX_TIMEOUT: float = float(os.getenv("SANDBOX_TIMEOUT", "10"))
+    SANDBOX_START_TIMEOUT: float = float(os.getenv("SANDBOX_START_TIMEOUT", "30"))
+    SANDBOX_MEMORY_LIMIT_MB: int = int(os.getenv("SANDBOX_MEMORY_LIMIT_MB", "512"))
+    SANDBOX_MAX_OUTPUT: int = int(os.getenv("SANDBOX_MAX_OUTPUT", str(1 << 20)))
+    SANDBOX_ISOLATE_NETWORK: bool = os.getenv("SANDBOX_ISOLATE_NETWORK", "true").lower() == "true"
+    SANDBOX_ISOLATE_FILESYSTEM: bool = os.getenv("SANDBOX_ISOLATE_FILESYSTEM", "true").lower() == "true"
+    SANDBOX_REQUIRE_ISOLATION: bool = os.getenv("SANDBOX_REQUIRE_ISOLATION", "true").lower() == "true"
+    SANDBOX_DOCKER_IMAGE: str = os.getenv("SANDBOX_DOCKER_IMAGE", "python:3.11-slim")
+
+    # Workflows (step outputs memoized by a hash of step definition and inputs;
+    # template agents mapped to models as "agent=provider:model,...")
+    WORKFLOW_MEMO_ENABLED: bool = os.getenv("WORKFLOW_MEMO_ENABLED", "true").lower() == "true"
+    WORKFLOW_MEMO_SIZE: int = int(os.getenv("WORKFLOW_MEMO_SIZE", "1000"))
+    WORKFLOW_MEMO_TTL: int = int(os.getenv("WORKFLOW_MEMO_TTL", "604800"))
+    WORKFLOW_MAX_PARALLEL: int = int(os.getenv("WORKFLOW_MAX_PARALLEL", "8"))
+    WORKFLOW_AGENTS: str = os.getenv(
+        "WORKFLOW_AGENTS",
+        "codex=openai:gpt-4-turbo,claude=anthropic:claude-3-sonnet-20240229,"
+        "jules=openai:gpt-3.5-turbo,gemini=openai:gpt-4-turbo",
+    )
+
+    # Memory search index tuning (defaults for per-request ef_search/probes)
+    MEMORY_SEARCH_EF_SEARCH: int = int(os.getenv("MEMORY_SEARCH_EF_SEARCH", "40"))
+    MEMORY_SEARCH_PROBES: int = int(os.getenv("MEMORY_SEARCH_PROBES", "0"))
+
+    # Memory vector store ("pgvector", or "numpy" for SQLite/single-node)
+    VECTOR_STORE_BACKEND: Optional[str] = os.getenv("VECTOR_STORE_BACKEND")
+    VECTOR_STORE_DIR: str = os.getenv("VECTOR_STORE_DIR", "./vector_store")
+    VECTOR_STORE_SEGMENT_ROWS: int = int(os.getenv("VECTOR_STORE_SEGMENT_ROWS", "65536"))
+    VECTOR_STORE_COMPACT_SEGMENTS: int = int(os.getenv("VECTOR_STORE_COMPACT_SEGMENTS", "8"))
+    VECTOR_STORE_COMPACT_DELETED_RATIO: float = float(os.getenv("VECTOR_STORE_COMPACT_DELETED_RATIO", "0.2"))
     
     # Security
     SECRET_KEY: str = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production")
@@ -22,11 +150,61 @@ class Config:
     
     # Model defaults
     DEFAULT_MODEL: str = "gpt-3.5-turbo"
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
     MAX_TOKENS: int = 4096
     TEMPERATURE: float = 0.7
+
+    # Token accounting ("reject" or "trim" requests that overflow the context)
+    CONTEXT_OVERFLOW_POLICY: str = os.getenv("CONTEXT_OVERFLOW_POLICY", "reject")
+    DEFAULT_CONTEXT_WINDOW: int = int(os.getenv("DEFAULT_CONTEXT_WINDOW", "8192"))
+    TOKEN_COUNT_CACHE_SIZE: int = int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "50000"))
+
+    # History compaction (older turns replaced by a cached rolling summary)
+    HISTORY_COMPACTION_ENABLED: bool = os.getenv("HISTORY_COMPACTION_ENABLED", "false").lower() == "true"
+    HISTORY_COMPACTION_TOKEN_BUDGET: int = int(os.getenv("HISTORY_COMPACTION_TOKEN_BUDGET", "6000"))
+    HISTORY_KEEP_MESSAGES: int = int(os.getenv("HISTORY_KEEP_MESSAGES", "6"))
+    HISTORY_SUMMARY_STEP: int = int(os.getenv("HISTORY_SUMMARY_STEP", "4"))
+    HISTORY_SUMMARY_PROVIDER: str = os.getenv("HISTORY_SUMMARY_PROVIDER", "openai")
+    HISTORY_SUMMARY_MODEL: str = os.getenv("HISTORY_SUMMARY_MODEL", "gpt-3.5-turbo")
+    HISTORY_SUMMARY_MAX_TOKENS: int = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "512"))
+    HISTORY_SUMMARY_TTL: int = int(os.getenv("HISTORY_SUMMARY_TTL", "604800"))
     
-    # Streaming
-    STREAM_CHUNK_SIZE: int = 1024
-    STREAM_TIMEOUT: int = 30
-    
+    # Streaming (chunks are coalesced into SSE frames of up to
+    # STREAM_CHUNK_SIZE characters, held back at most STREAM_FLUSH_INTERVAL_MS;
+    # STREAM_TIMEOUT is the idle timeout in seconds)
+    STREAM_CHUNK_SIZE: int = int(os.getenv("STREAM_CHUNK_SIZE", "1024"))
+    STREAM_FLUSH_INTERVAL_MS: float = float(os.getenv("STREAM_FLUSH_INTERVAL_MS", "50"))
+    STREAM_TIMEOUT: int = int(os.getenv("STREAM_TIMEOUT", "30"))
+
+    # Provider HTTP connection pools (one pool per provider, shared process-wide)
+    PROVIDER_MAX_CONNECTIONS: int = int(os.getenv("PROVIDER_MAX_CONNECTIONS", "100"))
+    PROVIDER_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("PROVIDER_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    PROVIDER_KEEPALIVE_EXPIRY: float = float(os.getenv("PROVIDER_KEEPALIVE_EXPIRY", "60"))
+    PROVIDER_CONNECT_TIMEOUT: float = float(os.getenv("PROVIDER_CONNECT_TIMEOUT", "5"))
+    PROVIDER_REQUEST_TIMEOUT: float = float(os.getenv("PROVIDER_REQUEST_TIMEOUT", "600"))
+    PROVIDER_WARMUP_CONNECTIONS: int = int(os.getenv("PROVIDER_WARMUP_CONNECTIONS", "2"))
+
+    # Provider routing. Fallback chains are "provider:model>provider:model"
+    # lists separated by commas; the first fallback is also the hedge target.
+    ROUTER_FALLBACKS: str = os.getenv("ROUTER_FALLBACKS", "")
+    ROUTER_WINDOW: int = int(os.getenv("ROUTER_WINDOW", "200"))
+    ROUTER_HEDGE_PERCENTILE: float = float(os.getenv("ROUTER_HEDGE_PERCENTILE", "95"))
+    ROUTER_HEDGE_MIN_SAMPLES: int = int(os.getenv("ROUTER_HEDGE_MIN_SAMPLES", "20"))
+    ROUTER_HEDGE_DEFAULT_DELAY_MS: float = float(os.getenv("ROUTER_HEDGE_DEFAULT_DELAY_MS", "2000"))
+    ROUTER_HEDGE_MIN_DELAY_MS: float = float(os.getenv("ROUTER_HEDGE_MIN_DELAY_MS", "100"))
+    ROUTER_MAX_ERROR_RATE: float = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5"))
+
+    # Upstream admission control. Limits are "key=concurrency:rpm:tpm" entries
+    # separated by commas, keyed by provider or "provider:model"; 0 is unlimited.
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    ADMISSION_MAX_CONCURRENCY: int = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "64"))
+    ADMISSION_RPM: int = int(os.getenv("ADMISSION_RPM", "0"))
+    ADMISSION_TPM: int = int(os.getenv("ADMISSION_TPM", "0"))
+    ADMISSION_LIMITS: str = os.getenv("ADMISSION_LIMITS", "")
+    ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "256"))
+    ADMISSION_MAX_WAIT: float = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+
+    # Merge identical chat, stream and embedding calls that are in flight together
+    SINGLEFLIGHT_ENABLED: bool = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+
 config = Config()
@@ -1,7 +1,6 @@
 # DB memory stub
 
-from sqlalchemy import Column, Integer, String, DateTime, Text, func
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, Index, Integer, String, DateTime, Text, Uuid, func
 from pgvector.sqlalchemy import Vector
 from .config import Base
 import uuid
@@ -20,12 +19,33 @@ class MemoryEntry(Base):
     """
     __tablename__ = "memory_entries"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(String, nullable=False, index=True)  # TODO: FK to users table
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(String, nullable=False)  # TODO: FK to users table
     content = Column(Text, nullable=False)
-    embedding = Column(Vector(1536))  # OpenAI ada-002 dimensions
+    embedding = Column(Vector(1536))  # OpenAI ada-002 dimensions; NULL outside pgvector
     entry_metadata = Column(Text, nullable=True)  # Store as JSON string for tags, context
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Keyset pagination of a user's timeline; also serves user_id lookups.
+        # Both sort keys descend so ORDER BY and the row comparison in
+        # `get_timeline` are served by a single index range scan
+        Index(
+            "ix_memory_entries_user_created_id",
+            user_id,
+            created_at.desc(),
+            id.desc(),
+            postgresql_include=["entry_metadata"],
+        ),
+        # Approximate nearest-neighbour index for cosine distance (<=>)
+        Index(
+            "ix_memory_entries_embedding_hnsw",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
     
     def __repr__(self):
         return f"<Memory {self.id}: {self.content[:50]}...>"
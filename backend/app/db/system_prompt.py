@@ -0,0 +1,23 @@
+# DB model for system prompts
+
+from sqlalchemy import Column, DateTime, Integer, String, Text
+from .config import Base
+from datetime import datetime
+
+class SystemPromptEntry(Base):
+    """Represents a stored system prompt.
+
+    Attributes:
+        id: The unique ID of the prompt.
+        name: The unique name of the prompt.
+        content: The text content of the prompt.
+        description: An optional description of the prompt.
+        updated_at: The timestamp when the prompt was last written.
+    """
+    __tablename__ = "system_prompts"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String, nullable=False, unique=True)
+    content = Column(Text, nullable=False)
+    description = Column(Text, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,513 @@
+"""Pluggable vector storage for memory embeddings.
+
+`PgVectorStore` keeps embeddings in the `memory_entries.embedding` column and
+searches them with pgvector. `NumpyVectorStore` keeps them outside the
+database in per-user, memory-mapped float32 segments, so similarity search
+works on SQLite and single-node deployments without any external service.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import config
+from .config import engine
+from .memory import MemoryEntry
+
+logger = logging.getLogger(__name__)
+
+# A search hit: (memory id, cosine similarity)
+VectorHit = Tuple[str, float]
+
+# Rows copied at a time while compacting, to bound memory use
+_COMPACT_CHUNK_ROWS = 65536
+
+
+class VectorStore(ABC):
+    """An abstract base class for memory embedding stores."""
+
+    # Whether embeddings live in the memory_entries.embedding column
+    stores_in_rows: bool = False
+
+    @abstractmethod
+    async def add(self, user_id: str, ids: List[str], vectors: List[List[float]]) -> None:
+        """Indexes the embeddings of newly stored memories.
+
+        Args:
+            user_id: The ID of the user who owns the memories.
+            ids: The memory IDs.
+            vectors: The embeddings, in the same order as `ids`.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def search(
+        self,
+        db: AsyncSession,
+        user_id: str,
+        vector: List[float],
+        limit: int,
+        threshold: float,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+    ) -> List[VectorHit]:
+        """Finds the memories most similar to a query embedding.
+
+        Args:
+            db: The database session.
+            user_id: The ID of the user whose memories are searched.
+            vector: The query embedding.
+            limit: The maximum number of hits.
+            threshold: The minimum cosine similarity of a hit.
+            ef_search: An optional HNSW candidate list size.
+            probes: An optional number of IVFFlat lists to probe.
+
+        Returns:
+            Hits ordered from most to least similar.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, user_id: str, ids: List[str]) -> None:
+        """Removes memories from the index.
+
+        Args:
+            user_id: The ID of the user who owns the memories.
+            ids: The memory IDs.
+        """
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """Gets statistics about the store.
+
+        Returns:
+            A dictionary of backend-specific statistics.
+        """
+        return {"backend": type(self).__name__}
+
+
+class PgVectorStore(VectorStore):
+    """Stores embeddings in Postgres and searches them with pgvector."""
+    stores_in_rows = True
+
+    async def add(self, user_id: str, ids: List[str], vectors: List[List[float]]) -> None:
+        """Does nothing; embeddings are written with the memory rows."""
+
+    async def delete(self, user_id: str, ids: List[str]) -> None:
+        """Does nothing; embeddings are deleted with the memory rows."""
+
+    async def search(
+        self,
+        db: AsyncSession,
+        user_id: str,
+        vector: List[float],
+        limit: int,
+        threshold: float,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+    ) -> List[VectorHit]:
+        """Finds similar memories with an index-friendly k-NN query.
+
+        The nearest neighbours are found with `ORDER BY embedding <=> query
+        LIMIT k` so Postgres can use the vector index; the similarity
+        threshold is applied to those candidates afterwards.
+        """
+        # Index parameters are transaction-local, so they only affect this search
+        ef_search = max(ef_search or config.MEMORY_SEARCH_EF_SEARCH, limit)
+        await db.execute(
+            text("SELECT set_config('hnsw.ef_search', :value, true)"),
+            {"value": str(ef_search)}
+        )
+        if probes or config.MEMORY_SEARCH_PROBES:
+            await db.execute(
+                text("SELECT set_config('ivfflat.probes', :value, true)"),
+                {"value": str(probes or config.MEMORY_SEARCH_PROBES)}
+            )
+
+        sql = text("""
+            SELECT id, 1 - distance AS similarity
+            FROM (
+                SELECT id, embedding <=> :query_embedding AS distance
+                FROM memory_entries
+                WHERE user_id = :user_id
+                ORDER BY embedding <=> :query_embedding
+                LIMIT :limit
+            ) nearest
+            WHERE 1 - distance > :threshold
+            ORDER BY distance
+        """).bindparams(bindparam("query_embedding", type_=MemoryEntry.embedding.type))
+
+        result = await db.execute(sql, {
+            "query_embedding": vector,
+            "user_id": user_id,
+            "threshold": threshold,
+            "limit": limit
+        })
+        return [(str(row.id), float(row.similarity)) for row in result]
+
+
+class _Segment:
+    """An append-only pair of files holding float32 rows and their IDs.
+
+    `<name>.f32` holds unit-length rows of `dim` float32 values and
+    `<name>.ids` holds the matching 16-byte UUIDs. Vectors are written before
+    IDs, so a partially written append is ignored on load.
+    """
+    def __init__(self, directory: str, name: str, dim: int):
+        self.name = name
+        self.dim = dim
+        self.vectors_path = os.path.join(directory, f"{name}.f32")
+        self.ids_path = os.path.join(directory, f"{name}.ids")
+        self._maps: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    @property
+    def rows(self) -> int:
+        """The number of complete rows in the segment."""
+        try:
+            return os.path.getsize(self.ids_path) // 16
+        except FileNotFoundError:
+            return 0
+
+    def append(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """Appends rows to the segment files.
+
+        Args:
+            ids: A 1-D array of 16-byte UUIDs.
+            vectors: A 2-D float32 array of normalized rows.
+        """
+        with open(self.vectors_path, "ab") as f:
+            f.write(vectors.tobytes())
+        with open(self.ids_path, "ab") as f:
+            f.write(ids.tobytes())
+        self._maps = None
+
+    def load(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Memory-maps the segment.
+
+        Returns:
+            A tuple of the (rows, dim) vector matrix and the (rows,) ID array.
+        """
+        rows = self.rows
+        if self._maps is None or len(self._maps[1]) != rows:
+            if rows == 0:
+                return np.empty((0, self.dim), np.float32), np.empty(0, "V16")
+            vectors = np.memmap(self.vectors_path, np.float32, "r", shape=(rows, self.dim))
+            ids = np.memmap(self.ids_path, "V16", "r", shape=(rows,))
+            self._maps = (vectors, ids)
+        return self._maps
+
+    def repair(self) -> None:
+        """Truncates both files to the last complete row after a crash."""
+        try:
+            vector_rows = os.path.getsize(self.vectors_path) // (4 * self.dim)
+        except FileNotFoundError:
+            return
+        rows = min(self.rows, vector_rows)
+        for path, size in ((self.vectors_path, rows * 4 * self.dim), (self.ids_path, rows * 16)):
+            if os.path.getsize(path) != size:
+                os.truncate(path, size)
+
+    def remove(self) -> None:
+        """Deletes the segment files."""
+        self._maps = None
+        for path in (self.vectors_path, self.ids_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class _UserIndex:
+    """The segments, tombstones and manifest of one user's vectors."""
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._manifest_path = os.path.join(directory, "manifest.json")
+        self._deleted_path = os.path.join(directory, "deleted.ids")
+        manifest = {"dim": None, "segments": [], "next": 0}
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path) as f:
+                manifest = json.load(f)
+        self.dim: Optional[int] = manifest["dim"]
+        self._next = manifest["next"]
+        self.segments = [_Segment(directory, name, self.dim) for name in manifest["segments"]]
+        if self.segments:
+            self.segments[-1].repair()
+        self.deleted = self._load_deleted()
+        self._compacting: set = set()
+
+    def _load_deleted(self) -> np.ndarray:
+        try:
+            return np.unique(np.fromfile(self._deleted_path, "V16"))
+        except FileNotFoundError:
+            return np.empty(0, "V16")
+
+    def _write_manifest(self) -> None:
+        tmp_path = self._manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "dim": self.dim,
+                "segments": [s.name for s in self.segments],
+                "next": self._next,
+            }, f)
+        os.replace(tmp_path, self._manifest_path)
+
+    def _new_segment(self) -> _Segment:
+        segment = _Segment(self.directory, f"seg-{self._next:06d}", self.dim)
+        self._next += 1
+        self.segments.append(segment)
+        self._write_manifest()
+        return segment
+
+    @property
+    def rows(self) -> int:
+        return sum(s.rows for s in self.segments)
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """Appends rows to the active segment, sealing it when full."""
+        with self.lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+            active = self.segments[-1] if self.segments else None
+            if (
+                active is None
+                or active.rows >= config.VECTOR_STORE_SEGMENT_ROWS
+                or active.name in self._compacting
+            ):
+                active = self._new_segment()
+            active.append(ids, vectors)
+
+    def delete(self, ids: np.ndarray) -> None:
+        """Records tombstones for the given IDs."""
+        with self.lock:
+            with open(self._deleted_path, "ab") as f:
+                f.write(ids.tobytes())
+            self.deleted = np.union1d(self.deleted, ids)
+
+    def search(self, query: np.ndarray, limit: int) -> List[Tuple[bytes, float]]:
+        """Finds the top rows by dot product with a unit-length query."""
+        with self.lock:
+            segments, deleted = list(self.segments), self.deleted
+        candidate_scores, candidate_ids = [], []
+        for segment in segments:
+            vectors, ids = segment.load()
+            if not len(ids):
+                continue
+            scores = vectors @ query
+            if len(deleted):
+                scores[np.isin(ids, deleted)] = -np.inf
+            take = min(limit, len(scores))
+            top = np.argpartition(scores, len(scores) - take)[len(scores) - take:]
+            candidate_scores.append(scores[top])
+            candidate_ids.append(np.asarray(ids[top]))
+        if not candidate_scores:
+            return []
+        scores = np.concatenate(candidate_scores)
+        ids = np.concatenate(candidate_ids)
+        order = np.argsort(-scores)[:limit]
+        return [(ids[i].tobytes(), float(scores[i])) for i in order if np.isfinite(scores[i])]
+
+    def needs_compaction(self) -> bool:
+        """Whether enough sealed segments or tombstones have piled up."""
+        sealed = len(self.segments) - 1
+        rows = self.rows
+        return (
+            sealed >= config.VECTOR_STORE_COMPACT_SEGMENTS
+            or (rows and len(self.deleted) / rows > config.VECTOR_STORE_COMPACT_DELETED_RATIO)
+        )
+
+    def compact(self) -> None:
+        """Merges all current segments into one and drops deleted rows.
+
+        The merge runs without holding the lock, so searches and appends
+        continue meanwhile; appends go to a fresh segment that is kept as is.
+        """
+        with self.lock:
+            old = list(self.segments)
+            self._compacting = {s.name for s in old}
+            deleted = self.deleted
+            merged = _Segment(self.directory, f"seg-{self._next:06d}", self.dim)
+            self._next += 1
+        dropped = []
+        try:
+            for segment in old:
+                vectors, ids = segment.load()
+                for start in range(0, len(ids), _COMPACT_CHUNK_ROWS):
+                    chunk_vectors = vectors[start:start + _COMPACT_CHUNK_ROWS]
+                    chunk_ids = ids[start:start + _COMPACT_CHUNK_ROWS]
+                    if len(deleted):
+                        gone = np.isin(chunk_ids, deleted)
+                        dropped.append(np.asarray(chunk_ids[gone]))
+                        chunk_vectors, chunk_ids = chunk_vectors[~gone], chunk_ids[~gone]
+                    if len(chunk_ids):
+                        merged.append(np.asarray(chunk_ids), np.asarray(chunk_vectors))
+        except Exception:
+            merged.remove()
+            with self.lock:
+                self._compacting = set()
+            raise
+
+        with self.lock:
+            self.segments = [merged] + [s for s in self.segments if s.name not in self._compacting]
+            self._compacting = set()
+            self._write_manifest()
+            if dropped:
+                self.deleted = np.setdiff1d(self.deleted, np.concatenate(dropped))
+                tmp_path = self._deleted_path + ".tmp"
+                self.deleted.tofile(tmp_path)
+                os.replace(tmp_path, self._deleted_path)
+        # Open memory maps of the old files stay valid after unlinking
+        for segment in old:
+            segment.remove()
+
+
+class NumpyVectorStore(VectorStore):
+    """Stores embeddings in per-user, memory-mapped float32 segment files.
+
+    Rows are normalized on insert, so cosine similarity is a single
+    matrix-vector product per segment followed by an `argpartition` top-k.
+    New rows are appended to the active segment; once enough sealed segments
+    or deleted rows accumulate, the user's segments are compacted into one in
+    a background thread.
+    """
+    def __init__(self, directory: str):
+        """Initializes the store.
+
+        Args:
+            directory: The root directory for all users' segment files.
+        """
+        self.directory = directory
+        self._indexes: Dict[str, _UserIndex] = {}
+        self._lock = threading.Lock()
+        self._compacting: set = set()
+        self._tasks: set = set()
+
+    def _index(self, user_id: str) -> _UserIndex:
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                user_dir = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32]
+                index = _UserIndex(os.path.join(self.directory, user_dir))
+                self._indexes[user_id] = index
+            return index
+
+    @staticmethod
+    def _pack_ids(ids: List[str]) -> np.ndarray:
+        return np.array([uuid.UUID(str(i)).bytes for i in ids], dtype="V16")
+
+    @staticmethod
+    def _normalize(vectors: List[List[float]]) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix[np.newaxis, :]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+    async def add(self, user_id: str, ids: List[str], vectors: List[List[float]]) -> None:
+        """Appends normalized embeddings to the user's active segment."""
+        if not ids:
+            return
+        index = self._index(user_id)
+        await asyncio.to_thread(index.add, self._pack_ids(ids), self._normalize(vectors))
+        self._maybe_compact(user_id, index)
+
+    async def delete(self, user_id: str, ids: List[str]) -> None:
+        """Records tombstones so deleted memories are skipped by searches."""
+        if not ids:
+            return
+        index = self._index(user_id)
+        await asyncio.to_thread(index.delete, self._pack_ids(ids))
+        self._maybe_compact(user_id, index)
+
+    async def search(
+        self,
+        db: AsyncSession,
+        user_id: str,
+        vector: List[float],
+        limit: int,
+        threshold: float,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+    ) -> List[VectorHit]:
+        """Finds similar memories with an exact vectorized scan.
+
+        `ef_search` and `probes` are ignored because the scan is exact.
+        """
+        index = self._index(user_id)
+        query = self._normalize(vector)[0]
+        if index.dim is not None and len(query) != index.dim:
+            raise ValueError(f"Expected a {index.dim}-dimensional query, got {len(query)}")
+        hits = await asyncio.to_thread(index.search, query, limit)
+        return [
+            (str(uuid.UUID(bytes=memory_id)), similarity)
+            for memory_id, similarity in hits
+            if similarity > threshold
+        ]
+
+    def _maybe_compact(self, user_id: str, index: _UserIndex) -> None:
+        """Starts a background compaction for a user if one is due."""
+        if user_id in self._compacting or not index.needs_compaction():
+            return
+        self._compacting.add(user_id)
+
+        async def run():
+            try:
+                await asyncio.to_thread(index.compact)
+            except Exception as e:
+                logger.error(f"Vector store compaction failed for {user_id}: {e}")
+            finally:
+                self._compacting.discard(user_id)
+
+        task = asyncio.get_running_loop().create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> dict:
+        """Gets the number of loaded users, segments and vectors."""
+        with self._lock:
+            indexes = list(self._indexes.values())
+        return {
+            "backend": type(self).__name__,
+            "users": len(indexes),
+            "segments": sum(len(i.segments) for i in indexes),
+            "vectors": sum(i.rows for i in indexes),
+            "deleted": sum(len(i.deleted) for i in indexes),
+        }
+
+
+def create_vector_store(backend: str) -> VectorStore:
+    """Creates the configured vector store.
+
+    Args:
+        backend: "pgvector" or "numpy".
+
+    Returns:
+        The vector store.
+
+    Raises:
+        ValueError: If the backend is unknown.
+    """
+    if backend == "pgvector":
+        return PgVectorStore()
+    if backend == "numpy":
+        return NumpyVectorStore(config.VECTOR_STORE_DIR)
+    raise ValueError(f"Unknown vector store backend '{backend}'")
+
+
+vector_store = create_vector_store(
+    config.VECTOR_STORE_BACKEND
+    or ("pgvector" if engine.dialect.name == "postgresql" else "numpy")
+)
@@ -3,9 +3,16 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
-from .api import chat, auth, workflow, plugin, system_prompt, memory
+from contextlib import asynccontextmanager
+from .api import chat, auth, workflow, plugin, system_prompt, memory, jobs, attachments
 from .config import config
+from .db.config import engine, pool_stats
+from .models.registry import provider_registry
+from .utils.embedding_cache import embedding_cache
+from .utils.history_compactor import history_compactor
+from .utils.response_cache import response_cache
 from dotenv import load_dotenv
+import asyncio
 import os
 import logging
 
@@ -16,10 +23,41 @@ load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Manages resources that live for the whole application.
+
+    Pre-opens pooled connections to the model providers and starts the
+    plugin worker processes, the code interpreter sandboxes and the
+    background job workers on startup. On shutdown, running jobs are handed
+    back to the queue, the plugin workers and sandboxes exit and connections
+    to providers, caches and databases are closed cleanly.
+    """
+    await provider_registry.warm_up()
+    if config.PLUGIN_WARM_START:
+        await plugin.plugin_pool.start()
+        await plugin.sandbox_pool.start()
+    if config.JOB_WORKERS > 0:
+        await jobs.job_workers.start()
+    yield
+    await jobs.job_workers.stop()
+    await provider_registry.close()
+    await embedding_cache.close()
+    await response_cache.close()
+    await history_compactor.close()
+    await workflow.workflow_engine.close()
+    # Joins the prompt writer off the event loop; close() bounds the wait
+    await asyncio.to_thread(system_prompt.prompt_store.close)
+    plugin.plugin_pool.shutdown()
+    await plugin.sandbox_pool.close()
+    await plugin.plugin_cache.close()
+    await engine.dispose()
+
 app = FastAPI(
     title="MGDI API",
     description="Multimodal GPT Dev Interface",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -41,6 +79,15 @@ async def health_check():
     """
     return {"status": "healthy", "version": "0.1.0"}
 
+@app.get("/health/db")
+async def database_health():
+    """Returns database connection pool usage.
+
+    Returns:
+        A dictionary with pool occupancy, saturation and checkout wait times.
+    """
+    return pool_stats()
+
 # API Routers
 app.include_router(system_prompt.router, prefix='/api/system', tags=["System"])
 app.include_router(chat.router, prefix='/api/chat', tags=["Chat"])
@@ -48,6 +95,8 @@ app.include_router(auth.router, prefix='/api/auth', tags=["Auth"])
 app.include_router(workflow.router, prefix='/api/workflow', tags=["Workflow"])
 app.include_router(plugin.router, prefix='/api/plugin', tags=["Plugin"])
 app.include_router(memory.router, prefix='/api/memory', tags=["Memory"])
+app.include_router(jobs.router, prefix='/api/jobs', tags=["Jobs"])
+app.include_router(attachments.router, prefix='/api/attachments', tags=["Attachments"])
 
 # Serve static files for frontend
 if os.path.exists("../frontend/dist"):
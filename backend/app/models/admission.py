@@ -0,0 +1,375 @@
+"""Admission control for upstream model provider calls.
+
+Every upstream call must be admitted before it is sent. Calls are grouped
+into gates, one per configured provider or provider/model limit, and each
+gate enforces:
+
+* a concurrency limit, held for the whole call (for streams, until the
+  stream is closed);
+* requests-per-minute and tokens-per-minute token buckets, charged with the
+  prompt tokens plus `max_tokens`, the way the providers account for rate
+  limits themselves.
+
+When a gate is full, callers wait in a bounded priority queue where
+interactive requests are served before batch work. A call that would wait
+longer than `ADMISSION_MAX_WAIT`, or that finds the queue full, is shed
+with `AdmissionRejected`, which the API turns into a 503 with Retry-After.
+Shedding early is cheaper than letting the provider answer with 429s that
+clients then retry.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from fastapi import HTTPException
+
+from ..config import config
+
+T = TypeVar("T")
+
+PRIORITIES: Dict[str, int] = {"interactive": 0, "batch": 1}
+
+# The priority of upstream calls made by the current request
+request_priority: ContextVar[str] = ContextVar("request_priority", default="interactive")
+
+
+@contextmanager
+def admission_priority(name: str) -> Iterator[None]:
+    """Sets the priority of upstream calls made inside the block.
+
+    Args:
+        name: "interactive" or "batch".
+
+    Raises:
+        ValueError: If the priority is unknown.
+    """
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {name!r}")
+    token = request_priority.set(name)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+class AdmissionRejected(Exception):
+    """Raised when an upstream call is shed instead of being queued."""
+    def __init__(self, key: str, reason: str, retry_after: float):
+        super().__init__(f"{key} is overloaded ({reason}), retry after {math.ceil(retry_after)}s")
+        self.key = key
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def overloaded(error: AdmissionRejected) -> HTTPException:
+    """Converts a shed call into a 503 response with Retry-After.
+
+    Args:
+        error: The rejection.
+
+    Returns:
+        The HTTP exception to raise.
+    """
+    return HTTPException(
+        status_code=503, detail=str(error), headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+@dataclass(frozen=True)
+class Limits:
+    """Limits for one gate; 0 means unlimited.
+
+    Attributes:
+        concurrency: The maximum number of calls in flight.
+        rpm: The maximum number of requests per minute.
+        tpm: The maximum number of tokens per minute.
+    """
+    concurrency: int = 0
+    rpm: int = 0
+    tpm: int = 0
+
+
+def parse_limits(spec: str) -> Dict[str, Limits]:
+    """Parses limits from a "key=concurrency:rpm:tpm,key=..." string.
+
+    Keys are a provider ("openai") or a provider and model ("openai:gpt-4").
+
+    Args:
+        spec: The limits specification.
+
+    Returns:
+        A mapping of key to limits.
+
+    Raises:
+        ValueError: If an entry is malformed.
+    """
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        key, sep, values = entry.partition("=")
+        numbers = values.split(":")
+        if not sep or not key.strip() or len(numbers) != 3:
+            raise ValueError(f"Invalid admission limit entry: {entry!r}")
+        limits[key.strip().lower()] = Limits(*(int(n) for n in numbers))
+    return limits
+
+
+class TokenBucket:
+    """A token bucket refilled continuously at a per-minute rate.
+
+    The bucket may go into debt: a reservation always succeeds and returns
+    how long the caller has to wait for the tokens to exist.
+    """
+    def __init__(self, per_minute: int):
+        """Initializes a full bucket.
+
+        Args:
+            per_minute: The refill rate, which is also the capacity.
+        """
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Takes tokens from the bucket.
+
+        Args:
+            amount: The tokens to take; capped at the capacity so that any
+                single request can eventually be admitted.
+
+        Returns:
+            The seconds until the reserved tokens are available.
+        """
+        self._refill()
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+    def refund(self, amount: float) -> None:
+        """Returns tokens from a reservation that was not used.
+
+        Args:
+            amount: The tokens to return.
+        """
+        self._refill()
+        self.level = min(self.capacity, self.level + min(amount, self.capacity))
+
+
+class _Gate:
+    """The concurrency slots, rate buckets and wait queue of one key."""
+    def __init__(self, key: str, limits: Limits):
+        self.key = key
+        self.limits = limits
+        self.requests = TokenBucket(limits.rpm) if limits.rpm > 0 else None
+        self.tokens = TokenBucket(limits.tpm) if limits.tpm > 0 else None
+        self.in_flight = 0
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def enter(self, priority: int, max_queue: int, max_wait: float) -> None:
+        """Takes a concurrency slot, queueing for at most `max_wait` seconds."""
+        if self.limits.concurrency <= 0 or (self.in_flight < self.limits.concurrency and not self.waiters):
+            self.in_flight += 1
+            return
+        if len(self.waiters) >= max_queue:
+            self.shed += 1
+            raise AdmissionRejected(self.key, "queue full", max_wait)
+        self.queued += 1
+        waiter = (priority, next(self._order), asyncio.get_running_loop().create_future())
+        heapq.heappush(self.waiters, waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[2]), max_wait)
+        except asyncio.TimeoutError:
+            if waiter[2].done():
+                return
+            self._forget(waiter)
+            self.shed += 1
+            raise AdmissionRejected(self.key, "queue timeout", max_wait)
+        except asyncio.CancelledError:
+            self._forget(waiter)
+            raise
+
+    def _forget(self, waiter: Tuple[int, int, asyncio.Future]) -> None:
+        """Removes a waiter that gave up, passing on a slot it was just handed."""
+        if waiter[2].done():
+            self.leave()
+            return
+        waiter[2].cancel()
+        self.waiters.remove(waiter)
+        heapq.heapify(self.waiters)
+
+    def leave(self) -> None:
+        """Releases a slot, handing it straight to the next waiter if any."""
+        if self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            future.set_result(None)
+            return
+        self.in_flight -= 1
+
+    def reserve(self, tokens: int) -> float:
+        """Charges the rate buckets and returns the seconds to wait."""
+        delays = [0.0]
+        if self.requests is not None:
+            delays.append(self.requests.reserve(1))
+        if self.tokens is not None:
+            delays.append(self.tokens.reserve(tokens))
+        return max(delays)
+
+    def refund(self, tokens: int) -> None:
+        """Undoes a reservation for a call that will not be sent."""
+        if self.requests is not None:
+            self.requests.refund(1)
+        if self.tokens is not None:
+            self.tokens.refund(tokens)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": len(self.waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+            "avg_wait_ms": round(self.wait_total / self.admitted * 1000, 2) if self.admitted else 0.0,
+            "max_wait_ms": round(self.wait_max * 1000, 2),
+            "limits": {"concurrency": self.limits.concurrency, "rpm": self.limits.rpm, "tpm": self.limits.tpm},
+        }
+
+
+class Ticket:
+    """Proof of admission; must be released when the call is finished."""
+    def __init__(self, gate: Optional[_Gate]):
+        self._gate = gate
+
+    def bind(self, stream: T) -> T:
+        """Ties the ticket to a stream so it is released if the stream is
+        dropped without ever being iterated or closed.
+
+        Args:
+            stream: The stream that holds the ticket.
+
+        Returns:
+            The stream.
+        """
+        weakref.finalize(stream, self.release)
+        return stream
+
+    def release(self) -> None:
+        """Frees the concurrency slot. Releasing twice is harmless."""
+        gate, self._gate = self._gate, None
+        if gate is not None:
+            gate.leave()
+
+
+class AdmissionController:
+    """Admits upstream calls through per-provider and per-model gates."""
+    def __init__(
+        self,
+        enabled: bool,
+        default: Limits,
+        overrides: Dict[str, Limits],
+        max_queue: int,
+        max_wait: float,
+    ):
+        """Initializes the controller.
+
+        Args:
+            enabled: Whether calls are limited at all.
+            default: The limits of each provider without an override.
+            overrides: Limits keyed by provider or by "provider:model". A
+                provider key is shared by all of its models that have no
+                model key of their own.
+            max_queue: The most calls that may wait at one gate.
+            max_wait: The longest time in seconds a call may wait for a
+                slot and for rate budget combined.
+        """
+        self.enabled = enabled
+        self.default = default
+        self.overrides = overrides
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._gates: Dict[str, _Gate] = {}
+
+    def _gate(self, provider: str, model: str) -> _Gate:
+        """Gets the gate a call is admitted through, creating it if needed."""
+        key = f"{provider}:{model}".lower()
+        if key not in self.overrides:
+            key = provider.lower()
+        gate = self._gates.get(key)
+        if gate is None:
+            gate = self._gates[key] = _Gate(key, self.overrides.get(key, self.default))
+        return gate
+
+    async def acquire(self, provider: str, model: str, tokens: int = 0) -> Ticket:
+        """Waits until a call may be sent.
+
+        Args:
+            provider: The provider the call goes to.
+            model: The model the call is for.
+            tokens: The tokens the call is charged for.
+
+        Returns:
+            A ticket to release when the call has finished.
+
+        Raises:
+            AdmissionRejected: If the call is shed.
+        """
+        if not self.enabled:
+            return Ticket(None)
+        gate = self._gate(provider, model)
+        started = time.monotonic()
+        await gate.enter(PRIORITIES[request_priority.get()], self.max_queue, self.max_wait)
+        try:
+            delay = gate.reserve(tokens)
+            waited = time.monotonic() - started
+            if waited + delay > self.max_wait:
+                gate.refund(tokens)
+                gate.shed += 1
+                raise AdmissionRejected(gate.key, "rate limit", delay)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            gate.leave()
+            raise
+        waited = time.monotonic() - started
+        gate.admitted += 1
+        gate.wait_total += waited
+        gate.wait_max = max(gate.wait_max, waited)
+        return Ticket(gate)
+
+    def stats(self) -> dict:
+        """Gets admission counters and queue-time metrics per gate.
+
+        Returns:
+            A dictionary with the controller settings and per-gate stats.
+        """
+        return {
+            "enabled": self.enabled,
+            "max_queue": self.max_queue,
+            "max_wait_seconds": self.max_wait,
+            "gates": {key: gate.stats() for key, gate in self._gates.items()},
+        }
+
+
+admission_controller = AdmissionController(
+    enabled=config.ADMISSION_ENABLED,
+    default=Limits(config.ADMISSION_MAX_CONCURRENCY, config.ADMISSION_RPM, config.ADMISSION_TPM),
+    overrides=parse_limits(config.ADMISSION_LIMITS),
+    max_queue=config.ADMISSION_MAX_QUEUE,
+    max_wait=config.ADMISSION_MAX_WAIT,
+)
@@ -1,6 +1,9 @@
-from typing import AsyncGenerator, Dict, Any
+from typing import AsyncGenerator, Dict, Any, Optional
+import httpx
 import anthropic
 from ..config import config
+from ..utils.token_counter import count_messages
+from .admission import Ticket, admission_controller
 from .base import BaseModelProvider
 
 class AnthropicProvider(BaseModelProvider):
@@ -9,15 +12,22 @@ class AnthropicProvider(BaseModelProvider):
     This class provides methods for generating text and getting available models
     from the Anthropic API.
     """
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
         """Initializes the Anthropic provider.
 
+        Args:
+            http_client: An optional shared HTTP client whose connection pool
+                should be used for all API calls.
+
         Raises:
             ValueError: If the ANTHROPIC_API_KEY is not set.
         """
         if not config.ANTHROPIC_API_KEY:
             raise ValueError("ANTHROPIC_API_KEY is required")
-        self.client = anthropic.AsyncAnthropic(api_key=config.ANTHROPIC_API_KEY)
+        client_kwargs = {}
+        if http_client is not None:
+            client_kwargs = {"http_client": http_client, "timeout": http_client.timeout}
+        self.client = anthropic.AsyncAnthropic(api_key=config.ANTHROPIC_API_KEY, **client_kwargs)
     
     async def generate(
         self, 
@@ -42,8 +52,11 @@ class AnthropicProvider(BaseModelProvider):
             The generated text, or an async generator of text chunks if streaming.
 
         Raises:
+            AdmissionRejected: If the call is shed by admission control.
             Exception: If an error occurs with the Anthropic API.
         """
+        ticket = await admission_controller.acquire("anthropic", model, count_messages(model, messages) + max_tokens)
+        streaming = False
         try:
             # Convert messages to Anthropic format
             system_messages = [m for m in messages if m["role"] == "system"]
@@ -62,25 +75,36 @@ class AnthropicProvider(BaseModelProvider):
             )
             
             if stream:
-                return self._stream_response(response)
+                # The stream keeps the admission slot until it is closed
+                streaming = True
+                return ticket.bind(self._stream_response(response, ticket))
             else:
                 return response.content[0].text
                 
         except Exception as e:
             raise Exception(f"Anthropic API error: {str(e)}")
+        finally:
+            if not streaming:
+                ticket.release()
     
-    async def _stream_response(self, response) -> AsyncGenerator[str, None]:
+    async def _stream_response(self, response, ticket: Ticket) -> AsyncGenerator[str, None]:
         """Streams response chunks from the Anthropic API.
 
         Args:
             response: The response from the Anthropic API.
+            ticket: The admission ticket to release when the stream ends.
 
         Yields:
             Text chunks from the response.
         """
-        async for chunk in response:
-            if chunk.type == "content_block_delta":
-                yield chunk.delta.text
+        try:
+            async for chunk in response:
+                if chunk.type == "content_block_delta":
+                    yield chunk.delta.text
+        finally:
+            # Release the HTTP connection even if the consumer stops early
+            ticket.release()
+            await response.response.aclose()
     
     def get_available_models(self) -> list[str]:
         """Gets a list of available models from the Anthropic API.
@@ -1,7 +1,14 @@
 import asyncio
 from typing import AsyncGenerator, Optional, Dict, Any, List
+import httpx
 import openai
 from ..config import config
+from ..utils.embedding_batcher import EmbeddingBatcher
+from ..utils.cache import stable_hash
+from ..utils.embedding_cache import embedding_cache
+from ..utils.singleflight import SingleFlight
+from ..utils.token_counter import count_messages, count_text
+from .admission import Ticket, admission_controller
 from .base import BaseModelProvider
 
 class OpenAIProvider(BaseModelProvider):
@@ -10,15 +17,24 @@ class OpenAIProvider(BaseModelProvider):
     This class provides methods for generating text, getting embeddings, and
     getting available models from the OpenAI API.
     """
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
         """Initializes the OpenAI provider.
 
+        Args:
+            http_client: An optional shared HTTP client whose connection pool
+                should be used for all API calls.
+
         Raises:
             ValueError: If the OPENAI_API_KEY is not set.
         """
         if not config.OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY is required")
-        self.client = openai.AsyncOpenAI(api_key=config.OPENAI_API_KEY)
+        client_kwargs = {}
+        if http_client is not None:
+            client_kwargs = {"http_client": http_client, "timeout": http_client.timeout}
+        self.client = openai.AsyncOpenAI(api_key=config.OPENAI_API_KEY, **client_kwargs)
+        self._embedding_batchers: Dict[str, EmbeddingBatcher] = {}
+        self.embedding_flights = SingleFlight(config.SINGLEFLIGHT_ENABLED)
     
     async def generate(
         self, 
@@ -43,8 +59,11 @@ class OpenAIProvider(BaseModelProvider):
             The generated text, or an async generator of text chunks if streaming.
 
         Raises:
+            AdmissionRejected: If the call is shed by admission control.
             Exception: If an error occurs with the OpenAI API.
         """
+        ticket = await admission_controller.acquire("openai", model, count_messages(model, messages) + max_tokens)
+        streaming = False
         try:
             response = await self.client.chat.completions.create(
                 model=model,
@@ -56,31 +75,48 @@ class OpenAIProvider(BaseModelProvider):
             )
             
             if stream:
-                return self._stream_response(response)
+                # The stream keeps the admission slot until it is closed
+                streaming = True
+                return ticket.bind(self._stream_response(response, ticket))
             else:
                 return response.choices[0].message.content
                 
         except Exception as e:
             raise Exception(f"OpenAI API error: {str(e)}")
+        finally:
+            if not streaming:
+                ticket.release()
     
-    async def _stream_response(self, response) -> AsyncGenerator[str, None]:
+    async def _stream_response(self, response, ticket: Ticket) -> AsyncGenerator[str, None]:
         """Streams response chunks from the OpenAI API.
 
         Args:
             response: The response from the OpenAI API.
+            ticket: The admission ticket to release when the stream ends.
 
         Yields:
             Text chunks from the response.
         """
-        async for chunk in response:
-            if chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
+        try:
+            async for chunk in response:
+                if chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Release the HTTP connection even if the consumer stops early
+            ticket.release()
+            await response.response.aclose()
     
-    async def get_embedding(self, text: str) -> List[float]:
+    async def get_embedding(self, text: str, model: str = config.EMBEDDING_MODEL) -> List[float]:
         """Generates a text embedding for vector storage.
 
+        Embeddings are served from the shared embedding cache when the same
+        text was embedded before with the same model. Misses are coalesced
+        with concurrent calls into batched upstream requests, and concurrent
+        calls for the same text share a single lookup.
+
         Args:
             text: The text to get an embedding for.
+            model: The embedding model to use.
 
         Returns:
             A list of floats representing the embedding.
@@ -88,14 +124,76 @@ class OpenAIProvider(BaseModelProvider):
         Raises:
             Exception: If an error occurs with the OpenAI API.
         """
+        cached = await embedding_cache.get(model, text)
+        if cached is not None:
+            return cached
+
+        async def fetch():
+            embedding = await self._get_batcher(model).embed(text)
+            await embedding_cache.set(model, text, embedding)
+            return embedding
+
+        embedding, _ = await self.embedding_flights.do(stable_hash(model, text), fetch)
+        return embedding
+
+    async def get_embeddings(self, texts: List[str], model: str = config.EMBEDDING_MODEL) -> List[List[float]]:
+        """Generates embeddings for several texts in one API request.
+
+        Args:
+            texts: The texts to get embeddings for.
+            model: The embedding model to use.
+
+        Returns:
+            The embeddings, in the same order as `texts`.
+
+        Raises:
+            AdmissionRejected: If the call is shed by admission control.
+            openai.APIStatusError: If the API answers with an error status.
+            Exception: If another error occurs with the OpenAI API.
+        """
+        ticket = await admission_controller.acquire("openai", model, sum(count_text(model, text) for text in texts))
         try:
             response = await self.client.embeddings.create(
-                model="text-embedding-ada-002",
-                input=text
+                model=model,
+                input=texts
             )
-            return response.data[0].embedding
+        except openai.APIStatusError:
+            # Keeps `status_code`, which tells the batcher bad inputs from overload
+            raise
         except Exception as e:
-            raise Exception(f"OpenAI embedding error: {str(e)}")
+            raise Exception(f"OpenAI embedding error: {str(e)}") from e
+        finally:
+            ticket.release()
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def _get_batcher(self, model: str) -> EmbeddingBatcher:
+        """Gets the embedding batcher for a model, creating it if needed.
+
+        Args:
+            model: The embedding model.
+
+        Returns:
+            The batcher for the model.
+        """
+        batcher = self._embedding_batchers.get(model)
+        if batcher is None:
+            batcher = EmbeddingBatcher(
+                lambda texts: self.get_embeddings(texts, model),
+                max_batch=config.EMBEDDING_BATCH_SIZE,
+                max_wait=config.EMBEDDING_BATCH_WINDOW_MS / 1000,
+                max_tokens=config.EMBEDDING_BATCH_MAX_TOKENS,
+                count_tokens=lambda text: count_text(model, text),
+            )
+            self._embedding_batchers[model] = batcher
+        return batcher
+
+    def embedding_stats(self) -> Dict[str, dict]:
+        """Gets embedding batching counters.
+
+        Returns:
+            A dictionary of batcher statistics per embedding model.
+        """
+        return {model: batcher.stats() for model, batcher in self._embedding_batchers.items()}
     
     def get_available_models(self) -> list[str]:
         """Gets a list of available models from the OpenAI API.
@@ -0,0 +1,152 @@
+"""A process-wide registry of model providers.
+
+Providers are built once per process and each one owns a tuned
+``httpx.AsyncClient``, so keep-alive connections and TLS sessions are reused
+across requests instead of being thrown away with a per-call SDK client.
+"""
+import asyncio
+import logging
+from collections.abc import Mapping
+from typing import Callable, Dict, Iterator, List
+
+import httpx
+
+from ..config import config
+from .anthropic import AnthropicProvider
+from .base import BaseModelProvider
+from .openai import OpenAIProvider
+
+logger = logging.getLogger(__name__)
+
+ProviderFactory = Callable[..., BaseModelProvider]
+
+
+def build_http_client() -> httpx.AsyncClient:
+    """Builds an HTTP client with the configured connection pool limits.
+
+    Returns:
+        A new `httpx.AsyncClient`.
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=config.PROVIDER_MAX_CONNECTIONS,
+            max_keepalive_connections=config.PROVIDER_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.PROVIDER_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            config.PROVIDER_REQUEST_TIMEOUT,
+            connect=config.PROVIDER_CONNECT_TIMEOUT,
+        ),
+    )
+
+
+class ProviderRegistry(Mapping):
+    """A read-only mapping of provider name to a shared provider instance.
+
+    Providers are created lazily on first access (or by `warm_up`), and a
+    provider whose API key is missing is skipped with a warning, exactly as
+    if it had never been registered. After `close` the registry can be
+    reopened, which builds fresh clients.
+    """
+    def __init__(self, factories: Dict[str, ProviderFactory]):
+        """Initializes the registry.
+
+        Args:
+            factories: A mapping of provider name to a callable that accepts
+                an ``http_client`` keyword argument and returns a provider.
+        """
+        self._factories = factories
+        self._providers: Dict[str, BaseModelProvider] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        # Clients built for providers that turned out to be unconfigured;
+        # `open` cannot await, so they are closed by `close`
+        self._unused: List[httpx.AsyncClient] = []
+        self._opened = False
+
+    def open(self) -> None:
+        """Builds the providers and their HTTP clients if not already built."""
+        if self._opened:
+            return
+        for name, factory in self._factories.items():
+            client = build_http_client()
+            try:
+                self._providers[name] = factory(http_client=client)
+            except ValueError as e:
+                logger.warning(f"{name} provider disabled: {e}")
+                self._unused.append(client)
+                continue
+            self._clients[name] = client
+        self._opened = True
+
+    def require(self, name: str) -> BaseModelProvider:
+        """Gets a provider, failing if it is not configured.
+
+        Args:
+            name: The name of the provider.
+
+        Returns:
+            The shared provider instance.
+
+        Raises:
+            ValueError: If the provider is not registered or not configured.
+        """
+        provider = self.get(name)
+        if provider is None:
+            raise ValueError(f"Provider '{name}' is not configured")
+        return provider
+
+    async def warm_up(self) -> None:
+        """Pre-opens pooled connections to every configured provider.
+
+        Failures are logged and ignored; the pool will simply connect on
+        first use instead.
+        """
+        self.open()
+        await asyncio.gather(*(
+            self._warm_provider(name) for name in self._providers
+        ))
+
+    async def _warm_provider(self, name: str) -> None:
+        """Opens `PROVIDER_WARMUP_CONNECTIONS` connections to a provider.
+
+        Args:
+            name: The name of the provider to warm up.
+        """
+        client = self._clients[name]
+        url = str(self._providers[name].client.base_url)
+        results = await asyncio.gather(*(
+            client.head(url, timeout=config.PROVIDER_CONNECT_TIMEOUT)
+            for _ in range(config.PROVIDER_WARMUP_CONNECTIONS)
+        ), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            logger.warning(f"Warm-up for {name} provider failed: {errors[0]}")
+
+    async def close(self) -> None:
+        """Closes all pooled connections and forgets the providers."""
+        clients = [*self._clients.values(), *self._unused]
+        self._providers.clear()
+        self._clients.clear()
+        self._unused.clear()
+        self._opened = False
+        await asyncio.gather(
+            *(client.aclose() for client in clients), return_exceptions=True
+        )
+
+    def __getitem__(self, name: str) -> BaseModelProvider:
+        self.open()
+        return self._providers[name]
+
+    def __iter__(self) -> Iterator[str]:
+        self.open()
+        return iter(self._providers)
+
+    def __len__(self) -> int:
+        self.open()
+        return len(self._providers)
+
+
+provider_registry = ProviderRegistry({
+    "openai": OpenAIProvider,
+    "anthropic": AnthropicProvider,
+})
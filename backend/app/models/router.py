@@ -0,0 +1,429 @@
+"""Latency-aware routing of chat requests across providers.
+
+The router keeps a rolling window of latencies and outcomes for every
+provider/model pair. On top of those statistics it offers two per-request
+strategies:
+
+* Fallback: if a model fails, the request is retried on the next model in its
+  configured fallback chain. Models whose recent error rate is too high are
+  skipped while a healthier alternative remains.
+* Hedging: if the primary model has not answered by the time most of its
+  recent requests had (a configurable latency percentile), a second request
+  is sent to the first model in the fallback chain. Whichever answers first
+  wins and the other request is cancelled.
+
+For streams, latency is the time to the first chunk; once a stream has
+produced its first chunk it is committed to and no longer rerouted.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import (
+    Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Mapping, Optional, Tuple
+)
+
+import numpy as np
+
+from ..config import config
+from .admission import AdmissionRejected
+from .base import BaseModelProvider
+from .registry import provider_registry
+
+logger = logging.getLogger(__name__)
+
+Target = Tuple[str, str]
+
+
+def parse_fallback_chains(spec: str) -> Dict[Target, List[Target]]:
+    """Parses fallback chains from a "p:model>p:model,p:model>p:model" string.
+
+    Each comma-separated chain starts with the model it applies to, followed
+    by the models to try instead, in order.
+
+    Args:
+        spec: The fallback chain specification.
+
+    Returns:
+        A mapping of (provider, model) to its fallback targets.
+
+    Raises:
+        ValueError: If a chain entry is malformed.
+    """
+    chains = {}
+    for chain in filter(None, (part.strip() for part in spec.split(","))):
+        targets = []
+        for entry in chain.split(">"):
+            provider, sep, model = entry.strip().partition(":")
+            if not sep or not provider or not model:
+                raise ValueError(f"Invalid fallback target: {entry!r}")
+            targets.append((provider.lower(), model))
+        chains[targets[0]] = targets[1:]
+    return chains
+
+
+class LatencyTracker:
+    """A rolling window of latencies and outcomes for one provider/model."""
+    def __init__(self, window: int):
+        """Initializes the tracker.
+
+        Args:
+            window: The number of recent requests to keep.
+        """
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+
+    def record(self, latency: Optional[float], ok: bool) -> None:
+        """Records a finished request.
+
+        Args:
+            latency: The seconds the request took, if it succeeded.
+            ok: Whether the request succeeded.
+        """
+        self.requests += 1
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+        else:
+            self.errors += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Gets a latency percentile over the window.
+
+        Args:
+            q: The percentile, between 0 and 100.
+
+        Returns:
+            The latency in seconds, or None without samples.
+        """
+        if not self.latencies:
+            return None
+        return float(np.percentile(np.fromiter(self.latencies, dtype=np.float64), q))
+
+    @property
+    def error_rate(self) -> float:
+        """The share of failed requests over the window."""
+        if not self.outcomes:
+            return 0.0
+        return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    def stats(self) -> dict:
+        """Gets latency and error statistics.
+
+        Returns:
+            A dictionary with request counts, error rate and p50/p99 latency.
+        """
+        p50, p99 = self.percentile(50), self.percentile(99)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": self.error_rate,
+            "p50_ms": p50 * 1000 if p50 is not None else None,
+            "p99_ms": p99 * 1000 if p99 is not None else None,
+            "samples": len(self.latencies),
+        }
+
+
+@dataclass
+class RouteResult:
+    """The outcome of a routed request.
+
+    Attributes:
+        value: The generated text, or an async iterator of chunks for streams.
+        provider: The provider that served the request.
+        model: The model that served the request.
+        hedged: Whether a hedge request was sent.
+        attempts: The (provider, model) pairs that failed before this one.
+    """
+    value: Any
+    provider: str
+    model: str
+    hedged: bool = False
+    attempts: List[str] = field(default_factory=list)
+
+
+class _Stream:
+    """A provider stream whose first chunk has already been read."""
+    def __init__(self, first: Optional[str], rest: AsyncIterator[str]):
+        self.first = first
+        self.rest = rest
+
+    async def __aiter__(self):
+        try:
+            if self.first is not None:
+                yield self.first
+                async for chunk in self.rest:
+                    yield chunk
+        finally:
+            await self.aclose()
+
+    async def aclose(self) -> None:
+        aclose = getattr(self.rest, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+class ModelRouter:
+    """Routes chat requests with rolling latency stats, hedging and fallback."""
+    def __init__(
+        self,
+        providers: Mapping[str, BaseModelProvider],
+        fallbacks: Optional[Dict[Target, List[Target]]] = None,
+        window: int = 200,
+        hedge_percentile: float = 95.0,
+        hedge_min_samples: int = 20,
+        hedge_default_delay: float = 2.0,
+        hedge_min_delay: float = 0.1,
+        max_error_rate: float = 0.5,
+    ):
+        """Initializes the router.
+
+        Args:
+            providers: The providers to route between, by name.
+            fallbacks: Fallback chains per (provider, model). The first entry
+                of a chain is also the hedge target.
+            window: The number of recent requests kept per provider/model.
+            hedge_percentile: The latency percentile of the primary after
+                which a hedge request is sent.
+            hedge_min_samples: The samples needed before the percentile is
+                trusted; until then `hedge_default_delay` is used.
+            hedge_default_delay: The hedge delay in seconds without enough samples.
+            hedge_min_delay: The smallest hedge delay in seconds.
+            max_error_rate: The error rate above which a model is skipped
+                while later models in its chain remain.
+        """
+        self.providers = providers
+        self.fallbacks = fallbacks or {}
+        self.window = window
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.max_error_rate = max_error_rate
+        self._trackers: Dict[Tuple[str, str, str], LatencyTracker] = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks_used = 0
+        self.skipped_unhealthy = 0
+
+    def tracker(self, target: Target, kind: str) -> LatencyTracker:
+        """Gets the tracker for a provider/model and request kind.
+
+        Args:
+            target: The (provider, model) pair.
+            kind: "complete" for whole responses, "stream" for time to first chunk.
+
+        Returns:
+            The tracker, created if needed.
+        """
+        key = (target[0], target[1], kind)
+        tracker = self._trackers.get(key)
+        if tracker is None:
+            tracker = self._trackers[key] = LatencyTracker(self.window)
+        return tracker
+
+    def hedge_delay(self, target: Target, kind: str) -> float:
+        """Gets how long to wait for a target before hedging.
+
+        Args:
+            target: The (provider, model) pair.
+            kind: The request kind.
+
+        Returns:
+            The delay in seconds.
+        """
+        tracker = self.tracker(target, kind)
+        if len(tracker.latencies) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, tracker.percentile(self.hedge_percentile))
+
+    async def complete(
+        self, target: Target, messages: List[Dict[str, str]], hedge: bool = False,
+        fallback: bool = False, **params
+    ) -> RouteResult:
+        """Generates a whole response.
+
+        Args:
+            target: The requested (provider, model) pair.
+            messages: The conversation.
+            hedge: Whether to hedge slow requests.
+            fallback: Whether to fail over along the fallback chain.
+            **params: Sampling parameters for `generate`.
+
+        Returns:
+            The routed result, with the generated text as its value.
+
+        Raises:
+            Exception: The last upstream error if every target failed.
+        """
+        async def call(t: Target) -> str:
+            return await self.providers[t[0]].generate(
+                messages=messages, model=t[1], stream=False, **params
+            )
+        return await self._route(target, "complete", call, hedge, fallback)
+
+    async def stream(
+        self, target: Target, messages: List[Dict[str, str]], hedge: bool = False,
+        fallback: bool = False, **params
+    ) -> RouteResult:
+        """Opens a streamed response.
+
+        Hedging and fallback apply until the first chunk arrives.
+
+        Args:
+            target: The requested (provider, model) pair.
+            messages: The conversation.
+            hedge: Whether to hedge slow first chunks.
+            fallback: Whether to fail over along the fallback chain.
+            **params: Sampling parameters for `generate`.
+
+        Returns:
+            The routed result, with an async iterator of chunks as its value.
+
+        Raises:
+            Exception: The last upstream error if every target failed.
+        """
+        async def call(t: Target) -> _Stream:
+            upstream = await self.providers[t[0]].generate(
+                messages=messages, model=t[1], stream=True, **params
+            )
+            try:
+                first = await upstream.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except BaseException:
+                await _Stream(None, upstream).aclose()
+                raise
+            return _Stream(first, upstream)
+        return await self._route(target, "stream", call, hedge, fallback)
+
+    async def _timed(self, target: Target, kind: str, call: Callable[[Target], Awaitable[Any]]) -> Any:
+        """Runs one attempt and records its latency or failure."""
+        started = time.perf_counter()
+        try:
+            result = await call(target)
+        except (asyncio.CancelledError, AdmissionRejected):
+            # Local load shedding says nothing about the provider's health
+            raise
+        except Exception:
+            self.tracker(target, kind).record(None, ok=False)
+            raise
+        self.tracker(target, kind).record(time.perf_counter() - started, ok=True)
+        return result
+
+    async def _route(
+        self, target: Target, kind: str, call: Callable[[Target], Awaitable[Any]],
+        hedge: bool, fallback: bool
+    ) -> RouteResult:
+        """Tries the requested target, its hedge and its fallbacks in turn."""
+        alternatives = [t for t in self.fallbacks.get(target, []) if t[0] in self.providers]
+        chain = [target] + (alternatives if fallback else [])
+        hedge_target = alternatives[0] if hedge and alternatives else None
+        attempts: List[str] = []
+        error: Optional[Exception] = None
+        tried = set()
+        for position, current in enumerate(chain):
+            if current in tried:
+                continue
+            last = position == len(chain) - 1
+            if not last and self.tracker(current, kind).error_rate > self.max_error_rate:
+                self.skipped_unhealthy += 1
+                attempts.append(f"{current[0]}:{current[1]}")
+                continue
+            if position > 0:
+                self.fallbacks_used += 1
+            try:
+                if position == 0 and hedge_target is not None:
+                    tried.add(hedge_target)
+                    winner, value, hedged = await self._race(current, hedge_target, kind, call)
+                    return RouteResult(value, *winner, hedged=hedged, attempts=attempts)
+                if current[0] not in self.providers:
+                    raise ValueError(f"Provider '{current[0]}' is not configured")
+                value = await self._timed(current, kind, call)
+                return RouteResult(value, *current, attempts=attempts)
+            except Exception as e:
+                logger.warning(f"{current[0]}:{current[1]} failed: {e}")
+                attempts.append(f"{current[0]}:{current[1]}")
+                error = e
+            finally:
+                tried.add(current)
+        raise error if error is not None else ValueError(f"No healthy provider for {target[0]}:{target[1]}")
+
+    async def _race(
+        self, primary: Target, secondary: Target, kind: str,
+        call: Callable[[Target], Awaitable[Any]]
+    ) -> Tuple[Target, Any, bool]:
+        """Runs the primary, hedging with the secondary if it is slow or fails.
+
+        Returns:
+            The winning target, its result and whether a hedge was sent.
+
+        Raises:
+            Exception: The last error if both requests failed.
+        """
+        tasks = {asyncio.create_task(self._timed(primary, kind, call)): primary}
+        winner_task = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(primary, kind))
+            primary_task = next(iter(tasks))
+            if not done or primary_task.exception() is not None:
+                self.hedges += 1
+                tasks[asyncio.create_task(self._timed(secondary, kind, call))] = secondary
+            hedged = len(tasks) > 1
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner_task = task
+                        winner = tasks[task]
+                        if winner == secondary:
+                            self.hedge_wins += 1
+                        return winner, task.result(), hedged
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # A losing stream that opened at the same time must still be closed
+            for task in tasks:
+                if task is not winner_task and not task.cancelled() and task.exception() is None:
+                    aclose = getattr(task.result(), "aclose", None)
+                    if aclose is not None:
+                        await aclose()
+
+    def stats(self) -> dict:
+        """Gets routing metrics.
+
+        Returns:
+            A dictionary with hedge, fallback and per provider/model statistics.
+        """
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_win_rate": self.hedge_wins / self.hedges if self.hedges else 0.0,
+            "fallbacks": self.fallbacks_used,
+            "skipped_unhealthy": self.skipped_unhealthy,
+            "targets": {
+                f"{provider}:{model}:{kind}": tracker.stats()
+                for (provider, model, kind), tracker in self._trackers.items()
+            },
+        }
+
+
+model_router = ModelRouter(
+    provider_registry,
+    fallbacks=parse_fallback_chains(config.ROUTER_FALLBACKS),
+    window=config.ROUTER_WINDOW,
+    hedge_percentile=config.ROUTER_HEDGE_PERCENTILE,
+    hedge_min_samples=config.ROUTER_HEDGE_MIN_SAMPLES,
+    hedge_default_delay=config.ROUTER_HEDGE_DEFAULT_DELAY_MS / 1000,
+    hedge_min_delay=config.ROUTER_HEDGE_MIN_DELAY_MS / 1000,
+    max_error_rate=config.ROUTER_MAX_ERROR_RATE,
+)
@@ -1,16 +1,453 @@
 """A plugin for analyzing audio files.
 
-This is a stub for a plugin that will eventually be able to analyze audio
-files and extract information from them.
+Recordings can be hours long, so they are never loaded whole. The file is
+split into chunks of `AUDIO_CHUNK_SECONDS`, and `analyze_chunk` reads one
+chunk through a memory map and computes features over fixed-size frames
+with vectorized NumPy:
+
+- RMS level per frame, which also gives a coarse loudness timeline and
+  silent stretches;
+- a windowed FFT per frame, which gives spectral centroid, roll-off,
+  flatness and band energies.
+
+Chunks are independent, so they can run in parallel on several worker
+processes. `AudioSummary` merges their partial results in any order, and
+silent stretches that cross a chunk boundary are joined. The summary can
+be read at any time, which lets callers show progress while the rest of the
+file is still being analyzed.
 """
+import asyncio
+import math
+import os
+import struct
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import config
+
+_WAVE_FORMAT_PCM = 1
+_WAVE_FORMAT_FLOAT = 3
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# Band edges in Hz for the energy summary; the last band runs to Nyquist
+_BANDS = [0, 125, 250, 500, 1000, 2000, 4000, 8000]
+_SPECTRUM_BLOCK = 256
+
+
+def probe_audio(
+    file_path: str,
+    sample_rate: Optional[int] = None,
+    channels: int = 1,
+    sample_width: int = 2,
+) -> Dict[str, Any]:
+    """Reads an audio file's format from its header.
+
+    WAV files describe themselves; any other file is treated as raw
+    little-endian PCM, which needs its `sample_rate`.
+
+    Args:
+        file_path: The path to the audio file.
+        sample_rate: The sample rate of raw PCM input.
+        channels: The channel count of raw PCM input.
+        sample_width: The bytes per sample of raw PCM input.
+
+    Returns:
+        A dictionary with the `format`, `sample_rate`, `channels`,
+        `sample_width`, whether samples are `float`, the `frames` per
+        channel, the `duration` in seconds and where the samples are stored
+        (`data_offset`, `data_size`).
+
+    Raises:
+        ValueError: If the file is not valid WAV and no sample rate was
+            given, or it uses an unsupported sample format.
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, "rb") as f:
+        head = f.read(12)
+        if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+            info = _probe_wav(f, size)
+        elif sample_rate:
+            info = {
+                "format": "pcm", "sample_rate": int(sample_rate), "channels": int(channels),
+                "sample_width": int(sample_width), "float": False, "data_offset": 0, "data_size": size,
+            }
+        else:
+            raise ValueError(f"Not a WAV file and no sample_rate given for raw PCM: {file_path}")
+    if info["sample_width"] not in (1, 2, 3, 4, 8) or (info["float"] and info["sample_width"] not in (4, 8)):
+        raise ValueError(f"Unsupported sample width: {info['sample_width'] * 8} bits")
+    if info["channels"] < 1 or info["sample_rate"] < 1:
+        raise ValueError("Invalid channel count or sample rate")
+    block = info["sample_width"] * info["channels"]
+    info["frames"] = min(info["data_size"], size - info["data_offset"]) // block
+    info["duration"] = round(info["frames"] / info["sample_rate"], 3)
+    return info
+
+
+def _probe_wav(f, size: int) -> Dict[str, Any]:
+    """Walks the RIFF chunks up to the sample data, reading only headers."""
+    fmt = None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            raise ValueError("WAV file has no data chunk")
+        kind, length = struct.unpack("<4sI", header)
+        if kind == b"fmt ":
+            data = f.read(length)
+            code, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", data[:16])
+            if code == _WAVE_FORMAT_EXTENSIBLE and len(data) >= 26:
+                code = struct.unpack("<H", data[24:26])[0]
+            if code not in (_WAVE_FORMAT_PCM, _WAVE_FORMAT_FLOAT):
+                raise ValueError(f"Unsupported WAV encoding: {code:#x}")
+            fmt = {"channels": channels, "sample_rate": sample_rate, "sample_width": bits // 8, "float": code == _WAVE_FORMAT_FLOAT}
+            f.seek(length % 2, os.SEEK_CUR)
+        elif kind == b"data":
+            if fmt is None:
+                raise ValueError("WAV data chunk before fmt chunk")
+            offset = f.tell()
+            # Streamed WAVs may leave the size unset; the data then runs to the end
+            data_size = length if 0 < length < 0xFFFFFFFF else size - offset
+            return {"format": "wav", **fmt, "data_offset": offset, "data_size": data_size}
+        else:
+            f.seek(length + length % 2, os.SEEK_CUR)
+
+
+def read_samples(file_path: str, info: Dict[str, Any], start: int, stop: int) -> np.ndarray:
+    """Reads frames `start` to `stop` as mono float32 in [-1, 1].
+
+    Only the requested range is mapped into memory.
+
+    Args:
+        file_path: The path to the audio file.
+        info: The file's format, from `probe_audio`.
+        start: The first frame.
+        stop: The frame after the last.
+
+    Returns:
+        The samples, averaged across channels.
+    """
+    width, channels = info["sample_width"], info["channels"]
+    count = (stop - start) * channels
+    if count <= 0:
+        return np.zeros(0, dtype=np.float32)
+    offset = info["data_offset"] + start * width * channels
+    if width == 3:
+        raw = np.memmap(file_path, dtype=np.uint8, mode="r", offset=offset, shape=(count, 3)).astype(np.int32)
+        samples = (raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)) << 8 >> 8  # sign-extend 24 bits
+        scaled = samples.astype(np.float32) / (1 << 23)
+    else:
+        dtype = {1: "u1", 2: "<i2", 4: "<f4" if info["float"] else "<i4", 8: "<f8"}[width]
+        raw = np.memmap(file_path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+        if info["float"]:
+            scaled = raw.astype(np.float32)
+        elif width == 1:
+            scaled = (raw.astype(np.float32) - 128) / 128
+        else:
+            scaled = raw.astype(np.float32) / float(1 << (8 * width - 1))
+    del raw
+    return scaled.reshape(-1, channels).mean(axis=1, dtype=np.float32) if channels > 1 else scaled
+
+
+def _layout(info: Dict[str, Any]) -> Tuple[int, int, int]:
+    """Gets the frame size, frames per timeline point and chunk size in samples."""
+    frame = config.AUDIO_FRAME_SIZE
+    per_point = max(1, round(config.AUDIO_TIMELINE_SECONDS * info["sample_rate"] / frame))
+    chunk = max(1, round(config.AUDIO_CHUNK_SECONDS * info["sample_rate"] / (frame * per_point))) * frame * per_point
+    return frame, per_point, chunk
+
+
+def plan_chunks(info: Dict[str, Any]) -> List[Tuple[int, int]]:
+    """Splits a file into chunks that start on timeline point boundaries.
+
+    Args:
+        info: The file's format, from `probe_audio`.
+
+    Returns:
+        The (start, stop) frame range of each chunk.
+    """
+    chunk = _layout(info)[2]
+    return [(start, min(start + chunk, info["frames"])) for start in range(0, info["frames"], chunk)]
 
-def analyze_audio(file_path: str) -> dict:
-    """Analyzes an audio file and returns a dictionary of information.
+
+def _db(mean_square) -> Any:
+    return 10 * np.log10(np.maximum(mean_square, 1e-10))
+
+
+def analyze_chunk(
+    file_path: str,
+    info: Dict[str, Any],
+    start: int,
+    stop: int,
+    silence_db: float,
+    frame: int,
+    per_point: int,
+) -> Dict[str, Any]:
+    """Computes frame features for one chunk of a file.
+
+    Args:
+        file_path: The path to the audio file.
+        info: The file's format, from `probe_audio`.
+        start: The chunk's first frame.
+        stop: The frame after the chunk's last.
+        silence_db: The frame level, in dBFS, below which a frame is silent.
+        frame: The samples per analysis frame.
+        per_point: The frames per loudness timeline point.
+
+    Returns:
+        The chunk's partial result, to be merged by `AudioSummary`.
+    """
+    rate = info["sample_rate"]
+    samples = read_samples(file_path, info, start, stop)
+    full = len(samples) // frame
+    squares = np.square(samples, dtype=np.float64)
+    energy = squares[:full * frame].reshape(full, frame).sum(axis=1)
+    counts = np.full(full, frame)
+    if len(samples) > full * frame:  # the file's last, short frame
+        energy = np.append(energy, squares[full * frame:].sum())
+        counts = np.append(counts, len(samples) - full * frame)
+    levels = _db(energy / np.maximum(counts, 1))
+
+    starts = np.arange(0, len(energy), per_point)
+    timeline = _db(np.add.reduceat(energy, starts) / np.add.reduceat(counts, starts)) if len(energy) else np.zeros(0)
+
+    silent = levels < silence_db
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], silent.astype(np.int8), [0]))))
+    silence = [
+        [(start + a * frame) / rate, min(start + b * frame, stop) / rate]
+        for a, b in zip(edges[::2], edges[1::2])
+    ]
+
+    window = np.hanning(frame).astype(np.float32)
+    freqs = np.fft.rfftfreq(frame, 1 / rate)
+    power = np.zeros(len(freqs))
+    centroid = rolloff = flatness = 0.0
+    voiced = 0
+    for block in range(0, full, _SPECTRUM_BLOCK):
+        # Transform a block of frames at a time to bound the FFT's memory
+        frames = samples[block * frame:min(full, block + _SPECTRUM_BLOCK) * frame].reshape(-1, frame)
+        spectrum = np.square(np.abs(np.fft.rfft(frames * window, axis=1)))
+        power += spectrum.sum(axis=0)
+        spectrum = spectrum[~silent[block:block + len(frames)]]
+        if not len(spectrum):
+            continue
+        totals = spectrum.sum(axis=1)
+        spectrum, totals = spectrum[totals > 0], totals[totals > 0]
+        magnitude = np.sqrt(spectrum)
+        centroid += float(((magnitude @ freqs) / magnitude.sum(axis=1)).sum())
+        cumulative = np.cumsum(spectrum, axis=1)
+        rolloff += float(freqs[np.argmax(cumulative >= 0.85 * totals[:, None], axis=1)].sum())
+        flatness += float((np.exp(np.log(spectrum + 1e-12).mean(axis=1)) / (spectrum.mean(axis=1) + 1e-12)).sum())
+        voiced += len(spectrum)
+
+    return {
+        "start": start,
+        "stop": stop,
+        "sum_squares": float(squares.sum()),
+        "peak": float(np.abs(samples).max()) if len(samples) else 0.0,
+        "clipped": int((np.abs(samples) >= 0.999).sum()),
+        "timeline": timeline,
+        "silence": silence,
+        "power": power,
+        "spectral": {"frames": voiced, "centroid": centroid, "rolloff": rolloff, "flatness": flatness},
+    }
+
+
+class AudioSummary:
+    """Merges chunk results, in any order, into one analysis."""
+    def __init__(self, info: Dict[str, Any], silence_db: float, min_silence: float):
+        """Initializes an empty summary.
+
+        Args:
+            info: The file's format, from `probe_audio`.
+            silence_db: The frame level, in dBFS, below which a frame is
+                silent.
+            min_silence: The shortest silent stretch reported, in seconds.
+        """
+        self.info = info
+        self.silence_db = silence_db
+        self.min_silence = min_silence
+        frame, per_point, _ = _layout(info)
+        self.frame, self.per_point = frame, per_point
+        self.point = frame * per_point
+        self.resolution = self.point / info["sample_rate"]
+        self.timeline: List[Optional[float]] = [None] * math.ceil(info["frames"] / self.point)
+        self.frames_done = 0
+        self.sum_squares = 0.0
+        self.peak = 0.0
+        self.clipped = 0
+        self.silence: List[List[float]] = []
+        self.power: Optional[np.ndarray] = None
+        self.spectral = {"frames": 0, "centroid": 0.0, "rolloff": 0.0, "flatness": 0.0}
+        self.freqs = np.fft.rfftfreq(frame, 1 / info["sample_rate"])
+
+    def add(self, partial: Dict[str, Any]) -> None:
+        """Merges one chunk's result from `analyze_chunk`."""
+        self.frames_done += partial["stop"] - partial["start"]
+        self.sum_squares += partial["sum_squares"]
+        self.peak = max(self.peak, partial["peak"])
+        self.clipped += partial["clipped"]
+        first = partial["start"] // self.point
+        for i, level in enumerate(partial["timeline"]):
+            self.timeline[first + i] = round(float(level), 2)
+        self.silence = sorted(self.silence + partial["silence"])
+        self.power = partial["power"] if self.power is None else self.power + partial["power"]
+        for key, value in partial["spectral"].items():
+            self.spectral[key] += value
+
+    def _silent_stretches(self) -> List[List[float]]:
+        merged: List[List[float]] = []
+        for start, end in self.silence:
+            if merged and start <= merged[-1][1] + 1e-9:  # continues across a chunk boundary
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return [[round(a, 3), round(b, 3)] for a, b in merged if b - a >= self.min_silence]
+
+    def result(self) -> Dict[str, Any]:
+        """Gets the analysis of the chunks merged so far.
+
+        Returns:
+            A dictionary with the file's format and duration, the share of
+            it analyzed so far (`progress`), overall and peak level,
+            clipping, a loudness timeline, silent stretches and a spectral
+            summary.
+        """
+        info = self.info
+        samples = self.frames_done
+        silence = self._silent_stretches()
+        silent_seconds = sum(b - a for a, b in silence)
+        spectral = self.spectral
+        voiced = max(1, spectral["frames"])
+        bands = {}
+        dominant = None
+        if self.power is not None and self.power.sum() > 0:
+            total = self.power.sum()
+            dominant = round(float(self.freqs[np.argmax(self.power[1:]) + 1]), 1)
+            lows = [low for low in _BANDS if low < info["sample_rate"] / 2]
+            for low, high in zip(lows, lows[1:] + [math.inf]):
+                share = self.power[(self.freqs >= low) & (self.freqs < high)].sum() / total
+                bands[f"{low}-{high}" if high < math.inf else f"{low}+"] = round(float(share), 4)
+        return {
+            **{k: info[k] for k in ("format", "sample_rate", "channels", "sample_width", "duration")},
+            "progress": round(samples / info["frames"], 4) if info["frames"] else 1.0,
+            "rms_db": round(float(_db(self.sum_squares / samples)), 2) if samples else None,
+            "peak_db": round(float(20 * np.log10(max(self.peak, 1e-5))), 2),
+            "clipping": round(self.clipped / samples, 6) if samples else 0.0,
+            "timeline": {"resolution": round(self.resolution, 4), "rms_db": list(self.timeline)},
+            "silence": {
+                "threshold_db": self.silence_db,
+                "segments": silence,
+                "total": round(silent_seconds, 3),
+                "ratio": round(silent_seconds / info["duration"], 4) if info["duration"] else 0.0,
+            },
+            "spectrum": {
+                "centroid_hz": round(spectral["centroid"] / voiced, 1),
+                "rolloff_hz": round(spectral["rolloff"] / voiced, 1),
+                "flatness": round(spectral["flatness"] / voiced, 4),
+                "dominant_hz": dominant,
+                "bands": bands,
+            },
+        }
+
+
+def _options(silence_db: Optional[float], min_silence: Optional[float]) -> Tuple[float, float]:
+    return (
+        config.AUDIO_SILENCE_DB if silence_db is None else float(silence_db),
+        config.AUDIO_MIN_SILENCE if min_silence is None else float(min_silence),
+    )
+
+
+async def stream_audio_analysis(
+    file_path: str,
+    run_chunk: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+    parallel: int,
+    silence_db: Optional[float] = None,
+    min_silence: Optional[float] = None,
+    **format_args: Any,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Analyzes an audio file chunk by chunk, yielding partial results.
 
     Args:
         file_path: The path to the audio file.
+        run_chunk: Runs `analyze_chunk` with the given keyword arguments,
+            for example in a worker pool.
+        parallel: The most chunks analyzed at the same time.
+        silence_db: The frame level, in dBFS, below which a frame is
+            silent. Defaults to `AUDIO_SILENCE_DB`.
+        min_silence: The shortest silent stretch reported, in seconds.
+            Defaults to `AUDIO_MIN_SILENCE`.
+        **format_args: The `sample_rate`, `channels` and `sample_width` of
+            raw PCM input.
+
+    Yields:
+        The merged analysis after each finished chunk; the last one has a
+        `progress` of 1.
+
+    Raises:
+        ValueError: If the file's format is not supported.
+    """
+    silence_db, min_silence = _options(silence_db, min_silence)
+    info = await asyncio.to_thread(probe_audio, file_path, **format_args)
+    summary = AudioSummary(info, silence_db, min_silence)
+    chunks = iter(plan_chunks(info))
+    running: set = set()
+
+    def submit() -> None:
+        for start, stop in chunks:
+            args = {
+                "file_path": file_path, "info": info, "start": start, "stop": stop,
+                "silence_db": silence_db, "frame": summary.frame, "per_point": summary.per_point,
+            }
+            running.add(asyncio.ensure_future(run_chunk(args)))
+            if len(running) >= max(1, parallel):
+                return
+
+    try:
+        submit()
+        if not running:
+            yield summary.result()
+        while running:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            running.difference_update(done)
+            submit()
+            for task in done:
+                summary.add(task.result())
+                yield summary.result()
+    finally:
+        for task in running:
+            task.cancel()
+
+
+def analyze_audio(
+    file_path: str,
+    silence_db: Optional[float] = None,
+    min_silence: Optional[float] = None,
+    **format_args: Any,
+) -> dict:
+    """Analyzes an audio file and returns a dictionary of information.
+
+    Chunks are analyzed one after another in this process; the plugin API
+    spreads them across the worker pool instead.
+
+    Args:
+        file_path: The path to a WAV or raw PCM file.
+        silence_db: The frame level, in dBFS, below which a frame is
+            silent. Defaults to `AUDIO_SILENCE_DB`.
+        min_silence: The shortest silent stretch reported, in seconds.
+            Defaults to `AUDIO_MIN_SILENCE`.
+        **format_args: The `sample_rate`, `channels` and `sample_width` of
+            raw PCM input.
 
     Returns:
-        A dictionary of information about the audio file.
+        A dictionary with the file's format and duration, overall and peak
+        level, clipping, a loudness timeline, silent stretches and a
+        spectral summary.
+
+    Raises:
+        ValueError: If the file's format is not supported.
     """
-    return {"status": "stub"}
+    silence_db, min_silence = _options(silence_db, min_silence)
+    info = probe_audio(file_path, **format_args)
+    summary = AudioSummary(info, silence_db, min_silence)
+    for start, stop in plan_chunks(info):
+        summary.add(analyze_chunk(file_path, info, start, stop, silence_db, summary.frame, summary.per_point))
+    return summary.result()
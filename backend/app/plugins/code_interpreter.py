@@ -1,16 +1,613 @@
 """A plugin for interpreting code.
 
-This is a stub for a plugin that will eventually be able to interpret code
-and return the results.
+Snippets run in a pool of pre-started, resource-limited Python interpreter
+processes, so a call pays for a round trip over a pipe rather than for an
+interpreter start. Each sandbox runs a small loop (`BOOTSTRAP`) that reads a
+request, executes it in fresh globals, streams its stdout and stderr back as
+they are written, and reports the result.
+
+Reusing a process is only safe while the snippets leave no state behind.
+After every run the sandbox compares the interpreter's state with a snapshot
+taken at start-up (builtins, `sys.path`, environment, working directory,
+open files, threads); a sandbox whose state changed, that timed out, or that
+has served `SANDBOX_MAX_RUNS` snippets is killed and replaced in the
+background by a fresh one.
+
+Local sandboxes apply rlimits (address space, CPU time, file size, open
+files) to themselves as the first thing `BOOTSTRAP` does, in their own
+session. They then enter a user namespace with an empty network namespace
+and a private mount namespace whose root is a small tmpfs holding only a
+read-only view of the system libraries and the interpreter, `/dev/null`
+and friends, `/tmp` and the `/work` directory. The API's files, `.env`, the
+databases and attachments are not visible. A second, nested user namespace
+keeps snippets from undoing those mounts. A sandbox reports what it could
+not isolate; with `SANDBOX_REQUIRE_ISOLATION` such a sandbox is refused,
+otherwise it is logged and counted in `stats()`.
+
+With `SANDBOX_BACKEND=docker` the same loop runs in a container instead,
+which needs the `docker` CLI but no Python dependency.
 """
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+# Runs inside each sandbox. Requests and events are JSON lines on the
+# process's original stdin and stdout; the snippet itself sees an in-memory
+# stdin and streams that turn writes into events. Local sandboxes get their
+# limits and isolation settings as a JSON argument and apply them here,
+# rather than in a `preexec_fn`, which is unsafe in a threaded parent.
+BOOTSTRAP = r'''
+import builtins, ctypes, io, json, os, shutil, sys, threading, time, traceback
+
+_settings = json.loads(sys.argv[1]) if len(sys.argv) > 1 else {}
+_requests = os.fdopen(os.dup(0), "r")
+_events = os.fdopen(os.dup(1), "w")
+_null = os.open(os.devnull, os.O_RDWR)
+os.dup2(_null, 0)
+os.dup2(_null, 1)
+
+_MS_RDONLY, _MS_NOSUID, _MS_NODEV, _MS_NOEXEC, _MS_REMOUNT = 1, 2, 4, 8, 32
+_MS_NOATIME, _MS_NODIRATIME, _MS_BIND, _MS_REC, _MS_PRIVATE, _MS_RELATIME = 1024, 2048, 4096, 16384, 1 << 18, 1 << 21
+_SYS_PIVOT_ROOT = {"x86_64": 155, "aarch64": 41, "riscv64": 41}
+_libc = ctypes.CDLL(None, use_errno=True)
+
+def _check(result, what):
+    if result != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno), what)
+
+def _mount(source, target, fstype, flags, data=None):
+    encode = lambda s: s.encode() if s else None
+    _check(_libc.mount(encode(source), encode(target), encode(fstype), flags, encode(data)), f"mount {target}")
+
+def _enter_user_namespace(flags, proc):
+    uid, gid = os.getuid(), os.getgid()
+    _check(_libc.unshare(0x10000000 | flags), "unshare")
+    for name, line in (("setgroups", "deny"), ("uid_map", f"{uid} {uid} 1"), ("gid_map", f"{gid} {gid} 1")):
+        with open(f"self/{name}", "w", opener=lambda path, mode: os.open(path, mode, dir_fd=proc)) as f:
+            f.write(line)
+
+def _pivot(root, readonly):
+    _mount(None, "/", None, _MS_REC | _MS_PRIVATE)
+    _mount("tmpfs", root, "tmpfs", _MS_NOSUID | _MS_NODEV, "size=64m,mode=755")
+    for path in readonly:
+        target = root + path
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.islink(path):
+            os.symlink(os.readlink(path), target)
+            continue
+        os.makedirs(target, exist_ok=True)
+        _mount(path, target, None, _MS_BIND | _MS_REC)
+        # A remount must keep the flags the original mount has locked
+        flag = os.statvfs(path).f_flag
+        locked = flag & (_MS_NOEXEC | _MS_NOATIME | _MS_NODIRATIME) | (_MS_RELATIME if flag & os.ST_RELATIME else 0)
+        _mount(None, target, None, _MS_REMOUNT | _MS_BIND | _MS_RDONLY | _MS_NOSUID | _MS_NODEV | locked)
+    os.makedirs(root + "/dev")
+    for device in ("null", "zero", "random", "urandom"):
+        open(f"{root}/dev/{device}", "w").close()
+        _mount(f"/dev/{device}", f"{root}/dev/{device}", None, _MS_BIND)
+    os.mkdir(root + "/tmp", 0o1777)
+    os.chmod(root + "/tmp", 0o1777)
+    os.mkdir(root + "/work")
+    os.chdir(root)
+    machine = os.uname().machine
+    if machine not in _SYS_PIVOT_ROOT:
+        raise OSError(38, f"pivot_root is not supported on {machine}")
+    _check(_libc.syscall(_SYS_PIVOT_ROOT[machine], b".", b"."), "pivot_root")
+    _check(_libc.umount2(b".", 2), "umount old root")
+    os.chdir("/work")
+    os.environ["HOME"] = "/work"
+
+def _isolate(settings):
+    errors = list(settings.get("errors", []))
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    for name, value in settings.get("rlimits", []) if resource else []:
+        kind = getattr(resource, name)
+        hard = resource.getrlimit(kind)[1]
+        value = value if hard == resource.RLIM_INFINITY else min(value, hard)
+        try:
+            resource.setrlimit(kind, (value, value))
+        except (ValueError, OSError) as e:
+            errors.append(f"{name}: {e}")
+    network, root = settings.get("network", False), settings.get("root")
+    if not (network or root):
+        return errors
+    # /proc is gone after the pivot, and must not stay reachable through a
+    # descriptor, so it is only held open while setting up
+    proc = os.open("/proc", os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        _enter_user_namespace((0x40000000 if network else 0) | (0x00020000 if root else 0), proc)
+    except OSError as e:
+        os.close(proc)
+        return errors + [f"namespaces: {e}"]
+    if root:
+        try:
+            _pivot(root, settings["readonly"])
+            # Snippets hold every capability in the namespace that owns the
+            # mounts; a nested one keeps them from remounting `/usr` writable
+            _enter_user_namespace(0, proc)
+        except OSError as e:
+            errors.append(f"filesystem: {e}")
+    os.close(proc)
+    return errors
+
+_isolation_errors = _isolate(_settings)
+
+def _send(event):
+    _events.write(json.dumps(event) + "\n")
+    _events.flush()
+
+class _Stream(io.TextIOBase):
+    def __init__(self, name):
+        self.name = name
+    def writable(self):
+        return True
+    def write(self, s):
+        for i in range(0, len(s), 16384):
+            _send({"type": self.name, "data": s[i:i + 16384]})
+        return len(s)
+
+def _fds():
+    try:
+        return sorted(os.listdir("/proc/self/fd"))
+    except OSError:
+        pass
+    # Without /proc, probe every descriptor the sandbox may open
+    try:
+        import resource
+        soft = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+        limit = 4096 if soft == resource.RLIM_INFINITY else min(soft, 4096)
+    except (ImportError, ValueError):
+        limit = 256
+    fds = []
+    for fd in range(limit):
+        try:
+            os.fstat(fd)
+        except OSError:
+            continue
+        fds.append(fd)
+    return fds
+
+def _state():
+    return (
+        {k: id(v) for k, v in vars(builtins).items()},
+        list(sys.path), dict(os.environ), os.getcwd(),
+        threading.active_count(), _fds(),
+    )
+
+def _clean(path):
+    for name in os.listdir(path):
+        full = os.path.join(path, name)
+        if os.path.isdir(full) and not os.path.islink(full):
+            shutil.rmtree(full)
+        else:
+            os.unlink(full)
+
+_workdir = os.getcwd()
+_clean(_workdir)
+_baseline = _state()
+_send({"type": "ready", "pid": os.getpid(), "isolation_errors": _isolation_errors})
+
+for _line in _requests:
+    _request = json.loads(_line)
+    _globals = {"__name__": "__main__", "__builtins__": builtins}
+    sys.stdin = io.StringIO(_request.get("stdin", ""))
+    sys.stdout, sys.stderr = _Stream("stdout"), _Stream("stderr")
+    _ok, _error = True, None
+    _started = time.perf_counter()
+    try:
+        exec(compile(_request["code"], "<sandbox>", "exec"), _globals)
+    except SystemExit as e:
+        _ok = e.code in (None, 0)
+        _error = None if _ok else f"SystemExit: {e.code}"
+    except BaseException as e:
+        _ok = False
+        _error = "".join(traceback.format_exception(type(e), e, e.__traceback__.tb_next))
+    _elapsed = time.perf_counter() - _started
+    sys.stdin, sys.stdout, sys.stderr = sys.__stdin__, sys.__stdout__, sys.__stderr__
+    _globals.clear()
+    try:
+        os.chdir(_workdir)
+        _clean(_workdir)
+        _clean_state = _state() == _baseline
+    except Exception:
+        _clean_state = False
+    _send({"type": "result", "ok": _ok, "error": _error,
+           "exec_ms": round(_elapsed * 1000, 3), "contaminated": not _clean_state})
+'''
+
+# System directories a filesystem-isolated sandbox sees, read-only, besides
+# the interpreter's prefix
+_SYSTEM_DIRS = ["/usr", "/bin", "/lib", "/lib32", "/lib64", "/libx32"]
+
+
+class SandboxError(Exception):
+    """Raised when a sandbox cannot be started."""
+
+
+def _readonly_paths() -> List[str]:
+    """Lists the paths a filesystem-isolated sandbox needs to run Python.
+
+    Symlinks, such as `/bin` on merged-`/usr` systems, are recreated in the
+    sandbox rather than mounted, and paths inside another mounted path are
+    left out.
+    """
+    candidates = set(_SYSTEM_DIRS)
+    for prefix in {sys.prefix, sys.base_prefix}:
+        candidates |= {os.path.abspath(prefix), os.path.realpath(prefix)}
+    paths = sorted(p for p in candidates if os.path.lexists(p))
+    mounted = [p for p in paths if not os.path.islink(p)]
+    return [p for p in paths if not any(p.startswith(q + "/") for q in mounted)]
+
+
+def _local_settings(memory_limit_mb: int, cpu_seconds: int, root: str) -> Dict[str, Any]:
+    """Builds the limits and isolation settings a local sandbox applies to itself."""
+    rlimits = [["RLIMIT_CPU", cpu_seconds], ["RLIMIT_FSIZE", 64 * 1024 * 1024], ["RLIMIT_NOFILE", 64], ["RLIMIT_CORE", 0]]
+    if memory_limit_mb > 0:
+        rlimits.append(["RLIMIT_AS", memory_limit_mb * 1024 * 1024])
+    settings: Dict[str, Any] = {"rlimits": rlimits}
+    if sys.platform.startswith("linux"):
+        settings["network"] = config.SANDBOX_ISOLATE_NETWORK
+        if config.SANDBOX_ISOLATE_FILESYSTEM:
+            settings.update(root=root, readonly=_readonly_paths())
+    elif config.SANDBOX_ISOLATE_NETWORK or config.SANDBOX_ISOLATE_FILESYSTEM:
+        # Reported like a failed isolation, so SANDBOX_REQUIRE_ISOLATION applies
+        settings["errors"] = [f"namespaces: unavailable on {sys.platform}"]
+    return settings
+
+
+class Sandbox:
+    """One warm interpreter process."""
+    def __init__(self, process: asyncio.subprocess.Process, workdir: Optional[str]):
+        self.process = process
+        self.workdir = workdir
+        self.runs = 0
+        self.isolation_errors: List[str] = []
+
+    @classmethod
+    async def spawn(cls, backend: str, memory_limit_mb: int, cpu_seconds: int, start_timeout: float) -> "Sandbox":
+        """Starts a sandbox and waits until it is ready.
+
+        Args:
+            backend: "local" or "docker".
+            memory_limit_mb: The sandbox's memory limit.
+            cpu_seconds: The CPU time the sandbox may use over its lifetime.
+            start_timeout: The seconds to wait for the sandbox to start.
+
+        Returns:
+            The ready sandbox.
+
+        Raises:
+            SandboxError: If the sandbox does not start, or cannot be
+                isolated while `SANDBOX_REQUIRE_ISOLATION` is set.
+        """
+        workdir = None
+        if backend == "docker":
+            argv = [
+                "docker", "run", "-i", "--rm", "--network", "none", "--pids-limit", "64",
+                "--memory", f"{memory_limit_mb}m", "--tmpfs", "/work", "-w", "/work",
+                config.SANDBOX_DOCKER_IMAGE, "python", "-I", "-u", "-c", BOOTSTRAP,
+            ]
+            options: Dict[str, Any] = {}
+        else:
+            workdir = tempfile.mkdtemp(prefix="sandbox-")
+            settings = _local_settings(memory_limit_mb, cpu_seconds, workdir)
+            argv = [sys.executable, "-I", "-u", "-c", BOOTSTRAP, json.dumps(settings)]
+            options = {"cwd": workdir, "env": {"PATH": os.defpath, "HOME": workdir}}
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            start_new_session=True,
+            limit=1 << 20,
+            **options,
+        )
+        sandbox = cls(process, workdir)
+        try:
+            line = await asyncio.wait_for(process.stdout.readline(), start_timeout)
+            ready = json.loads(line or b"{}")
+            if ready.get("type") != "ready":
+                raise SandboxError("Sandbox exited during start-up")
+            sandbox.isolation_errors = ready.get("isolation_errors", [])
+            if sandbox.isolation_errors and config.SANDBOX_REQUIRE_ISOLATION:
+                raise SandboxError(f"isolation failed ({'; '.join(sandbox.isolation_errors)})")
+        except (asyncio.TimeoutError, ValueError, SandboxError) as e:
+            await sandbox.kill()
+            raise SandboxError(f"Sandbox failed to start: {e or type(e).__name__}")
+        except BaseException:
+            await sandbox.kill()
+            raise
+        return sandbox
+
+    async def execute(self, code: str, stdin: str, timeout: float, max_output: int) -> AsyncIterator[Dict[str, Any]]:
+        """Runs a snippet, yielding output events and then the result.
+
+        Args:
+            code: The Python code to run.
+            stdin: The snippet's standard input.
+            timeout: The seconds the snippet may run.
+            max_output: The most stdout and stderr characters to return.
+
+        Yields:
+            `stdout` and `stderr` events with the text written, then one
+            `result` event. A result with `fatal` set means the sandbox must
+            not be reused.
+        """
+        self.runs += 1
+        request = json.dumps({"code": code, "stdin": stdin}) + "\n"
+        self.process.stdin.write(request.encode("utf-8"))
+        deadline = time.monotonic() + timeout
+        output = 0
+        try:
+            await self.process.stdin.drain()
+            while True:
+                line = await asyncio.wait_for(self.process.stdout.readline(), max(0.0, deadline - time.monotonic()))
+                if not line:
+                    yield {"type": "result", "ok": False, "error": "Sandbox crashed", "fatal": True}
+                    return
+                event = json.loads(line)
+                if event["type"] == "result":
+                    event["fatal"] = event.pop("contaminated", False)
+                    yield event
+                    return
+                output += len(event.get("data", ""))
+                if output > max_output:
+                    yield {"type": "result", "ok": False, "error": "Output limit exceeded", "fatal": True}
+                    return
+                yield event
+        except asyncio.TimeoutError:
+            yield {"type": "result", "ok": False, "error": f"Timed out after {timeout:g}s", "fatal": True, "timeout": True}
+        except (ConnectionError, ValueError) as e:
+            yield {"type": "result", "ok": False, "error": f"Sandbox failed: {e}", "fatal": True}
+
+    async def kill(self) -> None:
+        """Kills the sandbox and removes its working directory."""
+        if self.process.returncode is None:
+            try:
+                os.killpg(self.process.pid, 9)
+            except (ProcessLookupError, PermissionError):
+                self.process.kill()
+            await self.process.wait()
+        if self.workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class SandboxPool:
+    """A pool of warm sandboxes that recycles them as they get used."""
+    def __init__(
+        self,
+        size: int,
+        max_runs: int,
+        timeout: float,
+        memory_limit_mb: int,
+        max_output: int,
+        backend: str = "local",
+    ):
+        """Initializes the pool; sandboxes are started by `start` or first use.
+
+        Args:
+            size: The number of sandboxes.
+            max_runs: The snippets a sandbox runs before it is replaced.
+            timeout: The default seconds a snippet may run.
+            memory_limit_mb: Each sandbox's memory limit.
+            max_output: The most output characters a snippet may produce.
+            backend: "local" processes or "docker" containers.
+        """
+        self.size = max(1, size)
+        self.max_runs = max_runs
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_output = max_output
+        self.backend = backend
+        self._idle: Deque[Sandbox] = deque()
+        self._available: Optional[asyncio.Condition] = None
+        self._live = 0
+        self._spawning: Set[asyncio.Task] = set()
+        self._overheads: Deque[float] = deque(maxlen=1000)
+        self._closed = False
+        self.runs = 0
+        self.spawned = 0
+        self.unisolated = 0
+        self.isolation_error: Optional[str] = None
+        self.recycled: Dict[str, int] = {"max_runs": 0, "contaminated": 0, "timeout": 0, "error": 0, "abandoned": 0}
+
+    def _condition(self) -> asyncio.Condition:
+        if self._available is None:
+            self._available = asyncio.Condition()
+        return self._available
+
+    async def _spawn(self) -> Sandbox:
+        """Starts a sandbox, counting it against the pool size."""
+        cpu_seconds = int(self.timeout * max(1, self.max_runs)) + 1
+        sandbox = await Sandbox.spawn(self.backend, self.memory_limit_mb, cpu_seconds, config.SANDBOX_START_TIMEOUT)
+        self.spawned += 1
+        if sandbox.isolation_errors:
+            self.unisolated += 1
+            self.isolation_error = "; ".join(sandbox.isolation_errors)
+            logger.warning(f"Sandbox {sandbox.process.pid} runs without full isolation: {self.isolation_error}")
+        return sandbox
+
+    async def _replenish(self) -> None:
+        """Starts a sandbox in the background and makes it available."""
+        try:
+            sandbox = await self._spawn()
+        except Exception as e:
+            logger.warning(f"Starting a sandbox failed: {e}")
+            async with self._condition():
+                # Let a waiting caller try to start one itself
+                self._live -= 1
+                self._condition().notify()
+            return
+        async with self._condition():
+            if self._closed:
+                await sandbox.kill()
+                return
+            self._idle.append(sandbox)
+            self._condition().notify()
+
+    def _start_replenish(self) -> None:
+        task = asyncio.create_task(self._replenish())
+        self._spawning.add(task)
+        task.add_done_callback(self._spawning.discard)
+
+    async def start(self) -> None:
+        """Starts sandboxes until the pool is full."""
+        self._closed = False
+        missing = self.size - self._live
+        self._live += missing
+        await asyncio.gather(*(self._replenish() for _ in range(missing)))
+
+    async def _acquire(self) -> Sandbox:
+        """Takes an idle sandbox, starting one if the pool is not full."""
+        condition = self._condition()
+        async with condition:
+            while True:
+                if self._idle:
+                    return self._idle.popleft()
+                if self._live < self.size:
+                    self._live += 1
+                    break
+                await condition.wait()
+        try:
+            return await self._spawn()
+        except BaseException:
+            async with condition:
+                # Let a waiting caller try to start one itself
+                self._live -= 1
+                condition.notify()
+            raise
+
+    async def _release(self, sandbox: Sandbox, reason: Optional[str]) -> None:
+        """Returns a sandbox to the pool, or replaces it if it is spent."""
+        if reason is None and sandbox.runs >= self.max_runs:
+            reason = "max_runs"
+        if reason is None and not self._closed:
+            async with self._condition():
+                self._idle.append(sandbox)
+                self._condition().notify()
+            return
+        self.recycled[reason or "max_runs"] = self.recycled.get(reason or "max_runs", 0) + 1
+        await sandbox.kill()
+        if self._closed:
+            self._live -= 1
+        else:
+            self._start_replenish()
+
+    async def run(self, code: str, stdin: str = "", timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Runs a snippet in a warm sandbox.
+
+        Args:
+            code: The Python code to run.
+            stdin: The snippet's standard input.
+            timeout: The seconds the snippet may run, up to the pool default.
+
+        Yields:
+            `stdout` and `stderr` events as the snippet writes, then a
+            `result` event with `ok`, `error`, `exec_ms` and `overhead_ms`.
+
+        Raises:
+            SandboxError: If no sandbox could be started.
+        """
+        timeout = min(timeout or self.timeout, self.timeout)
+        sandbox = await self._acquire()
+        started = time.perf_counter()
+        reason = "abandoned"
+        try:
+            async for event in sandbox.execute(code, stdin, timeout, self.max_output):
+                if event["type"] == "result":
+                    fatal = event.pop("fatal", False)
+                    timed_out = event.pop("timeout", False)
+                    reason = ("timeout" if timed_out else "contaminated" if "exec_ms" in event else "error") if fatal else None
+                    if "exec_ms" in event:
+                        overhead = (time.perf_counter() - started) * 1000 - event["exec_ms"]
+                        event["overhead_ms"] = round(overhead, 3)
+                        self._overheads.append(overhead)
+                    self.runs += 1
+                yield event
+        finally:
+            await self._release(sandbox, reason)
+
+    async def close(self) -> None:
+        """Kills every sandbox."""
+        self._closed = True
+        spawning = list(self._spawning)
+        for task in spawning:
+            task.cancel()
+        # Let cancelled starts kill their half-started sandboxes
+        await asyncio.gather(*spawning, return_exceptions=True)
+        idle, self._idle = list(self._idle), deque()
+        self._live -= len(idle)
+        self._available = None
+        await asyncio.gather(*(sandbox.kill() for sandbox in idle), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Gets pool occupancy, recycling and isolation counters and per-run overhead.
+
+        Returns:
+            A dictionary of sandbox pool statistics.
+        """
+        overheads = sorted(self._overheads)
+
+        def percentile(q: float) -> Optional[float]:
+            return round(overheads[min(len(overheads) - 1, int(q * len(overheads)))], 3) if overheads else None
+
+        return {
+            "backend": self.backend,
+            "size": self.size,
+            "idle": len(self._idle),
+            "busy": self._live - len(self._idle) - len(self._spawning),
+            "runs": self.runs,
+            "spawned": self.spawned,
+            "recycled": dict(self.recycled),
+            "unisolated": self.unisolated,
+            "isolation_error": self.isolation_error,
+            "overhead_ms": {"p50": percentile(0.5), "p95": percentile(0.95)},
+        }
+
+
+sandbox_pool = SandboxPool(
+    size=config.SANDBOX_POOL_SIZE,
+    max_runs=config.SANDBOX_MAX_RUNS,
+    timeout=config.SANDBOX_TIMEOUT,
+    memory_limit_mb=config.SANDBOX_MEMORY_LIMIT_MB,
+    max_output=config.SANDBOX_MAX_OUTPUT,
+    backend=config.SANDBOX_BACKEND,
+)
+
 
-def interpret_code(code: str) -> dict:
+async def interpret_code(code: str, stdin: str = "", timeout: Optional[float] = None) -> dict:
     """Interprets a string of code and returns the results.
 
     Args:
-        code: The code to interpret.
+        code: The Python code to run.
+        stdin: The code's standard input.
+        timeout: The seconds the code may run.
 
     Returns:
-        A dictionary with the results of the interpretation.
+        A dictionary with the code's stdout and stderr, whether it
+        succeeded, its error if not, and its run time and overhead in ms.
     """
-    return {"status": "stub"}
+    streams: Dict[str, List[str]] = {"stdout": [], "stderr": []}
+    result: Dict[str, Any] = {}
+    async for event in sandbox_pool.run(code, stdin, timeout):
+        if event["type"] == "result":
+            result = event
+        else:
+            streams[event["type"]].append(event["data"])
+    result.pop("type", None)
+    return {"stdout": "".join(streams["stdout"]), "stderr": "".join(streams["stderr"]), **result}
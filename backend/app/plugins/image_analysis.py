@@ -1,16 +1,538 @@
 """A plugin for analyzing images.
 
-This is a stub for a plugin that will eventually be able to analyze images
-and extract information from them.
+Images are handled in three stages so that a multi-megapixel upload never
+has to sit in memory at full size:
+
+1. `probe_image` reads only the file header to learn the format and the
+   dimensions, and oversized images are rejected before any decoding.
+2. The image is decoded once, straight to analysis resolution (at most
+   `IMAGE_ANALYSIS_SIZE` pixels on the long side). With Pillow installed,
+   JPEGs are decoded at a reduced DCT scale and other formats are reduced
+   right after decoding. Without Pillow, PNG and BMP files are decoded by a
+   NumPy reader that downscales row by row, keeping memory proportional to
+   the image width. PNG rows are unfiltered in blocks of a few MiB, so the
+   Average and Paeth filters, which depend on the byte to their left, are
+   swept along anti-diagonals in vectorized steps rather than byte by byte.
+3. Features (histograms, colors, contrast, edges and a perceptual hash) are
+   computed with vectorized NumPy on the small image.
+
+Results are cached by the plugin API under the file's content hash, so a
+re-upload of the same image is not decoded again.
 """
+import math
+import os
+import struct
+import zlib
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import config
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# JPEG start-of-frame markers; C4 (DHT), C8 (JPG) and CC (DAC) are not frames
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+_READ_SIZE = 64 * 1024
+# Bytes of filtered PNG rows reversed together, and the fewest Average or
+# Paeth rows in such a block that are worth the anti-diagonal sweep
+_UNFILTER_BLOCK = 4 << 20
+_WAVEFRONT_MIN_ROWS = 16
+
+
+def probe_image(file_path: str) -> Dict[str, Any]:
+    """Reads an image's format and dimensions from its header.
+
+    Only the first few bytes are read, except for JPEGs, whose frame header
+    is found by skipping over the segments before it.
+
+    Args:
+        file_path: The path to the image file.
+
+    Returns:
+        A dictionary with the `format`, `width` and `height`.
+
+    Raises:
+        ValueError: If the format is not recognized or the header is
+            truncated.
+    """
+    with open(file_path, "rb") as f:
+        head = f.read(32)
+        try:
+            if head.startswith(_PNG_SIGNATURE) and head[12:16] == b"IHDR":
+                width, height = struct.unpack(">II", head[16:24])
+                return {"format": "png", "width": width, "height": height}
+            if head[:6] in (b"GIF87a", b"GIF89a"):
+                width, height = struct.unpack("<HH", head[6:10])
+                return {"format": "gif", "width": width, "height": height}
+            if head[:2] == b"BM":
+                width, height = struct.unpack("<ii", head[18:26])
+                return {"format": "bmp", "width": width, "height": abs(height)}
+            if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+                return {"format": "webp", **_probe_webp(head)}
+            if head[:2] == b"\xff\xd8":
+                f.seek(2)
+                return {"format": "jpeg", **_probe_jpeg(f)}
+        except struct.error:
+            raise ValueError(f"Truncated image header: {file_path}")
+    raise ValueError(f"Unrecognized image format: {file_path}")
+
+
+def _probe_webp(head: bytes) -> Dict[str, int]:
+    """Reads WebP dimensions from the first chunk header."""
+    chunk = head[12:16]
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", head[26:30])
+        return {"width": width & 0x3FFF, "height": height & 0x3FFF}
+    if chunk == b"VP8L":
+        bits = int.from_bytes(head[21:25], "little")
+        return {"width": (bits & 0x3FFF) + 1, "height": ((bits >> 14) & 0x3FFF) + 1}
+    if chunk == b"VP8X":
+        return {"width": int.from_bytes(head[24:27], "little") + 1, "height": int.from_bytes(head[27:30], "little") + 1}
+    raise ValueError("Unrecognized WebP chunk")
+
+
+def _probe_jpeg(f: BinaryIO) -> Dict[str, int]:
+    """Finds the JPEG frame header by skipping segment by segment."""
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            raise ValueError("Truncated JPEG header")
+        if marker[1] == 0xFF:  # fill byte
+            f.seek(-1, os.SEEK_CUR)
+            continue
+        if 0xD0 <= marker[1] <= 0xD9 or marker[1] == 0x01:  # markers without a length
+            continue
+        length = struct.unpack(">H", f.read(2))[0]
+        if marker[1] in _JPEG_SOF:
+            height, width = struct.unpack(">xHH", f.read(5))
+            return {"width": width, "height": height}
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+class _BoxDownscaler:
+    """Averages incoming rows into blocks of `factor` x `factor` pixels."""
+    def __init__(self, width: int, height: int, factor: int):
+        self.factor = factor
+        self.starts = np.arange(0, width, factor)
+        self.counts = np.diff(np.append(self.starts, width)).astype(np.float64)[:, None]
+        self.rows: List[np.ndarray] = []
+        self._sum = np.zeros((len(self.starts), 3))
+        self._pending = 0
+
+    def add(self, row: np.ndarray) -> None:
+        """Adds one (width, 3) row of RGB values."""
+        self._sum += np.add.reduceat(row, self.starts, axis=0)
+        self._pending += 1
+        if self._pending == self.factor:
+            self.flush()
+
+    def flush(self) -> None:
+        """Emits the block of rows added so far."""
+        if self._pending:
+            self.rows.append((self._sum / (self.counts * self._pending)).astype(np.float32))
+            self._sum[:] = 0
+            self._pending = 0
+
+    def result(self) -> np.ndarray:
+        self.flush()
+        return np.stack(self.rows)
+
+
+def _to_rgb(pixels: np.ndarray, channels: int, palette: Optional[np.ndarray] = None) -> np.ndarray:
+    """Converts a (width, channels) row to RGB, compositing alpha on white."""
+    if palette is not None:
+        return palette[pixels[:, 0]]
+    pixels = pixels.astype(np.float64)
+    if channels in (2, 4):
+        alpha = pixels[:, -1:] / 255
+        pixels = pixels[:, :-1] * alpha + 255 * (1 - alpha)
+    if pixels.shape[1] == 1:
+        pixels = np.repeat(pixels, 3, axis=1)
+    return pixels
+
+
+def _unfilter(kind: int, row: np.ndarray, prior: np.ndarray, bpp: int) -> np.ndarray:
+    """Reverses a PNG scanline filter.
+
+    Sub and Up are vectorized. Average and Paeth depend on the byte just
+    reconstructed to their left, so on their own they run byte by byte;
+    `_unfilter_rows` sweeps whole blocks of them instead.
+    """
+    if kind == 0:
+        return row
+    if kind == 1:
+        return np.cumsum(row.reshape(-1, bpp), axis=0, dtype=np.uint8).reshape(-1)
+    if kind == 2:
+        return row + prior
+    out = bytearray(row.tobytes())
+    up = prior.tobytes()
+    if kind == 3:
+        for i in range(len(out)):
+            left = out[i - bpp] if i >= bpp else 0
+            out[i] = (out[i] + ((left + up[i]) >> 1)) & 0xFF
+    elif kind == 4:
+        for i in range(len(out)):
+            a = out[i - bpp] if i >= bpp else 0
+            b = up[i]
+            c = up[i - bpp] if i >= bpp else 0
+            p = a + b - c
+            pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+            out[i] = (out[i] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 0xFF
+    else:
+        raise ValueError(f"Invalid PNG filter type: {kind}")
+    return np.frombuffer(bytes(out), dtype=np.uint8)
+
+
+def _unfilter_wavefront(kinds: np.ndarray, rows: np.ndarray, prior: np.ndarray, bpp: int) -> np.ndarray:
+    """Reverses the filters of a block of rows along anti-diagonals.
+
+    A pixel depends on the pixel to its left and the two above it. With row
+    `j` shifted right by `j` pixels, those all sit in the previous two
+    columns, so each column of the shifted block is computed in one
+    vectorized step: width plus height steps instead of a step per byte.
+    """
+    count, stride = rows.shape
+    width = stride // bpp
+    # skewed[x + j + 1, j] holds pixel x of row j, with the prior row as row
+    # 0; the zeros to the left of each row stand in for the missing pixels
+    skewed = np.zeros((width + count + 1, count + 1, bpp), dtype=np.int16)
+    filtered = np.zeros_like(skewed)
+    skewed[1:width + 1, 0] = prior.reshape(width, bpp)
+    for j in range(1, count + 1):
+        filtered[j + 1:j + width + 1, j] = rows[j - 1].reshape(width, bpp)
+    uniform = int(kinds[0]) if (kinds == kinds[0]).all() else None
+    kinds = np.concatenate([[0], kinds]).astype(np.int16)[:, None]
+    for t in range(2, width + count + 1):
+        lo, hi = max(1, t - width), min(count, t - 1) + 1
+        a, b, c = skewed[t - 1, lo:hi], skewed[t - 1, lo - 1:hi - 1], skewed[t - 2, lo - 1:hi - 1]
+        if uniform == 3:
+            predicted = (a + b) >> 1
+        else:
+            ac, bc = a - c, b - c
+            pa, pb, pc = np.abs(bc), np.abs(ac), np.abs(ac + bc)
+            predicted = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+            if uniform != 4:
+                kind = kinds[lo:hi]
+                predicted = np.where(kind == 4, predicted, np.where(kind == 3, (a + b) >> 1, (kind == 1) * a + (kind == 2) * b))
+        skewed[t, lo:hi] = (filtered[t, lo:hi] + predicted) & 0xFF
+    out = np.empty((count, stride), dtype=np.uint8)
+    for j in range(1, count + 1):
+        out[j - 1] = skewed[j + 1:j + width + 1, j].reshape(-1)
+    return out
+
+
+def _unfilter_rows(kinds: np.ndarray, rows: np.ndarray, prior: np.ndarray, bpp: int) -> np.ndarray:
+    """Reverses the PNG filters of consecutive rows.
+
+    Args:
+        kinds: Each row's filter type.
+        rows: The filtered rows, as a (rows, stride) uint8 array.
+        prior: The reconstructed row above the first one.
+        bpp: The bytes per pixel.
+
+    Returns:
+        The reconstructed rows.
+
+    Raises:
+        ValueError: If a filter type is invalid.
+    """
+    if (kinds > 4).any():
+        raise ValueError(f"Invalid PNG filter type: {kinds.max()}")
+    out = np.empty_like(rows)
+    if np.isin(kinds, (3, 4)).sum() >= _WAVEFRONT_MIN_ROWS:
+        # The sweep holds (width + rows) x rows pixels, so tall blocks of
+        # narrow rows are swept in tiles about as tall as the rows are wide
+        tile = max(_WAVEFRONT_MIN_ROWS, rows.shape[1] // bpp)
+        for start in range(0, len(rows), tile):
+            part = slice(start, start + tile)
+            out[part] = _unfilter_wavefront(kinds[part], rows[part], prior, bpp)
+            prior = out[part][-1]
+        return out
+    for i, (kind, row) in enumerate(zip(kinds, rows)):
+        out[i] = prior = _unfilter(int(kind), row, prior, bpp)
+    return out
+
+
+def _png_chunks(f: BinaryIO) -> Iterator[Tuple[bytes, int]]:
+    """Yields (type, length) for each chunk, positioned at its data."""
+    f.seek(len(_PNG_SIGNATURE))
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            raise ValueError("Truncated PNG")
+        length, kind = struct.unpack(">I4s", header)
+        yield kind, length
+        if kind == b"IEND":
+            return
+
+
+def _decode_png(file_path: str, factor: int) -> Tuple[np.ndarray, str]:
+    """Decodes a PNG row by row, downscaling as it goes."""
+    palette = None
+    with open(file_path, "rb") as f:
+        chunks = _png_chunks(f)
+        for kind, length in chunks:
+            if kind == b"IHDR":
+                width, height, depth, color, _, _, interlace = struct.unpack(">IIBBBBB", f.read(length))
+                if depth not in (8, 16) or interlace or color not in _PNG_CHANNELS:
+                    raise ValueError("Decoding interlaced or low bit-depth PNGs needs Pillow")
+                channels = _PNG_CHANNELS[color]
+                bpp = channels * depth // 8
+                stride = width * bpp
+            elif kind == b"PLTE":
+                palette = np.frombuffer(f.read(length), dtype=np.uint8).reshape(-1, 3).astype(np.float64)
+            elif kind == b"IDAT":
+                break
+            else:
+                f.seek(length, os.SEEK_CUR)
+            f.seek(4, os.SEEK_CUR)  # CRC
+        else:
+            raise ValueError("PNG has no image data")
+
+        scaler = _BoxDownscaler(width, height, factor)
+        inflate = zlib.decompressobj()
+        pending = bytearray()
+        prior = np.zeros(stride, dtype=np.uint8)
+        rows = 0
+        block = max(1, _UNFILTER_BLOCK // (stride + 1))
+
+        def take_rows(final: bool = False) -> None:
+            # Rows are unfiltered a block at a time, so memory stays bounded
+            nonlocal prior, rows
+            while rows < height:
+                count = min(len(pending) // (stride + 1), block, height - rows)
+                if count == 0 or (count < min(block, height - rows) and not final):
+                    return
+                data = np.frombuffer(bytes(pending[:count * (stride + 1)]), dtype=np.uint8).reshape(count, stride + 1)
+                del pending[:count * (stride + 1)]
+                unfiltered = _unfilter_rows(data[:, 0], data[:, 1:], prior, bpp)
+                prior = unfiltered[-1]
+                for row in unfiltered:
+                    pixels = row[::2] if depth == 16 else row  # keep the high byte
+                    scaler.add(_to_rgb(pixels.reshape(width, channels), channels, palette if color == 3 else None))
+                rows += count
+
+        while kind == b"IDAT":
+            remaining = length
+            while remaining:
+                data = f.read(min(remaining, _READ_SIZE))
+                if not data:
+                    raise ValueError("Truncated PNG")
+                remaining -= len(data)
+                while data:
+                    # Inflate in bounded pieces; the rest stays in unconsumed_tail
+                    pending += inflate.decompress(data, _READ_SIZE)
+                    data = inflate.unconsumed_tail
+                    take_rows()
+            f.seek(4, os.SEEK_CUR)
+            kind, length = next(chunks)
+        pending += inflate.flush()
+        take_rows(final=True)
+        if rows < height:
+            raise ValueError("Truncated PNG image data")
+    return scaler.result(), "RGBA" if channels in (2, 4) else "P" if color == 3 else "RGB" if channels == 3 else "L"
 
-def analyze_image(file_path: str) -> dict:
+
+def _decode_bmp(file_path: str, factor: int) -> Tuple[np.ndarray, str]:
+    """Decodes an uncompressed 24 or 32-bit BMP through a memory map."""
+    with open(file_path, "rb") as f:
+        header = f.read(54)
+    offset, = struct.unpack("<I", header[10:14])
+    width, height, _, bits, compression = struct.unpack("<iiHHI", header[18:34])
+    if bits not in (24, 32) or compression not in (0, 3):
+        raise ValueError("Decoding compressed or palette BMPs needs Pillow")
+    bpp = bits // 8
+    stride = (width * bpp + 3) & ~3
+    data = np.memmap(file_path, dtype=np.uint8, mode="r", offset=offset, shape=(abs(height), stride))
+    scaler = _BoxDownscaler(width, abs(height), factor)
+    # Rows are stored bottom-up unless the height is negative
+    for y in (range(height - 1, -1, -1) if height > 0 else range(-height)):
+        scaler.add(data[y, :width * bpp].reshape(width, bpp)[:, 2::-1].astype(np.float64))
+    del data
+    return scaler.result(), "RGB"
+
+
+def _decode_with_pillow(file_path: str, size: int) -> Tuple[np.ndarray, str]:
+    """Decodes any format Pillow supports, straight to analysis resolution."""
+    from PIL import Image
+
+    with Image.open(file_path) as image:
+        mode = image.mode
+        # thumbnail() sets the JPEG draft scale, so the full image is never decoded
+        image.thumbnail((size, size), resample=Image.Resampling.BOX)
+        if "A" in image.getbands() or image.mode == "P":
+            image = image.convert("RGBA")
+            background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+            image = Image.alpha_composite(background, image)
+        return np.asarray(image.convert("RGB"), dtype=np.float32), mode
+
+
+def decode_image(file_path: str, info: Dict[str, Any], size: int) -> Tuple[np.ndarray, str, str]:
+    """Decodes an image once, at analysis resolution.
+
+    Args:
+        file_path: The path to the image file.
+        info: The image's header, from `probe_image`.
+        size: The longest side of the decoded image, in pixels.
+
+    Returns:
+        A (pixels, mode, decoder) tuple; `pixels` is a float32 (height,
+        width, 3) RGB array.
+
+    Raises:
+        ValueError: If the image cannot be decoded without Pillow.
+    """
+    try:
+        pixels, mode = _decode_with_pillow(file_path, size)
+        return pixels, mode, "pillow"
+    except ImportError:
+        pass
+    factor = max(1, math.ceil(max(info["width"], info["height"]) / size))
+    if info["format"] == "png":
+        pixels, mode = _decode_png(file_path, factor)
+    elif info["format"] == "bmp":
+        pixels, mode = _decode_bmp(file_path, factor)
+    else:
+        raise ValueError(f"Decoding {info['format'].upper()} images needs Pillow")
+    return pixels, mode, "numpy"
+
+
+def _resample(channel: np.ndarray, size: int) -> np.ndarray:
+    """Resizes a 2D array to size x size by block averaging."""
+    result = channel
+    for axis in (0, 1):
+        n = result.shape[axis]
+        if n >= size:
+            starts = np.linspace(0, n, size, endpoint=False).astype(int)
+            counts = np.diff(np.append(starts, n))
+            shape = [1, 1]
+            shape[axis] = size
+            result = np.add.reduceat(result, starts, axis=axis) / counts.reshape(shape)
+        else:
+            result = np.take(result, np.arange(size) * n // size, axis=axis)
+    return result
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    return np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n))
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def perceptual_hash(luma: np.ndarray) -> str:
+    """Computes a 64-bit DCT perceptual hash.
+
+    The luma is reduced to 32x32 and transformed; each bit says whether one
+    of the 8x8 lowest-frequency coefficients is above their median, so the
+    hash survives rescaling, recompression and small edits.
+
+    Args:
+        luma: A 2D array of luma values.
+
+    Returns:
+        The hash as 16 hex digits.
+    """
+    coefficients = (_DCT32 @ _resample(luma, 32) @ _DCT32.T)[:8, :8].reshape(-1)
+    bits = coefficients > np.median(coefficients[1:])
+    return f"{int(''.join('1' if bit else '0' for bit in bits), 2):016x}"
+
+
+def hash_distance(a: str, b: str) -> int:
+    """Counts the bits that differ between two perceptual hashes.
+
+    Args:
+        a: A perceptual hash.
+        b: Another perceptual hash.
+
+    Returns:
+        The Hamming distance; near-duplicates are within a few bits.
+    """
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def _histogram(values: np.ndarray, bins: int) -> List[float]:
+    counts = np.bincount(np.clip(values * bins / 256, 0, bins - 1).astype(np.intp).ravel(), minlength=bins)
+    return [round(float(c), 4) for c in counts / max(1, values.size)]
+
+
+def extract_features(pixels: np.ndarray) -> Dict[str, Any]:
+    """Computes color, tone, edge and hash features of a decoded image.
+
+    Args:
+        pixels: A float (height, width, 3) RGB array with values in 0-255.
+
+    Returns:
+        A dictionary of image features.
+    """
+    rgb = pixels.reshape(-1, 3)
+    luma = pixels @ np.array([0.299, 0.587, 0.114])
+    r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    rg, yb = r - g, 0.5 * (r + g) - b
+    colorfulness = math.hypot(rg.std(), yb.std()) + 0.3 * math.hypot(rg.mean(), yb.mean())
+
+    probabilities = np.bincount(luma.astype(np.intp).ravel(), minlength=256) / luma.size
+    probabilities = probabilities[probabilities > 0]
+    gradient = np.hypot(*np.gradient(luma)) if min(luma.shape) > 1 else np.zeros_like(luma)
+
+    quantized = rgb.astype(np.intp) >> 4
+    bins = (quantized[:, 0] << 8) | (quantized[:, 1] << 4) | quantized[:, 2]
+    counts = np.bincount(bins, minlength=4096)
+    top = [i for i in np.argsort(counts)[::-1][:5] if counts[i]]
+    dominant = []
+    for i in top:
+        color = rgb[bins == i].mean(axis=0).round().astype(int)
+        dominant.append({"color": "#%02x%02x%02x" % tuple(color), "share": round(float(counts[i] / len(bins)), 4)})
+
+    return {
+        "brightness": round(float(luma.mean() / 255), 4),
+        "contrast": round(float(luma.std() / 255), 4),
+        "colorfulness": round(colorfulness, 2),
+        "entropy": round(float(-(probabilities * np.log2(probabilities)).sum()), 4),
+        "edge_density": round(float((gradient > 32).mean()), 4),
+        "mean_color": [round(float(v), 1) for v in rgb.mean(axis=0)],
+        "dominant_colors": dominant,
+        "histogram": {
+            "r": _histogram(r, 16),
+            "g": _histogram(g, 16),
+            "b": _histogram(b, 16),
+            "luma": _histogram(luma, 32),
+        },
+        "phash": perceptual_hash(luma),
+    }
+
+
+def analyze_image(file_path: str, size: Optional[int] = None) -> dict:
     """Analyzes an image and returns a dictionary of information.
 
     Args:
         file_path: The path to the image file.
+        size: The longest side, in pixels, of the resolution features are
+            computed at. Defaults to `IMAGE_ANALYSIS_SIZE`.
 
     Returns:
-        A dictionary of information about the image.
+        A dictionary with the image's format, dimensions and mode, the
+        resolution it was analyzed at, and its features: brightness,
+        contrast, colorfulness, entropy, edge density, mean and dominant
+        colors, normalized histograms and a perceptual hash.
+
+    Raises:
+        ValueError: If the image is not recognized, has more than
+            `IMAGE_MAX_PIXELS` pixels or cannot be decoded.
     """
-    return {"status": "stub"}
+    info = probe_image(file_path)
+    if info["width"] <= 0 or info["height"] <= 0:
+        raise ValueError("Image has no pixels")
+    if info["width"] * info["height"] > config.IMAGE_MAX_PIXELS:
+        raise ValueError(f"Image has {info['width']}x{info['height']} pixels, over the limit of {config.IMAGE_MAX_PIXELS}")
+    pixels, mode, decoder = decode_image(file_path, info, size or config.IMAGE_ANALYSIS_SIZE)
+    return {
+        **info,
+        "mode": mode,
+        "bytes": os.path.getsize(file_path),
+        "analysis_size": [pixels.shape[1], pixels.shape[0]],
+        "decoder": decoder,
+        **extract_features(pixels),
+    }
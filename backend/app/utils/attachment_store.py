@@ -0,0 +1,271 @@
+"""A content-addressed store for uploaded attachments.
+
+Uploads are streamed to a temporary file in bounded pieces and hashed as
+they arrive, so a file is never held in memory whole. Once complete, the
+file is moved to a path derived from its SHA-256 (`objects/ab/abcd...`). A
+file uploaded again under any name finds its path taken and is discarded,
+so every distinct file is stored once. The hash is the attachment's ID:
+chat messages and plugin calls refer to attachments by it instead of
+sending the bytes again.
+"""
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import aiofiles
+import aiofiles.os
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+_ID = re.compile(r"^[0-9a-f]{64}$")
+_WRITE_BUFFER = 1 << 20
+
+
+class AttachmentTooLarge(Exception):
+    """Raised when an upload exceeds `ATTACHMENT_MAX_SIZE`."""
+
+
+def attachment_kind(content_type: str) -> str:
+    """Classifies a content type the way the frontend previews it.
+
+    Args:
+        content_type: A MIME type.
+
+    Returns:
+        "image", "audio" or "file".
+    """
+    kind = content_type.split("/", 1)[0]
+    return kind if kind in ("image", "audio") else "file"
+
+
+class AttachmentWriter:
+    """Streams one upload to disk, hashing it on the fly."""
+    def __init__(self, store: "AttachmentStore", filename: str, content_type: Optional[str]):
+        """Initializes the writer; the temporary file is opened on first write.
+
+        Args:
+            store: The store the upload goes to.
+            filename: The uploaded file's name.
+            content_type: The uploaded file's content type, if known.
+        """
+        self.store = store
+        self.filename = os.path.basename(filename or "") or "upload"
+        self.content_type = content_type or mimetypes.guess_type(self.filename)[0] or "application/octet-stream"
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._buffer = bytearray()
+        self._file = None
+        self._tmp_path = os.path.join(store.directory, "tmp", uuid.uuid4().hex)
+
+    async def write(self, data: bytes) -> None:
+        """Appends a piece of the upload.
+
+        Args:
+            data: The next bytes of the file.
+
+        Raises:
+            AttachmentTooLarge: If the upload grows past the store's limit.
+        """
+        self.size += len(data)
+        if self.size > self.store.max_size:
+            raise AttachmentTooLarge(f"Attachments are limited to {self.store.max_size} bytes")
+        self._digest.update(data)
+        self._buffer += data
+        if len(self._buffer) >= _WRITE_BUFFER:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        if self._file is None:
+            await aiofiles.os.makedirs(os.path.dirname(self._tmp_path), exist_ok=True)
+            self._file = await aiofiles.open(self._tmp_path, "wb")
+        if self._buffer:
+            await self._file.write(bytes(self._buffer))
+            self._buffer.clear()
+
+    async def commit(self) -> Tuple[Dict[str, Any], bool]:
+        """Finishes the upload and stores it under its content hash.
+
+        Returns:
+            The attachment's metadata, and whether it was new; if not, the
+            upload is discarded in favour of the stored copy.
+        """
+        await self._flush()
+        await self._file.close()
+        attachment_id = self._digest.hexdigest()
+        path = self.store.path(attachment_id)
+        metadata = await self.store.get(attachment_id)
+        if metadata is not None and await aiofiles.os.path.exists(path):
+            await aiofiles.os.remove(self._tmp_path)
+            self.store.deduplicated += 1
+            return metadata, False
+        await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+        await aiofiles.os.replace(self._tmp_path, path)
+        metadata = {
+            "id": attachment_id,
+            "filename": self.filename,
+            "content_type": self.content_type,
+            "type": attachment_kind(self.content_type),
+            "size": self.size,
+            "created_at": time.time(),
+        }
+        meta_tmp = f"{self._tmp_path}.json"
+        async with aiofiles.open(meta_tmp, "w") as f:
+            await f.write(json.dumps(metadata))
+        await aiofiles.os.replace(meta_tmp, f"{path}.json")
+        self.store.stored += 1
+        self.store.bytes_stored += self.size
+        return metadata, True
+
+    async def abort(self) -> None:
+        """Discards a partial upload."""
+        if self._file is not None:
+            await self._file.close()
+            try:
+                await aiofiles.os.remove(self._tmp_path)
+            except FileNotFoundError:
+                pass
+
+
+class AttachmentStore:
+    """Stores attachments on disk under their SHA-256."""
+    def __init__(self, directory: str, max_size: int):
+        """Initializes the store.
+
+        Args:
+            directory: The directory holding the attachments.
+            max_size: The largest attachment accepted, in bytes.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.stored = 0
+        self.deduplicated = 0
+        self.bytes_stored = 0
+
+    def path(self, attachment_id: str) -> str:
+        """Gets the path an attachment is stored at.
+
+        Args:
+            attachment_id: The attachment's SHA-256.
+
+        Returns:
+            The file's path.
+
+        Raises:
+            ValueError: If the ID is not a SHA-256 hex digest.
+        """
+        if not _ID.match(attachment_id or ""):
+            raise ValueError(f"Invalid attachment ID: {attachment_id!r}")
+        return os.path.join(self.directory, "objects", attachment_id[:2], attachment_id)
+
+    async def get(self, attachment_id: str) -> Optional[Dict[str, Any]]:
+        """Gets an attachment's metadata.
+
+        Args:
+            attachment_id: The attachment's SHA-256.
+
+        Returns:
+            The ID, filename, content type, kind, size and creation time, or
+            None if there is no such attachment.
+        """
+        try:
+            async with aiofiles.open(f"{self.path(attachment_id)}.json", "r") as f:
+                return json.loads(await f.read())
+        except (ValueError, FileNotFoundError):
+            return None
+
+    def writer(self, filename: str, content_type: Optional[str] = None) -> AttachmentWriter:
+        """Starts an upload.
+
+        Args:
+            filename: The uploaded file's name.
+            content_type: The uploaded file's content type, if known.
+
+        Returns:
+            A writer to stream the upload into.
+        """
+        return AttachmentWriter(self, filename, content_type)
+
+    async def save(
+        self, chunks: AsyncIterator[bytes], filename: str, content_type: Optional[str] = None
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Stores an upload from a stream of chunks.
+
+        Args:
+            chunks: The file's bytes.
+            filename: The uploaded file's name.
+            content_type: The uploaded file's content type, if known.
+
+        Returns:
+            The attachment's metadata, and whether it was new.
+
+        Raises:
+            AttachmentTooLarge: If the upload exceeds the store's limit.
+        """
+        writer = self.writer(filename, content_type)
+        try:
+            async for chunk in chunks:
+                await writer.write(chunk)
+            return await writer.commit()
+        except BaseException:
+            await writer.abort()
+            raise
+
+    async def render(self, content: str, attachment_ids: list) -> str:
+        """Appends references to attachments to a chat message.
+
+        Each attachment becomes a line naming its file, type, size and ID.
+        Small text attachments are also inlined, since a model can read
+        them directly.
+
+        Args:
+            content: The message text.
+            attachment_ids: The IDs of the message's attachments.
+
+        Returns:
+            The message text with its attachments.
+
+        Raises:
+            ValueError: If an attachment does not exist.
+        """
+        parts = [content] if content else []
+        for attachment_id in attachment_ids:
+            metadata = await self.get(attachment_id)
+            if metadata is None:
+                raise ValueError(f"Unknown attachment: {attachment_id}")
+            parts.append(
+                f"[Attachment: {metadata['filename']} ({metadata['content_type']}, "
+                f"{metadata['size']} bytes, sha256:{attachment_id})]"
+            )
+            textual = metadata["content_type"].startswith("text/") or metadata["content_type"] in (
+                "application/json", "application/xml", "application/x-yaml",
+            )
+            if textual and metadata["size"] <= config.ATTACHMENT_INLINE_BYTES:
+                async with aiofiles.open(self.path(attachment_id), "rb") as f:
+                    text = (await f.read()).decode("utf-8", errors="replace")
+                parts.append(f"```\n{text}\n```")
+        return "\n\n".join(parts)
+
+    def stats(self) -> Dict[str, Any]:
+        """Gets upload and de-duplication counters.
+
+        Returns:
+            A dictionary of attachment store statistics.
+        """
+        uploads = self.stored + self.deduplicated
+        return {
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "dedupe_rate": self.deduplicated / uploads if uploads else 0.0,
+            "bytes_stored": self.bytes_stored,
+        }
+
+
+attachment_store = AttachmentStore(config.ATTACHMENT_DIR, config.ATTACHMENT_MAX_SIZE)
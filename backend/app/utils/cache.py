@@ -0,0 +1,348 @@
+"""Two-tier byte caches.
+
+A `TieredCache` keeps a bounded in-process LRU in front of a persistent store.
+The persistent tier is Redis when it is reachable and a directory of files
+otherwise, so caches keep working on a single machine without extra services.
+Cache failures are logged and treated as misses; they never fail a request.
+"""
+import hashlib
+import logging
+import os
+import struct
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import aiofiles
+import aiofiles.os
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+
+def stable_hash(*parts: str) -> str:
+    """Hashes a sequence of strings into a hex digest.
+
+    Args:
+        *parts: The strings to hash. They are separated by NUL bytes so that
+            ("ab", "c") and ("a", "bc") hash differently.
+
+    Returns:
+        A SHA-256 hex digest.
+    """
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """A bounded in-process LRU map of byte values with optional expiry."""
+    def __init__(self, max_entries: int):
+        """Initializes the LRU cache.
+
+        Args:
+            max_entries: The maximum number of entries to keep.
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Gets a value and marks it as recently used.
+
+        Args:
+            key: The cache key.
+
+        Returns:
+            The cached value, or None if missing or expired.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at and expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        """Stores a value, evicting the least recently used entries if full.
+
+        Args:
+            key: The cache key.
+            value: The value to store.
+            ttl: An optional time-to-live in seconds.
+        """
+        if self.max_entries <= 0:
+            return
+        expires_at = time.time() + ttl if ttl else 0.0
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        """Removes a value if present.
+
+        Args:
+            key: The cache key.
+        """
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class FileStore:
+    """A persistent store that keeps one file per key under a directory.
+
+    Each file starts with an 8-byte expiry timestamp (0 for no expiry)
+    followed by the raw value.
+    """
+    _HEADER = struct.Struct("<d")
+
+    def __init__(self, directory: str):
+        """Initializes the file store.
+
+        Args:
+            directory: The directory to store files in.
+        """
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        digest = stable_hash(key)
+        return os.path.join(self.directory, digest[:2], digest)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Reads a value from disk.
+
+        Args:
+            key: The cache key.
+
+        Returns:
+            The stored value, or None if missing or expired.
+        """
+        path = self._path(key)
+        try:
+            async with aiofiles.open(path, "rb") as f:
+                data = await f.read()
+        except FileNotFoundError:
+            return None
+        (expires_at,) = self._HEADER.unpack_from(data)
+        if expires_at and expires_at < time.time():
+            await self.delete(key)
+            return None
+        return data[self._HEADER.size:]
+
+    async def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        """Writes a value to disk atomically.
+
+        Args:
+            key: The cache key.
+            value: The value to store.
+            ttl: An optional time-to-live in seconds.
+        """
+        path = self._path(key)
+        await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+        expires_at = time.time() + ttl if ttl else 0.0
+        # Unique per write, so concurrent writes of one key never share a file
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        async with aiofiles.open(tmp_path, "wb") as f:
+            await f.write(self._HEADER.pack(expires_at) + value)
+        await aiofiles.os.replace(tmp_path, path)
+
+    async def delete(self, key: str) -> None:
+        """Removes a value if present.
+
+        Args:
+            key: The cache key.
+        """
+        try:
+            await aiofiles.os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    async def close(self) -> None:
+        """Releases resources held by the store."""
+
+
+class RedisStore:
+    """A persistent store backed by Redis."""
+    def __init__(self, url: str, prefix: str):
+        """Initializes the Redis store.
+
+        Args:
+            url: The Redis connection URL.
+            prefix: A prefix added to every key.
+        """
+        import redis.asyncio as redis
+
+        self.prefix = prefix
+        self.client = redis.from_url(url, socket_connect_timeout=1)
+
+    async def ping(self) -> None:
+        """Checks that Redis is reachable.
+
+        Raises:
+            redis.RedisError: If Redis cannot be reached.
+        """
+        await self.client.ping()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Gets a value from Redis.
+
+        Args:
+            key: The cache key.
+
+        Returns:
+            The stored value, or None if missing.
+        """
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        """Stores a value in Redis.
+
+        Args:
+            key: The cache key.
+            value: The value to store.
+            ttl: An optional time-to-live in seconds.
+        """
+        await self.client.set(self.prefix + key, value, ex=ttl or None)
+
+    async def delete(self, key: str) -> None:
+        """Removes a value if present.
+
+        Args:
+            key: The cache key.
+        """
+        await self.client.delete(self.prefix + key)
+
+    async def close(self) -> None:
+        """Closes the Redis connection pool."""
+        await self.client.close()
+
+
+class TieredCache:
+    """A local LRU tier in front of a persistent Redis or file tier."""
+    def __init__(self, namespace: str, max_entries: int, ttl: Optional[int] = None):
+        """Initializes the cache.
+
+        Args:
+            namespace: A short name that keeps this cache's keys apart from
+                other caches sharing the same persistent store.
+            max_entries: The maximum number of entries in the local tier.
+            ttl: The default time-to-live in seconds, or None for no expiry.
+        """
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local = LRUCache(max_entries)
+        self._store = None
+        self._store_ready = False
+        self.hits: Dict[str, int] = {"local": 0, "persistent": 0}
+        self.misses = 0
+        self.errors = 0
+
+    async def _get_store(self):
+        """Opens the persistent tier on first use.
+
+        Falls back from Redis to the file store when Redis is unreachable.
+        """
+        if self._store_ready:
+            return self._store
+        backend = config.CACHE_BACKEND
+        store = None
+        if backend == "redis":
+            store = RedisStore(config.REDIS_URL, f"mgdi:{self.namespace}:")
+            try:
+                await store.ping()
+            except Exception as e:
+                logger.warning(f"Redis unavailable for {self.namespace} cache, using files: {e}")
+                await store.close()
+                backend = "file"
+        if backend == "file":
+            store = FileStore(os.path.join(config.CACHE_DIR, self.namespace))
+        self._store, self._store_ready = store, True
+        return store
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Gets a value, checking the local tier before the persistent one.
+
+        Args:
+            key: The cache key.
+
+        Returns:
+            The cached value, or None on a miss.
+        """
+        value = self.local.get(key)
+        if value is not None:
+            self.hits["local"] += 1
+            return value
+        try:
+            store = await self._get_store()
+            value = await store.get(key) if store is not None else None
+        except Exception as e:
+            self.errors += 1
+            logger.debug(f"{self.namespace} cache read failed: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits["persistent"] += 1
+        self.local.set(key, value, self.ttl)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        """Stores a value in both tiers.
+
+        Args:
+            key: The cache key.
+            value: The value to store.
+            ttl: An optional time-to-live overriding the cache default.
+        """
+        ttl = ttl if ttl is not None else self.ttl
+        self.local.set(key, value, ttl)
+        try:
+            store = await self._get_store()
+            if store is not None:
+                await store.set(key, value, ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.debug(f"{self.namespace} cache write failed: {e}")
+
+    async def delete(self, key: str) -> None:
+        """Removes a value from both tiers.
+
+        Args:
+            key: The cache key.
+        """
+        self.local.delete(key)
+        try:
+            store = await self._get_store()
+            if store is not None:
+                await store.delete(key)
+        except Exception as e:
+            self.errors += 1
+            logger.debug(f"{self.namespace} cache delete failed: {e}")
+
+    async def close(self) -> None:
+        """Closes the persistent tier; it is reopened on next use."""
+        store, self._store, self._store_ready = self._store, None, False
+        if store is not None:
+            await store.close()
+
+    def stats(self) -> dict:
+        """Gets hit and miss counters for this cache.
+
+        Returns:
+            A dictionary of counters and the overall hit rate.
+        """
+        hits = self.hits["local"] + self.hits["persistent"]
+        lookups = hits + self.misses
+        return {
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "local_entries": len(self.local),
+            "backend": type(self._store).__name__ if self._store else None,
+        }
@@ -0,0 +1,201 @@
+"""Micro-batching for embedding requests.
+
+Concurrent single-text embedding calls are collected for a short window and
+sent upstream as one batched request, then the vectors are fanned back out
+to the waiting callers.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from .token_counter import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+EmbedBatchFn = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+# Client errors that mean "try again later" rather than "this input is bad"
+_TRANSIENT_STATUSES = {408, 409, 429}
+
+
+def is_input_error(error: BaseException) -> bool:
+    """Tells whether a failed request was rejected because of its inputs.
+
+    Rate limits, server errors, timeouts, connection failures and local
+    load shedding say nothing about the inputs, and retrying them one by one
+    would only multiply the load on an already overloaded upstream.
+
+    Args:
+        error: The exception raised by the upstream call.
+
+    Returns:
+        True for 4xx responses other than timeouts, conflicts and rate
+        limits, and for local `ValueError` and `TypeError` input checks.
+    """
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return 400 <= status < 500 and status not in _TRANSIENT_STATUSES
+    return isinstance(error, (ValueError, TypeError))
+
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent embedding calls into batched upstream requests.
+
+    A batch is sent when `max_wait` seconds have passed since its first
+    input, when it holds `max_batch` distinct inputs, or when adding another
+    input would exceed `max_tokens`. If a batched request is rejected
+    because of its inputs, they are retried one by one so that a single bad
+    input only fails its own callers; any other failure, such as a rate
+    limit, fails the whole batch at once.
+    """
+    def __init__(
+        self,
+        embed_batch: EmbedBatchFn,
+        max_batch: int = 128,
+        max_wait: float = 0.005,
+        max_tokens: int = 100000,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+    ):
+        """Initializes the batcher.
+
+        Args:
+            embed_batch: A coroutine function that embeds a list of texts and
+                returns the vectors in the same order.
+            max_batch: The maximum number of inputs per upstream request.
+            max_wait: The maximum time in seconds an input waits for others.
+            max_tokens: The token budget per upstream request.
+            count_tokens: A function that counts the tokens of an input.
+        """
+        self.embed_batch = embed_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._pending_tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.callers = 0
+        self.batches = 0
+        self.upstream_inputs = 0
+        self.isolated_retries = 0
+        self.errors = 0
+
+    async def embed(self, text: str) -> List[float]:
+        """Embeds a text as part of the next batch.
+
+        Args:
+            text: The text to embed.
+
+        Returns:
+            The embedding for the text.
+
+        Raises:
+            Exception: If embedding this text failed upstream.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.callers += 1
+        if text in self._pending:
+            self._pending[text].append(future)
+            return await future
+
+        tokens = self.count_tokens(text)
+        if self._pending and self._pending_tokens + tokens > self.max_tokens:
+            self._flush()
+        self._pending[text] = [future]
+        self._pending_tokens += tokens
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        """Sends the pending inputs as one batch in the background."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending, self._pending_tokens = self._pending, {}, 0
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: Dict[str, List[asyncio.Future]]) -> None:
+        """Embeds a batch and resolves the callers' futures.
+
+        Args:
+            batch: A mapping of text to the futures waiting for it.
+        """
+        texts = list(batch)
+        self.batches += 1
+        self.upstream_inputs += len(texts)
+        try:
+            vectors = await self.embed_batch(texts)
+        except Exception as e:
+            if len(texts) == 1 or not is_input_error(e):
+                for futures in batch.values():
+                    self._resolve(futures, error=e)
+                return
+            logger.warning(f"Batched embedding of {len(texts)} inputs failed, retrying individually: {e}")
+            await asyncio.gather(*(self._run_single(text, batch[text]) for text in texts))
+            return
+        for text, vector in zip(texts, vectors):
+            self._resolve(batch[text], result=vector)
+
+    async def _run_single(self, text: str, futures: List[asyncio.Future]) -> None:
+        """Embeds one text on its own after its batch failed.
+
+        Args:
+            text: The text to embed.
+            futures: The futures waiting for the text.
+        """
+        self.isolated_retries += 1
+        try:
+            vectors = await self.embed_batch([text])
+        except Exception as e:
+            self._resolve(futures, error=e)
+        else:
+            self._resolve(futures, result=vectors[0])
+
+    def _resolve(
+        self,
+        futures: List[asyncio.Future],
+        result: Optional[List[float]] = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        """Sets a result or error on every future that is still waiting.
+
+        Args:
+            futures: The futures to resolve.
+            result: The embedding, if it succeeded.
+            error: The exception, if it failed.
+        """
+        if error is not None:
+            self.errors += 1
+        for future in futures:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        """Gets batching counters.
+
+        Returns:
+            A dictionary with caller, batch and upstream input counts.
+        """
+        return {
+            "callers": self.callers,
+            "batches": self.batches,
+            "upstream_inputs": self.upstream_inputs,
+            "avg_batch_size": self.upstream_inputs / self.batches if self.batches else 0.0,
+            "isolated_retries": self.isolated_retries,
+            "errors": self.errors,
+        }
+
@@ -0,0 +1,126 @@
+"""A content-addressed cache for text embeddings.
+
+Embeddings are keyed by a hash of the embedding model and the normalized
+text, and stored as packed little-endian float32 bytes (6 KB for a
+1536-dimension vector, instead of ~30 KB as a JSON list).
+"""
+import sys
+import unicodedata
+from array import array
+from typing import List, Optional
+
+from ..config import config
+from .cache import TieredCache, stable_hash
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes text so trivially different strings share a cache entry.
+
+    Texts that differ only in whitespace get the same key, so they share the
+    embedding of whichever was embedded first rather than each getting their
+    own.
+
+    Args:
+        text: The text to normalize.
+
+    Returns:
+        The NFC-normalized text with runs of whitespace collapsed.
+    """
+    return unicodedata.normalize("NFC", " ".join(text.split()))
+
+
+def embedding_key(model: str, text: str) -> str:
+    """Builds the cache key for an embedding.
+
+    Args:
+        model: The embedding model.
+        text: The embedded text.
+
+    Returns:
+        The cache key.
+    """
+    return stable_hash(model, normalize_text(text))
+
+
+def pack_vector(vector: List[float]) -> bytes:
+    """Packs a vector into little-endian float32 bytes.
+
+    Args:
+        vector: The vector to pack.
+
+    Returns:
+        The packed bytes.
+    """
+    packed = array("f", vector)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_vector(data: bytes) -> List[float]:
+    """Unpacks little-endian float32 bytes into a vector.
+
+    Args:
+        data: The packed bytes.
+
+    Returns:
+        The vector as a list of floats.
+    """
+    packed = array("f")
+    packed.frombytes(data)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tolist()
+
+
+class EmbeddingCache:
+    """Caches embeddings by (model, normalized text)."""
+    def __init__(self, cache: TieredCache):
+        """Initializes the embedding cache.
+
+        Args:
+            cache: The byte cache to store packed vectors in.
+        """
+        self.cache = cache
+
+    async def get(self, model: str, text: str) -> Optional[List[float]]:
+        """Gets a cached embedding.
+
+        Args:
+            model: The embedding model.
+            text: The embedded text.
+
+        Returns:
+            The embedding, or None on a miss.
+        """
+        data = await self.cache.get(embedding_key(model, text))
+        return unpack_vector(data) if data is not None else None
+
+    async def set(self, model: str, text: str, vector: List[float]) -> None:
+        """Caches an embedding.
+
+        Args:
+            model: The embedding model.
+            text: The embedded text.
+            vector: The embedding.
+        """
+        await self.cache.set(embedding_key(model, text), pack_vector(vector))
+
+    async def close(self) -> None:
+        """Closes the underlying cache."""
+        await self.cache.close()
+
+    def stats(self) -> dict:
+        """Gets hit and miss counters.
+
+        Returns:
+            A dictionary of cache statistics.
+        """
+        return self.cache.stats()
+
+
+embedding_cache = EmbeddingCache(TieredCache(
+    "emb",
+    max_entries=config.EMBEDDING_CACHE_SIZE,
+    ttl=config.EMBEDDING_CACHE_TTL or None,
+))
@@ -0,0 +1,117 @@
+"""File responses with byte ranges and zero-copy sending.
+
+`RangeFileResponse` serves one byte range of a file (`Range: bytes=...`),
+which lets clients seek in audio and resume interrupted downloads. When the
+ASGI server supports the `http.response.zerocopysend` extension, the file
+descriptor is handed to the server, which sends it with `sendfile` without
+copying the bytes through Python; otherwise the file is streamed in chunks
+read off the event loop.
+"""
+from typing import Mapping, Optional, Tuple
+
+import aiofiles
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when a requested range lies outside the file."""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parses a single-range `Range` header.
+
+    Args:
+        header: The `Range` header, if any.
+        size: The file size in bytes.
+
+    Returns:
+        The inclusive (first, last) byte positions, or None if the whole
+        file should be sent: there is no header, it uses a unit other than
+        bytes, or it asks for several ranges.
+
+    Raises:
+        RangeNotSatisfiable: If the range starts past the end of the file.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:  # a suffix: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable(header)
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+class RangeFileResponse(Response):
+    """Sends a file, or one byte range of it."""
+    chunk_size = 256 * 1024
+
+    def __init__(
+        self,
+        path: str,
+        size: int,
+        range_header: Optional[str] = None,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None,
+        method: str = "GET",
+    ):
+        """Initializes the response.
+
+        Args:
+            path: The path to the file.
+            size: The file size in bytes.
+            range_header: The request's `Range` header.
+            headers: Extra response headers.
+            media_type: The file's content type.
+            method: The request method; HEAD sends the headers only.
+        """
+        self.path = path
+        self.media_type = media_type
+        self.background = None
+        self.send_header_only = method.upper() == "HEAD"
+        self.init_headers(headers)
+        self.headers["accept-ranges"] = "bytes"
+        try:
+            selected = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            self.status_code = 416
+            self.offset = self.count = 0
+            self.headers["content-range"] = f"bytes */{size}"
+            self.headers["content-length"] = "0"
+            return
+        if selected is None:
+            self.status_code, self.offset, self.count = 200, 0, size
+        else:
+            start, end = selected
+            self.status_code, self.offset, self.count = 206, start, end - start + 1
+            self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+        self.headers["content-length"] = str(self.count)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only or not self.count:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({"type": ZEROCOPY_EXTENSION, "file": f, "offset": self.offset, "count": self.count})
+        else:
+            async with aiofiles.open(self.path, "rb") as f:
+                await f.seek(self.offset)
+                remaining = self.count
+                while remaining:
+                    chunk = await f.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        raise RuntimeError(f"File at path {self.path} is shorter than expected")
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
@@ -0,0 +1,249 @@
+"""Server-side compaction of long chat histories.
+
+Clients resend the whole conversation on every turn. Once a conversation
+exceeds a token budget, the compactor keeps the system messages and the most
+recent messages verbatim and replaces everything older with a summary
+written by a cheap model. The kept messages always start at a user turn, as
+some providers reject a conversation that starts with an assistant turn.
+
+Summaries are cached by a hash chain over the summarized messages, so each
+conversation prefix is summarized once. Summaries are rolling: a longer
+prefix is summarized from the cached summary of the longest shorter prefix
+plus the messages added since, not from scratch. The split point advances in
+steps of several messages, so a new summary is needed only every few turns.
+However far the conversation is past the cached summary (after a restart or
+a cache eviction), catching up takes a single summarizer call.
+"""
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from ..config import config
+from ..models.registry import provider_registry
+from .cache import TieredCache, stable_hash
+from .token_counter import count_messages
+
+logger = logging.getLogger(__name__)
+
+SummarizeFn = Callable[[Optional[str], List[Dict[str, str]]], Awaitable[str]]
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a user and an "
+    "assistant. Update the summary with the new messages. Keep facts, "
+    "decisions, names, numbers, code identifiers and open questions; drop "
+    "pleasantries. Reply with the updated summary only."
+)
+
+
+def prefix_hashes(seed: str, messages: List[Dict[str, str]]) -> List[str]:
+    """Hashes every prefix of a conversation as a chain.
+
+    Args:
+        seed: A value that separates unrelated chains (e.g. the summary model).
+        messages: The conversation.
+
+    Returns:
+        A list where item i is the hash of the first i messages.
+    """
+    hashes = [stable_hash(seed)]
+    for message in messages:
+        hashes.append(stable_hash(hashes[-1], message["role"], message["content"]))
+    return hashes
+
+
+def format_transcript(messages: List[Dict[str, str]]) -> str:
+    """Formats messages as a plain transcript for the summarizer.
+
+    Args:
+        messages: The messages to format.
+
+    Returns:
+        One "role: content" paragraph per message.
+    """
+    return "\n\n".join(f"{m['role']}: {m['content']}" for m in messages)
+
+
+def next_user_turn(turns: List[Dict[str, str]], index: int) -> int:
+    """Finds the first user turn at or after an index.
+
+    Args:
+        turns: The conversation without its system messages.
+        index: The index to start from.
+
+    Returns:
+        The index of the user turn, or `len(turns)` if there is none.
+    """
+    while index < len(turns) and turns[index]["role"] != "user":
+        index += 1
+    return index
+
+
+class HistoryCompactor:
+    """Replaces old conversation turns with a cached rolling summary."""
+    def __init__(
+        self,
+        summarize: SummarizeFn,
+        cache: TieredCache,
+        seed: str,
+        enabled: bool,
+        token_budget: int,
+        keep_messages: int,
+        step: int,
+    ):
+        """Initializes the compactor.
+
+        Args:
+            summarize: A coroutine function that takes the previous summary
+                (or None) and the messages to add, and returns the new summary.
+            cache: The cache summaries are stored in.
+            seed: A value identifying the summarizer, so that changing the
+                summary model does not reuse old summaries.
+            enabled: Whether compaction runs at all.
+            token_budget: The prompt size in tokens above which a
+                conversation is compacted.
+            keep_messages: The number of most recent messages kept verbatim.
+            step: The number of messages the summarized prefix grows by at a time.
+        """
+        self.summarize = summarize
+        self.cache = cache
+        self.seed = seed
+        self.enabled = enabled
+        self.token_budget = token_budget
+        self.keep_messages = keep_messages
+        self.step = max(1, step)
+        self.compactions = 0
+        self.summaries = 0
+        self.failures = 0
+
+    async def compact(
+        self, model: str, messages: List[Dict[str, str]]
+    ) -> Tuple[List[Dict[str, str]], int]:
+        """Compacts a conversation if it is over the token budget.
+
+        Args:
+            model: The model the conversation is for, used to count tokens.
+            messages: The conversation.
+
+        Returns:
+            A (messages, summarized) tuple with the conversation to send and
+            the number of messages replaced by the summary. System messages
+            keep their places and the summary takes the place of the first
+            summarized turn. If summarizing fails, the conversation is
+            returned unchanged.
+        """
+        if not self.enabled or count_messages(model, messages) <= self.token_budget:
+            return messages, 0
+        turns = [m for m in messages if m["role"] != "system"]
+        aligned = (len(turns) - self.keep_messages) // self.step * self.step
+        if aligned <= 0 or next_user_turn(turns, aligned) == len(turns):
+            return messages, 0
+
+        try:
+            summary, split = await self._summary(turns, aligned)
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"History compaction failed, sending full history: {e}")
+            return messages, 0
+        self.compactions += 1
+        compacted, position = [], 0
+        for message in messages:
+            if message["role"] == "system":
+                compacted.append(message)
+                continue
+            if position == 0:
+                compacted.append({"role": "system", "content": SUMMARY_PREFIX + summary})
+            if position >= split:
+                compacted.append(message)
+            position += 1
+        return compacted, split
+
+    async def _summary(self, turns: List[Dict[str, str]], aligned: int) -> Tuple[str, int]:
+        """Summarizes the turns before a split, extending the longest cached summary.
+
+        Splits advance in steps and are then moved forward to the next user
+        turn, so every request of a conversation tries the same boundaries.
+
+        Args:
+            turns: The conversation without its system messages.
+            aligned: The split before moving it to a user turn; a multiple
+                of `step`.
+
+        Returns:
+            A (summary, split) tuple with the summary and the number of turns
+            it replaces.
+        """
+        boundaries = [next_user_turn(turns, length) for length in range(aligned, 0, -self.step)]
+        prefix = turns[:boundaries[0]]
+        hashes = prefix_hashes(self.seed, prefix)
+        cached_at, summary = 0, None
+        for length in boundaries:
+            data = await self.cache.get(hashes[length])
+            if data is not None:
+                cached_at, summary = length, data.decode("utf-8")
+                break
+        if cached_at == len(prefix):
+            return summary, cached_at
+
+        # Fold everything since the cached summary in with one call; only the
+        # new boundary is cached, which is the one the next turns extend
+        summary = await self.summarize(summary, prefix[cached_at:])
+        self.summaries += 1
+        await self.cache.set(hashes[len(prefix)], summary.encode("utf-8"))
+        return summary, len(prefix)
+
+    async def close(self) -> None:
+        """Closes the summary cache."""
+        await self.cache.close()
+
+    def stats(self) -> dict:
+        """Gets compaction counters.
+
+        Returns:
+            A dictionary with compaction, summary and failure counts.
+        """
+        return {
+            "enabled": self.enabled,
+            "compactions": self.compactions,
+            "summaries": self.summaries,
+            "failures": self.failures,
+        }
+
+
+async def summarize_with_cheap_model(
+    previous: Optional[str], messages: List[Dict[str, str]]
+) -> str:
+    """Updates a conversation summary using the configured summary model.
+
+    Args:
+        previous: The summary so far, or None.
+        messages: The messages to fold into the summary.
+
+    Returns:
+        The updated summary.
+
+    Raises:
+        Exception: If the summary model is unavailable or fails.
+    """
+    provider = provider_registry.require(config.HISTORY_SUMMARY_PROVIDER)
+    content = f"Current summary:\n{previous or '(none)'}\n\nNew messages:\n{format_transcript(messages)}"
+    return await provider.generate(
+        messages=[
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+            {"role": "user", "content": content},
+        ],
+        model=config.HISTORY_SUMMARY_MODEL,
+        max_tokens=config.HISTORY_SUMMARY_MAX_TOKENS,
+        temperature=0.0,
+    )
+
+
+history_compactor = HistoryCompactor(
+    summarize_with_cheap_model,
+    TieredCache("hist", max_entries=1000, ttl=config.HISTORY_SUMMARY_TTL or None),
+    seed=f"{config.HISTORY_SUMMARY_PROVIDER}:{config.HISTORY_SUMMARY_MODEL}",
+    enabled=config.HISTORY_COMPACTION_ENABLED,
+    token_budget=config.HISTORY_COMPACTION_TOKEN_BUDGET,
+    keep_messages=config.HISTORY_KEEP_MESSAGES,
+    step=config.HISTORY_SUMMARY_STEP,
+)
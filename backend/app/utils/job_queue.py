@@ -0,0 +1,515 @@
+"""Durable job queues for work that should not run inside a request.
+
+A job is a kind (which handler runs it), a JSON payload, and its state:
+status, attempts, progress, result or error. Jobs live in a schedule ordered
+by the time they may next run. Claiming a job leases it: it stays in the
+schedule with the lease deadline as its time, so a job whose worker died or
+was redeployed becomes claimable again once the lease (the visibility
+timeout) runs out. Every claim increments the job's attempt counter, which
+also fences writes, so a worker whose lease was taken over can no longer
+update the job.
+
+Two backends share this model: Redis, for queues shared by many API and
+worker processes, and SQLite, as a single-host stand-in when Redis is not
+available.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional, Union
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Tells `_update` to take a finished job out of the schedule
+DONE = "done"
+
+_JSON_FIELDS = ("payload", "result", "progress")
+
+
+@dataclass
+class Job:
+    """A unit of background work and its state.
+
+    Attributes:
+        id: The unique ID of the job.
+        kind: The name of the handler that runs the job.
+        payload: The handler's input.
+        status: One of "queued", "running", "succeeded" or "failed".
+        attempts: How many times the job has been claimed.
+        max_attempts: The most times the job may be claimed.
+        run_at: When a queued job may run, or when a running job's lease ends.
+        created_at: When the job was submitted.
+        updated_at: When the job last changed.
+        progress: The latest progress reported by the handler.
+        result: The handler's output, once succeeded.
+        error: The last error, if an attempt failed.
+    """
+    id: str
+    kind: str
+    payload: Dict[str, Any]
+    status: str = QUEUED
+    attempts: int = 0
+    max_attempts: int = 3
+    run_at: float = 0.0
+    created_at: float = 0.0
+    updated_at: float = 0.0
+    progress: Optional[Dict[str, Any]] = None
+    result: Any = None
+    error: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        """Whether the job has succeeded or permanently failed."""
+        return self.status in (SUCCEEDED, FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Converts the job to a JSON-serializable dictionary."""
+        return asdict(self)
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "Job":
+        """Builds a job from a stored row with JSON-encoded fields."""
+        values = {}
+        for name in cls.__dataclass_fields__:
+            value = row.get(name)
+            if isinstance(value, bytes):
+                value = value.decode("utf-8")
+            if name in _JSON_FIELDS:
+                value = json.loads(value) if value else None
+            values[name] = value
+        for name in ("attempts", "max_attempts"):
+            values[name] = int(values[name])
+        for name in ("run_at", "created_at", "updated_at"):
+            values[name] = float(values[name])
+        values["error"] = values["error"] or None
+        return cls(**values)
+
+
+def _encode(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON-encodes the structured fields of a job update."""
+    return {
+        name: json.dumps(value, default=str) if name in _JSON_FIELDS else ("" if value is None else value)
+        for name, value in fields.items()
+    }
+
+
+class JobQueue(ABC):
+    """The operations shared by the job queue backends."""
+    backend = ""
+
+    async def enqueue(self, kind: str, payload: Dict[str, Any], max_attempts: Optional[int] = None) -> Job:
+        """Submits a job.
+
+        Args:
+            kind: The name of the handler that runs the job.
+            payload: The handler's input.
+            max_attempts: The most times the job may be tried, defaulting to
+                `JOB_MAX_ATTEMPTS`.
+
+        Returns:
+            The queued job.
+        """
+        now = time.time()
+        job = Job(
+            id=uuid.uuid4().hex,
+            kind=kind,
+            payload=payload,
+            max_attempts=max_attempts or config.JOB_MAX_ATTEMPTS,
+            run_at=now,
+            created_at=now,
+            updated_at=now,
+        )
+        await self._insert(job)
+        return job
+
+    async def heartbeat(self, job: Job, visibility_timeout: float) -> bool:
+        """Extends the lease of a running job.
+
+        Args:
+            job: The claimed job.
+            visibility_timeout: The seconds from now the lease should last.
+
+        Returns:
+            False if the lease was lost to another worker.
+        """
+        return await self._update(job, time.time() + visibility_timeout, {})
+
+    async def report(self, job: Job, progress: Dict[str, Any]) -> bool:
+        """Records a running job's progress.
+
+        Args:
+            job: The claimed job.
+            progress: The progress to record.
+
+        Returns:
+            False if the lease was lost to another worker.
+        """
+        job.progress = progress
+        return await self._update(job, None, {"progress": progress})
+
+    async def complete(self, job: Job, result: Any) -> bool:
+        """Stores a job's result and marks it succeeded.
+
+        Args:
+            job: The claimed job.
+            result: The JSON-serializable result.
+
+        Returns:
+            False if the lease was lost to another worker.
+        """
+        return await self._update(job, DONE, {"status": SUCCEEDED, "result": result, "error": None})
+
+    async def retry(self, job: Job, error: str, delay: float) -> bool:
+        """Puts a failed job back in the queue to be tried again later.
+
+        Args:
+            job: The claimed job.
+            error: The error of the failed attempt.
+            delay: The seconds to wait before the next attempt.
+
+        Returns:
+            False if the lease was lost to another worker.
+        """
+        return await self._update(job, time.time() + delay, {"status": QUEUED, "error": error})
+
+    async def fail(self, job: Job, error: str) -> bool:
+        """Marks a job as permanently failed.
+
+        Args:
+            job: The claimed job.
+            error: The final error.
+
+        Returns:
+            False if the lease was lost to another worker.
+        """
+        return await self._update(job, DONE, {"status": FAILED, "error": error})
+
+    @abstractmethod
+    async def _insert(self, job: Job) -> None:
+        """Stores a new job and schedules it."""
+
+    @abstractmethod
+    async def _update(self, job: Job, schedule: Union[None, float, str], fields: Dict[str, Any]) -> bool:
+        """Updates a job if this worker still holds its lease.
+
+        Args:
+            job: The job as claimed; its attempt count fences the write.
+            schedule: None to keep the job's place in the schedule, a time
+                to reschedule it at, or `DONE` to remove it.
+            fields: The fields to change.
+
+        Returns:
+            Whether the job was updated.
+        """
+
+    @abstractmethod
+    async def claim(self, worker: str, visibility_timeout: float) -> Optional[Job]:
+        """Leases the next job that is due.
+
+        Args:
+            worker: A name for the claiming worker.
+            visibility_timeout: The seconds until the lease runs out.
+
+        Returns:
+            The claimed job, or None if no job is due.
+        """
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Job]:
+        """Gets a job by its ID.
+
+        Args:
+            job_id: The ID of the job.
+
+        Returns:
+            The job, or None if it does not exist or has expired.
+        """
+
+    async def purge(self) -> int:
+        """Deletes finished jobs older than `JOB_RESULT_TTL`.
+
+        Returns:
+            The number of jobs deleted.
+        """
+        return 0
+
+    async def ping(self) -> None:
+        """Checks that the backend is reachable, connecting if needed."""
+
+    @abstractmethod
+    async def stats(self) -> Dict[str, Any]:
+        """Gets queue depth counters."""
+
+    @abstractmethod
+    async def close(self) -> None:
+        """Closes the connection to the backend."""
+
+
+class SQLiteJobQueue(JobQueue):
+    """A job queue in a local SQLite database.
+
+    Claims are a single `UPDATE ... RETURNING` statement, so several worker
+    processes on the same host can share the database safely.
+    """
+    backend = "sqlite"
+
+    def __init__(self, path: str, result_ttl: int = 0):
+        """Initializes the queue; the database is opened on first use.
+
+        Args:
+            path: The database file.
+            result_ttl: The seconds finished jobs are kept, or 0 to keep them.
+        """
+        self.path = path
+        self.result_ttl = result_ttl
+        self._db = None
+        self._lock = asyncio.Lock()
+
+    async def _conn(self):
+        """Opens the database and creates the jobs table if needed."""
+        if self._db is None:
+            import aiosqlite
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            db = await aiosqlite.connect(self.path, isolation_level=None)
+            db.row_factory = aiosqlite.Row
+            await db.execute("PRAGMA journal_mode=WAL")
+            await db.execute("PRAGMA busy_timeout=5000")
+            await db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, "
+                "status TEXT NOT NULL, attempts INTEGER NOT NULL, max_attempts INTEGER NOT NULL, "
+                "run_at REAL NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                "progress TEXT, result TEXT, error TEXT, worker TEXT)"
+            )
+            await db.execute("CREATE INDEX IF NOT EXISTS jobs_schedule ON jobs (status, run_at)")
+            self._db = db
+        return self._db
+
+    async def ping(self) -> None:
+        """Opens the database.
+
+        Opening it up front means a claim cancelled at shutdown never leaves
+        a half-opened connection (and its thread) behind.
+        """
+        async with self._lock:
+            await self._conn()
+
+    async def _insert(self, job: Job) -> None:
+        row = _encode(job.to_dict())
+        async with self._lock:
+            db = await self._conn()
+            await db.execute(
+                f"INSERT INTO jobs ({', '.join(row)}) VALUES ({', '.join('?' for _ in row)})",
+                list(row.values()),
+            )
+
+    async def _update(self, job: Job, schedule: Union[None, float, str], fields: Dict[str, Any]) -> bool:
+        values = _encode({**fields, "updated_at": time.time()})
+        if isinstance(schedule, float):
+            values["run_at"] = schedule
+        assignments = ", ".join(f"{name} = ?" for name in values)
+        async with self._lock:
+            db = await self._conn()
+            cursor = await db.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ? AND attempts = ? AND status = ?",
+                [*values.values(), job.id, job.attempts, RUNNING],
+            )
+        return cursor.rowcount == 1
+
+    async def claim(self, worker: str, visibility_timeout: float) -> Optional[Job]:
+        now = time.time()
+        async with self._lock:
+            db = await self._conn()
+            cursor = await db.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, run_at = ?, worker = ?, updated_at = ? "
+                "WHERE id = (SELECT id FROM jobs WHERE status IN (?, ?) AND run_at <= ? ORDER BY run_at LIMIT 1) "
+                "RETURNING *",
+                [RUNNING, now + visibility_timeout, worker, now, QUEUED, RUNNING, now],
+            )
+            row = await cursor.fetchone()
+        return Job.from_row(dict(row)) if row is not None else None
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        async with self._lock:
+            db = await self._conn()
+            cursor = await db.execute("SELECT * FROM jobs WHERE id = ?", [job_id])
+            row = await cursor.fetchone()
+        return Job.from_row(dict(row)) if row is not None else None
+
+    async def purge(self) -> int:
+        if not self.result_ttl:
+            return 0
+        async with self._lock:
+            db = await self._conn()
+            cursor = await db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                [SUCCEEDED, FAILED, time.time() - self.result_ttl],
+            )
+        return cursor.rowcount
+
+    async def stats(self) -> Dict[str, Any]:
+        async with self._lock:
+            db = await self._conn()
+            cursor = await db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+            counts = {status: count for status, count in await cursor.fetchall()}
+            cursor = await db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?) AND run_at <= ?",
+                [QUEUED, RUNNING, time.time()],
+            )
+            (due,) = await cursor.fetchone()
+        return {"backend": self.backend, "due": due, "by_status": counts}
+
+    async def close(self) -> None:
+        db, self._db = self._db, None
+        if db is not None:
+            await db.close()
+
+
+# Claims the first due job in the schedule, leasing it until ARGV[2]
+_CLAIM_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 1)
+if #ids == 0 then return false end
+local key = ARGV[4] .. ids[1]
+if redis.call('EXISTS', key) == 0 then
+    redis.call('ZREM', KEYS[1], ids[1])
+    return false
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ids[1])
+redis.call('HINCRBY', key, 'attempts', 1)
+redis.call('HSET', key, 'status', 'running', 'run_at', ARGV[2], 'worker', ARGV[3], 'updated_at', ARGV[1])
+return redis.call('HGETALL', key)
+"""
+
+# Updates a running job if the attempt count still matches the caller's claim
+_UPDATE_SCRIPT = """
+local key = KEYS[2]
+if redis.call('HGET', key, 'attempts') ~= ARGV[1] or redis.call('HGET', key, 'status') ~= 'running' then
+    return 0
+end
+if ARGV[2] == 'done' then
+    redis.call('ZREM', KEYS[1], ARGV[4])
+elseif ARGV[2] ~= '' then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[4])
+    redis.call('HSET', key, 'run_at', ARGV[2])
+end
+if #ARGV > 4 then
+    redis.call('HSET', key, unpack(ARGV, 5))
+end
+if ARGV[2] == 'done' and tonumber(ARGV[3]) > 0 then
+    redis.call('EXPIRE', key, ARGV[3])
+end
+return 1
+"""
+
+
+class RedisJobQueue(JobQueue):
+    """A job queue in Redis, shared by every API and worker process.
+
+    Each job is a hash; the schedule is a sorted set of job IDs scored by the
+    time they may next run. Claims and fenced updates are Lua scripts, so
+    they are atomic across processes.
+    """
+    backend = "redis"
+
+    def __init__(self, url: str, prefix: str = "mgdi:jobs:", result_ttl: int = 0):
+        """Initializes the queue.
+
+        Args:
+            url: The Redis connection URL.
+            prefix: A prefix added to every key.
+            result_ttl: The seconds finished jobs are kept, or 0 to keep them.
+        """
+        import redis.asyncio as redis
+
+        self.prefix = prefix
+        self.result_ttl = result_ttl
+        self.client = redis.from_url(url, socket_connect_timeout=1)
+        self._schedule = prefix + "schedule"
+        self._claim = self.client.register_script(_CLAIM_SCRIPT)
+        self._fenced_update = self.client.register_script(_UPDATE_SCRIPT)
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.prefix}job:{job_id}"
+
+    async def ping(self) -> None:
+        """Checks that Redis is reachable.
+
+        Raises:
+            redis.RedisError: If Redis cannot be reached.
+        """
+        await self.client.ping()
+
+    async def _insert(self, job: Job) -> None:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(self._key(job.id), mapping=_encode(job.to_dict()))
+            pipe.zadd(self._schedule, {job.id: job.run_at})
+            await pipe.execute()
+
+    async def _update(self, job: Job, schedule: Union[None, float, str], fields: Dict[str, Any]) -> bool:
+        pairs = []
+        for name, value in _encode({**fields, "updated_at": time.time()}).items():
+            pairs.extend([name, value])
+        updated = await self._fenced_update(
+            keys=[self._schedule, self._key(job.id)],
+            args=[job.attempts, "" if schedule is None else schedule, self.result_ttl, job.id, *pairs],
+        )
+        return updated == 1
+
+    async def claim(self, worker: str, visibility_timeout: float) -> Optional[Job]:
+        now = time.time()
+        flat = await self._claim(
+            keys=[self._schedule],
+            args=[now, now + visibility_timeout, worker, self.prefix + "job:"],
+        )
+        if not flat:
+            return None
+        row = {flat[i].decode("utf-8"): flat[i + 1] for i in range(0, len(flat), 2)}
+        return Job.from_row(row)
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        row = await self.client.hgetall(self._key(job_id))
+        if not row:
+            return None
+        return Job.from_row({k.decode("utf-8"): v for k, v in row.items()})
+
+    async def stats(self) -> Dict[str, Any]:
+        due = await self.client.zcount(self._schedule, "-inf", time.time())
+        scheduled = await self.client.zcard(self._schedule)
+        return {"backend": self.backend, "due": due, "scheduled": scheduled}
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+async def open_job_queue() -> JobQueue:
+    """Opens the configured job queue.
+
+    Falls back from Redis to SQLite when Redis is unreachable, like the
+    persistent cache tier falls back to files.
+
+    Returns:
+        The job queue.
+    """
+    if config.JOB_QUEUE_BACKEND == "redis":
+        queue = RedisJobQueue(config.REDIS_URL, result_ttl=config.JOB_RESULT_TTL)
+        try:
+            await queue.ping()
+            return queue
+        except Exception as e:
+            logger.warning(f"Redis unavailable for the job queue, using SQLite: {e}")
+            await queue.close()
+    return SQLiteJobQueue(config.JOB_QUEUE_SQLITE_PATH, result_ttl=config.JOB_RESULT_TTL)
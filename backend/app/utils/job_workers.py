@@ -0,0 +1,256 @@
+"""A pool of async workers that process jobs from the job queue.
+
+Each worker claims a due job, runs the handler registered for its kind and
+stores the result. While a handler runs, its lease is extended periodically,
+so the visibility timeout only has to cover a missed heartbeat and not the
+longest job. A failed attempt is retried with exponential backoff until the
+job runs out of attempts; handlers raise `PermanentJobError` for failures
+that retrying cannot fix. A worker that is stopped mid-job hands the job
+back to the queue right away instead of waiting for its lease to expire.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import anyio
+
+from ..models.admission import request_priority
+from .job_queue import Job, JobQueue, open_job_queue
+
+logger = logging.getLogger(__name__)
+
+ReportFn = Callable[[Dict[str, Any]], Awaitable[None]]
+Handler = Callable[[Dict[str, Any], ReportFn], Awaitable[Any]]
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler for a failure that retrying cannot fix."""
+
+
+class JobWorkerPool:
+    """Submits jobs and, once started, processes them with async workers."""
+    def __init__(
+        self,
+        handlers: Dict[str, Handler],
+        concurrency: int,
+        visibility_timeout: float,
+        poll_interval: float,
+        retry_backoff: float,
+        open_queue: Callable[[], Awaitable[JobQueue]] = open_job_queue,
+    ):
+        """Initializes the pool; the queue is opened on first use.
+
+        Args:
+            handlers: The handler coroutine function for each job kind. A
+                handler receives the payload and a coroutine function to
+                report progress with, and returns a JSON-serializable result.
+            concurrency: The number of workers `start` runs.
+            visibility_timeout: The seconds a claimed job stays invisible to
+                other workers without a heartbeat.
+            poll_interval: The seconds an idle worker waits before checking
+                the queue again.
+            retry_backoff: The delay in seconds before the first retry; it
+                doubles with every further attempt.
+            open_queue: A coroutine function that opens the job queue.
+        """
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.retry_backoff = retry_backoff
+        self._open_queue = open_queue
+        self._queue: Optional[JobQueue] = None
+        self._queue_lock = asyncio.Lock()
+        self._workers: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._name = f"{socket.gethostname()}:{os.getpid()}"
+        self.busy = 0
+        self.claimed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self.lost_leases = 0
+        self.run_seconds = 0.0
+
+    async def queue(self) -> JobQueue:
+        """Gets the job queue, opening it on first use.
+
+        Returns:
+            The job queue.
+        """
+        if self._queue is None:
+            async with self._queue_lock:
+                if self._queue is None:
+                    queue = await self._open_queue()
+                    await queue.ping()
+                    self._queue = queue
+        return self._queue
+
+    def register(self, kind: str, handler: Handler) -> None:
+        """Registers the handler for a job kind.
+
+        Args:
+            kind: The job kind.
+            handler: The handler coroutine function.
+        """
+        self.handlers[kind] = handler
+
+    async def submit(self, kind: str, payload: Dict[str, Any], max_attempts: Optional[int] = None) -> Job:
+        """Queues a job and wakes an idle local worker.
+
+        Args:
+            kind: The job kind; must have a handler.
+            payload: The handler's input.
+            max_attempts: The most times the job may be tried.
+
+        Returns:
+            The queued job.
+
+        Raises:
+            ValueError: If there is no handler for the kind.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind!r}")
+        job = await (await self.queue()).enqueue(kind, payload, max_attempts)
+        self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """Gets a job by its ID.
+
+        Args:
+            job_id: The ID of the job.
+
+        Returns:
+            The job, or None if it does not exist.
+        """
+        return await (await self.queue()).get(job_id)
+
+    async def start(self) -> None:
+        """Starts the workers and the purge of expired results."""
+        if self._workers:
+            return
+        await self.queue()
+        self._workers = [
+            asyncio.create_task(self._work(f"{self._name}:{n}")) for n in range(self.concurrency)
+        ]
+        self._workers.append(asyncio.create_task(self._purge()))
+
+    async def stop(self) -> None:
+        """Stops the workers, requeueing their jobs, and closes the queue."""
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        queue, self._queue = self._queue, None
+        if queue is not None:
+            await queue.close()
+
+    async def _work(self, name: str) -> None:
+        """Claims and runs jobs until cancelled."""
+        # Background jobs yield upstream capacity to interactive requests
+        request_priority.set("batch")
+        queue = await self.queue()
+        while True:
+            try:
+                job = await queue.claim(name, self.visibility_timeout)
+            except Exception as e:
+                logger.error(f"Claiming a job failed: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(queue, job)
+            except Exception as e:
+                # A store error while recording the outcome must not kill the
+                # worker; the job's lease expires and it is claimed again
+                logger.error(f"Recording the outcome of job {job.id} failed: {e}")
+
+    async def _run(self, queue: JobQueue, job: Job) -> None:
+        """Runs one claimed job and records its outcome."""
+        self.claimed += 1
+        if job.attempts > job.max_attempts:
+            # The job's lease expired on its last allowed attempt
+            await queue.fail(job, job.error or "Job lease expired")
+            self.failed += 1
+            return
+        handler = self.handlers.get(job.kind)
+        if handler is None:
+            await queue.fail(job, f"Unknown job kind: {job.kind!r}")
+            self.failed += 1
+            return
+
+        async def report(progress: Dict[str, Any]) -> None:
+            await queue.report(job, progress)
+
+        heartbeat = asyncio.create_task(self._heartbeat(queue, job))
+        self.busy += 1
+        started = time.perf_counter()
+        try:
+            result = await handler(job.payload, report)
+            stored = await queue.complete(job, result)
+            self.succeeded += stored
+        except asyncio.CancelledError:
+            with anyio.CancelScope(shield=True):
+                await queue.retry(job, "Worker stopped", 0)
+            raise
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            if isinstance(e, PermanentJobError) or job.attempts >= job.max_attempts:
+                stored = await queue.fail(job, error)
+                self.failed += stored
+            else:
+                stored = await queue.retry(job, error, self.retry_backoff * 2 ** (job.attempts - 1))
+                self.retried += stored
+        finally:
+            self.busy -= 1
+            self.run_seconds += time.perf_counter() - started
+            heartbeat.cancel()
+        if not stored:
+            self.lost_leases += 1
+            logger.warning(f"Lost the lease on job {job.id}; its outcome was discarded")
+
+    async def _heartbeat(self, queue: JobQueue, job: Job) -> None:
+        """Extends a running job's lease until cancelled."""
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            try:
+                await queue.heartbeat(job, self.visibility_timeout)
+            except Exception as e:
+                logger.warning(f"Heartbeat for job {job.id} failed: {e}")
+
+    async def _purge(self) -> None:
+        """Deletes expired results once a minute."""
+        while True:
+            try:
+                await (await self.queue()).purge()
+            except Exception as e:
+                logger.warning(f"Purging finished jobs failed: {e}")
+            await asyncio.sleep(60)
+
+    async def stats(self) -> Dict[str, Any]:
+        """Gets worker counters and queue depth.
+
+        Returns:
+            A dictionary with worker and queue statistics.
+        """
+        finished = self.succeeded + self.failed + self.retried
+        return {
+            "workers": self.concurrency if self._workers else 0,
+            "busy": self.busy,
+            "claimed": self.claimed,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+            "lost_leases": self.lost_leases,
+            "avg_run_ms": round(self.run_seconds / finished * 1000, 1) if finished else 0.0,
+            "queue": await (await self.queue()).stats(),
+        }
@@ -0,0 +1,133 @@
+"""Incremental JSON record streams.
+
+Reads a stream of JSON values from request body chunks without buffering the
+whole body, and formats newline-delimited JSON (NDJSON) output lines.
+"""
+import codecs
+import json
+from typing import Any, AsyncIterator, List
+
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+_SEPARATORS = " \t\r\n,"
+
+
+def ndjson_line(record: Any) -> str:
+    """Serializes a record as one NDJSON line.
+
+    Args:
+        record: A JSON-serializable value.
+
+    Returns:
+        The compact JSON text followed by a newline.
+    """
+    return json.dumps(record, separators=(",", ":"), default=str) + "\n"
+
+
+class DuplexNDJSONResponse(StreamingResponse):
+    """An NDJSON streaming response that is sent while the body is still read.
+
+    Starlette's `StreamingResponse` watches for client disconnects by
+    consuming ASGI receive messages, which would swallow request body chunks
+    the endpoint has not read yet. This response only sends, leaving the
+    request body to the endpoint.
+    """
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+class _RecordParser:
+    """Splits a growing text buffer into complete JSON values.
+
+    Accepts either a single top-level JSON array or a sequence of values
+    separated by whitespace (NDJSON).
+    """
+    def __init__(self, max_record_bytes: int):
+        self.max_record_bytes = max_record_bytes
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._array = None
+        self._closed = False
+
+    def feed(self, text: str, final: bool = False) -> List[Any]:
+        """Adds text and returns every value that is now complete.
+
+        Args:
+            text: The next piece of input.
+            final: Whether this is the end of the input.
+
+        Returns:
+            The complete values, in order.
+
+        Raises:
+            ValueError: If the input is malformed or a value is too large.
+        """
+        buffer = self._buffer + text
+        records = []
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in _SEPARATORS:
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if self._closed:
+                raise ValueError("Unexpected data after end of JSON array")
+            if self._array is None:
+                self._array = buffer[pos] == "["
+                if self._array:
+                    pos += 1
+                    continue
+            if self._array and buffer[pos] == "]":
+                self._closed = True
+                pos += 1
+                continue
+            try:
+                record, end = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if final:
+                    raise ValueError(f"Malformed JSON record: {e}")
+                break
+            if end == len(buffer) and not final:
+                # A scalar such as 12 might continue in the next chunk
+                break
+            records.append(record)
+            pos = end
+        self._buffer = buffer[pos:]
+        if len(self._buffer) > self.max_record_bytes:
+            raise ValueError(f"JSON record exceeds {self.max_record_bytes} bytes")
+        if final and self._array and not self._closed:
+            raise ValueError("Unterminated JSON array")
+        return records
+
+
+async def iter_json_records(
+    chunks: AsyncIterator[bytes], max_record_bytes: int = 1 << 20
+) -> AsyncIterator[Any]:
+    """Yields JSON values from a JSON array or NDJSON byte stream.
+
+    Only the current partial value is kept in memory, so memory use is
+    bounded by `max_record_bytes` regardless of the total input size.
+
+    Args:
+        chunks: An async iterator of raw body chunks.
+        max_record_bytes: The maximum size of a single value.
+
+    Yields:
+        Each decoded JSON value.
+
+    Raises:
+        ValueError: If the input is malformed or a value is too large.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    parser = _RecordParser(max_record_bytes)
+    async for chunk in chunks:
+        for record in parser.feed(decoder.decode(chunk)):
+            yield record
+    for record in parser.feed(decoder.decode(b"", final=True), final=True):
+        yield record
+
@@ -0,0 +1,336 @@
+"""A warm process pool for CPU-bound plugins.
+
+Plugin functions such as image and audio analysis are synchronous and
+CPU-bound; run on the event loop they would stall every other request, and
+run in threads they would contend for the GIL. The pool runs them in a set
+of pre-started worker processes instead.
+
+Workers are spawned rather than forked, so they never inherit the API's
+threads or open connections, and each one imports the plugin modules once
+at start-up. Large inputs and outputs are not pickled through the pool's
+pipe: plugins take file paths, and `bytes` arguments or results above a
+threshold travel through shared memory. Each task runs under a wall-clock
+timeout and an address-space limit inside its worker; a task that does not
+come back even after the timeout takes its worker down with it, and the
+pool is restarted.
+
+Tasks wait in the parent until a worker is free, so the executor's own
+queue stays empty. This keeps timeouts from counting time spent waiting and
+lets the pool report its queue depth and utilization.
+"""
+import asyncio
+import concurrent.futures
+import importlib
+import logging
+import math
+import multiprocessing
+import os
+import signal
+import time
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Dict, Iterable, Optional
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Arguments and results at least this large go through shared memory
+SHARED_MEMORY_THRESHOLD = 64 * 1024
+
+# How long past its timeout a task may take before its worker is presumed hung
+_HUNG_GRACE = 2.0
+
+
+class PluginTimeout(Exception):
+    """Raised when a plugin task runs past its timeout."""
+
+
+class PluginError(Exception):
+    """Raised when a plugin task fails in its worker."""
+
+
+class PluginInputError(PluginError):
+    """Raised when a plugin rejects its arguments or input file."""
+
+
+class PluginBusy(Exception):
+    """Raised when too many plugin tasks are already waiting for a worker."""
+    def __init__(self, retry_after: float):
+        super().__init__(f"Plugin workers are busy, retry after {math.ceil(retry_after)}s")
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+@dataclass(frozen=True)
+class SharedBytes:
+    """A handle to bytes placed in a shared memory block."""
+    name: str
+    size: int
+
+    @classmethod
+    def export(cls, data: bytes) -> "SharedBytes":
+        """Copies bytes into a new shared memory block.
+
+        The receiver owns the block and must call `load`.
+        """
+        shm = SharedMemory(create=True, size=max(len(data), 1))
+        try:
+            shm.buf[:len(data)] = data
+        finally:
+            shm.close()
+        return cls(shm.name, len(data))
+
+    def load(self) -> bytes:
+        """Reads the bytes and frees the shared memory block."""
+        shm = SharedMemory(name=self.name)
+        try:
+            return bytes(shm.buf[:self.size])
+        finally:
+            shm.close()
+            shm.unlink()
+
+
+def _share(value: Any) -> Any:
+    """Replaces large bytes with a shared memory handle."""
+    if isinstance(value, (bytes, bytearray, memoryview)) and len(value) >= SHARED_MEMORY_THRESHOLD:
+        return SharedBytes.export(value)
+    return value
+
+
+def _unshare(value: Any) -> Any:
+    """Replaces a shared memory handle with the bytes it refers to."""
+    return value.load() if isinstance(value, SharedBytes) else value
+
+
+def _release(values: Iterable[Any]) -> None:
+    """Frees the shared memory behind handles that were never loaded."""
+    for value in values:
+        if isinstance(value, SharedBytes):
+            try:
+                value.load()
+            except FileNotFoundError:
+                pass
+
+
+def _init_worker(modules: Iterable[str], memory_limit_mb: int) -> None:
+    """Prepares a worker process: limits, thread counts and plugin imports."""
+    # Parallelism comes from the pool; keep numeric libraries single-threaded
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(var, "1")
+    # Leave shutdown to the parent; a Ctrl+C in the terminal reaches the
+    # whole process group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if memory_limit_mb > 0 and resource is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    for module in modules:
+        importlib.import_module(module)
+
+
+def _on_alarm(signum, frame):
+    raise PluginTimeout("Plugin timed out")
+
+
+def _run_task(fn: Callable[..., Any], kwargs: Dict[str, Any], timeout: float) -> Any:
+    """Runs one plugin call inside a worker process."""
+    kwargs = {k: _unshare(v) for k, v in kwargs.items()}
+    previous = signal.signal(signal.SIGALRM, _on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        result = fn(**kwargs)
+    except MemoryError:
+        raise PluginError("Plugin exceeded its memory limit")
+    except PluginTimeout:
+        raise
+    except (TypeError, ValueError, OSError) as e:
+        raise PluginInputError(f"{type(e).__name__}: {e}")
+    except Exception as e:
+        # Re-raise as a plain error so exotic exception types unpickle
+        raise PluginError(f"{type(e).__name__}: {e}")
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+    if isinstance(result, dict):
+        return {k: _share(v) for k, v in result.items()}
+    return _share(result)
+
+
+def _ping() -> int:
+    """Starts a worker; returns its process ID."""
+    time.sleep(0.05)
+    return os.getpid()
+
+
+class PluginPool:
+    """Runs synchronous plugin functions in warm worker processes."""
+    def __init__(
+        self,
+        workers: int,
+        timeout: float,
+        memory_limit_mb: int = 0,
+        max_queue: int = 0,
+        modules: Iterable[str] = (),
+    ):
+        """Initializes the pool; workers are started by `start` or first use.
+
+        Args:
+            workers: The number of worker processes.
+            timeout: The default seconds a task may run.
+            memory_limit_mb: The address space each worker may use, or 0 for
+                no limit.
+            max_queue: The most tasks that may wait for a worker, or 0 for no
+                limit.
+            modules: Modules every worker imports at start-up.
+        """
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_queue = max_queue
+        self.modules = tuple(modules)
+        self._executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._warm = False
+        self._warm_lock = asyncio.Lock()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._started_at = time.monotonic()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    async def start(self) -> None:
+        """Starts every worker process, so no task pays for start-up.
+
+        Spawning a worker and importing the plugins takes a while, and that
+        time must not count against the first tasks' timeouts.
+        """
+        async with self._warm_lock:
+            if self._warm and self._executor is not None:
+                return
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.modules, self.memory_limit_mb),
+                )
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(self._executor, _ping) for _ in range(self.workers)))
+            self._warm = True
+
+    async def run(self, fn: Callable[..., Any], kwargs: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        """Runs a plugin function in a worker process.
+
+        Args:
+            fn: A picklable (module-level) plugin function.
+            kwargs: The function's keyword arguments.
+            timeout: The seconds the call may run, defaulting to the pool's.
+
+        Returns:
+            The function's result.
+
+        Raises:
+            PluginBusy: If too many tasks are already waiting.
+            PluginTimeout: If the call runs past its timeout.
+            PluginError: If the call fails or its worker dies.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        if self.max_queue and self._slots.locked() and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise PluginBusy(self.timeout)
+        timeout = timeout or self.timeout
+        self.queued += 1
+        queued_at = time.perf_counter()
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.wait_seconds += time.perf_counter() - queued_at
+        self.running += 1
+        started = time.perf_counter()
+        args = {k: _share(v) for k, v in kwargs.items()}
+        try:
+            await self.start()
+            started = time.perf_counter()
+            executor = self._executor
+            future = asyncio.get_running_loop().run_in_executor(executor, _run_task, fn, args, timeout)
+            try:
+                result = await asyncio.wait_for(future, timeout + _HUNG_GRACE)
+            except asyncio.TimeoutError:
+                # The worker did not honour its alarm (e.g. stuck in C code)
+                self._restart(executor)
+                raise PluginTimeout("Plugin timed out")
+            except concurrent.futures.process.BrokenProcessPool:
+                self._restart(executor)
+                raise PluginError("Plugin worker died")
+            if isinstance(result, dict):
+                result = {k: _unshare(v) for k, v in result.items()}
+            result = _unshare(result)
+            self.completed += 1
+            return result
+        except PluginTimeout:
+            self.timeouts += 1
+            _release(args.values())
+            raise
+        except Exception:
+            self.failed += 1
+            _release(args.values())
+            raise
+        finally:
+            self.running -= 1
+            self.busy_seconds += time.perf_counter() - started
+            self._slots.release()
+
+    def _restart(self, executor: concurrent.futures.ProcessPoolExecutor) -> None:
+        """Kills a broken or hung executor; a new one starts on next use."""
+        if self._executor is not executor:
+            return
+        self._executor, self._warm = None, False
+        self.restarts += 1
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.kill()
+        logger.warning("Restarted the plugin worker pool")
+
+    def shutdown(self) -> None:
+        """Stops the worker processes."""
+        executor, self._executor, self._warm = self._executor, None, False
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Gets queue depth, worker utilization and task counters.
+
+        Returns:
+            A dictionary of pool statistics. Utilization is the share of
+            worker time spent on tasks since the pool was created.
+        """
+        elapsed = time.monotonic() - self._started_at
+        finished = self.completed + self.failed + self.timeouts
+        return {
+            "workers": self.workers,
+            "started": self._warm,
+            "queued": self.queued,
+            "running": self.running,
+            "utilization": round(min(1.0, self.busy_seconds / (elapsed * self.workers)), 4) if elapsed else 0.0,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+            "avg_run_ms": round(self.busy_seconds / finished * 1000, 1) if finished else 0.0,
+            "avg_wait_ms": round(self.wait_seconds / finished * 1000, 1) if finished else 0.0,
+        }
@@ -0,0 +1,193 @@
+"""An exact-match cache for chat completions.
+
+Responses are keyed by a canonical hash of the provider, model, messages and
+sampling parameters, so only byte-for-byte equivalent requests share an
+entry. A response is stored as the list of chunks it was produced in, which
+lets a cached response be replayed to streaming and non-streaming clients
+alike.
+"""
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import config
+from .cache import TieredCache, stable_hash
+
+logger = logging.getLogger(__name__)
+
+
+def response_key(
+    provider: str, model: str, messages: List[Dict[str, Any]], params: Dict[str, Any]
+) -> str:
+    """Builds the cache key for a chat completion.
+
+    Args:
+        provider: The provider name.
+        model: The model name.
+        messages: The conversation, as role/content dictionaries.
+        params: The sampling parameters (temperature, max_tokens, ...).
+
+    Returns:
+        The cache key.
+    """
+    canonical = json.dumps(
+        {"provider": provider, "model": model, "messages": messages, "params": params},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return stable_hash(canonical)
+
+
+def parse_model_ttls(spec: str) -> Dict[str, int]:
+    """Parses per-model TTLs from a "model=seconds,model=seconds" string.
+
+    Args:
+        spec: The TTL specification.
+
+    Returns:
+        A mapping of model name to TTL in seconds, where 0 means the model's
+        responses are not cached.
+
+    Raises:
+        ValueError: If an entry is malformed.
+    """
+    ttls = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        model, sep, seconds = entry.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid model TTL entry: {entry!r}")
+        ttls[model.strip()] = int(seconds)
+    return ttls
+
+
+def parse_cache_control(header: Optional[str]) -> Tuple[bool, bool]:
+    """Interprets a request's Cache-Control header for the response cache.
+
+    `no-store` bypasses the cache entirely. `no-cache` skips the lookup but
+    stores the fresh response, refreshing the entry.
+
+    Args:
+        header: The Cache-Control header value, if any.
+
+    Returns:
+        A (read, write) tuple saying whether to look up and store the response.
+    """
+    directives = {d.strip().split("=")[0].lower() for d in (header or "").split(",")}
+    if "no-store" in directives:
+        return False, False
+    if "no-cache" in directives:
+        return False, True
+    return True, True
+
+
+class ResponseCache:
+    """Caches chat completions as lists of chunks."""
+    def __init__(
+        self,
+        cache: TieredCache,
+        enabled: bool,
+        max_temperature: float,
+        model_ttls: Optional[Dict[str, int]] = None,
+    ):
+        """Initializes the response cache.
+
+        Args:
+            cache: The byte cache to store responses in.
+            enabled: Whether responses are cached at all.
+            max_temperature: The highest temperature whose responses are
+                cached; sampled responses above it are not repeatable.
+            model_ttls: TTLs in seconds for specific models; a TTL of 0 turns
+                caching off for that model. Other models use the cache's
+                default TTL.
+        """
+        self.cache = cache
+        self.enabled = enabled
+        self.max_temperature = max_temperature
+        self.model_ttls = model_ttls or {}
+        self.bypasses = 0
+        self.refreshes = 0
+
+    def cacheable(self, temperature: float) -> bool:
+        """Checks whether a request may use the cache.
+
+        Args:
+            temperature: The request's sampling temperature.
+
+        Returns:
+            True if the cache is enabled and the request is deterministic enough.
+        """
+        return self.enabled and temperature <= self.max_temperature
+
+    def ttl_for(self, model: str) -> Optional[int]:
+        """Gets the TTL for a model's responses.
+
+        Args:
+            model: The model name.
+
+        Returns:
+            The TTL in seconds, 0 if the model's responses are not cached, or
+            None for the cache default.
+        """
+        return self.model_ttls.get(model)
+
+    async def get(self, key: str) -> Optional[List[str]]:
+        """Gets a cached response.
+
+        Args:
+            key: The cache key from `response_key`.
+
+        Returns:
+            The response chunks, or None on a miss.
+        """
+        data = await self.cache.get(key)
+        if data is None:
+            return None
+        try:
+            return json.loads(data)["chunks"]
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Discarding malformed cached response: {e}")
+            await self.cache.delete(key)
+            return None
+
+    async def set(self, key: str, model: str, chunks: List[str]) -> None:
+        """Caches a response.
+
+        Responses of models whose TTL is 0 are not stored.
+
+        Args:
+            key: The cache key from `response_key`, built for the provider
+                and model that produced the response.
+            model: The model that produced the response.
+            chunks: The response chunks, in order.
+        """
+        ttl = self.ttl_for(model)
+        if ttl == 0:
+            return
+        data = json.dumps({"chunks": chunks}, ensure_ascii=False).encode("utf-8")
+        await self.cache.set(key, data, ttl)
+
+    async def close(self) -> None:
+        """Closes the underlying cache."""
+        await self.cache.close()
+
+    def stats(self) -> dict:
+        """Gets hit, miss, bypass and refresh counters.
+
+        Returns:
+            A dictionary of cache statistics.
+        """
+        return {
+            "enabled": self.enabled,
+            **self.cache.stats(),
+            "bypasses": self.bypasses,
+            "refreshes": self.refreshes,
+        }
+
+
+response_cache = ResponseCache(
+    TieredCache("resp", max_entries=config.RESPONSE_CACHE_SIZE, ttl=config.RESPONSE_CACHE_TTL or None),
+    enabled=config.RESPONSE_CACHE_ENABLED,
+    max_temperature=config.RESPONSE_CACHE_MAX_TEMPERATURE,
+    model_ttls=parse_model_ttls(config.RESPONSE_CACHE_MODEL_TTLS),
+)
@@ -0,0 +1,214 @@
+"""A semantic cache for chat completions.
+
+Where the exact-match response cache only helps byte-identical requests,
+this cache embeds the final user turn and answers paraphrases of earlier
+prompts from the closest cached response, if it is similar enough. Entries
+are scoped by provider, model, system prompt and the turns before the final
+one, so an answer is only reused under the same instructions and in the
+same conversation: short follow-ups such as "yes, do that" mean different
+things in different conversations.
+
+Each scope keeps a compact in-process index: unit-normalized float32 vectors
+in one contiguous array, searched with a single matrix-vector product.
+Entries are appended in time order, so age and size eviction both drop a
+prefix of the array.
+"""
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import config
+from .cache import stable_hash
+
+
+def semantic_scope(provider: str, model: str, messages: List[Dict[str, str]]) -> str:
+    """Builds the scope key a request's cache entries are shared within.
+
+    Args:
+        provider: The provider name.
+        model: The model name.
+        messages: The conversation; everything but the final turn affects
+            the scope.
+
+    Returns:
+        The scope key.
+    """
+    system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+    history = [[m["role"], m["content"]] for m in messages[:-1] if m["role"] != "system"]
+    return stable_hash(provider, model, system, json.dumps(history))
+
+
+class _ScopeIndex:
+    """The cached responses of one scope, oldest first."""
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.size = 0
+        # Most scopes are single conversations holding a handful of entries,
+        # so start with one row and grow by doubling
+        self.vectors = np.empty((1, dim), dtype=np.float32)
+        self.created = np.empty(1, dtype=np.float64)
+        self.entries: List[Tuple[List[str], float]] = []
+
+    def add(self, vector: np.ndarray, chunks: List[str], latency: float, now: float) -> None:
+        if self.size == len(self.vectors):
+            capacity = 2 * len(self.vectors)
+            self.vectors = np.resize(self.vectors, (capacity, self.dim))
+            self.created = np.resize(self.created, capacity)
+        self.vectors[self.size] = vector
+        self.created[self.size] = now
+        self.entries.append((chunks, latency))
+        self.size += 1
+
+    def drop_oldest(self, count: int) -> None:
+        if count <= 0:
+            return
+        count = min(count, self.size)
+        remaining = self.size - count
+        self.vectors[:remaining] = self.vectors[count:self.size]
+        self.created[:remaining] = self.created[count:self.size]
+        del self.entries[:count]
+        self.size = remaining
+
+    def expire(self, cutoff: float) -> None:
+        self.drop_oldest(int(np.searchsorted(self.created[:self.size], cutoff, side="left")))
+
+    def nearest(self, vector: np.ndarray) -> Tuple[int, float]:
+        similarities = self.vectors[:self.size] @ vector
+        best = int(np.argmax(similarities))
+        return best, float(similarities[best])
+
+
+class SemanticCache:
+    """Caches chat responses by the meaning of the final user turn."""
+    def __init__(
+        self,
+        enabled: bool,
+        max_temperature: float,
+        threshold: float,
+        max_entries: int,
+        max_scopes: int,
+        max_age: float,
+    ):
+        """Initializes the semantic cache.
+
+        Args:
+            enabled: Whether the cache is used at all.
+            max_temperature: The highest temperature whose responses are
+                cached and served.
+            threshold: The minimum cosine similarity for a hit.
+            max_entries: The maximum number of responses kept per scope.
+            max_scopes: The maximum number of scopes kept; the least recently
+                used scope is dropped first.
+            max_age: The number of seconds a response stays reusable.
+        """
+        self.enabled = enabled
+        self.max_temperature = max_temperature
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_scopes = max_scopes
+        self.max_age = max_age
+        self._scopes: "OrderedDict[str, _ScopeIndex]" = OrderedDict()
+        self.lookups = 0
+        self.hits = 0
+        self.latency_saved = 0.0
+
+    def cacheable(self, temperature: float) -> bool:
+        """Checks whether a request may use the cache.
+
+        Args:
+            temperature: The request's sampling temperature.
+
+        Returns:
+            True if the cache is enabled and the request is deterministic enough.
+        """
+        return self.enabled and temperature <= self.max_temperature
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> Optional[np.ndarray]:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(array))
+        return array / norm if norm else None
+
+    def get(self, scope: str, vector: List[float]) -> Optional[Tuple[List[str], float]]:
+        """Finds the closest cached response in a scope.
+
+        Args:
+            scope: The scope key from `semantic_scope`.
+            vector: The embedding of the final user turn.
+
+        Returns:
+            A (chunks, similarity) tuple on a hit, or None on a miss.
+        """
+        self.lookups += 1
+        index = self._scopes.get(scope)
+        query = self._normalize(vector)
+        if index is None or query is None or index.dim != len(query):
+            return None
+        self._scopes.move_to_end(scope)
+        index.expire(time.time() - self.max_age)
+        if index.size == 0:
+            return None
+        best, similarity = index.nearest(query)
+        if similarity < self.threshold:
+            return None
+        chunks, latency = index.entries[best]
+        self.hits += 1
+        self.latency_saved += latency
+        return chunks, similarity
+
+    def set(self, scope: str, vector: List[float], chunks: List[str], latency: float) -> None:
+        """Caches a response.
+
+        Args:
+            scope: The scope key from `semantic_scope`.
+            vector: The embedding of the final user turn.
+            chunks: The response chunks, in order.
+            latency: The seconds the upstream call took, credited as saved
+                time whenever this entry is reused.
+        """
+        if self.max_entries <= 0:
+            return
+        vector = self._normalize(vector)
+        if vector is None:
+            return
+        index = self._scopes.get(scope)
+        if index is None or index.dim != len(vector):
+            index = self._scopes[scope] = _ScopeIndex(len(vector))
+        self._scopes.move_to_end(scope)
+        now = time.time()
+        index.expire(now - self.max_age)
+        if index.size >= self.max_entries:
+            # Drop a tenth at a time so the array is not shifted on every insert
+            index.drop_oldest(index.size - self.max_entries + max(1, self.max_entries // 10))
+        index.add(vector, chunks, latency, now)
+        while len(self._scopes) > self.max_scopes:
+            self._scopes.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Gets hit-rate and latency-saved metrics.
+
+        Returns:
+            A dictionary of cache statistics.
+        """
+        return {
+            "enabled": self.enabled,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "latency_saved_seconds": self.latency_saved,
+            "scopes": len(self._scopes),
+            "entries": sum(index.size for index in self._scopes.values()),
+        }
+
+
+semantic_cache = SemanticCache(
+    enabled=config.SEMANTIC_CACHE_ENABLED,
+    max_temperature=config.RESPONSE_CACHE_MAX_TEMPERATURE,
+    threshold=config.SEMANTIC_CACHE_THRESHOLD,
+    max_entries=config.SEMANTIC_CACHE_MAX_ENTRIES,
+    max_scopes=config.SEMANTIC_CACHE_MAX_SCOPES,
+    max_age=config.SEMANTIC_CACHE_MAX_AGE,
+)
@@ -0,0 +1,266 @@
+"""Single-flight de-duplication of identical in-flight upstream calls.
+
+When several clients (or a client and its own retries) send the same
+request at the same moment, only the first one calls upstream; the others
+wait for its result. Calls are keyed by a canonical hash of the request, and
+a key is forgotten as soon as its call finishes, so this never serves stale
+results; it only merges calls that overlap in time.
+
+Streams are shared the same way. The first request opens the upstream stream
+and a pump task buffers its chunks; every identical request subscribes to
+the buffer, so a late joiner first replays what was already produced and
+then follows the live stream. The upstream stream is closed once every
+subscriber has gone away.
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import anyio
+
+
+class _Call:
+    """A shared in-flight call and the number of callers waiting on it."""
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Shares the result of identical concurrent calls."""
+    def __init__(self, enabled: bool = True):
+        """Initializes an empty set of in-flight calls.
+
+        Args:
+            enabled: Whether identical calls are merged; if not, every call
+                goes upstream.
+        """
+        self.enabled = enabled
+        self._calls: Dict[str, _Call] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Runs a call, or joins the identical call already in flight.
+
+        The call runs in its own task, so a caller that is cancelled does not
+        cancel it for the others; it is cancelled only when every caller has
+        gone away.
+
+        Args:
+            key: The canonical hash of the call.
+            fn: A coroutine function making the call.
+
+        Returns:
+            A (result, shared) tuple; `shared` is True if the result came
+            from another caller's call.
+
+        Raises:
+            Exception: Whatever the call raised, for every caller.
+        """
+        if not self.enabled:
+            return await fn(), False
+        call = self._calls.get(key)
+        shared = call is not None
+        if call is None:
+            call = self._calls[key] = _Call(asyncio.create_task(fn()))
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.calls += 1
+        else:
+            self.shared += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _Call) -> None:
+        """Removes a finished call so later requests start a fresh one."""
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        """Gets de-duplication counters.
+
+        Returns:
+            A dictionary with upstream calls made, calls that joined an
+            in-flight call, and the number currently in flight.
+        """
+        total = self.calls + self.shared
+        return {
+            "calls": self.calls,
+            "shared": self.shared,
+            "shared_rate": self.shared / total if total else 0.0,
+            "in_flight": len(self._calls),
+        }
+
+
+class SharedStream:
+    """One upstream stream fanned out to any number of subscribers."""
+    def __init__(self, open_stream: Callable[[], Awaitable[AsyncIterator[str]]], on_done: Callable[[], None]):
+        """Starts pumping the upstream stream into a buffer.
+
+        Args:
+            open_stream: A coroutine function that opens the upstream stream.
+            on_done: Called once the stream has finished, failed or been
+                abandoned.
+        """
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._opened = asyncio.Event()
+        self._changed = asyncio.Event()
+        self._on_done = on_done
+        self._task = asyncio.create_task(self._pump(open_stream))
+
+    async def _pump(self, open_stream: Callable[[], Awaitable[AsyncIterator[str]]]) -> None:
+        """Reads the upstream stream into the buffer, waking subscribers."""
+        upstream = None
+        try:
+            upstream = await open_stream()
+            self._opened.set()
+            async for chunk in upstream:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = ConnectionAbortedError("Shared stream was abandoned")
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._opened.set()
+            self._notify()
+            self._on_done()
+            if upstream is not None:
+                with anyio.CancelScope(shield=True):
+                    aclose = getattr(upstream, "aclose", None)
+                    if aclose is not None:
+                        await aclose()
+
+    def _notify(self) -> None:
+        """Wakes every subscriber waiting for the buffer to change."""
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def subscribe(self) -> "StreamSubscription":
+        """Adds a subscriber.
+
+        Returns:
+            The subscription; it keeps the upstream stream open until it has
+            been iterated to the end or closed.
+        """
+        return StreamSubscription(self)
+
+    def _leave(self) -> None:
+        """Drops a subscriber, abandoning the upstream when none are left."""
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.done:
+            # Unregister right away so a new request opens a fresh stream
+            self._on_done()
+            self._task.cancel()
+
+
+class StreamSubscription:
+    """One subscriber's view of a shared stream, starting from its first chunk."""
+    def __init__(self, stream: SharedStream):
+        self.stream = stream
+        self._closed = False
+        stream.subscribers += 1
+
+    async def ready(self) -> None:
+        """Waits until the upstream stream has been opened.
+
+        Raises:
+            Exception: The error that prevented the stream from opening.
+        """
+        await self.stream._opened.wait()
+        if self.stream.error is not None and not self.stream.chunks:
+            self.close()
+            raise self.stream.error
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        """Replays the buffered chunks, then follows the live stream.
+
+        Raises:
+            Exception: The upstream error, after the chunks read before it.
+        """
+        stream = self.stream
+        position = 0
+        try:
+            while True:
+                if position < len(stream.chunks):
+                    position += 1
+                    yield stream.chunks[position - 1]
+                elif stream.done:
+                    if stream.error is not None:
+                        raise stream.error
+                    return
+                else:
+                    await stream._changed.wait()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Unsubscribes. Closing twice is harmless."""
+        if not self._closed:
+            self._closed = True
+            self.stream._leave()
+
+
+class StreamFlights:
+    """Shares identical concurrent streams between requests."""
+    def __init__(self, enabled: bool = True):
+        """Initializes an empty set of in-flight streams.
+
+        Args:
+            enabled: Whether identical streams are shared; if not, every
+                request opens its own.
+        """
+        self.enabled = enabled
+        self._streams: Dict[str, SharedStream] = {}
+        self.streams = 0
+        self.shared = 0
+
+    def subscribe(
+        self, key: str, open_stream: Callable[[], Awaitable[AsyncIterator[str]]]
+    ) -> Tuple[StreamSubscription, bool]:
+        """Subscribes to a stream, opening it unless it is already in flight.
+
+        Args:
+            key: The canonical hash of the request.
+            open_stream: A coroutine function that opens the upstream stream.
+
+        Returns:
+            A (subscription, shared) tuple; `shared` is True if the stream was
+            opened by another request.
+        """
+        if not self.enabled:
+            return SharedStream(open_stream, lambda: None).subscribe(), False
+        stream = self._streams.get(key)
+        shared = stream is not None
+        if stream is None:
+            stream = self._streams[key] = SharedStream(open_stream, lambda: self._forget(key, stream))
+            self.streams += 1
+        else:
+            self.shared += 1
+        return stream.subscribe(), shared
+
+    def _forget(self, key: str, stream: SharedStream) -> None:
+        """Removes a finished stream so later requests open a fresh one."""
+        if self._streams.get(key) is stream:
+            del self._streams[key]
+
+    def stats(self) -> dict:
+        """Gets fan-out counters.
+
+        Returns:
+            A dictionary with upstream streams opened, requests that joined
+            an in-flight stream, and the number currently in flight.
+        """
+        return {
+            "streams": self.streams,
+            "shared": self.shared,
+            "in_flight": len(self._streams),
+        }
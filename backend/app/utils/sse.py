@@ -0,0 +1,157 @@
+"""Server-sent event (SSE) streaming for chat responses.
+
+Upstream providers yield many tiny text chunks, often a single token each.
+`event_stream` coalesces them into fewer `text/event-stream` frames, bounded
+by size and by a short time window, while always sending the first chunk
+immediately so time-to-first-byte does not suffer. It also enforces an idle
+timeout and, when the client goes away, closes the upstream stream so the
+provider stops generating tokens nobody will read.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Callable, Optional, Tuple
+
+import anyio
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+DONE = "[DONE]"
+
+
+def sse_event(data: str, event: Optional[str] = None) -> str:
+    """Formats one server-sent event.
+
+    Every line of `data` becomes its own `data:` field, so chunks containing
+    newlines survive the round trip; clients join the fields with newlines.
+
+    Args:
+        data: The event payload.
+        event: An optional event type.
+
+    Returns:
+        The encoded event, terminated by a blank line.
+    """
+    lines = data.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    frame = "".join(f"data: {line}\n" for line in lines)
+    if event:
+        frame = f"event: {event}\n{frame}"
+    return frame + "\n"
+
+
+async def _aclose(iterator: AsyncIterator) -> None:
+    """Closes an async iterator if it supports closing."""
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+async def event_stream(
+    chunks: AsyncIterator[str],
+    max_chars: int,
+    max_wait: float,
+    idle_timeout: float,
+    on_complete: Optional[Callable[[], Tuple[str, Any]]] = None,
+) -> AsyncIterator[str]:
+    """Turns a stream of text chunks into coalesced SSE frames.
+
+    The first chunk is sent as soon as it arrives. Later chunks are buffered
+    until `max_chars` characters are pending or `max_wait` seconds have
+    passed since the first buffered chunk. The stream ends with a `[DONE]`
+    event; upstream failures and idle timeouts are reported as an `error`
+    event before it. If the consumer stops reading (for example because the
+    client disconnected), the upstream iterator is closed right away.
+
+    Args:
+        chunks: The upstream text chunks.
+        max_chars: The buffered size that forces a frame out.
+        max_wait: The longest time in seconds a chunk is held back.
+        idle_timeout: The longest time in seconds to wait for the next
+            upstream chunk before giving up.
+        on_complete: An optional callable returning an (event, payload)
+            pair that is sent as a JSON event after the last chunk of a
+            stream that completed successfully.
+
+    Yields:
+        Encoded SSE frames.
+    """
+    iterator = chunks.__aiter__()
+    pending: Optional[asyncio.Future] = None
+    buffer = []
+    buffered = 0
+    flush_at = None
+    first = True
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = idle_timeout if flush_at is None else max(0.0, flush_at - loop.time())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                if flush_at is None:
+                    raise asyncio.TimeoutError(f"No data from upstream for {idle_timeout} seconds")
+                yield sse_event("".join(buffer))
+                buffer, buffered, flush_at = [], 0, None
+                continue
+            try:
+                chunk = pending.result()
+            except StopAsyncIteration:
+                pending = None
+                break
+            pending = None
+            if not chunk:
+                continue
+            buffer.append(chunk)
+            buffered += len(chunk)
+            if first or buffered >= max_chars:
+                first = False
+                yield sse_event("".join(buffer))
+                buffer, buffered, flush_at = [], 0, None
+            elif flush_at is None:
+                flush_at = loop.time() + max_wait
+        if buffer:
+            yield sse_event("".join(buffer))
+        if on_complete is not None:
+            event, payload = on_complete()
+            yield sse_event(json.dumps(payload), event=event)
+        yield sse_event(DONE)
+    except Exception as e:
+        logger.error(f"Stream error: {e}")
+        if buffer:
+            yield sse_event("".join(buffer))
+        yield sse_event(json.dumps({"error": str(e) or type(e).__name__}), event="error")
+        yield sse_event(DONE)
+    finally:
+        # Cleanup must finish even while the response task is being cancelled
+        with anyio.CancelScope(shield=True):
+            if pending is not None:
+                pending.cancel()
+                await asyncio.gather(pending, return_exceptions=True)
+            await _aclose(iterator)
+
+
+class EventStreamResponse(StreamingResponse):
+    """A `text/event-stream` response.
+
+    Starlette cancels the body iterator as soon as the client disconnects,
+    which lets `event_stream` close the upstream provider stream.
+    """
+    media_type = "text/event-stream"
+
+    def __init__(self, content: AsyncIterator[str], headers: Optional[dict] = None, **kwargs):
+        """Initializes the response with headers that disable buffering.
+
+        Args:
+            content: The encoded SSE frames.
+            headers: Extra response headers.
+            **kwargs: Further arguments for `StreamingResponse`.
+        """
+        headers = {
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+            **(headers or {}),
+        }
+        super().__init__(content, headers=headers, **kwargs)
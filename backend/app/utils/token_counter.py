@@ -0,0 +1,230 @@
+"""Token counting and context budgeting for chat requests.
+
+Counts use the model's real tokenizer when `tiktoken` knows the model, and
+a per-family characters-per-token estimate otherwise. `tiktoken` is a
+listed requirement; the estimate also covers environments without it.
+Tokenizers are built once per encoding, and counts for individual message
+texts are memoized, so re-counting a long conversation that grows by one
+message per turn only tokenizes the new message.
+"""
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+# Context window sizes in tokens, matched by longest model name prefix
+CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-4-turbo": 128000,
+    "gpt-4-32k": 32768,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo-16k": 16385,
+    "gpt-3.5-turbo": 16385,
+    "claude-3": 200000,
+    "claude-2": 100000,
+}
+
+# Approximate characters per token when no exact tokenizer is available
+_CHARS_PER_TOKEN: Dict[str, float] = {"openai": 4.0, "anthropic": 3.5}
+
+# Chat formatting overhead per message and for priming the reply
+_MESSAGE_OVERHEAD = 3
+_REPLY_OVERHEAD = 3
+
+
+class ContextOverflowError(ValueError):
+    """Raised when a conversation does not fit the model's context window."""
+    def __init__(self, prompt_tokens: int, budget: int, model: str):
+        super().__init__(
+            f"Prompt needs {prompt_tokens} tokens but {model} has room for {budget} "
+            f"after reserving max_tokens"
+        )
+        self.prompt_tokens = prompt_tokens
+        self.budget = budget
+
+
+def estimate_tokens(text: str, chars_per_token: float = 4.0) -> int:
+    """Roughly estimates the number of tokens in a text.
+
+    Args:
+        text: The text to estimate.
+        chars_per_token: The average characters per token.
+
+    Returns:
+        The estimated token count.
+    """
+    return int(len(text) / chars_per_token) + 1
+
+
+def model_family(model: str) -> str:
+    """Gets the provider family of a model from its name.
+
+    Args:
+        model: The model name.
+
+    Returns:
+        "anthropic" for Claude models, otherwise "openai".
+    """
+    return "anthropic" if model.startswith("claude") else "openai"
+
+
+@lru_cache(maxsize=None)
+def _encoding(name: str):
+    """Loads a tiktoken encoding once per process."""
+    import tiktoken
+
+    return tiktoken.get_encoding(name)
+
+
+@lru_cache(maxsize=256)
+def tokenizer_for(model: str) -> str:
+    """Gets the tokenizer to count a model's tokens with.
+
+    Args:
+        model: The model name.
+
+    Returns:
+        A tiktoken encoding name, or "~<family>" for the estimate.
+    """
+    family = model_family(model)
+    if family == "openai":
+        try:
+            import tiktoken
+
+            name = tiktoken.encoding_for_model(model).name
+            _encoding(name)
+            return name
+        except ImportError:
+            pass
+        except Exception as e:
+            logger.debug(f"No exact tokenizer for {model}, estimating: {e}")
+    return f"~{family}"
+
+
+def _tokenize_count(tokenizer: str, text: str) -> int:
+    """Counts the tokens of a text with a tokenizer from `tokenizer_for`."""
+    if tokenizer.startswith("~"):
+        return estimate_tokens(text, _CHARS_PER_TOKEN[tokenizer[1:]])
+    return len(_encoding(tokenizer).encode(text, disallowed_special=()))
+
+
+# Message texts recur on every turn of a conversation, so their counts are memoized
+_count = lru_cache(maxsize=config.TOKEN_COUNT_CACHE_SIZE)(_tokenize_count)
+
+
+def count_text(model: str, text: str) -> int:
+    """Counts the tokens of a text.
+
+    Args:
+        model: The model whose tokenizer to use.
+        text: The text to count.
+
+    Returns:
+        The token count.
+    """
+    return _tokenize_count(tokenizer_for(model), text) if text else 0
+
+
+def count_messages(model: str, messages: List[Dict[str, str]]) -> int:
+    """Counts the prompt tokens of a conversation, including chat formatting.
+
+    Args:
+        model: The model whose tokenizer to use.
+        messages: The conversation, as role/content dictionaries.
+
+    Returns:
+        The prompt token count.
+    """
+    tokenizer = tokenizer_for(model)
+    total = _REPLY_OVERHEAD
+    for message in messages:
+        total += _MESSAGE_OVERHEAD + _count(tokenizer, message["content"]) + _count(tokenizer, message["role"])
+    return total
+
+
+def context_window(model: str) -> int:
+    """Gets the context window of a model.
+
+    Args:
+        model: The model name.
+
+    Returns:
+        The context window in tokens.
+    """
+    matches = [prefix for prefix in CONTEXT_WINDOWS if model.startswith(prefix)]
+    if not matches:
+        return config.DEFAULT_CONTEXT_WINDOW
+    return CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+def fit_messages(
+    model: str,
+    messages: List[Dict[str, str]],
+    max_tokens: int,
+    policy: str = "reject",
+) -> Tuple[List[Dict[str, str]], int, int]:
+    """Makes sure a conversation fits the model's context window.
+
+    With the "trim" policy, the oldest messages are dropped until the prompt
+    fits, always keeping system messages and the final message.
+
+    Args:
+        model: The model name.
+        messages: The conversation.
+        max_tokens: The tokens reserved for the completion.
+        policy: "reject" or "trim".
+
+    Returns:
+        A (messages, prompt_tokens, dropped) tuple with the conversation to
+        send, its prompt token count and the number of messages dropped.
+
+    Raises:
+        ContextOverflowError: If the conversation does not fit and cannot be
+            trimmed to fit.
+    """
+    budget = context_window(model) - max_tokens
+    prompt_tokens = count_messages(model, messages)
+    if prompt_tokens <= budget:
+        return messages, prompt_tokens, 0
+    if policy != "trim":
+        raise ContextOverflowError(prompt_tokens, budget, model)
+
+    tokenizer = tokenizer_for(model)
+    costs = [
+        _MESSAGE_OVERHEAD + _count(tokenizer, m["content"]) + _count(tokenizer, m["role"])
+        for m in messages
+    ]
+    keep = [True] * len(messages)
+    for i, message in enumerate(messages[:-1]):
+        if prompt_tokens <= budget:
+            break
+        if message["role"] != "system":
+            keep[i] = False
+            prompt_tokens -= costs[i]
+    if prompt_tokens > budget:
+        raise ContextOverflowError(prompt_tokens, budget, model)
+    trimmed = [m for m, kept in zip(messages, keep) if kept]
+    return trimmed, prompt_tokens, len(messages) - len(trimmed)
+
+
+def usage(
+    model: str, prompt_tokens: int, completion: Optional[str]
+) -> Dict[str, int]:
+    """Builds token usage metadata for a response.
+
+    Args:
+        model: The model that produced the completion.
+        prompt_tokens: The prompt token count.
+        completion: The completion text.
+
+    Returns:
+        A dictionary with prompt, completion and total token counts.
+    """
+    completion_tokens = count_text(model, completion or "")
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
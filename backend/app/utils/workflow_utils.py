@@ -1,17 +1,605 @@
-"""A stub for workflow utilities.
+"""Workflows declared as DAGs of steps, run concurrently with memoized outputs.
 
-This is a stub for a module that will eventually be used to handle
-workflows.
+A workflow is a list of steps. Each step has a type ("model", "memory_search",
+"plugin", ...) handled by an executor coroutine, parameters, and the steps it
+needs. Parameters may reference the workflow inputs and earlier step outputs
+with `{{inputs.name}}` and `{{steps.id}}` placeholders (`{{steps.id.field}}`
+for a field of a dictionary output); a referenced step is an implicit
+dependency. Every step starts as soon as the steps it depends on have
+finished, so independent branches run concurrently.
+
+A step's output is cached under a hash of its type and its parameters after
+placeholders are resolved, i.e. of its definition and everything it consumed.
+Re-running a workflow therefore only executes the steps whose definition or
+upstream outputs changed; retrying a failed workflow resumes after the steps
+that already succeeded. Steps whose output can change under the same
+parameters, memory searches and plugin calls on a file path, are not
+memoized unless they opt in. The pipeline templates from ORCHESTRATION.md
+are built in.
 """
+import asyncio
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from .cache import TieredCache, stable_hash
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+StepExecutor = Callable[[Dict[str, Any]], Awaitable[Any]]
+ReportFn = Callable[[Dict[str, Any]], Awaitable[None]]
+
+SUCCEEDED = "succeeded"
+CACHED = "cached"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+# Step types whose output can change while their parameters stay the same
+# (a memory search sees newly stored memories), so they are not memoized
+# unless a step opts in
+VOLATILE_TYPES = {"memory_search"}
+
+_PLACEHOLDER = re.compile(r"\{\{\s*(inputs|steps)\.(\w+)((?:\.\w+)*)\s*\}\}")
+
+
+class WorkflowError(Exception):
+    """Raised when a step of a workflow fails.
+
+    Attributes:
+        result: The workflow result, with the outputs and timings of the steps
+            that did run.
+    """
+    def __init__(self, message: str, result: Dict[str, Any]):
+        super().__init__(message)
+        self.result = result
+
+
+@dataclass(frozen=True)
+class Step:
+    """A step of a workflow.
+
+    Attributes:
+        id: The step's name, unique within its workflow.
+        type: The executor that runs the step.
+        params: The executor's parameters, possibly with placeholders.
+        needs: The steps that must finish first, besides those referenced
+            by placeholders.
+        retries: How many times a failed step is retried.
+        optional: Whether the workflow continues if the step fails; its
+            output is then None.
+        cache: Whether the step's output is memoized. Defaults to False for
+            volatile step types and for plugin steps that read a file by
+            path, which can change under the same path; files passed as an
+            `attachment` ID are keyed by their content.
+    """
+    id: str
+    type: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    needs: Tuple[str, ...] = ()
+    retries: int = 0
+    optional: bool = False
+    cache: bool = True
+
+    @classmethod
+    def from_dict(cls, spec: Dict[str, Any]) -> "Step":
+        """Builds a step from its declaration.
+
+        Args:
+            spec: A dictionary with the step's `id`, `type` and optional
+                `needs`, `retries`, `optional` and `cache`; any other keys
+                are the executor's parameters.
+
+        Returns:
+            The step.
+
+        Raises:
+            ValueError: If the declaration is malformed.
+        """
+        if not isinstance(spec, dict) or not spec.get("id") or not spec.get("type"):
+            raise ValueError(f"A step needs an id and a type: {spec!r}")
+        params = {k: v for k, v in spec.items() if k not in ("id", "type", "needs", "retries", "optional", "cache")}
+        needs = _names(spec.get("needs", ()), f"Step {spec['id']!r} needs")
+        try:
+            retries = int(spec.get("retries", 0))
+        except (TypeError, ValueError):
+            raise ValueError(f"Step {spec['id']!r} retries must be an integer")
+        return cls(
+            id=str(spec["id"]),
+            type=str(spec["type"]),
+            params=params,
+            needs=needs,
+            retries=retries,
+            optional=bool(spec.get("optional", False)),
+            cache=bool(spec.get("cache", _memoized_by_default(str(spec["type"]), params))),
+        )
+
+    def references(self, scope: str) -> Set[str]:
+        """Gets the names a step's parameters refer to.
+
+        Args:
+            scope: "inputs" or "steps".
+
+        Returns:
+            The referenced input or step names.
+        """
+        text = json.dumps(self.params)
+        return {name for kind, name, _ in _PLACEHOLDER.findall(text) if kind == scope}
+
+    @property
+    def dependencies(self) -> Set[str]:
+        """The steps that must finish before this one starts."""
+        return set(self.needs) | self.references("steps")
+
+
+@dataclass(frozen=True)
+class Workflow:
+    """A validated workflow whose steps are in topological order.
+
+    Attributes:
+        name: The workflow's name.
+        steps: The steps, each after the steps it depends on.
+        outputs: The steps whose outputs the workflow returns; all if empty.
+    """
+    name: str
+    steps: Tuple[Step, ...]
+    outputs: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_dict(cls, name: str, spec: Dict[str, Any]) -> "Workflow":
+        """Builds a workflow from its declaration.
+
+        Args:
+            name: The workflow's name.
+            spec: A dictionary with a list of `steps` and optionally the
+                `outputs` to return.
+
+        Returns:
+            The workflow.
+
+        Raises:
+            ValueError: If a step is malformed, a step ID is repeated, a step
+                depends on an unknown step, or the steps form a cycle.
+        """
+        declared = spec.get("steps") or []
+        if not isinstance(declared, list):
+            raise ValueError(f"Workflow {name!r} steps must be a list")
+        steps = [Step.from_dict(s) for s in declared]
+        if not steps:
+            raise ValueError(f"Workflow {name!r} has no steps")
+        by_id: Dict[str, Step] = {}
+        for step in steps:
+            if step.id in by_id:
+                raise ValueError(f"Duplicate step {step.id!r}")
+            by_id[step.id] = step
+        for step in steps:
+            unknown = step.dependencies - by_id.keys()
+            if unknown:
+                raise ValueError(f"Step {step.id!r} depends on unknown steps: {sorted(unknown)}")
+        outputs = _names(spec.get("outputs") or (), f"Workflow {name!r} outputs")
+        if set(outputs) - by_id.keys():
+            raise ValueError(f"Unknown output steps: {sorted(set(outputs) - by_id.keys())}")
+
+        # Kahn's algorithm, keeping the declared order among ready steps
+        remaining = {step.id: set(step.dependencies) for step in steps}
+        ordered: List[Step] = []
+        while remaining:
+            ready = [step for step in steps if remaining.get(step.id) == set()]
+            if not ready:
+                raise ValueError(f"Workflow {name!r} has a dependency cycle among {sorted(remaining)}")
+            for step in ready:
+                del remaining[step.id]
+                ordered.append(step)
+            for deps in remaining.values():
+                deps.difference_update(step.id for step in ready)
+        return cls(name=name, steps=tuple(ordered), outputs=outputs)
+
+    @property
+    def inputs(self) -> Set[str]:
+        """The workflow inputs the steps refer to."""
+        return set().union(*(step.references("inputs") for step in self.steps))
+
+
+def _names(value: Any, what: str) -> Tuple[str, ...]:
+    """Reads a step ID or a list of step IDs from a declaration.
+
+    Args:
+        value: The declared value.
+        what: What is declared, for the error message.
+
+    Returns:
+        The step IDs.
+
+    Raises:
+        ValueError: If the value is not a string or a list of strings.
+    """
+    if isinstance(value, str):
+        return (value,)
+    if not isinstance(value, (list, tuple)) or not all(isinstance(v, str) for v in value):
+        raise ValueError(f"{what} must be a step ID or a list of step IDs")
+    return tuple(value)
+
+
+def render(value: Any, inputs: Dict[str, Any], outputs: Dict[str, Any]) -> Any:
+    """Resolves the placeholders in a step's parameters.
+
+    A string that is a single placeholder becomes the referenced value
+    itself; placeholders inside longer strings are replaced by the value's
+    text (JSON for anything but strings).
+
+    Args:
+        value: The parameters, or a part of them.
+        inputs: The workflow inputs.
+        outputs: The outputs of the steps finished so far.
+
+    Returns:
+        The parameters with placeholders resolved.
+    """
+    if isinstance(value, dict):
+        return {k: render(v, inputs, outputs) for k, v in value.items()}
+    if isinstance(value, list):
+        return [render(v, inputs, outputs) for v in value]
+    if not isinstance(value, str) or "{{" not in value:
+        return value
 
-def run_workflow(workflow_name: str, inputs: dict) -> dict:
-    """Runs a workflow.
+    def lookup(match: re.Match) -> Any:
+        scope, name, path = match.groups()
+        found = (inputs if scope == "inputs" else outputs).get(name)
+        for key in filter(None, path.split(".")):
+            found = found.get(key) if isinstance(found, dict) else None
+        return found
+
+    whole = _PLACEHOLDER.fullmatch(value.strip())
+    if whole:
+        return lookup(whole)
+
+    def text(match: re.Match) -> str:
+        found = lookup(match)
+        if found is None:
+            return ""
+        return found if isinstance(found, str) else json.dumps(found, default=str)
+
+    return _PLACEHOLDER.sub(text, value)
+
+
+def _memoized_by_default(step_type: str, params: Dict[str, Any]) -> bool:
+    """Tells whether a step's output is memoized when it does not say."""
+    if step_type in VOLATILE_TYPES:
+        return False
+    args = params.get("args")
+    return not (step_type == "plugin" and isinstance(args, dict) and "file_path" in args)
+
+
+def step_key(step: Step, params: Dict[str, Any]) -> str:
+    """Builds the memo key for a step with resolved parameters.
+
+    The step's ID is left out, so an identical step in another workflow
+    shares its output.
 
     Args:
-        workflow_name: The name of the workflow to run.
-        inputs: A dictionary of inputs for the workflow.
+        step: The step.
+        params: The step's parameters with placeholders resolved.
 
     Returns:
-        A dictionary of outputs from the workflow.
+        The cache key.
     """
-    return {"status": "stub"}
+    return stable_hash("step", step.type, json.dumps(params, sort_keys=True, default=str))
+
+
+def parse_agents(spec: str) -> Dict[str, Tuple[str, str]]:
+    """Parses agent targets from an "agent=provider:model,..." string.
+
+    Args:
+        spec: The agent specification.
+
+    Returns:
+        A mapping of agent name to (provider, model).
+
+    Raises:
+        ValueError: If an entry is malformed.
+    """
+    agents = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        agent, _, target = entry.partition("=")
+        provider, sep, model = target.strip().partition(":")
+        if not agent.strip() or not sep or not provider or not model:
+            raise ValueError(f"Invalid agent target: {entry!r}")
+        agents[agent.strip().lower()] = (provider.lower(), model)
+    return agents
+
+
+def _model_step(step_id: str, agent: str, prompt: str, **extra: Any) -> Dict[str, Any]:
+    """Declares a template step that asks an agent's model, retrying once."""
+    return {"id": step_id, "type": "model", "agent": agent, "prompt": prompt, "retries": 1, **extra}
+
+
+# The pipeline templates from ORCHESTRATION.md. Steps that only need the
+# same upstream output (review and docs) run side by side; the memory
+# context lookup is optional.
+TEMPLATES: Dict[str, Dict[str, Any]] = {
+    "feature": {
+        "steps": [
+            {"id": "context", "type": "memory_search", "query": "{{inputs.task}}", "limit": 5,
+             "optional": True, "cache": False},
+            _model_step(
+                "plan", "codex",
+                "Plan the implementation of this feature. List the pipeline steps, "
+                "their owners and the acceptance tests.\n\nTask:\n{{inputs.task}}\n\n"
+                "Related notes:\n{{steps.context}}",
+            ),
+            _model_step("spec", "codex", "Write the feature specification for this plan.\n\n{{steps.plan}}"),
+            _model_step(
+                "build", "codex",
+                "Implement this specification with code and tests.\n\n{{steps.spec}}",
+            ),
+            _model_step(
+                "review", "claude",
+                "Review this implementation against its specification. Flag risks, "
+                "missing tests and edge cases.\n\nSpecification:\n{{steps.spec}}\n\n"
+                "Implementation:\n{{steps.build}}",
+            ),
+            _model_step(
+                "docs", "jules",
+                "Write the README and CONTRIBUTING updates for this change.\n\n{{steps.build}}",
+            ),
+        ],
+        "outputs": ["plan", "spec", "build", "review", "docs"],
+    },
+    "bugfix": {
+        "steps": [
+            _model_step(
+                "repro", "codex",
+                "Reproduce this bug and write a failing test for it.\n\n{{inputs.task}}",
+            ),
+            _model_step(
+                "patch", "codex",
+                "Fix the bug so this test passes.\n\nBug:\n{{inputs.task}}\n\nTest:\n{{steps.repro}}",
+            ),
+            _model_step("review", "claude", "Review this fix for risks and edge cases.\n\n{{steps.patch}}"),
+            _model_step("changelog", "jules", "Write the changelog entry for this fix.\n\n{{steps.patch}}"),
+        ],
+    },
+    "docs": {
+        "steps": [
+            _model_step(
+                "scope", "jules",
+                "Map the scope and style of this documentation change.\n\n{{inputs.task}}",
+            ),
+            _model_step("pass", "jules", "Apply this documentation plan across the files.\n\n{{steps.scope}}"),
+            _model_step("review", "claude", "Review these documentation changes for clarity.\n\n{{steps.pass}}"),
+        ],
+    },
+    "multimodal_ui": {
+        "steps": [
+            {"id": "intake", "type": "plugin", "plugin": "image_analysis",
+             "args": {"attachment": "{{inputs.image}}"}, "retries": 1},
+            _model_step(
+                "critique", "gemini",
+                "Analyze this screenshot; list UI defects and a11y issues; provide "
+                "concrete CSS/ARIA fixes.\n\nTask:\n{{inputs.task}}\n\nImage analysis:\n{{steps.intake}}",
+            ),
+            _model_step("implement", "codex", "Implement these UI fixes.\n\n{{steps.critique}}"),
+            _model_step("docs", "jules", "Document these UI changes.\n\n{{steps.implement}}"),
+        ],
+    },
+}
+
+
+def load_workflow(workflow: Union[str, Dict[str, Any]]) -> Workflow:
+    """Gets a built-in template by name, or builds an inline workflow.
+
+    Args:
+        workflow: A template name, or a declaration with `steps` and an
+            optional `name`.
+
+    Returns:
+        The workflow.
+
+    Raises:
+        ValueError: If the template is unknown or the declaration invalid.
+    """
+    if isinstance(workflow, str):
+        if workflow not in TEMPLATES:
+            raise ValueError(f"Unknown workflow: {workflow!r}")
+        return Workflow.from_dict(workflow, TEMPLATES[workflow])
+    if not isinstance(workflow, dict):
+        raise ValueError("A workflow must be a template name or a declaration")
+    return Workflow.from_dict(str(workflow.get("name") or "inline"), workflow)
+
+
+class WorkflowEngine:
+    """Runs workflows with a memo cache of step outputs."""
+    def __init__(
+        self,
+        executors: Dict[str, StepExecutor],
+        cache: TieredCache,
+        enabled: bool = True,
+        max_parallel: int = 8,
+    ):
+        """Initializes the engine.
+
+        Args:
+            executors: The executor coroutine function for each step type. An
+                executor receives the step's resolved parameters and returns
+                a JSON-serializable output.
+            cache: The memo cache for step outputs.
+            enabled: Whether step outputs are memoized.
+            max_parallel: The most steps of one workflow run at once.
+        """
+        self.executors = executors
+        self.cache = cache
+        self.enabled = enabled
+        self.max_parallel = max_parallel
+        self.flights = SingleFlight()
+        self.runs = 0
+        self.executed = 0
+        self.cached = 0
+        self.failed = 0
+
+    def validate(self, workflow: Workflow, inputs: Dict[str, Any]) -> None:
+        """Checks that a workflow can run before any step does.
+
+        Args:
+            workflow: The workflow.
+            inputs: The workflow inputs.
+
+        Raises:
+            ValueError: If the inputs are not a dictionary, a step type has no
+                executor or an input is missing.
+        """
+        if not isinstance(inputs, dict):
+            raise ValueError("Workflow inputs must be a dictionary")
+        unknown = {step.type for step in workflow.steps} - self.executors.keys()
+        if unknown:
+            raise ValueError(f"Unknown step types: {sorted(unknown)}")
+        missing = workflow.inputs - inputs.keys()
+        if missing:
+            raise ValueError(f"Missing workflow inputs: {sorted(missing)}")
+
+    async def run(
+        self, workflow: Workflow, inputs: Dict[str, Any], report: Optional[ReportFn] = None
+    ) -> Dict[str, Any]:
+        """Runs a workflow.
+
+        Args:
+            workflow: The workflow.
+            inputs: The workflow inputs.
+            report: An optional coroutine function called with the progress
+                after every step.
+
+        Returns:
+            A dictionary with the workflow's `outputs` and, per step, its
+            status, whether it came from the cache, and its start offset,
+            queue wait and duration in milliseconds.
+
+        Raises:
+            ValueError: If the workflow cannot run (see `validate`).
+            WorkflowError: If a required step fails.
+        """
+        self.validate(workflow, inputs)
+        self.runs += 1
+        started = time.perf_counter()
+        outputs: Dict[str, Any] = {}
+        records: Dict[str, Dict[str, Any]] = {}
+        slots = asyncio.Semaphore(self.max_parallel)
+        tasks: Dict[str, asyncio.Task] = {}
+
+        def ms(since: float) -> float:
+            return round((time.perf_counter() - since) * 1000, 1)
+
+        async def run_step(step: Step) -> bool:
+            ok = await asyncio.gather(*(tasks[dep] for dep in step.dependencies))
+            if not all(ok):
+                records[step.id] = {"status": SKIPPED}
+                return False
+            ok = await attempt(step)
+            if report is not None:
+                await self._report(report, workflow, records)
+            return ok
+
+        async def attempt(step: Step) -> bool:
+            record: Dict[str, Any] = {"start_ms": ms(started)}
+            records[step.id] = record
+            ready = time.perf_counter()
+            try:
+                params = render(step.params, inputs, outputs)
+                key = step_key(step, params)
+                memoize = self.enabled and step.cache
+                data = await self.cache.get(key) if memoize else None
+                if data is not None:
+                    outputs[step.id] = json.loads(data)
+                    record.update(status=CACHED, cached=True, wait_ms=0.0, duration_ms=ms(ready))
+                    self.cached += 1
+                    return True
+                async with slots:
+                    record["wait_ms"] = ms(ready)
+                    running = time.perf_counter()
+                    output = await self._execute(step, key, params)
+                    record["duration_ms"] = ms(running)
+                outputs[step.id] = output
+                record.update(status=SUCCEEDED, cached=False)
+                self.executed += 1
+                if memoize:
+                    await self._memoize(key, output)
+                return True
+            except Exception as e:
+                self.failed += 1
+                record.update(status=FAILED, error=str(e) or type(e).__name__)
+                record.setdefault("duration_ms", ms(ready))
+                if step.optional:
+                    outputs[step.id] = None
+                    return True
+                return False
+
+        for step in workflow.steps:
+            tasks[step.id] = asyncio.create_task(run_step(step))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+        failed = [s.id for s in workflow.steps if records[s.id]["status"] == FAILED and not s.optional]
+        result = {
+            "workflow": workflow.name,
+            "status": FAILED if failed else SUCCEEDED,
+            "outputs": {sid: outputs[sid] for sid in workflow.outputs or [s.id for s in workflow.steps] if sid in outputs},
+            "steps": {s.id: records[s.id] for s in workflow.steps},
+            "elapsed_ms": ms(started),
+        }
+        if failed:
+            raise WorkflowError(f"Step {failed[0]!r} failed: {records[failed[0]]['error']}", result)
+        return result
+
+    async def _execute(self, step: Step, key: str, params: Dict[str, Any]) -> Any:
+        """Runs a step, sharing identical concurrent runs and retrying failures."""
+        executor = self.executors[step.type]
+        for attempt in range(step.retries + 1):
+            try:
+                output, _ = await self.flights.do(key, lambda: executor(params))
+                return output
+            except Exception as e:
+                if attempt == step.retries:
+                    raise
+                logger.info(f"Retrying step {step.id!r} after: {e}")
+
+    async def _memoize(self, key: str, output: Any) -> None:
+        """Stores a step output, skipping outputs that are not JSON."""
+        try:
+            data = json.dumps(output).encode("utf-8")
+        except (TypeError, ValueError):
+            return
+        await self.cache.set(key, data)
+
+    @staticmethod
+    async def _report(report: ReportFn, workflow: Workflow, records: Dict[str, Dict[str, Any]]) -> None:
+        """Reports progress, ignoring failures of the reporter."""
+        done = sum(1 for r in records.values() if "status" in r)
+        try:
+            await report({"stage": "running", "workflow": workflow.name, "done": done,
+                          "total": len(workflow.steps), "steps": records})
+        except Exception as e:
+            logger.warning(f"Reporting workflow progress failed: {e}")
+
+    async def close(self) -> None:
+        """Closes the memo cache."""
+        await self.cache.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Gets run and step counters.
+
+        Returns:
+            A dictionary of counters and memo cache statistics.
+        """
+        steps = self.executed + self.cached
+        return {
+            "runs": self.runs,
+            "steps_executed": self.executed,
+            "steps_cached": self.cached,
+            "steps_failed": self.failed,
+            "memo_hit_rate": self.cached / steps if steps else 0.0,
+            "cache": self.cache.stats(),
+        }
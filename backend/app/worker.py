@@ -0,0 +1,39 @@
+# Standalone background job worker
+import asyncio
+import logging
+import signal
+from dotenv import load_dotenv
+import os
+
+# Load .env file on startup
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
+
+from .api import plugin, workflow  # workflow registers its job handler
+from .api.jobs import job_workers
+from .models.registry import provider_registry
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def main():
+    """Runs job workers until SIGINT or SIGTERM.
+
+    Running jobs are handed back to the queue on shutdown, so workers can be
+    scaled and redeployed independently of the API.
+    """
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    await provider_registry.warm_up()
+    await job_workers.start()
+    logger.info(f"Started {job_workers.concurrency} job workers")
+    await stopping.wait()
+    await job_workers.stop()
+    await workflow.workflow_engine.close()
+    plugin.plugin_pool.shutdown()
+    await plugin.sandbox_pool.close()
+    await provider_registry.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
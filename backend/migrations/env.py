@@ -18,6 +18,7 @@ if config.config_file_name is not None:
 # for 'autogenerate' support
 from app.db.config import Base  # Import your Base
 from app.db.memory import MemoryEntry # Import your models
+from app.db.system_prompt import SystemPromptEntry
 target_metadata = Base.metadata
 
 # other values from the config, defined by the needs of env.py,
@@ -0,0 +1,33 @@
+from alembic import op
+
+"""Add an HNSW cosine index on memory_entries.embedding"""
+
+# revision identifiers, used by Alembic.
+revision = 'memory_embedding_hnsw'
+down_revision = 'initial_migration'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_memory_entries_embedding_hnsw',
+            'memory_entries',
+            ['embedding'],
+            unique=False,
+            postgresql_using='hnsw',
+            postgresql_with={'m': 16, 'ef_construction': 64},
+            postgresql_ops={'embedding': 'vector_cosine_ops'},
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_memory_entries_embedding_hnsw',
+            table_name='memory_entries',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,47 @@
+from alembic import op
+import sqlalchemy as sa
+
+"""Add a (user_id, created_at DESC, id DESC) index for timeline keyset pagination"""
+
+# revision identifiers, used by Alembic.
+revision = 'memory_timeline_keyset'
+down_revision = 'memory_embedding_hnsw'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_memory_entries_user_created_id',
+            'memory_entries',
+            ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            unique=False,
+            postgresql_include=['entry_metadata'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # The composite index has user_id as its prefix, so this one is redundant
+        op.drop_index(
+            'ix_memory_entries_user_id',
+            table_name='memory_entries',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_memory_entries_user_id',
+            'memory_entries',
+            ['user_id'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            'ix_memory_entries_user_created_id',
+            table_name='memory_entries',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,25 @@
+from alembic import op
+import sqlalchemy as sa
+
+"""Add the system_prompts table"""
+
+# revision identifiers, used by Alembic.
+revision = 'system_prompts'
+down_revision = 'memory_timeline_keyset'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'system_prompts',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name'),
+    )
+
+def downgrade():
+    op.drop_table('system_prompts')
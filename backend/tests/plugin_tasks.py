@@ -0,0 +1,26 @@
+"""Plugin functions for the plugin pool tests."""
+import os
+import time
+
+
+def whoami():
+    return os.getpid()
+
+
+def reverse(data):
+    return {"size": len(data), "reversed": bytes(reversed(data))}
+
+
+def spin(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+    return "done"
+
+
+def hog(mb):
+    return len(bytearray(mb * 1024 * 1024))
+
+
+def crash():
+    os._exit(1)
@@ -0,0 +1,124 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from app.api import chat
+from app.main import app
+from app.models.admission import (
+    AdmissionController,
+    AdmissionRejected,
+    Limits,
+    admission_priority,
+    parse_limits,
+)
+from app.models.router import ModelRouter
+
+
+def make_controller(concurrency=1, rpm=0, tpm=0, max_queue=10, max_wait=1.0, overrides=None):
+    return AdmissionController(
+        enabled=True,
+        default=Limits(concurrency, rpm, tpm),
+        overrides=overrides or {},
+        max_queue=max_queue,
+        max_wait=max_wait,
+    )
+
+
+def test_parse_limits():
+    """Test limits parse per provider and per model"""
+    limits = parse_limits("openai=8:500:0, openai:GPT-4=2:100:40000")
+    assert limits["openai"] == Limits(8, 500, 0)
+    assert limits["openai:gpt-4"] == Limits(2, 100, 40000)
+    with pytest.raises(ValueError):
+        parse_limits("openai=8:500")
+
+
+@pytest.mark.asyncio
+async def test_concurrency_slot_is_handed_over():
+    """Test a queued call is admitted as soon as a slot is released"""
+    controller = make_controller(concurrency=1)
+    first = await controller.acquire("openai", "gpt-4")
+    waiting = asyncio.create_task(controller.acquire("openai", "gpt-4"))
+    await asyncio.sleep(0.01)
+    assert not waiting.done()
+    first.release()
+    second = await waiting
+    second.release()
+    second.release()
+    stats = controller.stats()["gates"]["openai"]
+    assert stats["in_flight"] == 0
+    assert stats["admitted"] == 2 and stats["queued"] == 1
+    assert stats["max_wait_ms"] > 0
+
+
+@pytest.mark.asyncio
+async def test_interactive_calls_jump_the_queue():
+    """Test interactive waiters are admitted before earlier batch waiters"""
+    controller = make_controller(concurrency=1)
+    held = await controller.acquire("openai", "gpt-4")
+    order = []
+
+    async def call(name, priority):
+        with admission_priority(priority):
+            ticket = await controller.acquire("openai", "gpt-4")
+        order.append(name)
+        ticket.release()
+
+    batch = asyncio.create_task(call("batch", "batch"))
+    await asyncio.sleep(0.01)
+    interactive = asyncio.create_task(call("interactive", "interactive"))
+    await asyncio.sleep(0.01)
+    held.release()
+    await asyncio.gather(batch, interactive)
+    assert order == ["interactive", "batch"]
+
+
+@pytest.mark.asyncio
+async def test_sheds_when_queue_full_or_wait_too_long():
+    """Test calls are rejected when the queue is full or the wait times out"""
+    controller = make_controller(concurrency=1, max_queue=1, max_wait=0.05)
+    held = await controller.acquire("openai", "gpt-4")
+    queued = asyncio.create_task(controller.acquire("openai", "gpt-4"))
+    await asyncio.sleep(0.01)
+    with pytest.raises(AdmissionRejected, match="queue full"):
+        await controller.acquire("openai", "gpt-4")
+    with pytest.raises(AdmissionRejected, match="queue timeout"):
+        await queued
+    held.release()
+    stats = controller.stats()["gates"]["openai"]
+    assert stats == {**stats, "in_flight": 0, "queue_depth": 0, "shed": 2}
+
+
+@pytest.mark.asyncio
+async def test_rate_buckets_per_model():
+    """Test RPM and TPM budgets are enforced per configured model"""
+    controller = make_controller(
+        concurrency=0, max_wait=0.5,
+        overrides={"openai:gpt-4": Limits(0, 60, 1000)},
+    )
+    (await controller.acquire("openai", "gpt-4", tokens=900)).release()
+    with pytest.raises(AdmissionRejected) as rejected:
+        await controller.acquire("openai", "gpt-4", tokens=900)
+    assert rejected.value.reason == "rate limit"
+    assert rejected.value.retry_after >= 1
+    # Other models share the unlimited provider gate
+    (await controller.acquire("openai", "gpt-3.5-turbo", tokens=10**6)).release()
+    assert set(controller.stats()["gates"]) == {"openai:gpt-4", "openai"}
+
+
+class OverloadedProvider:
+    """A provider whose calls are always shed"""
+    async def generate(self, messages, model, max_tokens, temperature, stream=False, **kwargs):
+        raise AdmissionRejected("openai", "queue full", 7)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_chat_returns_503_with_retry_after(monkeypatch, stream):
+    """Test shed chat requests get a 503 with Retry-After"""
+    provider = OverloadedProvider()
+    monkeypatch.setattr(chat, "PROVIDERS", {"openai": provider})
+    monkeypatch.setattr(chat, "model_router", ModelRouter({"openai": provider}))
+    client = TestClient(app)
+    body = {"messages": [{"role": "user", "content": "hi"}], "stream": stream}
+    response = client.post("/api/chat/", json=body)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "7"
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import pytest
+from fastapi.testclient import TestClient
+from app.api import attachments, chat, plugin
+from app.config import config
+from app.main import app
+from app.models.router import ModelRouter
+from app.utils.attachment_store import AttachmentStore
+from app.utils.cache import TieredCache
+from app.utils.file_response import RangeFileResponse
+from app.utils.singleflight import SingleFlight
+
+
+class EchoProvider:
+    """A provider that answers with the final prompt it was sent"""
+    async def generate(self, messages, model, max_tokens, temperature, stream=False, **kwargs):
+        return messages[-1]["content"]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = AttachmentStore(str(tmp_path), max_size=2 << 20)
+    for module in (attachments, chat, plugin):
+        monkeypatch.setattr(module, "attachment_store", store)
+    return store
+
+
+def upload(client, *files):
+    return client.post("/api/attachments/", files=[("file", f) for f in files])
+
+
+def test_upload_is_content_addressed_and_deduplicated(store, tmp_path):
+    """Test uploads are stored under their SHA-256 and identical files are stored once"""
+    client = TestClient(app)
+    data = os.urandom(3 << 19)
+    first = upload(client, ("a.bin", data, "application/octet-stream"))
+    assert first.status_code == 201
+    meta = first.json()["attachments"][0]
+    assert meta["id"] == hashlib.sha256(data).hexdigest()
+    assert meta["size"] == len(data) and meta["type"] == "file" and not meta["deduplicated"]
+
+    second = upload(client, ("copy.bin", data, "application/octet-stream"), ("note.txt", b"hi", "text/plain"))
+    copy, note = second.json()["attachments"]
+    assert copy["deduplicated"] and copy["filename"] == "a.bin"
+    assert note["type"] == "file" and not note["deduplicated"]
+    assert store.stats()["stored"] == 2 and store.stats()["deduplicated"] == 1
+    assert os.listdir(tmp_path / "tmp") == []
+
+
+def test_oversized_upload_is_rejected_and_discarded(store, tmp_path):
+    """Test files past the size limit get a 413 and leave nothing behind"""
+    response = upload(TestClient(app), ("big.bin", os.urandom((2 << 20) + 1), "application/octet-stream"))
+    assert response.status_code == 413
+    assert os.listdir(tmp_path / "tmp") == []
+    assert not (tmp_path / "objects").exists()
+
+
+def test_upload_requires_multipart_files(store):
+    """Test bodies without file parts are rejected"""
+    client = TestClient(app)
+    assert client.post("/api/attachments/", json={"a": 1}).status_code == 400
+    assert client.post("/api/attachments/", data={"field": "x"}, files={"f": ("", b"")}).status_code == 400
+
+
+def test_download_supports_ranges_and_revalidation(store):
+    """Test downloads honor Range, If-None-Match and HEAD"""
+    client = TestClient(app)
+    data = bytes(range(256)) * 4
+    attachment_id = upload(client, ("clip.wav", data, "audio/wav")).json()["attachments"][0]["id"]
+    url = f"/api/attachments/{attachment_id}"
+
+    full = client.get(url)
+    assert full.status_code == 200 and full.content == data
+    assert full.headers["accept-ranges"] == "bytes" and full.headers["etag"] == f'"{attachment_id}"'
+    assert full.headers["content-disposition"].startswith("inline")
+
+    part = client.get(url, headers={"Range": "bytes=10-19"})
+    assert part.status_code == 206 and part.content == data[10:20]
+    assert part.headers["content-range"] == f"bytes 10-19/{len(data)}"
+    assert client.get(url, headers={"Range": "bytes=-5"}).content == data[-5:]
+    assert client.get(url, headers={"Range": "bytes=5000-"}).status_code == 416
+
+    assert client.get(url, headers={"If-None-Match": f'"{attachment_id}"'}).status_code == 304
+    head = client.head(url)
+    assert head.status_code == 200 and head.content == b"" and head.headers["content-length"] == str(len(data))
+
+    assert client.get(f"{url}/meta").json()["filename"] == "clip.wav"
+    assert client.get("/api/attachments/" + "0" * 64).status_code == 404
+    assert client.get("/api/attachments/../config").status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_zero_copy_send_when_server_supports_it(tmp_path):
+    """Test the file descriptor is handed to the server instead of read in Python"""
+    path = tmp_path / "f.bin"
+    path.write_bytes(b"0123456789")
+    messages = []
+
+    async def send(message):
+        if message["type"] == "http.response.zerocopysend":
+            message = {**message, "data": os.pread(message["file"].fileno(), message["count"], message["offset"])}
+        messages.append(message)
+
+    scope = {"type": "http", "extensions": {"http.response.zerocopysend": {}}}
+    await RangeFileResponse(str(path), 10, range_header="bytes=2-5")(scope, None, send)
+    assert messages[0]["status"] == 206
+    assert messages[1]["type"] == "http.response.zerocopysend" and messages[1]["data"] == b"2345"
+
+
+def test_chat_messages_reference_attachments(store, monkeypatch):
+    """Test chat messages expand attachment IDs and reject unknown ones"""
+    provider = EchoProvider()
+    monkeypatch.setattr(chat, "PROVIDERS", {"openai": provider})
+    monkeypatch.setattr(chat, "model_router", ModelRouter({"openai": provider}))
+    monkeypatch.setattr(chat, "chat_flights", SingleFlight())
+    client = TestClient(app)
+    attachment_id = upload(client, ("notes.txt", b"remember the milk", "text/plain")).json()["attachments"][0]["id"]
+
+    def ask(*ids):
+        message = {"role": "user", "content": "Summarize", "attachments": list(ids)}
+        return client.post("/api/chat/", json={"messages": [message], "temperature": 0.5})
+
+    content = ask(attachment_id).json()["content"]
+    assert content.startswith("Summarize") and f"sha256:{attachment_id}" in content
+    assert "remember the milk" in content
+    assert ask("f" * 64).status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_plugins_take_attachments(store, monkeypatch):
+    """Test plugin calls resolve attachment IDs and reuse them as cache keys"""
+    class InlinePool:
+        async def run(self, fn, args, timeout=None):
+            return fn(**args)
+
+    monkeypatch.setattr(config, "CACHE_BACKEND", "none")
+    monkeypatch.setattr(plugin, "plugin_pool", InlinePool())
+    monkeypatch.setattr(plugin, "plugin_cache", TieredCache("plugin", max_entries=10))
+    calls = []
+    monkeypatch.setattr(plugin, "file_digest", lambda path: calls.append(path))
+    monkeypatch.setitem(plugin.PLUGINS, "image_analysis", lambda file_path: {"size": os.path.getsize(file_path)})
+    meta, _ = await store.save(aiter_bytes(b"x" * 100), "a.png", "image/png")
+
+    result = await plugin.run_plugin("image_analysis", {"attachment": meta["id"]})
+    assert result == {"size": 100} and calls == []
+    with pytest.raises(ValueError):
+        await plugin.run_plugin("image_analysis", {"attachment": "a" * 64})
+    response = TestClient(app).post("/api/plugin/", json={"plugin": "image_analysis", "args": {"attachment": "x"}})
+    assert response.status_code == 404
+
+
+async def aiter_bytes(data):
+    yield data
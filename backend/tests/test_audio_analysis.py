@@ -0,0 +1,155 @@
+import json
+import wave
+import httpx
+import numpy as np
+import pytest
+from app.api import plugin
+from app.config import config
+from app.main import app
+from app.plugins.audio_analysis import analyze_audio, analyze_chunk, probe_audio, stream_audio_analysis
+from app.utils.cache import TieredCache
+from app.utils.plugin_pool import PluginError, PluginInputError, PluginTimeout
+
+RATE = 8000
+
+
+def tone(seconds, freq, level=0.5):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return level * np.sin(2 * np.pi * freq * t)
+
+
+def write_wav(path, signal, channels=1, width=2):
+    """Writes a signal as integer PCM, duplicated across channels."""
+    scale = float(1 << (8 * width - 1)) - 1
+    samples = np.repeat((signal * scale).astype(np.int32)[:, None], channels, axis=1).ravel()
+    data = samples.astype("<i2").tobytes() if width == 2 else b"".join(int(s).to_bytes(3, "little", signed=True) for s in samples)
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(width)
+        f.setframerate(RATE)
+        f.writeframes(data)
+
+
+@pytest.fixture
+def small_frames(monkeypatch):
+    """Short frames, timeline points and chunks so tiny files span several chunks."""
+    monkeypatch.setattr(config, "AUDIO_FRAME_SIZE", 256)
+    monkeypatch.setattr(config, "AUDIO_TIMELINE_SECONDS", 0.128)
+    monkeypatch.setattr(config, "AUDIO_CHUNK_SECONDS", 0.512)
+    monkeypatch.setattr(config, "CACHE_BACKEND", "none")
+    monkeypatch.setattr(plugin, "plugin_cache", TieredCache("plugin", max_entries=10))
+
+
+@pytest.fixture
+def recording(tmp_path):
+    """A 440 Hz tone, 1.024 s of silence and a 2 kHz tone, in stereo."""
+    path = tmp_path / "talk.wav"
+    write_wav(path, np.concatenate([tone(1.024, 440), np.zeros(int(1.024 * RATE)), tone(0.5, 2000, 0.3)]), channels=2)
+    return path
+
+
+def test_probe_reads_wav_and_raw_pcm_headers(tmp_path, recording):
+    """Test formats come from the WAV header, and raw PCM needs its rate"""
+    info = probe_audio(str(recording))
+    assert (info["format"], info["channels"], info["sample_width"], info["duration"]) == ("wav", 2, 2, 2.548)
+    raw = tmp_path / "talk.pcm"
+    raw.write_bytes(bytes(16000))
+    with pytest.raises(ValueError):
+        probe_audio(str(raw))
+    assert probe_audio(str(raw), sample_rate=RATE)["duration"] == 1.0
+
+
+def test_levels_silence_and_spectrum(recording, small_frames):
+    """Test loudness, silent stretches across chunk boundaries and the spectrum"""
+    result = analyze_audio(str(recording))
+    assert result["progress"] == 1.0 and len(result["timeline"]["rms_db"]) == 20
+    assert result["peak_db"] == pytest.approx(-6.02, abs=0.1)
+    # The silence spans two chunk boundaries and comes back as one stretch
+    assert result["silence"]["segments"] == [[1.024, 2.048]]
+    spectrum = result["spectrum"]
+    assert spectrum["dominant_hz"] == pytest.approx(440, abs=RATE / 256)
+    assert spectrum["bands"]["250-500"] > 0.8 and spectrum["bands"]["2000+"] > 0.05
+
+
+def test_24_bit_and_chunking_do_not_change_the_result(tmp_path, recording, small_frames, monkeypatch):
+    """Test 24-bit input reads the same and chunk size does not matter"""
+    signal = np.concatenate([tone(1.024, 440), np.zeros(int(1.024 * RATE)), tone(0.5, 2000, 0.3)])
+    write_wav(tmp_path / "talk24.wav", signal, channels=2, width=3)
+    chunked = analyze_audio(str(recording))
+    deep = analyze_audio(str(tmp_path / "talk24.wav"))
+    assert deep["sample_width"] == 3 and deep["silence"] == chunked["silence"]
+    assert deep["rms_db"] == pytest.approx(chunked["rms_db"], abs=0.01)
+    monkeypatch.setattr(config, "AUDIO_CHUNK_SECONDS", 60)
+    assert analyze_audio(str(recording)) == chunked
+
+
+@pytest.mark.asyncio
+async def test_partial_results_arrive_as_chunks_finish(recording, small_frames):
+    """Test chunks run in parallel and each one yields a fuller partial result"""
+    running, peak = 0, 0
+
+    async def run_chunk(args):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            return analyze_chunk(**args)
+        finally:
+            running -= 1
+
+    partials = [p async for p in stream_audio_analysis(str(recording), run_chunk, parallel=2)]
+    progress = [p["progress"] for p in partials]
+    assert len(partials) == 5 and progress == sorted(progress) and progress[-1] == 1.0
+    assert None in partials[0]["timeline"]["rms_db"]
+    assert partials[-1] == analyze_audio(str(recording)) and peak <= 2
+
+
+@pytest.mark.asyncio
+async def test_audio_endpoints(recording, small_frames, monkeypatch):
+    """Test the plugin call and the SSE stream, which replays cached results"""
+    class InlinePool:
+        workers = 2
+        calls = 0
+
+        async def run(self, fn, args, timeout=None):
+            InlinePool.calls += 1
+            return fn(**args)
+
+    monkeypatch.setattr(plugin, "plugin_pool", InlinePool())
+    monkeypatch.setattr(config, "PLUGIN_FILE_DIRS", str(recording.parent))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        async with client.stream("POST", "/api/plugin/audio_analysis/stream", json={"file_path": str(recording)}) as response:
+            body = (await response.aread()).decode()
+        events = [e.split("\n")[0] for e in body.split("\n\n") if e]
+        assert events == ["event: progress"] * 4 + ["event: result", "data: [DONE]"]
+        assert InlinePool.calls == 5
+        response = await client.post("/api/plugin/", json={"plugin": "audio_analysis", "args": {"file_path": str(recording)}})
+        assert response.json()["result"]["silence"]["segments"] == [[1.024, 2.048]]
+        async with client.stream("POST", "/api/plugin/audio_analysis/stream", json={"file_path": str(recording)}) as response:
+            body = (await response.aread()).decode()
+        assert body.startswith("event: result") and InlinePool.calls == 5
+        result = json.loads(body.split("\n\n")[0].split("data: ", 1)[1])
+        assert result["progress"] == 1.0
+        missing = await client.post("/api/plugin/audio_analysis/stream", json={"file_path": str(recording.parent / "nope.wav")})
+        assert missing.status_code == 400
+        outside = await client.post("/api/plugin/audio_analysis/stream", json={"file_path": "/etc/passwd"})
+        assert outside.status_code == 403
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("error, status", [(PluginInputError("ValueError: bad chunk"), 400), (PluginTimeout("slow"), 504), (PluginError("MemoryError: "), 500)])
+async def test_stream_maps_first_chunk_failures(recording, monkeypatch, error, status):
+    """Test a failure before the stream starts gets the same status as a plugin call"""
+    class FailingPool:
+        workers = 2
+
+        async def run(self, fn, args, timeout=None):
+            raise error
+
+    monkeypatch.setattr(plugin, "plugin_pool", FailingPool())
+    monkeypatch.setattr(plugin, "plugin_cache", TieredCache("plugin", max_entries=10))
+    monkeypatch.setattr(config, "CACHE_BACKEND", "none")
+    monkeypatch.setattr(config, "PLUGIN_FILE_DIRS", str(recording.parent))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/api/plugin/audio_analysis/stream", json={"file_path": str(recording)})
+    assert response.status_code == status
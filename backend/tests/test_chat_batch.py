@@ -0,0 +1,105 @@
+import asyncio
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app.api import chat
+from app.config import config
+from app.main import app
+from app.models.router import ModelRouter
+from app.utils.singleflight import SingleFlight
+
+
+class DelayProvider:
+    """A provider that sleeps for the number of ms given as the prompt"""
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    async def generate(self, messages, model, max_tokens, temperature, stream=False, **kwargs):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(int(messages[-1]["content"]) / 1000)
+        finally:
+            self.active -= 1
+        return f"slept {messages[-1]['content']}"
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    provider = DelayProvider()
+    monkeypatch.setattr(chat, "PROVIDERS", {"openai": provider})
+    monkeypatch.setattr(chat, "model_router", ModelRouter({"openai": provider}))
+    monkeypatch.setattr(chat, "chat_flights", SingleFlight())
+    return provider
+
+
+def run_batch(items, **params):
+    body = "".join(json.dumps(item) + "\n" for item in items)
+    response = TestClient(app).post("/api/chat/batch", content=body, params=params)
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def prompt(content):
+    return {"messages": [{"role": "user", "content": content}], "temperature": 0.5}
+
+
+def test_results_stream_in_completion_order(provider):
+    """Test results carry their index and arrive as items finish"""
+    lines = run_batch([prompt("150"), prompt("10"), prompt("80")], parallelism=3)
+    results, summary = lines[:-1], lines[-1]["summary"]
+    assert [r["index"] for r in results] == [1, 2, 0]
+    assert results[0]["response"]["content"] == "slept 10"
+    assert summary["succeeded"] == 3 and summary["failed"] == 0
+    assert summary["completion_tokens"] > 0
+    assert summary["latency_ms"]["p50"] is not None
+
+
+def test_parallelism_is_capped(provider, monkeypatch):
+    """Test no more than the requested number of items run at once"""
+    monkeypatch.setattr(config, "BATCH_MAX_PARALLEL", 4)
+    run_batch([prompt(str(20 + i)) for i in range(8)], parallelism=2)
+    assert provider.peak == 2
+    provider.peak = 0
+    run_batch([prompt(str(20 + i)) for i in range(8)], parallelism=100)
+    assert provider.peak == 4
+
+
+def test_partial_failures_are_reported(provider):
+    """Test invalid and timed-out items fail without affecting the others"""
+    lines = run_batch(
+        [prompt("10"), {"messages": "nope"}, prompt("500"), {**prompt("10"), "provider": "nobody"}],
+        timeout=0.2,
+    )
+    by_index = {line["index"]: line for line in lines[:-1]}
+    assert by_index[0]["response"]["content"] == "slept 10"
+    assert by_index[1]["status"] == 422
+    assert by_index[2]["status"] == 504
+    assert by_index[3]["status"] == 400
+    summary = lines[-1]["summary"]
+    assert (summary["total"], summary["succeeded"], summary["failed"], summary["timed_out"]) == (4, 1, 3, 1)
+
+
+def test_malformed_body_stops_reading(provider):
+    """Test a syntax error is reported and the items read before it still run"""
+    response = TestClient(app).post("/api/chat/batch", content=json.dumps(prompt("1")) + "\n{oops")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    by_index = {line["index"]: line for line in lines[:-1]}
+    assert "response" in by_index[0]
+    assert by_index[1]["status"] == 400
+    assert lines[-1]["summary"]["total"] == 2
+
+
+@pytest.mark.asyncio
+async def test_body_read_errors_end_the_stream(provider):
+    """Test a failure reading the body is reported instead of hanging the stream"""
+    async def records():
+        yield prompt("1")
+        raise RuntimeError("client disconnected")
+
+    lines = [json.loads(line) async for line in chat._run_batch(records(), parallelism=2, timeout=5)]
+    by_index = {line["index"]: line for line in lines[:-1]}
+    assert "response" in by_index[0]
+    assert by_index[1]["status"] == 500 and "client disconnected" in by_index[1]["error"]
+    assert lines[-1]["summary"]["total"] == 2
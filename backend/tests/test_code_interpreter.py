@@ -0,0 +1,195 @@
+import asyncio
+import json
+import httpx
+import pytest
+from app.api import plugin
+from app.config import config
+from app.main import app
+from app.plugins import code_interpreter
+from app.plugins.code_interpreter import SandboxError, SandboxPool, interpret_code
+
+
+@pytest.fixture(autouse=True)
+def allow_unisolated(monkeypatch):
+    """Lets the tests run where unprivileged user namespaces are disabled"""
+    monkeypatch.setattr(config, "SANDBOX_REQUIRE_ISOLATION", False)
+
+
+@pytest.fixture
+def pool():
+    return SandboxPool(size=2, max_runs=50, timeout=5, memory_limit_mb=512, max_output=4096)
+
+
+async def collect(pool, code, stdin="", timeout=None):
+    events = [event async for event in pool.run(code, stdin, timeout)]
+    output = "".join(e["data"] for e in events if e["type"] == "stdout")
+    return output, events[-1]
+
+
+@pytest.mark.asyncio
+async def test_streams_output_and_reads_stdin(pool):
+    """Test output arrives as events before the result and stdin is passed in"""
+    try:
+        await pool.start()
+        events = [e async for e in pool.run("import sys\nprint(input().upper())\nprint('oops', file=sys.stderr)", "hi")]
+        assert [e["type"] for e in events] == ["stdout", "stdout", "stderr", "stderr", "result"]
+        assert events[0]["data"] == "HI" and events[2]["data"] == "oops"
+        assert events[-1]["ok"] and events[-1]["overhead_ms"] >= 0
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_errors_and_state_do_not_leak_between_runs(pool):
+    """Test a failing snippet reports its traceback and the next run starts clean"""
+    try:
+        _, result = await collect(pool, "x = 1\nopen('scratch', 'w').write('x')\n1 / 0")
+        assert not result["ok"] and "ZeroDivisionError" in result["error"]
+        output, result = await collect(pool, "import os\nprint('x' in globals(), os.listdir('.'))")
+        assert result["ok"] and output == "False []\n"
+        assert pool.stats()["recycled"]["contaminated"] == 0
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_sandboxes_cannot_reach_the_api_files(pool):
+    """Test snippets see neither the API's files nor a writable system directory"""
+    try:
+        await pool.start()
+        if pool.stats()["unisolated"]:
+            pytest.skip(f"Isolation unavailable: {pool.stats()['isolation_error']}")
+        code = f"import os\nprint(os.path.exists({__file__!r}), os.getcwd())\nopen('/usr/x', 'w')"
+        output, result = await collect(pool, code)
+        assert output == "False /work\n"
+        assert not result["ok"] and "Read-only file system" in result["error"]
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_sandboxes_that_cannot_be_isolated(monkeypatch, pool):
+    """Test a sandbox whose isolation fails is refused, or counted if isolation is optional"""
+    monkeypatch.setattr(code_interpreter, "_readonly_paths", lambda: ["/nonexistent"])
+    try:
+        output, result = await collect(pool, "print('ran')")
+        assert result["ok"] and output == "ran\n"
+        assert pool.stats()["unisolated"] == 1 and pool.stats()["isolation_error"]
+        monkeypatch.setattr(config, "SANDBOX_REQUIRE_ISOLATION", True)
+        with pytest.raises(SandboxError, match="isolation failed"):
+            await collect(SandboxPool(size=1, max_runs=1, timeout=5, memory_limit_mb=512, max_output=4096), "pass")
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_isolation_is_reported_unavailable_off_linux(monkeypatch, pool):
+    """Test a local sandbox off Linux reports missing isolation instead of none"""
+    with monkeypatch.context() as m:
+        m.setattr(code_interpreter.sys, "platform", "darwin")
+        settings = code_interpreter._local_settings(512, 5, "/unused")
+    monkeypatch.setattr(code_interpreter, "_local_settings", lambda *args: settings)
+    try:
+        output, result = await collect(pool, "print('ran')")
+        assert result["ok"] and output == "ran\n"
+        assert pool.stats()["isolation_error"] == "namespaces: unavailable on darwin"
+        monkeypatch.setattr(config, "SANDBOX_REQUIRE_ISOLATION", True)
+        with pytest.raises(SandboxError, match="unavailable on darwin"):
+            await collect(SandboxPool(size=1, max_runs=1, timeout=5, memory_limit_mb=512, max_output=4096), "pass")
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_start_wakes_a_waiting_run(monkeypatch):
+    """Test a run whose sandbox fails to start hands its slot to a waiting run"""
+    pool = SandboxPool(size=1, max_runs=5, timeout=5, memory_limit_mb=512, max_output=4096)
+    spawn, started = pool._spawn, asyncio.Event()
+
+    async def fail_first_spawn():
+        if not started.is_set():
+            started.set()
+            await asyncio.sleep(0.05)
+            raise SandboxError("Sandbox failed to start")
+        return await spawn()
+
+    monkeypatch.setattr(pool, "_spawn", fail_first_spawn)
+    try:
+        first = asyncio.ensure_future(collect(pool, "print(1)"))
+        await started.wait()
+        second = asyncio.ensure_future(collect(pool, "print(2)"))
+        with pytest.raises(SandboxError):
+            await first
+        output, result = await asyncio.wait_for(second, 10)
+        assert result["ok"] and output == "2\n"
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_contaminated_and_spent_sandboxes_are_replaced():
+    """Test sandboxes are recycled after changing interpreter state or hitting max runs"""
+    pool = SandboxPool(size=1, max_runs=3, timeout=5, memory_limit_mb=512, max_output=4096)
+    try:
+        pid, _ = await collect(pool, "import os; print(os.getpid())")
+        await collect(pool, "import sys; sys.path.append('/tmp')")
+        output, result = await collect(pool, "import os, sys; print(os.getpid(), '/tmp' in sys.path)")
+        assert result["ok"] and output.split()[0] != pid.strip() and output.split()[1] == "False"
+        for _ in range(3):
+            await collect(pool, "pass")
+        stats = pool.stats()
+        assert stats["recycled"]["contaminated"] == 1 and stats["recycled"]["max_runs"] == 1
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_timeouts_and_output_limits_recycle_the_sandbox(pool):
+    """Test runaway snippets are killed and the pool stays usable"""
+    try:
+        _, result = await collect(pool, "while True: pass", timeout=0.3)
+        assert not result["ok"] and "Timed out" in result["error"]
+        _, result = await collect(pool, "while True: print('x' * 1000)")
+        assert not result["ok"] and "output" in result["error"].lower()
+        output, result = await collect(pool, "print('still here')")
+        assert result["ok"] and output == "still here\n"
+        recycled = pool.stats()["recycled"]
+        assert recycled["timeout"] == 1 and recycled["error"] == 1
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_warm_runs_have_low_overhead(pool):
+    """Test a warm run costs a pipe round trip, not an interpreter start"""
+    try:
+        await pool.start()
+        for _ in range(20):
+            await collect(pool, "pass")
+        assert pool.stats()["overhead_ms"]["p50"] < 50
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_code_interpreter_endpoints(monkeypatch, pool):
+    """Test the code interpreter runs as a plugin and streams over SSE"""
+    monkeypatch.setattr(code_interpreter, "sandbox_pool", pool)
+    monkeypatch.setattr(plugin, "sandbox_pool", pool)
+    try:
+        result = await interpret_code("print(sum(range(10)))")
+        assert result["ok"] and result["stdout"] == "45\n"
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.post("/api/plugin/", json={"plugin": "code_interpreter", "args": {"code": "print(6 * 7)"}})
+            assert response.status_code == 200 and response.json()["result"]["stdout"] == "42\n"
+            async with client.stream("POST", "/api/plugin/code_interpreter/stream", json={"code": "print('a')\nprint('b')"}) as response:
+                body = (await response.aread()).decode()
+            assert response.headers["content-type"].startswith("text/event-stream")
+            events = [e for e in body.split("\n\n") if e]
+            assert events[0] == 'event: stdout\ndata: {"type": "stdout", "data": "a"}'
+            assert events[-2].startswith("event: result") and events[-1] == "data: [DONE]"
+            assert json.loads(events[-2].split("data: ", 1)[1])["ok"]
+            status = (await client.get("/api/plugin/")).json()
+            assert status["sandboxes"]["runs"] == 3
+    finally:
+        await pool.close()
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import httpx
+import pytest
+from app.config import config
+from app.models.openai import OpenAIProvider
+from app.utils.embedding_batcher import EmbeddingBatcher
+
+
+class FakeEmbeddings:
+    """Records upstream batches and fails on inputs containing 'bad'"""
+    def __init__(self):
+        self.calls = []
+
+    async def embed_batch(self, texts):
+        self.calls.append(list(texts))
+        await asyncio.sleep(0)
+        if any("bad" in t for t in texts):
+            raise ValueError("input rejected")
+        return [[float(len(t))] for t in texts]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_request():
+    """Test that concurrent callers are coalesced and deduplicated"""
+    upstream = FakeEmbeddings()
+    batcher = EmbeddingBatcher(upstream.embed_batch, max_wait=0.01)
+
+    results = await asyncio.gather(*(batcher.embed(t) for t in ["a", "bb", "a", "ccc"]))
+
+    assert results == [[1.0], [2.0], [1.0], [3.0]]
+    assert upstream.calls == [["a", "bb", "ccc"]]
+    assert batcher.stats()["callers"] == 4
+
+
+@pytest.mark.asyncio
+async def test_batch_size_limit_splits_requests():
+    """Test that max_batch caps inputs per upstream request"""
+    upstream = FakeEmbeddings()
+    batcher = EmbeddingBatcher(upstream.embed_batch, max_batch=2, max_wait=0.01)
+
+    await asyncio.gather(*(batcher.embed(t) for t in ["a", "b", "c"]))
+
+    assert upstream.calls == [["a", "b"], ["c"]]
+
+
+@pytest.mark.asyncio
+async def test_errors_are_isolated_per_caller():
+    """Test that one bad input does not fail the rest of its batch"""
+    upstream = FakeEmbeddings()
+    batcher = EmbeddingBatcher(upstream.embed_batch, max_wait=0.01)
+
+    results = await asyncio.gather(
+        batcher.embed("good"), batcher.embed("bad"), return_exceptions=True
+    )
+
+    assert results[0] == [4.0]
+    assert isinstance(results[1], ValueError)
+    assert batcher.stats()["isolated_retries"] == 2
+
+
+@pytest.mark.asyncio
+async def test_overload_errors_fail_the_batch_without_retries():
+    """Test that rate limits fail every caller instead of fanning out single requests"""
+    class RateLimited(Exception):
+        status_code = 429
+
+    calls = []
+
+    async def embed_batch(texts):
+        calls.append(list(texts))
+        raise RateLimited("slow down")
+
+    batcher = EmbeddingBatcher(embed_batch, max_wait=0.01)
+    results = await asyncio.gather(batcher.embed("a"), batcher.embed("b"), return_exceptions=True)
+
+    assert all(isinstance(r, RateLimited) for r in results)
+    assert calls == [["a", "b"]]
+    assert batcher.stats()["isolated_retries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_openai_bad_input_is_isolated(monkeypatch):
+    """Test a 400 from the OpenAI API splits the batch so other callers still get vectors"""
+    monkeypatch.setattr(config, "OPENAI_API_KEY", "test")
+    monkeypatch.setattr(config, "CACHE_BACKEND", "none")
+    requests = []
+
+    def handler(request):
+        texts = json.loads(request.content)["input"]
+        requests.append(texts)
+        if "bad" in texts:
+            return httpx.Response(400, json={"error": {"message": "invalid input", "type": "invalid_request_error"}})
+        data = [{"object": "embedding", "index": i, "embedding": [float(len(t))]} for i, t in enumerate(texts)]
+        return httpx.Response(200, json={"object": "list", "data": data, "model": "m", "usage": {"prompt_tokens": 1, "total_tokens": 1}})
+
+    provider = OpenAIProvider(http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    results = await asyncio.gather(
+        provider.get_embedding("good", "m"), provider.get_embedding("bad", "m"), return_exceptions=True
+    )
+
+    assert results[0] == [4.0]
+    assert getattr(results[1], "status_code", None) == 400
+    assert requests[0] == ["good", "bad"] and sorted(requests[1:]) == [["bad"], ["good"]]
@@ -0,0 +1,68 @@
+import asyncio
+import os
+import pytest
+from app.config import config
+from app.utils.cache import FileStore, LRUCache, TieredCache
+from app.utils.embedding_cache import (
+    EmbeddingCache,
+    embedding_key,
+    pack_vector,
+    unpack_vector,
+)
+
+
+def test_lru_evicts_least_recently_used():
+    """Test bounded LRU eviction order"""
+    cache = LRUCache(max_entries=2)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+    assert cache.get("a") == b"1"
+    cache.set("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+    assert len(cache) == 2
+
+
+def test_vector_packing_is_float32():
+    """Test vectors round-trip through compact float32 bytes"""
+    vector = [0.5, -1.25, 3.0]
+    data = pack_vector(vector)
+    assert len(data) == 4 * len(vector)
+    assert unpack_vector(data) == vector
+
+
+def test_embedding_key_normalizes_text():
+    """Test that whitespace-only differences share a cache key"""
+    assert embedding_key("m", "dark  theme\n") == embedding_key("m", "dark theme")
+    assert embedding_key("m", "dark theme") != embedding_key("other", "dark theme")
+
+
+@pytest.mark.asyncio
+async def test_tiered_cache_uses_file_tier(tmp_path, monkeypatch):
+    """Test local and persistent tier hits with the file fallback"""
+    monkeypatch.setattr(config, "CACHE_BACKEND", "file")
+    monkeypatch.setattr(config, "CACHE_DIR", str(tmp_path))
+    cache = EmbeddingCache(TieredCache("emb-test", max_entries=10))
+
+    assert await cache.get("m", "hello") is None
+    await cache.set("m", "hello", [1.0, 2.0])
+    assert await cache.get("m", "hello") == [1.0, 2.0]
+
+    # A fresh process only has the persistent tier
+    fresh = EmbeddingCache(TieredCache("emb-test", max_entries=10))
+    assert await fresh.get("m", "hello") == [1.0, 2.0]
+    assert await fresh.get("m", "hello") == [1.0, 2.0]
+
+    assert cache.stats()["hits"] == {"local": 1, "persistent": 0}
+    assert cache.stats()["misses"] == 1
+    assert fresh.stats()["hits"] == {"local": 1, "persistent": 1}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_file_writes_of_one_key(tmp_path):
+    """Test concurrent writes of the same key each use their own temporary file"""
+    store = FileStore(str(tmp_path))
+    values = [bytes([i]) * 100_000 for i in range(8)]
+    await asyncio.gather(*(store.set("k", value) for value in values))
+    assert await store.get("k") in values
+    assert not [name for _, _, files in os.walk(tmp_path) for name in files if name.endswith(".tmp")]
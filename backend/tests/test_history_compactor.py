@@ -0,0 +1,117 @@
+import pytest
+from app.config import config
+from app.utils.cache import TieredCache
+from app.utils.history_compactor import SUMMARY_PREFIX, HistoryCompactor, prefix_hashes
+
+
+class FakeSummarizer:
+    """Records calls and summarizes by joining message contents"""
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    async def __call__(self, previous, messages):
+        if self.fail:
+            raise RuntimeError("summary model down")
+        self.calls.append((previous, [m["content"] for m in messages]))
+        return "|".join(filter(None, [previous] + [m["content"] for m in messages]))
+
+
+def conversation(n):
+    return [{"role": "system", "content": "sys"}] + [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"m{i}"} for i in range(n)
+    ]
+
+
+def make_compactor(summarize, **overrides):
+    options = dict(seed="test", enabled=True, token_budget=0, keep_messages=2, step=2)
+    options.update(overrides)
+    return HistoryCompactor(summarize, TieredCache("hist-test", max_entries=100), **options)
+
+
+def test_prefix_hashes_chain():
+    """Test prefix hashes depend on every earlier message"""
+    a = prefix_hashes("s", conversation(3))
+    b = prefix_hashes("s", conversation(4))
+    assert a == b[:len(a)]
+    assert prefix_hashes("other", conversation(3))[1] != a[1]
+
+
+@pytest.mark.asyncio
+async def test_keeps_system_and_recent_turns(monkeypatch):
+    """Test older turns are replaced by a summary after the system prompt"""
+    monkeypatch.setattr(config, "CACHE_BACKEND", "none")
+    summarize = FakeSummarizer()
+    compactor = make_compactor(summarize)
+    messages, summarized = await compactor.compact("gpt-4", conversation(7))
+    assert summarized == 4
+    assert messages[0] == {"role": "system", "content": "sys"}
+    assert messages[1] == {"role": "system", "content": SUMMARY_PREFIX + "m0|m1|m2|m3"}
+    assert [m["content"] for m in messages[2:]] == ["m4", "m5", "m6"]
+
+
+@pytest.mark.asyncio
+async def test_summaries_are_rolling_and_cached(monkeypatch):
+    """Test each prefix is summarized once and extended incrementally"""
+    monkeypatch.setattr(config, "CACHE_BACKEND", "none")
+    summarize = FakeSummarizer()
+    compactor = make_compactor(summarize)
+    await compactor.compact("gpt-4", conversation(6))
+    await compactor.compact("gpt-4", conversation(7))
+    assert len(summarize.calls) == 1
+
+    await compactor.compact("gpt-4", conversation(8))
+    assert summarize.calls[-1] == ("m0|m1|m2|m3", ["m4", "m5"])
+    assert compactor.stats()["summaries"] == 2
+
+
+@pytest.mark.asyncio
+async def test_uncached_history_is_summarized_in_one_call(monkeypatch):
+    """Test a long conversation with no cached summary costs one summarizer call"""
+    monkeypatch.setattr(config, "CACHE_BACKEND", "none")
+    summarize = FakeSummarizer()
+    messages, summarized = await make_compactor(summarize).compact("gpt-4", conversation(40))
+    assert summarized == 38
+    assert summarize.calls == [(None, [f"m{i}" for i in range(38)])]
+
+
+@pytest.mark.asyncio
+async def test_under_budget_or_failing_summary_is_unchanged(monkeypatch):
+    """Test short conversations and summarizer failures pass through"""
+    monkeypatch.setattr(config, "CACHE_BACKEND", "none")
+    messages = conversation(8)
+    assert await make_compactor(FakeSummarizer(), token_budget=10000).compact("gpt-4", messages) == (messages, 0)
+
+    failing = make_compactor(FakeSummarizer(fail=True))
+    assert await failing.compact("gpt-4", messages) == (messages, 0)
+    assert failing.stats()["failures"] == 1
+
+
+@pytest.mark.asyncio
+async def test_kept_turns_start_with_a_user_turn(monkeypatch):
+    """Test the split moves to the next user turn and later requests reuse its summary"""
+    monkeypatch.setattr(config, "CACHE_BACKEND", "none")
+    summarize = FakeSummarizer()
+    compactor = make_compactor(summarize, step=3)
+    messages, summarized = await compactor.compact("gpt-4", conversation(7))
+    assert summarized == 4
+    assert messages[1] == {"role": "system", "content": SUMMARY_PREFIX + "m0|m1|m2|m3"}
+    assert messages[2]["role"] == "user"
+
+    await compactor.compact("gpt-4", conversation(8))
+    assert summarize.calls[-1] == ("m0|m1|m2|m3", ["m4", "m5"])
+
+
+@pytest.mark.asyncio
+async def test_system_messages_keep_their_places(monkeypatch):
+    """Test system messages are neither summarized nor moved"""
+    monkeypatch.setattr(config, "CACHE_BACKEND", "none")
+    summarize = FakeSummarizer()
+    history = conversation(7)
+    history.insert(3, {"role": "system", "content": "mid"})
+    history.insert(7, {"role": "system", "content": "late"})
+    messages, summarized = await make_compactor(summarize).compact("gpt-4", history)
+    assert summarized == 4
+    assert [m["content"] for m in messages] == [
+        "sys", SUMMARY_PREFIX + "m0|m1|m2|m3", "mid", "m4", "late", "m5", "m6"
+    ]
@@ -0,0 +1,169 @@
+import struct
+import tracemalloc
+import zlib
+import numpy as np
+import pytest
+from app.api import plugin
+from app.config import config
+from app.plugins import image_analysis
+from app.plugins.image_analysis import analyze_image, hash_distance, probe_image
+
+
+def paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    return a if pa <= pb and pa <= pc else b if pb <= pc else c
+
+
+def write_png(path, pixels, filters=(0,)):
+    """Writes an 8-bit RGB or RGBA PNG, cycling through the given row filters."""
+    height, width, channels = pixels.shape
+    raw, prior = bytearray(), bytes(width * channels)
+    for y in range(height):
+        row, kind = pixels[y].astype(np.uint8).tobytes(), filters[y % len(filters)]
+        out = bytearray()
+        for i, x in enumerate(row):
+            a = row[i - channels] if i >= channels else 0
+            c = prior[i - channels] if i >= channels else 0
+            predictor = [0, a, prior[i], (a + prior[i]) // 2, paeth(a, prior[i], c)][kind]
+            out.append((x - predictor) & 0xFF)
+        raw += bytes([kind]) + out
+        prior = row
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    color = {3: 2, 4: 6}[channels]
+    header = struct.pack(">IIBBBBB", width, height, 8, color, 0, 0, 0)
+    compressed = zlib.compress(bytes(raw))
+    # Split the image data across several IDAT chunks like real encoders do
+    idats = b"".join(chunk(b"IDAT", compressed[i:i + 1000]) for i in range(0, len(compressed), 1000))
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + idats + chunk(b"IEND", b""))
+
+
+def scene(width, height):
+    """A gradient with a dark rectangle, so it has structure to hash."""
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([x * 255 // width, y * 255 // height, np.full_like(x, 128)], axis=-1)
+    pixels[height // 4:height // 2, width // 2:width * 3 // 4] = 10
+    return pixels
+
+
+def test_probe_reads_only_the_header(tmp_path):
+    """Test format and size come from the header, even for truncated files"""
+    png = tmp_path / "big.png"
+    png.write_bytes(b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">II", 40000, 30000))
+    assert probe_image(str(png)) == {"format": "png", "width": 40000, "height": 30000}
+    jpeg = tmp_path / "a.jpg"
+    app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\0" + bytes(9)
+    jpeg.write_bytes(b"\xff\xd8" + app0 + b"\xff\xc0" + struct.pack(">HBHH", 17, 8, 480, 640))
+    assert probe_image(str(jpeg)) == {"format": "jpeg", "width": 640, "height": 480}
+    gif = tmp_path / "a.gif"
+    gif.write_bytes(b"GIF89a" + struct.pack("<HH", 320, 200) + bytes(20))
+    assert probe_image(str(gif))["width"] == 320
+    webp = tmp_path / "a.webp"
+    webp.write_bytes(b"RIFF\0\0\0\0WEBPVP8X" + bytes(8) + (799).to_bytes(3, "little") + (599).to_bytes(3, "little"))
+    assert probe_image(str(webp)) == {"format": "webp", "width": 800, "height": 600}
+    (tmp_path / "a.txt").write_bytes(b"hello")
+    with pytest.raises(ValueError):
+        probe_image(str(tmp_path / "a.txt"))
+
+
+def test_oversized_images_are_rejected_before_decoding(tmp_path, monkeypatch):
+    """Test the pixel limit is enforced from the header alone"""
+    monkeypatch.setattr(config, "IMAGE_MAX_PIXELS", 1000)
+    path = tmp_path / "big.png"
+    write_png(path, scene(50, 50))
+    with pytest.raises(ValueError, match="over the limit"):
+        analyze_image(str(path))
+
+
+@pytest.mark.parametrize("filters", [(0,), (1, 2), (3, 4)])
+def test_png_is_decoded_once_at_analysis_size(tmp_path, filters):
+    """Test every PNG row filter decodes correctly while downscaling"""
+    pixels = np.zeros((60, 90, 3), dtype=np.uint8)
+    pixels[:, :45] = (255, 0, 0)
+    pixels[:, 45:] = (0, 0, 255)
+    path = tmp_path / "split.png"
+    write_png(path, pixels, filters)
+    result = analyze_image(str(path), size=30)
+    assert (result["format"], result["width"], result["height"]) == ("png", 90, 60)
+    assert result["analysis_size"] == [30, 20] and result["decoder"] == "numpy"
+    assert result["mean_color"] == [127.5, 0.0, 127.5]
+    assert {c["color"] for c in result["dominant_colors"]} == {"#ff0000", "#0000ff"}
+    assert sum(result["histogram"]["r"]) == pytest.approx(1, abs=1e-3)
+
+
+@pytest.mark.parametrize("filters", [(3,), (4,), (0, 1, 2, 3, 4), (4, 4, 4, 1)])
+def test_png_filter_blocks_decode_exactly(tmp_path, monkeypatch, filters):
+    """Test Average and Paeth rows swept in blocks match the image, across block boundaries"""
+    monkeypatch.setattr(image_analysis, "_UNFILTER_BLOCK", 25 * (3 * 33 + 1))
+    pixels = np.random.default_rng(0).integers(0, 256, (70, 33, 3), dtype=np.uint8)
+    path = tmp_path / "noise.png"
+    write_png(path, pixels, filters)
+    decoded, mode = image_analysis._decode_png(str(path), 1)
+    assert mode == "RGB" and np.array_equal(decoded, pixels)
+
+
+def test_tall_narrow_paeth_png_is_swept_in_tiles(tmp_path):
+    """Test a tall, narrow Paeth PNG decodes exactly without a height-squared sweep"""
+    pixels = np.random.default_rng(1).integers(0, 256, (2000, 4, 3), dtype=np.uint8)
+    path = tmp_path / "tall.png"
+    write_png(path, pixels, (4,))
+    tracemalloc.start()
+    try:
+        decoded, _ = image_analysis._decode_png(str(path), 1)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert np.array_equal(decoded, pixels)
+    assert peak < 4 << 20
+
+
+def test_alpha_is_composited_on_white(tmp_path):
+    """Test transparent pixels count as white"""
+    pixels = np.zeros((8, 8, 4), dtype=np.uint8)
+    path = tmp_path / "clear.png"
+    write_png(path, pixels)
+    result = analyze_image(str(path))
+    assert result["mode"] == "RGBA" and result["mean_color"] == [255.0, 255.0, 255.0]
+
+
+def test_bmp_and_perceptual_hash(tmp_path):
+    """Test BMPs decode through a memory map and rescaled copies hash alike"""
+    big = scene(320, 240).astype(np.uint8)
+    stride = (320 * 3 + 3) & ~3
+    rows = b"".join(row[:, ::-1].tobytes().ljust(stride, b"\0") for row in big[::-1])
+    header = b"BM" + struct.pack("<IHHI", 54 + len(rows), 0, 0, 54)
+    info = struct.pack("<IiiHHIIiiII", 40, 320, 240, 1, 24, 0, len(rows), 0, 0, 0, 0)
+    (tmp_path / "big.bmp").write_bytes(header + info + rows)
+    write_png(tmp_path / "small.png", scene(160, 120))
+    write_png(tmp_path / "other.png", scene(160, 120)[::-1, ::-1])
+    bmp = analyze_image(str(tmp_path / "big.bmp"))
+    small = analyze_image(str(tmp_path / "small.png"))
+    other = analyze_image(str(tmp_path / "other.png"))
+    assert bmp["format"] == "bmp" and bmp["analysis_size"] == [160, 120]
+    assert hash_distance(bmp["phash"], small["phash"]) <= 4
+    assert hash_distance(bmp["phash"], other["phash"]) > 16
+
+
+@pytest.mark.asyncio
+async def test_results_are_cached_by_content(tmp_path, monkeypatch):
+    """Test the same image under another name is served from the cache"""
+    class InlinePool:
+        calls = 0
+
+        async def run(self, fn, args, timeout=None):
+            InlinePool.calls += 1
+            return fn(**args)
+
+    monkeypatch.setattr(config, "CACHE_BACKEND", "none")
+    monkeypatch.setattr(plugin, "plugin_pool", InlinePool())
+    write_png(tmp_path / "a.png", scene(40, 30))
+    (tmp_path / "b.png").write_bytes((tmp_path / "a.png").read_bytes())
+    first = await plugin.run_plugin("image_analysis", {"file_path": str(tmp_path / "a.png")})
+    second = await plugin.run_plugin("image_analysis", {"file_path": str(tmp_path / "b.png")})
+    resized = await plugin.run_plugin("image_analysis", {"file_path": str(tmp_path / "b.png"), "size": 8})
+    assert first == second and resized["analysis_size"] == [8, 6]
+    assert InlinePool.calls == 2
@@ -0,0 +1,182 @@
+import asyncio
+import httpx
+import pytest
+from app.api import jobs
+from app.main import app
+from app.utils.job_queue import FAILED, QUEUED, RUNNING, SUCCEEDED, SQLiteJobQueue
+from app.utils.job_workers import JobWorkerPool, PermanentJobError
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteJobQueue(str(tmp_path / "jobs.db"), result_ttl=3600)
+
+
+def make_pool(queue, handlers, **kwargs):
+    async def open_queue():
+        return queue
+    options = {"concurrency": 2, "visibility_timeout": 5, "poll_interval": 0.01, "retry_backoff": 0}
+    options.update(kwargs)
+    return JobWorkerPool(handlers, open_queue=open_queue, **options)
+
+
+async def wait_finished(pool, job_id, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        job = await pool.get(job_id)
+        if job.finished:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+@pytest.mark.asyncio
+async def test_claim_is_exclusive_and_fenced(queue):
+    """Test a claimed job is leased to one worker and stale writes are discarded"""
+    job = await queue.enqueue("chat", {"n": 1}, max_attempts=3)
+    assert job.status == QUEUED
+    first = await queue.claim("a", visibility_timeout=60)
+    assert first.id == job.id and first.status == RUNNING and first.attempts == 1
+    assert await queue.claim("b", visibility_timeout=60) is None
+    # Expire the lease so another worker takes the job over
+    assert await queue.heartbeat(first, -1)
+    second = await queue.claim("b", visibility_timeout=60)
+    assert second.attempts == 2
+    assert not await queue.complete(first, "stale")
+    assert await queue.complete(second, "fresh")
+    stored = await queue.get(job.id)
+    assert (stored.status, stored.result) == (SUCCEEDED, "fresh")
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_attempts_are_retried(queue):
+    """Test a handler that fails transiently succeeds on a later attempt"""
+    calls = []
+
+    async def flaky(payload, report):
+        calls.append(payload)
+        await report({"attempt": len(calls)})
+        if len(calls) < 3:
+            raise RuntimeError("upstream timeout")
+        return {"echo": payload["x"]}
+
+    pool = make_pool(queue, {"flaky": flaky})
+    await pool.start()
+    try:
+        job = await pool.submit("flaky", {"x": 7}, max_attempts=3)
+        job = await wait_finished(pool, job.id)
+    finally:
+        await pool.stop()
+    assert job.status == SUCCEEDED and job.result == {"echo": 7}
+    assert job.attempts == 3 and job.progress == {"attempt": 3}
+    assert (pool.retried, pool.succeeded) == (2, 1)
+
+
+@pytest.mark.asyncio
+async def test_permanent_errors_and_exhausted_attempts_fail(queue):
+    """Test a permanent error fails at once and retries stop at max_attempts"""
+    async def invalid(payload, report):
+        raise PermanentJobError("bad input")
+
+    async def broken(payload, report):
+        raise RuntimeError("still down")
+
+    pool = make_pool(queue, {"invalid": invalid, "broken": broken})
+    await pool.start()
+    try:
+        first = await pool.submit("invalid", {}, max_attempts=5)
+        second = await pool.submit("broken", {}, max_attempts=2)
+        first = await wait_finished(pool, first.id)
+        second = await wait_finished(pool, second.id)
+    finally:
+        await pool.stop()
+    assert (first.status, first.attempts, first.error) == (FAILED, 1, "bad input")
+    assert (second.status, second.attempts, second.error) == (FAILED, 2, "still down")
+    with pytest.raises(ValueError):
+        await make_pool(queue, {}).submit("missing", {})
+
+
+@pytest.mark.asyncio
+async def test_stopped_worker_requeues_its_job(tmp_path):
+    """Test a job interrupted by shutdown is picked up again after a restart"""
+    path = str(tmp_path / "jobs.db")
+    started = asyncio.Event()
+
+    async def slow(payload, report):
+        started.set()
+        await asyncio.sleep(60)
+
+    pool = make_pool(SQLiteJobQueue(path), {"work": slow})
+    await pool.start()
+    job = await pool.submit("work", {})
+    await asyncio.wait_for(started.wait(), 5)
+    await pool.stop()
+
+    async def fast(payload, report):
+        return "done"
+
+    pool = make_pool(SQLiteJobQueue(path), {"work": fast})
+    await pool.start()
+    try:
+        job = await wait_finished(pool, job.id)
+    finally:
+        await pool.stop()
+    assert (job.status, job.result, job.attempts) == (SUCCEEDED, "done", 2)
+
+
+@pytest.mark.asyncio
+async def test_store_errors_do_not_kill_workers(queue, monkeypatch):
+    """Test a worker survives a store error while recording an outcome"""
+    complete, retry = queue.complete, queue.retry
+    blips = []
+
+    async def flaky(original, *args):
+        if len(blips) < 2:
+            blips.append(original.__name__)
+            raise RuntimeError("database is locked")
+        return await original(*args)
+
+    monkeypatch.setattr(queue, "complete", lambda *args: flaky(complete, *args))
+    monkeypatch.setattr(queue, "retry", lambda *args: flaky(retry, *args))
+
+    async def work(payload, report):
+        return "done"
+
+    pool = make_pool(queue, {"work": work}, concurrency=1, visibility_timeout=0.2)
+    await pool.start()
+    try:
+        job = await pool.submit("work", {}, max_attempts=3)
+        job = await wait_finished(pool, job.id)
+    finally:
+        await pool.stop()
+    assert blips == ["complete", "retry"]
+    assert (job.status, job.result, job.attempts) == (SUCCEEDED, "done", 2)
+
+@pytest.mark.asyncio
+async def test_jobs_api_submit_poll_and_events(queue, monkeypatch):
+    """Test jobs are accepted with 202 and their result can be polled and streamed"""
+    async def echo(payload, report):
+        await report({"stage": "echoing"})
+        return payload
+
+    pool = make_pool(queue, {"echo": echo})
+    monkeypatch.setattr(jobs, "job_workers", pool)
+    await pool.start()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/api/jobs/", json={"kind": "echo", "payload": {"a": 1}})
+            assert response.status_code == 202
+            assert response.headers["location"] == f"/api/jobs/{response.json()['id']}"
+            job_id = response.json()["id"]
+            await wait_finished(pool, job_id)
+            job = (await client.get(f"/api/jobs/{job_id}")).json()
+            assert job["status"] == SUCCEEDED and job["result"] == {"a": 1}
+            events = (await client.get(f"/api/jobs/{job_id}/events")).text
+            assert "event: job" in events and events.rstrip().endswith("data: [DONE]")
+            assert (await client.post("/api/jobs/", json={"kind": "nope"})).status_code == 400
+            assert (await client.get("/api/jobs/missing")).status_code == 404
+            stats = (await client.get("/api/jobs/stats")).json()
+            assert stats["succeeded"] == 1 and stats["queue"]["by_status"][SUCCEEDED] == 1
+    finally:
+        await pool.stop()
@@ -0,0 +1,153 @@
+import json
+import uuid
+from datetime import datetime, timedelta
+import httpx
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+from app.api import memory
+from app.config import config
+from app.db.config import Base, get_db
+from app.db.memory import MemoryEntry
+from app.db.vector_store import NumpyVectorStore
+from app.main import app
+
+
+class Provider:
+    """Embeds text as a fixed vector and rejects texts containing 'boom'"""
+    async def get_embedding(self, text):
+        if "boom" in text:
+            raise ValueError("embedding rejected")
+        return [1.0, float(len(text))]
+
+
+class FailingCommitSession(AsyncSession):
+    """A session whose commits always fail"""
+    async def commit(self):
+        raise RuntimeError("database is locked")
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A file-backed SQLite database served to the memory endpoints"""
+    path = tmp_path / "memory.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+    state = {"session_class": AsyncSession}
+
+    async def override_get_db():
+        async with async_sessionmaker(engine, class_=state["session_class"], expire_on_commit=False)() as session:
+            yield session
+
+    store = NumpyVectorStore(str(tmp_path / "vectors"))
+    monkeypatch.setattr(memory, "vector_store", store)
+    monkeypatch.setattr(memory.provider_registry, "require", lambda name: Provider())
+    monkeypatch.setattr(config, "CACHE_BACKEND", "none")
+    app.dependency_overrides[get_db] = override_get_db
+    yield engine, store, state
+    app.dependency_overrides.pop(get_db, None)
+
+
+async def count_rows(engine, user_id):
+    async with async_sessionmaker(engine)() as session:
+        return await session.scalar(select(func.count()).where(MemoryEntry.user_id == user_id))
+
+
+async def post_batch(body, user_id):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post(f"/api/memory/store/batch?user_id={user_id}", content=body)
+    return response.status_code, [json.loads(line) for line in response.text.splitlines()]
+
+
+@pytest.mark.asyncio
+async def test_batch_ingest_reports_each_record(database, monkeypatch):
+    """Test chunked inserts report invalid, failed and malformed records without losing the rest"""
+    engine, store, _ = database
+    monkeypatch.setattr(config, "MEMORY_INGEST_CHUNK_SIZE", 2)
+    body = b"\n".join([
+        b'{"content": "a"}',
+        b'{"content": "bb", "metadata": {"k": 1}}',
+        b'{"metadata": {}}',
+        b'{"content": "boom"}',
+        b'{"content": "ccc"}',
+        b'{"content": oops}',
+        b'{"content": "never"}',
+    ])
+    status, lines = await post_batch(body, "u1")
+
+    assert status == 200
+    results, summary = lines[:-1], lines[-1]["summary"]
+    assert [r["index"] for r in results] == [0, 1, 2, 3, 4, 5]
+    assert [("id" in r) for r in results] == [True, True, False, False, True, False]
+    assert results[2]["error"].startswith("Invalid memory") and results[3]["error"] == "embedding rejected"
+    assert (summary["stored"], summary["failed"]) == (3, 3)
+    assert await count_rows(engine, "u1") == 3
+    hits = await store.search(None, "u1", [1.0, 2.0], limit=10, threshold=-1.0)
+    assert sorted(memory_id for memory_id, _ in hits) == sorted(r["id"] for r in results if "id" in r)
+
+
+@pytest.mark.asyncio
+async def test_batch_ingest_removes_vectors_of_failed_commits(database):
+    """Test a chunk whose commit fails reports every record and leaves no vectors behind"""
+    engine, store, state = database
+    state["session_class"] = FailingCommitSession
+    status, lines = await post_batch(b'[{"content": "a"}, {"content": "b"}]', "u2")
+
+    assert status == 200
+    assert all(line["error"].startswith("Insert failed") for line in lines[:-1]) and len(lines) == 3
+    assert lines[-1]["summary"]["failed"] == 2
+    assert await count_rows(engine, "u2") == 0
+    assert await store.search(None, "u2", [1.0, 1.0], limit=10, threshold=-1.0) == []
+
+
+async def get_timeline(params):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await client.get("/api/memory/timeline", params=params)
+
+
+@pytest.mark.asyncio
+async def test_timeline_cursor_walks_rows_sharing_a_timestamp(database):
+    """Test following X-Next-Cursor visits every memory once, even with equal created_at"""
+    engine, _, _ = database
+    created_at = datetime(2024, 1, 1)
+    ids = [uuid.uuid4() for _ in range(5)]
+    async with async_sessionmaker(engine)() as session:
+        session.add_all(MemoryEntry(id=memory_id, user_id="u3", content=f"m{i}", created_at=created_at)
+                        for i, memory_id in enumerate(ids))
+        session.add(MemoryEntry(user_id="u3", content="newest", created_at=created_at + timedelta(days=1)))
+        await session.commit()
+
+    pages, cursor = [], None
+    while True:
+        params = {"user_id": "u3", "limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = await get_timeline(params)
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    seen = [entry["id"] for page in pages for entry in page]
+    assert [len(page) for page in pages] == [2, 2, 2]
+    assert pages[0][0]["content"] == "newest"
+    assert seen[1:] == [str(memory_id) for memory_id in sorted(ids, reverse=True)]
+
+
+@pytest.mark.asyncio
+async def test_timeline_without_content(database):
+    """Test include_content=false lists memories without their bodies"""
+    engine, _, _ = database
+    async with async_sessionmaker(engine)() as session:
+        session.add(MemoryEntry(user_id="u4", content="secret", entry_metadata='{"k": 1}'))
+        await session.commit()
+
+    response = await get_timeline({"user_id": "u4", "include_content": "false"})
+
+    assert response.status_code == 200
+    [entry] = response.json()
+    assert entry["content"] is None and entry["metadata"] == {"k": 1}
+    assert "X-Next-Cursor" not in response.headers
+    assert (await get_timeline({"user_id": "u4", "cursor": "not-a-cursor"})).status_code == 400
@@ -0,0 +1,42 @@
+import pytest
+from app.utils.ndjson import iter_json_records, ndjson_line
+
+
+async def collect(chunks, max_record_bytes=1 << 20):
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+    return [r async for r in iter_json_records(stream(), max_record_bytes)]
+
+
+@pytest.mark.asyncio
+async def test_parses_json_array_split_across_chunks():
+    """Test incremental parsing of a JSON array body"""
+    body = b'[{"content": "a"}, {"content": "b\\u00e9"}]'
+    chunks = [body[i:i + 5] for i in range(0, len(body), 5)]
+    assert await collect(chunks) == [{"content": "a"}, {"content": "bé"}]
+
+
+@pytest.mark.asyncio
+async def test_parses_ndjson_with_split_utf8():
+    """Test NDJSON bodies, including multi-byte characters split across chunks"""
+    body = '{"content": "café"}\n{"content": "b"}\n'.encode("utf-8")
+    split = body.index(b"\xa9")
+    assert await collect([body[:split], body[split:]]) == [
+        {"content": "café"},
+        {"content": "b"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rejects_malformed_and_oversized_records():
+    """Test that bad input raises instead of buffering forever"""
+    with pytest.raises(ValueError):
+        await collect([b'[{"content": "a"}, {"content": '])
+    with pytest.raises(ValueError):
+        await collect([b'{"content": "' + b"x" * 100], max_record_bytes=50)
+
+
+def test_ndjson_line_is_compact():
+    """Test NDJSON output formatting"""
+    assert ndjson_line({"index": 1, "id": "x"}) == '{"index":1,"id":"x"}\n'
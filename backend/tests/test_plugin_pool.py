@@ -0,0 +1,106 @@
+import asyncio
+import os
+import wave
+import pytest
+from fastapi.testclient import TestClient
+from app.api import plugin
+from app.config import config
+from app.main import app
+from app.utils.cache import TieredCache
+from app.utils.plugin_pool import PluginBusy, PluginError, PluginPool, PluginTimeout
+# Tasks live in their own module so workers do not import the whole app
+from plugin_tasks import crash, hog, reverse, spin, whoami
+
+
+@pytest.fixture
+def pool():
+    pool = PluginPool(workers=2, timeout=5, memory_limit_mb=512, max_queue=1)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_runs_in_warm_worker_processes(pool):
+    """Test plugin calls run outside the API process on pre-started workers"""
+    await pool.start()
+    pids = await asyncio.gather(*(pool.run(whoami, {}) for _ in range(3)))
+    assert os.getpid() not in pids and len(set(pids)) <= 2
+    assert pool.stats()["completed"] == 3
+
+
+@pytest.mark.asyncio
+async def test_large_bytes_travel_through_shared_memory(pool):
+    """Test large arguments and results round-trip and their shared memory is freed"""
+    def blocks():
+        return {name for name in os.listdir("/dev/shm") if not name.startswith("sem.")}
+    before = blocks()
+    data = os.urandom(1 << 20)
+    result = await pool.run(reverse, {"data": data})
+    assert result["size"] == len(data) and result["reversed"] == data[::-1]
+    assert blocks() == before
+
+
+@pytest.mark.asyncio
+async def test_timeouts_and_memory_limits(pool):
+    """Test runaway tasks are stopped without taking the pool down"""
+    with pytest.raises(PluginTimeout):
+        await pool.run(spin, {"seconds": 5}, timeout=0.3)
+    with pytest.raises(PluginError, match="memory limit"):
+        await pool.run(hog, {"mb": 1024})
+    assert await pool.run(spin, {"seconds": 0}) == "done"
+    stats = pool.stats()
+    assert (stats["timeouts"], stats["failed"], stats["restarts"]) == (1, 1, 0)
+
+
+@pytest.mark.asyncio
+async def test_crashed_worker_restarts_pool(pool):
+    """Test a dead worker fails its task and the pool is rebuilt"""
+    with pytest.raises(PluginError, match="died"):
+        await pool.run(crash, {})
+    assert await pool.run(spin, {"seconds": 0}) == "done"
+    assert pool.stats()["restarts"] == 1
+
+
+@pytest.mark.asyncio
+async def test_queue_depth_is_bounded(pool):
+    """Test tasks wait for a free worker and are shed once the queue is full"""
+    running = [asyncio.create_task(pool.run(spin, {"seconds": 0.5})) for _ in range(3)]
+    await asyncio.sleep(0.1)
+    stats = pool.stats()
+    assert (stats["running"], stats["queued"]) == (2, 1)
+    with pytest.raises(PluginBusy):
+        await pool.run(spin, {"seconds": 0})
+    assert await asyncio.gather(*running) == ["done"] * 3
+    assert pool.stats()["utilization"] > 0
+
+
+def test_plugin_endpoint(monkeypatch, tmp_path):
+    """Test plugins are listed with pool stats and called through the pool"""
+    pool = PluginPool(workers=1, timeout=5, modules=plugin.plugin_pool.modules)
+    monkeypatch.setattr(plugin, "plugin_pool", pool)
+    monkeypatch.setattr(plugin, "plugin_cache", TieredCache("plugin", max_entries=10))
+    monkeypatch.setattr(config, "CACHE_BACKEND", "none")
+    monkeypatch.setattr(config, "PLUGIN_FILE_DIRS", str(tmp_path))
+    with wave.open(str(tmp_path / "quiet.wav"), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(8000)
+        f.writeframes(bytes(8000))
+    client = TestClient(app)
+    try:
+        status = client.get("/api/plugin/").json()
+        assert "image_analysis" in status["plugins"] and status["pool"]["workers"] == 1
+        response = client.post("/api/plugin/", json={"plugin": "audio_analysis", "args": {"file_path": str(tmp_path / "quiet.wav")}})
+        assert response.status_code == 200 and response.json()["result"]["duration"] == 0.5
+        assert pool.stats()["completed"] == 1
+        missing = client.post("/api/plugin/", json={"plugin": "audio_analysis", "args": {"file_path": str(tmp_path / "x.wav")}})
+        assert missing.status_code == 400
+        assert client.post("/api/plugin/", json={"plugin": "nope"}).status_code == 404
+        bad = client.post("/api/plugin/", json={"plugin": "image_analysis", "args": {"wrong": 1}})
+        assert bad.status_code == 400
+        for path in ["/etc/passwd", str(tmp_path / ".." / "x.wav"), 1]:
+            outside = client.post("/api/plugin/", json={"plugin": "image_analysis", "args": {"file_path": path}})
+            assert outside.status_code == 403
+        assert pool.stats()["completed"] == 1
+    finally:
+        pool.shutdown()
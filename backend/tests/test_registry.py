@@ -0,0 +1,23 @@
+import pytest
+from app.models.registry import ProviderRegistry
+
+
+class Configured:
+    """A provider that keeps the HTTP client it was given"""
+    def __init__(self, http_client=None):
+        self.client = http_client
+
+
+def unconfigured(http_client=None):
+    raise ValueError("API key is required")
+
+
+@pytest.mark.asyncio
+async def test_unconfigured_providers_do_not_leak_clients():
+    """Test clients built for disabled providers are closed with the registry"""
+    registry = ProviderRegistry({"ok": Configured, "off": unconfigured})
+    assert list(registry) == ["ok"]
+    clients = [registry["ok"].client, *registry._unused]
+    assert len(clients) == 2
+    await registry.close()
+    assert all(client.is_closed for client in clients)
@@ -0,0 +1,151 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.api import chat
+from app.config import config
+from app.main import app
+from app.models.router import ModelRouter, parse_fallback_chains
+from app.utils.cache import TieredCache
+from app.utils.response_cache import (
+    ResponseCache,
+    parse_cache_control,
+    parse_model_ttls,
+    response_key,
+)
+
+
+class FakeProvider:
+    """A provider that counts upstream calls"""
+    def __init__(self):
+        self.calls = 0
+
+    async def generate(self, messages, model, max_tokens, temperature, stream=False, **kwargs):
+        self.calls += 1
+        if not stream:
+            return f"answer {self.calls}"
+
+        async def chunks():
+            for part in ["ans", "wer ", str(self.calls)]:
+                yield part
+        return chunks()
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    """Fake provider and an enabled, local-only response cache"""
+    monkeypatch.setattr(config, "CACHE_BACKEND", "none")
+    provider = FakeProvider()
+    monkeypatch.setattr(chat, "PROVIDERS", {"openai": provider})
+    monkeypatch.setattr(chat, "model_router", ModelRouter({"openai": provider}))
+    monkeypatch.setattr(chat, "response_cache", ResponseCache(
+        TieredCache("resp-test", max_entries=10), enabled=True, max_temperature=0.0
+    ))
+    return provider
+
+
+def post(client, body, **headers):
+    return client.post("/api/chat/", json=body, headers=headers)
+
+
+def test_response_key_is_canonical():
+    """Test that key order does not matter but content does"""
+    messages = [{"role": "user", "content": "hi"}]
+    a = response_key("openai", "m", messages, {"temperature": 0, "max_tokens": 5})
+    b = response_key("openai", "m", messages, {"max_tokens": 5, "temperature": 0})
+    assert a == b
+    assert a != response_key("anthropic", "m", messages, {"temperature": 0, "max_tokens": 5})
+
+
+def test_cache_control_and_ttl_parsing():
+    """Test Cache-Control directives and per-model TTL settings"""
+    assert parse_cache_control(None) == (True, True)
+    assert parse_cache_control("no-cache") == (False, True)
+    assert parse_cache_control("max-age=0, no-store") == (False, False)
+    assert parse_model_ttls("gpt-4=86400, gpt-3.5-turbo=60") == {"gpt-4": 86400, "gpt-3.5-turbo": 60}
+    with pytest.raises(ValueError):
+        parse_model_ttls("gpt-4")
+
+
+def test_identical_requests_hit_cache(fake):
+    """Test deterministic requests are answered from the cache"""
+    client = TestClient(app)
+    body = {"messages": [{"role": "user", "content": "hi"}], "temperature": 0}
+    first = post(client, body)
+    second = post(client, body)
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json()["content"] == first.json()["content"] == "answer 1"
+    assert second.json()["metadata"]["cache"] == "exact"
+    assert fake.calls == 1
+
+    # Sampled requests are never cached
+    post(client, {**body, "temperature": 0.7})
+    assert post(client, {**body, "temperature": 0.7}).headers["X-Cache"] == "BYPASS"
+    assert fake.calls == 3
+
+
+def test_cache_control_refresh_and_bypass(fake):
+    """Test no-cache refreshes the entry and no-store skips it"""
+    client = TestClient(app)
+    body = {"messages": [{"role": "user", "content": "hi"}], "temperature": 0}
+    post(client, body)
+    refreshed = post(client, body, **{"Cache-Control": "no-cache"})
+    assert refreshed.json()["content"] == "answer 2"
+    assert post(client, body).json()["content"] == "answer 2"
+    assert post(client, body, **{"Cache-Control": "no-store"}).json()["content"] == "answer 3"
+    assert post(client, body).json()["content"] == "answer 2"
+
+
+def test_streamed_response_replays_chunks(fake):
+    """Test a cached streamed response is replayed chunk by chunk"""
+    client = TestClient(app)
+    body = {"messages": [{"role": "user", "content": "hi"}], "temperature": 0, "stream": True}
+    first = post(client, body)
+    second = post(client, body)
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.text == first.text
+    assert first.text.startswith("data: ans\n\ndata: wer 1\n\nevent: usage\n")
+    assert first.text.endswith("data: [DONE]\n\n")
+    assert fake.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_zero_model_ttl_disables_caching(monkeypatch):
+    """Test a per-model TTL of 0 keeps that model's responses out of the cache"""
+    monkeypatch.setattr(config, "CACHE_BACKEND", "none")
+    cache = ResponseCache(
+        TieredCache("resp-ttl-test", max_entries=10), enabled=True, max_temperature=0.0,
+        model_ttls={"volatile": 0, "stable": 60},
+    )
+    await cache.set("a", "volatile", ["x"])
+    await cache.set("b", "stable", ["y"])
+    await cache.set("c", "other", ["z"])
+    assert await cache.get("a") is None
+    assert await cache.get("b") == ["y"]
+    assert await cache.get("c") == ["z"]
+
+
+def test_fallback_answer_is_cached_under_the_answering_model(fake, monkeypatch):
+    """Test an answer from a fallback model is not replayed for the requested model"""
+    class FlakyProvider(FakeProvider):
+        async def generate(self, messages, model, *args, **kwargs):
+            if model == "primary" and self.calls == 0:
+                self.calls += 1
+                raise RuntimeError("primary down")
+            return f"{model}: " + await super().generate(messages, model, *args, **kwargs)
+
+    provider = FlakyProvider()
+    monkeypatch.setattr(chat, "PROVIDERS", {"openai": provider})
+    monkeypatch.setattr(chat, "model_router", ModelRouter(
+        {"openai": provider}, fallbacks=parse_fallback_chains("openai:primary>openai:backup")
+    ))
+    client = TestClient(app)
+    messages = [{"role": "user", "content": "hi"}]
+
+    failover = post(client, {"messages": messages, "model": "primary", "temperature": 0, "fallback": True})
+    assert failover.json()["model"] == "backup"
+    primary = post(client, {"messages": messages, "model": "primary", "temperature": 0})
+    assert primary.headers["X-Cache"] == "MISS"
+    assert primary.json()["content"] == "primary: answer 3"
+    backup = post(client, {"messages": messages, "model": "backup", "temperature": 0})
+    assert backup.headers["X-Cache"] == "HIT"
+    assert backup.json()["content"] == failover.json()["content"] == "backup: answer 2"
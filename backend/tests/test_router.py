@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+from app.models.admission import AdmissionRejected
+from app.models.router import LatencyTracker, ModelRouter, parse_fallback_chains
+
+
+class FakeProvider:
+    """A provider with a fixed delay that can be made to fail"""
+    def __init__(self, name, delay=0.0, fail=False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.cancelled = 0
+        self.closed = 0
+
+    async def generate(self, messages, model, max_tokens=10, temperature=0.0, stream=False, **kwargs):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise RuntimeError(f"{self.name} is down")
+        if not stream:
+            return f"{self.name}:{model}"
+
+        async def chunks():
+            try:
+                yield f"{self.name} "
+                yield "done"
+            finally:
+                self.closed += 1
+        return chunks()
+
+
+def make_router(providers, **options):
+    fallbacks = parse_fallback_chains("a:m1>b:m2")
+    return ModelRouter(providers, fallbacks=fallbacks, hedge_default_delay=0.05, **options)
+
+
+def test_parse_fallback_chains():
+    """Test the fallback chain setting format"""
+    assert parse_fallback_chains("openai:gpt-4>anthropic:claude-3-opus-20240229>openai:gpt-3.5-turbo") == {
+        ("openai", "gpt-4"): [("anthropic", "claude-3-opus-20240229"), ("openai", "gpt-3.5-turbo")]
+    }
+    with pytest.raises(ValueError):
+        parse_fallback_chains("openai>anthropic:claude")
+
+
+def test_tracker_percentiles_and_error_rate():
+    """Test rolling latency percentiles and error rate over the window"""
+    tracker = LatencyTracker(window=4)
+    for latency in [0.1, 0.2, 0.3, 0.4, 0.5]:
+        tracker.record(latency, ok=True)
+    assert tracker.percentile(50) == pytest.approx(0.35)
+    tracker.record(None, ok=False)
+    assert tracker.error_rate == 0.25
+    assert tracker.stats()["errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_fallback_chain_on_failure():
+    """Test a failed request fails over only when opted in"""
+    router = make_router({"a": FakeProvider("a", fail=True), "b": FakeProvider("b")})
+    with pytest.raises(RuntimeError):
+        await router.complete(("a", "m1"), [])
+    result = await router.complete(("a", "m1"), [], fallback=True)
+    assert (result.value, result.provider, result.model) == ("b:m2", "b", "m2")
+    assert result.attempts == ["a:m1"]
+    assert router.stats()["fallbacks"] == 1
+
+
+@pytest.mark.asyncio
+async def test_shed_calls_do_not_count_as_provider_errors():
+    """Test local admission rejections leave the provider's error rate alone"""
+    class SheddingProvider(FakeProvider):
+        async def generate(self, *args, **kwargs):
+            raise AdmissionRejected("a", "queue full", 1)
+
+    router = make_router({"a": SheddingProvider("a"), "b": FakeProvider("b")})
+    for _ in range(3):
+        with pytest.raises(AdmissionRejected):
+            await router.complete(("a", "m1"), [])
+    assert router.tracker(("a", "m1"), "complete").error_rate == 0.0
+
+@pytest.mark.asyncio
+async def test_hedge_wins_and_loser_is_cancelled():
+    """Test a slow primary is hedged and cancelled when the hedge wins"""
+    slow, fast = FakeProvider("a", delay=1.0), FakeProvider("b")
+    router = make_router({"a": slow, "b": fast})
+    result = await router.complete(("a", "m1"), [], hedge=True)
+    assert result.provider == "b" and result.hedged
+    assert slow.cancelled == 1
+    stats = router.stats()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_not_hedged():
+    """Test no hedge is sent when the primary answers in time"""
+    router = make_router({"a": FakeProvider("a"), "b": FakeProvider("b")})
+    result = await router.complete(("a", "m1"), [], hedge=True)
+    assert result.provider == "a" and not result.hedged
+    assert router.stats()["hedges"] == 0
+    assert router.stats()["targets"]["a:m1:complete"]["requests"] == 1
+
+
+@pytest.mark.asyncio
+async def test_hedged_stream_commits_to_first_chunk():
+    """Test a hedged stream serves the first stream to produce a chunk"""
+    slow, fast = FakeProvider("a", delay=1.0), FakeProvider("b")
+    router = make_router({"a": slow, "b": fast})
+    result = await router.stream(("a", "m1"), [], hedge=True)
+    assert [chunk async for chunk in result.value] == ["b ", "done"]
+    assert result.provider == "b"
+    assert slow.cancelled == 1 and fast.closed == 1
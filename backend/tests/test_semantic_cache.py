@@ -0,0 +1,124 @@
+import time
+
+from fastapi.testclient import TestClient
+from app.api import chat
+from app.config import config
+from app.main import app
+from app.models.router import ModelRouter
+from app.utils.cache import TieredCache
+from app.utils.response_cache import ResponseCache
+from app.utils.semantic_cache import SemanticCache, semantic_scope
+
+
+def make_cache(**overrides):
+    options = dict(enabled=True, max_temperature=0.0, threshold=0.9, max_entries=10, max_scopes=10, max_age=60)
+    options.update(overrides)
+    return SemanticCache(**options)
+
+
+def test_nearest_entry_above_threshold_hits():
+    """Test lookups return the closest response only above the threshold"""
+    cache = make_cache()
+    cache.set("s", [1.0, 0.0], ["east"], latency=0.5)
+    cache.set("s", [0.0, 1.0], ["north"], latency=0.5)
+    chunks, similarity = cache.get("s", [0.99, 0.05])
+    assert chunks == ["east"] and similarity > 0.99
+    assert cache.get("s", [1.0, 1.0]) is None
+    assert cache.get("other", [1.0, 0.0]) is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["lookups"] == 3
+    assert stats["latency_saved_seconds"] == 0.5
+
+
+def test_eviction_by_size_and_age(monkeypatch):
+    """Test the oldest entries are evicted first"""
+    cache = make_cache(max_entries=20)
+    for i in range(25):
+        cache.set("s", [1.0, float(i)], [str(i)], latency=0.0)
+    assert cache.stats()["entries"] <= 20
+    assert cache.get("s", [1.0, 0.0]) is None
+    assert cache.get("s", [1.0, 24.0])[0] == ["24"]
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+    assert cache.get("s", [1.0, 24.0]) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_scope_depends_on_system_prompt():
+    """Test entries are shared only under the same system prompt and model"""
+    user = {"role": "user", "content": "hi"}
+    a = semantic_scope("openai", "m", [{"role": "system", "content": "A"}, user])
+    assert a == semantic_scope("openai", "m", [{"role": "system", "content": "A"}, {"role": "user", "content": "yo"}])
+    assert a != semantic_scope("openai", "m", [{"role": "system", "content": "B"}, user])
+    assert a != semantic_scope("openai", "m2", [{"role": "system", "content": "A"}, user])
+
+
+def test_scope_depends_on_earlier_turns():
+    """Test follow-ups are only matched within the same conversation"""
+    def follow_up(topic):
+        return [
+            {"role": "user", "content": f"Should I use {topic}?"},
+            {"role": "assistant", "content": "Maybe."},
+            {"role": "user", "content": "yes, do that"},
+        ]
+    assert semantic_scope("openai", "m", follow_up("Redis")) == semantic_scope("openai", "m", follow_up("Redis"))
+    assert semantic_scope("openai", "m", follow_up("Redis")) != semantic_scope("openai", "m", follow_up("Kafka"))
+
+
+class FakeProvider:
+    """A provider with toy embeddings keyed on the first word"""
+    def __init__(self):
+        self.calls = 0
+
+    async def generate(self, messages, model, max_tokens, temperature, stream=False, **kwargs):
+        self.calls += 1
+        return f"answer {self.calls}"
+
+    async def get_embedding(self, text):
+        return [1.0, 0.0] if text.lower().startswith("weather") else [0.0, 1.0]
+
+
+def test_paraphrase_served_from_semantic_cache(monkeypatch):
+    """Test a paraphrased prompt is answered from the semantic cache"""
+    monkeypatch.setattr(config, "CACHE_BACKEND", "none")
+    provider = FakeProvider()
+    monkeypatch.setattr(chat, "PROVIDERS", {"openai": provider})
+    monkeypatch.setattr(chat, "model_router", ModelRouter({"openai": provider}))
+    monkeypatch.setattr(chat, "response_cache", ResponseCache(
+        TieredCache("resp-test", max_entries=10), enabled=True, max_temperature=0.0
+    ))
+    monkeypatch.setattr(chat, "semantic_cache", make_cache())
+    client = TestClient(app)
+
+    def ask(text):
+        return client.post("/api/chat/", json={"messages": [{"role": "user", "content": text}], "temperature": 0})
+
+    assert ask("Weather in Paris?").json()["content"] == "answer 1"
+    paraphrase = ask("weather for paris today")
+    assert paraphrase.headers["X-Cache"] == "HIT"
+    assert paraphrase.json()["content"] == "answer 1"
+    assert paraphrase.json()["metadata"]["cache"] == "semantic"
+    assert ask("Tell me a joke").json()["content"] == "answer 2"
+    assert provider.calls == 2
+
+
+def test_semantic_hit_keeps_trimming_metadata(monkeypatch):
+    """Test a semantic hit still reports how the prompt was trimmed"""
+    monkeypatch.setattr(config, "CACHE_BACKEND", "none")
+    provider = FakeProvider()
+    monkeypatch.setattr(chat, "PROVIDERS", {"openai": provider})
+    monkeypatch.setattr(chat, "model_router", ModelRouter({"openai": provider}))
+    monkeypatch.setattr(chat, "response_cache", ResponseCache(
+        TieredCache("resp-test", max_entries=10), enabled=True, max_temperature=0.0
+    ))
+    monkeypatch.setattr(chat, "semantic_cache", make_cache())
+    monkeypatch.setattr(chat, "fit_messages", lambda model, messages, max_tokens, policy: (messages, 10, 3))
+    client = TestClient(app)
+
+    def ask(text):
+        return client.post("/api/chat/", json={"messages": [{"role": "user", "content": text}], "temperature": 0})
+
+    ask("Weather in Paris?")
+    metadata = ask("weather for paris today").json()["metadata"]
+    assert metadata["cache"] == "semantic" and metadata["trimmed_messages"] == 3
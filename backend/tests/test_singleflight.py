@@ -0,0 +1,192 @@
+import asyncio
+import httpx
+import pytest
+from app.api import chat
+from app.main import app
+from app.models.router import ModelRouter
+from app.utils.singleflight import SingleFlight, StreamFlights
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_result():
+    """Test identical concurrent calls run once and later calls run again"""
+    flights = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    results = await asyncio.gather(*(flights.do("k", fetch) for _ in range(3)))
+    assert results == [(1, False), (1, True), (1, True)]
+    assert await flights.do("k", fetch) == (2, False)
+    assert flights.stats() == {"calls": 2, "shared": 2, "shared_rate": 0.5, "in_flight": 0}
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller():
+    """Test a failed call fails all callers that shared it"""
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(flights.do("k", fail), flights.do("k", fail), return_exceptions=True)
+    assert [str(r) for r in results] == ["upstream down", "upstream down"]
+
+
+@pytest.mark.asyncio
+async def test_call_cancelled_only_when_every_caller_leaves():
+    """Test one caller going away does not cancel the shared call"""
+    flights = SingleFlight()
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await release.wait()
+        return "done"
+
+    first = asyncio.create_task(flights.do("k", slow))
+    second = asyncio.create_task(flights.do("k", slow))
+    await started.wait()
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    assert await second == ("done", True)
+
+    release.clear()
+    third = asyncio.create_task(flights.do("k", slow))
+    await asyncio.sleep(0.01)
+    third.cancel()
+    await asyncio.sleep(0.01)
+    assert flights.stats()["in_flight"] == 0
+
+
+class Upstream:
+    """A stream that yields chunks when told to and records being closed"""
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await self.queue.get()
+        if chunk is None:
+            raise StopAsyncIteration
+        return chunk
+
+    async def aclose(self):
+        self.closed = True
+
+
+async def collect(subscription):
+    return [chunk async for chunk in subscription]
+
+
+@pytest.mark.asyncio
+async def test_late_joiner_replays_buffered_prefix():
+    """Test a stream is opened once and late joiners see every chunk"""
+    flights = StreamFlights()
+    upstream = Upstream()
+    opened = []
+
+    async def open_stream():
+        opened.append(1)
+        return upstream
+
+    first, shared = flights.subscribe("k", open_stream)
+    await first.ready()
+    assert not shared
+    reader = asyncio.create_task(collect(first))
+    upstream.queue.put_nowait("a")
+    upstream.queue.put_nowait("b")
+    await asyncio.sleep(0.01)
+
+    late, shared = flights.subscribe("k", open_stream)
+    assert shared
+    await late.ready()
+    late_reader = asyncio.create_task(collect(late))
+    upstream.queue.put_nowait("c")
+    upstream.queue.put_nowait(None)
+    assert await reader == ["a", "b", "c"]
+    assert await late_reader == ["a", "b", "c"]
+    assert opened == [1] and upstream.closed
+    assert flights.stats() == {"streams": 1, "shared": 1, "in_flight": 0}
+
+
+@pytest.mark.asyncio
+async def test_upstream_closed_when_all_subscribers_leave():
+    """Test the shared stream is abandoned once nobody reads it"""
+    flights = StreamFlights()
+    upstream = Upstream()
+
+    async def open_stream():
+        return upstream
+
+    first, _ = flights.subscribe("k", open_stream)
+    second, _ = flights.subscribe("k", open_stream)
+    await first.ready()
+    first.close()
+    await asyncio.sleep(0.01)
+    assert not upstream.closed
+    second.close()
+    await asyncio.sleep(0.01)
+    assert upstream.closed
+    assert flights.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_open_failure_reaches_every_subscriber():
+    """Test a routing failure is raised by ready() for all subscribers"""
+    flights = StreamFlights()
+
+    async def open_stream():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("no provider")
+
+    subscriptions = [flights.subscribe("k", open_stream)[0] for _ in range(2)]
+    for subscription in subscriptions:
+        with pytest.raises(RuntimeError):
+            await subscription.ready()
+
+
+class SlowProvider:
+    """A provider that counts calls and answers slowly"""
+    def __init__(self):
+        self.calls = 0
+
+    async def generate(self, messages, model, max_tokens, temperature, stream=False, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        if not stream:
+            return "answer"
+
+        async def chunks():
+            for part in ["ans", "wer"]:
+                await asyncio.sleep(0.01)
+                yield part
+        return chunks()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stream", [False, True])
+async def test_chat_requests_share_upstream(monkeypatch, stream):
+    """Test identical concurrent chat requests make one upstream call"""
+    provider = SlowProvider()
+    monkeypatch.setattr(chat, "PROVIDERS", {"openai": provider})
+    monkeypatch.setattr(chat, "model_router", ModelRouter({"openai": provider}))
+    monkeypatch.setattr(chat, "chat_flights", SingleFlight())
+    monkeypatch.setattr(chat, "stream_flights", StreamFlights())
+    body = {"messages": [{"role": "user", "content": "hi"}], "temperature": 0.7, "stream": stream}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        responses = await asyncio.gather(*(client.post("/api/chat/", json=body) for _ in range(3)))
+    assert provider.calls == 1
+    if stream:
+        assert all(r.text.startswith("data: ans\n\ndata: wer\n\n") for r in responses)
+    else:
+        assert [r.json()["metadata"].get("shared", False) for r in responses].count(True) == 2
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from app.utils.sse import event_stream, sse_event
+
+
+async def collect(chunks, **options):
+    settings = dict(max_chars=1024, max_wait=0.05, idle_timeout=1.0)
+    settings.update(options)
+    return [frame async for frame in event_stream(chunks, **settings)]
+
+
+async def paced(parts, delay=0.0):
+    for part in parts:
+        await asyncio.sleep(delay)
+        yield part
+
+
+def test_multiline_chunks_are_escaped():
+    """Test each line of a chunk becomes its own data field"""
+    assert sse_event("a\nb\r\nc") == "data: a\ndata: b\ndata: c\n\n"
+    assert sse_event("x", event="error") == "event: error\ndata: x\n\n"
+
+
+@pytest.mark.asyncio
+async def test_first_chunk_is_sent_then_rest_coalesced():
+    """Test the first token is not held back and later ones are batched"""
+    frames = await collect(paced(["Hel", "lo", ", ", "world"]))
+    assert frames == [sse_event("Hel"), sse_event("lo, world"), sse_event("[DONE]")]
+
+
+@pytest.mark.asyncio
+async def test_size_and_time_bounds_flush():
+    """Test frames are flushed by size and by the time window"""
+    frames = await collect(paced(["a", "bb", "cc", "dd"]), max_chars=4)
+    assert frames[:3] == [sse_event("a"), sse_event("bbcc"), sse_event("dd")]
+
+    frames = await collect(paced(["a", "b", "c"], delay=0.05), max_wait=0.01)
+    assert frames == [sse_event("a"), sse_event("b"), sse_event("c"), sse_event("[DONE]")]
+
+
+@pytest.mark.asyncio
+async def test_idle_timeout_and_errors_end_the_stream():
+    """Test stalls and upstream failures are reported as error events"""
+    async def stalled():
+        yield "a"
+        await asyncio.sleep(0.5)
+        yield "b"
+
+    frames = await collect(stalled(), idle_timeout=0.1)
+    assert frames[0] == sse_event("a")
+    assert frames[1].startswith("event: error\n")
+    assert frames[-1] == sse_event("[DONE]")
+
+    async def failing():
+        yield "partial"
+        raise RuntimeError("upstream broke")
+
+    frames = await collect(failing())
+    assert "upstream broke" in frames[1]
+
+
+@pytest.mark.asyncio
+async def test_consumer_stop_closes_upstream():
+    """Test the upstream stream is closed when the client goes away"""
+    closed = asyncio.Event()
+
+    async def upstream():
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield "token"
+        finally:
+            closed.set()
+
+    stream = event_stream(upstream(), max_chars=1024, max_wait=0.05, idle_timeout=1.0)
+    assert await stream.__anext__() == sse_event("token")
+    await stream.aclose()
+    assert closed.is_set()
+
+    # Cancellation, as on a client disconnect, also closes it
+    closed.clear()
+
+    async def consume():
+        async for _ in event_stream(upstream(), max_chars=1024, max_wait=0.05, idle_timeout=1.0):
+            pass
+
+    task = asyncio.create_task(consume())
+    await asyncio.sleep(0.05)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert closed.is_set()
@@ -0,0 +1,168 @@
+import threading
+import time
+import pytest
+from fastapi.testclient import TestClient
+from app.api import chat, system_prompt
+from app.api.system_prompt import SystemPrompt, SystemPromptStore
+from app.main import app
+from app.models.router import ModelRouter
+
+
+def prompt(name, content="Be brief."):
+    return SystemPrompt(id=0, name=name, content=content)
+
+
+@pytest.fixture
+def store(tmp_path):
+    """A store persisted to a temporary SQLite database"""
+    store = SystemPromptStore(f"sqlite:///{tmp_path}/prompts.db")
+    yield store
+    store.close()
+
+
+def test_indexes_by_id_and_name(store):
+    """Test prompts get sequential IDs and are found by ID and name"""
+    first = store.add_prompt(prompt("terse"))
+    second = store.add_prompt(prompt("verbose", "Explain everything."))
+    assert (first.id, second.id) == (1, 2)
+    assert store.get_prompt(2).name == "verbose"
+    assert store.get_prompt_by_name("terse").id == 1
+    assert store.get_prompt_by_name("missing") is None
+
+
+def test_duplicate_names_rejected(store):
+    """Test names are unique across adds and renames"""
+    store.add_prompt(prompt("a"))
+    store.add_prompt(prompt("b"))
+    with pytest.raises(ValueError):
+        store.add_prompt(prompt("a"))
+    with pytest.raises(ValueError):
+        store.update_prompt(2, prompt("a"))
+    assert store.update_prompt(2, prompt("b", "new")).content == "new"
+    assert store.update_prompt(99, prompt("c")) is None
+
+
+def test_snapshots_are_immutable(store):
+    """Test a snapshot taken before a write is not changed by it"""
+    store.add_prompt(prompt("a"))
+    before = store.snapshot()
+    store.add_prompt(prompt("b"))
+    store.delete_prompt(1)
+    assert [p.name for p in before.prompts] == ["a"]
+    assert [p.name for p in store.list_prompts()] == ["b"]
+    assert before.etag != store.snapshot().etag
+
+
+def test_writes_survive_restart(tmp_path):
+    """Test the write-behind persists adds, renames and deletes"""
+    url = f"sqlite:///{tmp_path}/prompts.db"
+    store = SystemPromptStore(url)
+    store.add_prompt(prompt("a"))
+    store.add_prompt(prompt("b"))
+    store.add_prompt(prompt("c"))
+    store.update_prompt(1, prompt("b2"))
+    store.update_prompt(2, prompt("a"))
+    store.delete_prompt(3)
+    store.flush()
+    etag = store.snapshot().etag
+    store.close()
+
+    reopened = SystemPromptStore(url)
+    assert [(p.id, p.name) for p in reopened.list_prompts()] == [(1, "b2"), (2, "a")]
+    assert reopened.snapshot().etag == etag
+    assert reopened.add_prompt(prompt("d")).id == 3
+    reopened.close()
+
+
+def test_failed_writes_retry_without_overwriting_newer_edits(tmp_path):
+    """Test a change that failed to write never overwrites a newer edit"""
+    url = f"sqlite:///{tmp_path}/prompts.db"
+    store = SystemPromptStore(url)
+    write = store._write
+    attempts = []
+
+    def flaky_write(changes):
+        attempts.append(changes)
+        if len(attempts) == 1:
+            # A newer edit arrives while the first write is failing
+            store.update_prompt(1, prompt("a", "new"))
+            raise RuntimeError("database is locked")
+        write(changes)
+
+    store._write = flaky_write
+    store.add_prompt(prompt("a", "old"))
+    store.flush()
+    store.close()
+
+    reopened = SystemPromptStore(url)
+    assert reopened.get_prompt(1).content == "new"
+    reopened.close()
+
+
+def test_failing_writes_are_dropped_after_retries(tmp_path):
+    """Test a write that keeps failing is given up on so flush and close return"""
+    store = SystemPromptStore(f"sqlite:///{tmp_path}/prompts.db", write_retries=2, retry_delay=0.01)
+    attempts = []
+
+    def failing_write(changes):
+        attempts.append(changes)
+        raise RuntimeError("disk full")
+
+    store._write = failing_write
+    store.add_prompt(prompt("a"))
+    store.flush()
+    assert len(attempts) == 3
+    assert store.get_prompt(1).name == "a"
+    store.close()
+
+
+def test_close_gives_up_on_a_stuck_writer(tmp_path):
+    """Test close returns after its timeout while a write hangs"""
+    store = SystemPromptStore(f"sqlite:///{tmp_path}/prompts.db", close_timeout=0.1)
+    release = threading.Event()
+    store._write = lambda changes: release.wait(5)
+    store.add_prompt(prompt("a"))
+    started = time.monotonic()
+    store.close()
+    assert time.monotonic() - started < 2
+    release.set()
+
+
+def test_list_supports_conditional_get(monkeypatch):
+    """Test the listing returns 304 when the client's ETag is current"""
+    monkeypatch.setattr(system_prompt, "prompt_store", SystemPromptStore())
+    client = TestClient(app)
+    assert client.post("/api/system/prompts", json={"id": 0, "name": "a", "content": "x"}).json()["id"] == 1
+    assert client.post("/api/system/prompts", json={"id": 0, "name": "a", "content": "y"}).status_code == 409
+
+    first = client.get("/api/system/prompts")
+    etag = first.headers["etag"]
+    assert [p["name"] for p in first.json()] == ["a"]
+    assert client.get("/api/system/prompts", headers={"If-None-Match": etag}).status_code == 304
+
+    client.put("/api/system/prompts/1", json={"id": 0, "name": "a", "content": "z"})
+    changed = client.get("/api/system/prompts", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert client.get("/api/system/prompts/by-name/a").json()["content"] == "z"
+
+
+class EchoProvider:
+    """A provider that returns the messages it was sent"""
+    async def generate(self, messages, model, max_tokens, temperature, stream=False, **kwargs):
+        return " / ".join(m["content"] for m in messages)
+
+
+def test_chat_resolves_system_prompt_id(monkeypatch):
+    """Test chat requests can reference a stored system prompt"""
+    store = SystemPromptStore()
+    store.add_prompt(prompt("terse", "Be brief."))
+    monkeypatch.setattr(chat, "prompt_store", store)
+    provider = EchoProvider()
+    monkeypatch.setattr(chat, "PROVIDERS", {"openai": provider})
+    monkeypatch.setattr(chat, "model_router", ModelRouter({"openai": provider}))
+    client = TestClient(app)
+    body = {"messages": [{"role": "user", "content": "hi"}], "system_prompt_id": 1}
+    assert client.post("/api/chat/", json=body).json()["content"] == "Be brief. / hi"
+    body["system_prompt_id"] = 2
+    assert client.post("/api/chat/", json=body).status_code == 400
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from app.api import chat
+from app.config import config
+from app.main import app
+from app.models.router import ModelRouter
+from app.utils.token_counter import (
+    ContextOverflowError,
+    context_window,
+    count_messages,
+    count_text,
+    fit_messages,
+    tokenizer_for,
+)
+
+
+def history(n, size=400):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "x" * size}
+        for i in range(n)
+    ]
+
+
+def test_context_windows_match_longest_prefix():
+    """Test model context windows are looked up by name prefix"""
+    assert context_window("gpt-4") == 8192
+    assert context_window("gpt-4-turbo-preview") == 128000
+    assert context_window("claude-3-haiku-20240307") == 200000
+    assert context_window("unknown-model") == config.DEFAULT_CONTEXT_WINDOW
+
+
+def test_counts_are_memoized_per_message():
+    """Test re-counting a 100-message history stays well under a millisecond"""
+    messages = history(100)
+    total = count_messages("gpt-3.5-turbo", messages)
+    assert total > sum(count_text("gpt-3.5-turbo", m["content"]) for m in messages)
+
+    started = time.perf_counter()
+    for _ in range(100):
+        assert count_messages("gpt-3.5-turbo", messages) == total
+    assert (time.perf_counter() - started) / 100 < 0.001
+
+
+def test_reject_and_trim_policies():
+    """Test oversized conversations are rejected or trimmed oldest-first"""
+    messages = [{"role": "system", "content": "Be brief."}] + history(40, size=2000)
+    with pytest.raises(ContextOverflowError):
+        fit_messages("gpt-4", messages, max_tokens=1000)
+
+    trimmed, prompt_tokens, dropped = fit_messages("gpt-4", messages, max_tokens=1000, policy="trim")
+    assert dropped > 0
+    assert trimmed[0]["role"] == "system"
+    assert trimmed[-1] == messages[-1]
+    assert prompt_tokens == count_messages("gpt-4", trimmed) <= 8192 - 1000
+
+
+def test_tokenizer_is_resolved_once_per_model():
+    """Test tokenizer lookups are cached"""
+    tokenizer_for.cache_clear()
+    tokenizer_for("gpt-4")
+    tokenizer_for("gpt-4")
+    assert tokenizer_for.cache_info().hits == 1
+
+
+class FakeProvider:
+    async def generate(self, messages, model, max_tokens, temperature, stream=False, **kwargs):
+        return "four words right here"
+
+
+def test_endpoint_reports_usage_and_rejects_overflow(monkeypatch):
+    """Test usage metadata and the 400 for prompts that cannot fit"""
+    provider = FakeProvider()
+    monkeypatch.setattr(chat, "PROVIDERS", {"openai": provider})
+    monkeypatch.setattr(chat, "model_router", ModelRouter({"openai": provider}))
+    client = TestClient(app)
+
+    response = client.post("/api/chat/", json={"messages": [{"role": "user", "content": "hi"}], "max_tokens": 100})
+    usage = response.json()["metadata"]["usage"]
+    assert usage["total_tokens"] == usage["prompt_tokens"] + usage["completion_tokens"]
+    assert response.json()["metadata"]["tokens"] == usage["completion_tokens"]
+
+    huge = {"messages": history(10, size=20000), "model": "gpt-4", "max_tokens": 100}
+    assert client.post("/api/chat/", json=huge).status_code == 400
+    trimmed = client.post("/api/chat/", json={**huge, "context_policy": "trim"})
+    assert trimmed.status_code == 200
+    assert trimmed.json()["metadata"]["trimmed_messages"] > 0
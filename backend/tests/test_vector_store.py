@@ -0,0 +1,170 @@
+import importlib.util
+import io
+import uuid
+from pathlib import Path
+import numpy as np
+import pytest
+from app.config import config
+from app.db.vector_store import NumpyVectorStore, PgVectorStore
+
+MIGRATIONS = Path(__file__).resolve().parents[1] / "migrations" / "versions"
+
+
+def random_vectors(n, dim=8, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).tolist()
+
+
+@pytest.mark.asyncio
+async def test_numpy_store_returns_nearest_neighbours(tmp_path):
+    """Test exact top-k cosine search over memory-mapped segments"""
+    store = NumpyVectorStore(str(tmp_path))
+    vectors = random_vectors(50)
+    ids = [str(uuid.uuid4()) for _ in vectors]
+    await store.add("alice", ids, vectors)
+
+    hits = await store.search(None, "alice", vectors[7], limit=3, threshold=-1.0)
+
+    assert hits[0][0] == ids[7]
+    assert hits[0][1] == pytest.approx(1.0, abs=1e-5)
+    assert len(hits) == 3
+    assert [s for _, s in hits] == sorted((s for _, s in hits), reverse=True)
+    assert await store.search(None, "bob", vectors[7], limit=3, threshold=-1.0) == []
+
+
+@pytest.mark.asyncio
+async def test_numpy_store_applies_threshold(tmp_path):
+    """Test that hits below the similarity threshold are dropped"""
+    store = NumpyVectorStore(str(tmp_path))
+    a, b = str(uuid.uuid4()), str(uuid.uuid4())
+    await store.add("alice", [a, b], [[1.0, 0.0], [0.0, 1.0]])
+
+    hits = await store.search(None, "alice", [1.0, 0.1], limit=10, threshold=0.8)
+
+    assert [memory_id for memory_id, _ in hits] == [a]
+
+
+@pytest.mark.asyncio
+async def test_numpy_store_segments_deletes_and_compaction(tmp_path, monkeypatch):
+    """Test segment sealing, tombstones, compaction and reopening from disk"""
+    monkeypatch.setattr(config, "VECTOR_STORE_SEGMENT_ROWS", 4)
+    monkeypatch.setattr(config, "VECTOR_STORE_COMPACT_SEGMENTS", 100)
+    store = NumpyVectorStore(str(tmp_path))
+    vectors = random_vectors(10, seed=1)
+    ids = [str(uuid.uuid4()) for _ in vectors]
+    for memory_id, vector in zip(ids, vectors):
+        await store.add("alice", [memory_id], [vector])
+    assert store.stats()["segments"] == 3
+
+    await store.delete("alice", [ids[2]])
+    hits = await store.search(None, "alice", vectors[2], limit=10, threshold=-1.0)
+    assert ids[2] not in [memory_id for memory_id, _ in hits]
+    assert len(hits) == 9
+
+    store._index("alice").compact()
+    assert store.stats() == {
+        "backend": "NumpyVectorStore",
+        "users": 1,
+        "segments": 1,
+        "vectors": 9,
+        "deleted": 0,
+    }
+
+    reopened = NumpyVectorStore(str(tmp_path))
+    hits = await reopened.search(None, "alice", vectors[5], limit=1, threshold=-1.0)
+    assert hits[0][0] == ids[5]
+
+
+@pytest.mark.asyncio
+async def test_failed_memory_commit_removes_its_vector(tmp_path, monkeypatch):
+    """Test a memory whose row cannot be committed leaves no vector behind"""
+    from fastapi import HTTPException
+    from app.api import memory
+
+    class Provider:
+        async def get_embedding(self, text):
+            return [1.0] * 8
+
+    class FailingSession:
+        def add(self, entry):
+            pass
+
+        async def commit(self):
+            raise RuntimeError("database is locked")
+
+        async def rollback(self):
+            pass
+
+    store = NumpyVectorStore(str(tmp_path))
+    monkeypatch.setattr(memory, "vector_store", store)
+    monkeypatch.setattr(memory.provider_registry, "require", lambda name: Provider())
+    with pytest.raises(HTTPException):
+        await memory.store_memory(memory.MemoryRequest(content="hi"), FailingSession(), "u1")
+    assert await store.search(None, "u1", [1.0] * 8, 5, 0.0) == []
+
+
+class RecordingSession:
+    """Records the statements a search executes and returns no rows"""
+    def __init__(self):
+        self.executed = []
+
+    async def execute(self, statement, params=None):
+        self.executed.append((" ".join(str(statement).split()), params))
+        return []
+
+
+@pytest.mark.asyncio
+async def test_pg_search_sets_index_parameters_per_transaction(monkeypatch):
+    """Test ef_search and probes are set transaction-locally and ef_search covers the limit"""
+    monkeypatch.setattr(config, "MEMORY_SEARCH_PROBES", 0)
+    session = RecordingSession()
+    await PgVectorStore().search(session, "u", [0.1] * 3, limit=5, threshold=0.8, ef_search=40, probes=3)
+
+    assert session.executed[:2] == [
+        ("SELECT set_config('hnsw.ef_search', :value, true)", {"value": "40"}),
+        ("SELECT set_config('ivfflat.probes', :value, true)", {"value": "3"}),
+    ]
+
+    session = RecordingSession()
+    await PgVectorStore().search(session, "u", [0.1] * 3, limit=100, threshold=0.8, ef_search=40)
+    assert session.executed[0][1] == {"value": "100"}
+    assert not any("ivfflat.probes" in sql for sql, _ in session.executed)
+
+
+@pytest.mark.asyncio
+async def test_pg_search_thresholds_after_the_nearest_neighbours():
+    """Test the threshold filters the `ORDER BY <=> LIMIT k` subquery instead of the index scan"""
+    session = RecordingSession()
+    await PgVectorStore().search(session, "u", [0.1] * 3, limit=5, threshold=0.8)
+
+    sql, params = session.executed[-1]
+    subquery = sql[sql.index("FROM (") : sql.index(") nearest")]
+    assert "ORDER BY embedding <=> :query_embedding LIMIT :limit" in subquery
+    assert ":threshold" not in subquery
+    assert sql.index(") nearest") < sql.index("WHERE 1 - distance > :threshold")
+    assert (params["limit"], params["threshold"], params["user_id"]) == (5, 0.8, "u")
+
+
+def test_hnsw_migration_builds_the_index_concurrently():
+    """Test the migration creates and drops the HNSW index outside a transaction"""
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+
+    spec = importlib.util.spec_from_file_location("memory_embedding_hnsw", MIGRATIONS / "memory_embedding_hnsw.py")
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    buffer = io.StringIO()
+    context = MigrationContext.configure(dialect_name="postgresql", opts={"as_sql": True, "output_buffer": buffer})
+    with Operations.context(context):
+        migration.upgrade()
+        migration.downgrade()
+
+    statements = [s.strip() for s in buffer.getvalue().split(";") if s.strip()]
+    assert statements == [
+        "COMMIT",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_memory_entries_embedding_hnsw ON memory_entries "
+        "USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)",
+        "BEGIN",
+        "COMMIT",
+        "DROP INDEX CONCURRENTLY IF EXISTS ix_memory_entries_embedding_hnsw",
+        "BEGIN",
+    ]
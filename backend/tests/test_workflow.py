@@ -0,0 +1,223 @@
+import asyncio
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from app.api import jobs, workflow
+from app.config import config
+from app.main import app
+from app.utils.cache import TieredCache
+from app.utils.job_queue import SUCCEEDED, SQLiteJobQueue
+from app.utils.job_workers import JobWorkerPool, PermanentJobError
+from app.utils.workflow_utils import (
+    CACHED, FAILED, SKIPPED, Workflow, WorkflowEngine, WorkflowError, load_workflow, render
+)
+
+
+class Recorder:
+    """Step executors that record their calls and sleep for `ms` milliseconds"""
+    def __init__(self):
+        self.calls = []
+        self.fail = set()
+
+    async def echo(self, params):
+        self.calls.append(params["text"])
+        await asyncio.sleep(params.get("ms", 0) / 1000)
+        if params["text"] in self.fail:
+            raise RuntimeError(f"{params['text']} broke")
+        return params["text"].upper()
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    monkeypatch.setattr(config, "CACHE_BACKEND", "none")
+    recorder = Recorder()
+    engine = WorkflowEngine({"echo": recorder.echo}, TieredCache("wf-test", max_entries=100))
+    engine.recorder = recorder
+    return engine
+
+
+def diamond(top="a"):
+    return Workflow.from_dict("diamond", {"steps": [
+        {"id": "join", "type": "echo", "text": "{{steps.left}}+{{steps.right}}"},
+        {"id": "left", "type": "echo", "text": "{{inputs.top}}-l", "ms": 100},
+        {"id": "right", "type": "echo", "text": "{{inputs.top}}-r", "ms": 100},
+    ]})
+
+
+def test_workflow_validation():
+    """Test workflows are ordered topologically and invalid graphs rejected"""
+    assert [s.id for s in diamond().steps] == ["left", "right", "join"]
+    with pytest.raises(ValueError, match="cycle"):
+        Workflow.from_dict("loop", {"steps": [
+            {"id": "a", "type": "echo", "needs": "b"}, {"id": "b", "type": "echo", "text": "{{steps.a}}"},
+        ]})
+    with pytest.raises(ValueError, match="unknown steps"):
+        Workflow.from_dict("dangling", {"steps": [{"id": "a", "type": "echo", "needs": ["zzz"]}]})
+    with pytest.raises(ValueError, match="Duplicate"):
+        Workflow.from_dict("dup", {"steps": [{"id": "a", "type": "echo"}, {"id": "a", "type": "echo"}]})
+    for name in ("feature", "bugfix", "docs", "multimodal_ui"):
+        assert load_workflow(name).inputs
+
+
+@pytest.mark.parametrize("declaration", [
+    {"steps": 5},
+    {"steps": [{"id": "a", "type": "echo", "needs": 5}]},
+    {"steps": [{"id": "a", "type": "echo", "needs": [{}]}]},
+    {"steps": [{"id": "a", "type": "echo", "retries": [1]}]},
+    {"steps": [{"id": "a", "type": "echo"}], "outputs": 5},
+])
+def test_malformed_declarations_are_rejected(declaration):
+    """Test wrongly typed steps, needs and outputs are a 400, not a 500"""
+    with pytest.raises(ValueError):
+        load_workflow(declaration)
+    response = TestClient(app).post("/api/workflow/", json={"workflow": declaration})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_malformed_job_payload_fails_permanently():
+    """Test the job handler rejects what the endpoint rejects"""
+    with pytest.raises(PermanentJobError):
+        await workflow._run_workflow_job({"workflow": {"steps": [{"id": "a", "type": "model", "needs": 5}]}}, None)
+    with pytest.raises(PermanentJobError):
+        await workflow._run_workflow_job({"workflow": 5}, None)
+    with pytest.raises(PermanentJobError):
+        await workflow._run_workflow_job({"workflow": "feature", "inputs": ["task"]}, None)
+
+
+def test_render_placeholders():
+    """Test whole placeholders keep their type and embedded ones become text"""
+    outputs = {"s": {"n": 3, "items": [1]}}
+    assert render("{{ steps.s.n }}", {}, outputs) == 3
+    assert render({"x": ["n={{steps.s.n}} {{steps.s.items}} {{inputs.q}}"]}, {"q": "hi"}, outputs) == {"x": ["n=3 [1] hi"]}
+
+
+@pytest.mark.asyncio
+async def test_independent_branches_run_concurrently(engine):
+    """Test parallel branches overlap and every step reports its timings"""
+    result = await engine.run(diamond(), {"top": "a"})
+    assert result["outputs"]["join"] == "A-L+A-R"
+    steps = result["steps"]
+    assert result["elapsed_ms"] < 190
+    assert steps["join"]["start_ms"] >= 100
+    assert all(steps[s]["duration_ms"] >= 0 and "wait_ms" in steps[s] for s in steps)
+
+
+@pytest.mark.asyncio
+async def test_reruns_only_execute_changed_steps(engine):
+    """Test unchanged steps are served from the memo cache on a re-run"""
+    workflow = Workflow.from_dict("chain", {"steps": [
+        {"id": "fixed", "type": "echo", "text": "constant"},
+        {"id": "varies", "type": "echo", "text": "{{inputs.top}}"},
+        {"id": "both", "type": "echo", "text": "{{steps.fixed}} {{steps.varies}}"},
+    ]})
+    await engine.run(workflow, {"top": "one"})
+    result = await engine.run(workflow, {"top": "two"})
+    assert engine.recorder.calls == ["constant", "one", "CONSTANT ONE", "two", "CONSTANT TWO"]
+    assert result["steps"]["fixed"]["status"] == CACHED
+    result = await engine.run(workflow, {"top": "two"})
+    assert all(step["status"] == CACHED for step in result["steps"].values())
+    assert engine.stats()["steps_cached"] == 4
+
+
+
+def test_volatile_steps_are_not_memoized_by_default():
+    """Test memory searches and plugin calls on file paths opt out of memoization"""
+    workflow = Workflow.from_dict("mixed", {"steps": [
+        {"id": "search", "type": "memory_search", "query": "q"},
+        {"id": "by_path", "type": "plugin", "plugin": "image_analysis", "args": {"file_path": "/a.png"}},
+        {"id": "by_id", "type": "plugin", "plugin": "image_analysis", "args": {"attachment": "ab"}},
+        {"id": "forced", "type": "memory_search", "query": "q", "cache": True},
+    ]})
+    cache = {step.id: step.cache for step in workflow.steps}
+    assert cache == {"search": False, "by_path": False, "by_id": True, "forced": True}
+    assert not next(s for s in load_workflow("feature").steps if s.id == "context").cache
+
+@pytest.mark.asyncio
+async def test_failures_skip_dependents_and_resume(engine):
+    """Test a failed step skips its dependents and a retry resumes after the steps that succeeded"""
+    engine.recorder.fail.add("a-r")
+    with pytest.raises(WorkflowError) as raised:
+        await engine.run(diamond(), {"top": "a"})
+    steps = raised.value.result["steps"]
+    assert (steps["right"]["status"], steps["join"]["status"]) == (FAILED, SKIPPED)
+    assert "a-r broke" in str(raised.value)
+
+    engine.recorder.fail.clear()
+    engine.recorder.calls.clear()
+    result = await engine.run(diamond(), {"top": "a"})
+    assert engine.recorder.calls == ["a-r", "A-L+A-R"]
+    assert result["steps"]["left"]["status"] == CACHED
+
+
+@pytest.mark.asyncio
+async def test_optional_steps_and_retries(engine):
+    """Test optional failures yield None and retried steps recover"""
+    attempts = []
+
+    async def flaky(params):
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise RuntimeError("transient")
+        return "ok"
+
+    engine.executors["flaky"] = flaky
+    engine.recorder.fail.add("x")
+    workflow = Workflow.from_dict("opt", {"steps": [
+        {"id": "maybe", "type": "echo", "text": "x", "optional": True},
+        {"id": "retry", "type": "flaky", "retries": 1},
+        {"id": "after", "type": "echo", "text": "got {{steps.maybe}} {{steps.retry}}"},
+    ]})
+    result = await engine.run(workflow, {})
+    assert result["outputs"]["after"] == "GOT  OK"
+    assert result["steps"]["maybe"]["status"] == FAILED and len(attempts) == 2
+
+
+@pytest.mark.asyncio
+async def test_feature_template_as_job(engine, tmp_path, monkeypatch):
+    """Test the feature template runs as a job with review and docs side by side"""
+    async def model(params):
+        await asyncio.sleep(0.05)
+        return f"{params['agent']}:{len(params['prompt'])}"
+
+    async def search(params):
+        raise RuntimeError("no memory store")
+
+    engine.executors.update({"model": model, "memory_search": search})
+    monkeypatch.setattr(workflow, "workflow_engine", engine)
+
+    async def open_queue():
+        return SQLiteJobQueue(str(tmp_path / "jobs.db"))
+    pool = JobWorkerPool({}, concurrency=1, visibility_timeout=5, poll_interval=0.01,
+                         retry_backoff=0, open_queue=open_queue)
+    pool.register("workflow", workflow._run_workflow_job)
+    monkeypatch.setattr(jobs, "job_workers", pool)
+    await pool.start()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            bad = await client.post("/api/workflow/", json={"workflow": "feature", "inputs": {}})
+            assert bad.status_code == 400
+            response = await client.post("/api/workflow/", json={"workflow": "feature", "inputs": {"task": "x"}})
+            assert response.status_code == 202
+            for _ in range(500):
+                job = (await client.get(response.headers["location"])).json()
+                if job["status"] == SUCCEEDED:
+                    break
+                await asyncio.sleep(0.01)
+    finally:
+        await pool.stop()
+    result = job["result"]
+    assert set(result["outputs"]) == {"plan", "spec", "build", "review", "docs"}
+    assert result["outputs"]["review"].startswith("claude:")
+    steps = result["steps"]
+    assert steps["context"]["status"] == FAILED
+    assert abs(steps["review"]["start_ms"] - steps["docs"]["start_ms"]) < 40
+
+
+def test_workflow_templates_endpoint():
+    """Test the templates are listed with their inputs and dependencies"""
+    templates = TestClient(app).get("/api/workflow/templates").json()
+    assert templates["feature"]["inputs"] == ["task"]
+    review = next(s for s in templates["feature"]["steps"] if s["id"] == "review")
+    assert review["needs"] == ["build", "spec"]
@@ -92,7 +92,7 @@ function Message({ message }: MessageProps) {
                   {attachment.type === 'image' ? '🖼️' : 
                    attachment.type === 'audio' ? '🎵' : '📄'}
                 </span>
-                <span>{attachment.url.split('/').pop()}</span>
+                <span>{attachment.filename ?? attachment.url.split('/').pop()}</span>
               </div>
             ))}
           </div>
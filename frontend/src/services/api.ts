@@ -1,9 +1,18 @@
-import type { ChatMessage } from '../types/chat';
+import type { Attachment, ChatMessage } from '../types/chat';
 
 const API_BASE = 'http://localhost:8000/api';
 
+/**
+ * A message as sent to the API, with its attachments referenced by ID.
+ */
+export interface ChatRequestMessage {
+  role: ChatMessage['role'];
+  content: string;
+  attachments?: string[];
+}
+
 export interface ChatRequest {
-  messages: ChatMessage[];
+  messages: ChatRequestMessage[];
   model?: string;
   max_tokens?: number;
   temperature?: number;
@@ -18,6 +27,12 @@ export interface ChatResponse {
   metadata: Record<string, any>;
 }
 
+export interface TokenUsage {
+  prompt_tokens: number;
+  completion_tokens: number;
+  total_tokens: number;
+}
+
 export interface Provider {
   available: boolean;
   models?: string[];
@@ -64,10 +79,12 @@ class ApiService {
    *
    * @param request The chat request.
    * @param onChunk A callback to handle each chunk of the response.
+   * @param onUsage An optional callback for the token usage sent at the end.
    */
   async sendMessageStream(
     request: ChatRequest,
-    onChunk: (chunk: string) => void
+    onChunk: (chunk: string) => void,
+    onUsage?: (usage: TokenUsage) => void
   ): Promise<void> {
     const response = await fetch(`${API_BASE}/chat/`, {
       method: 'POST',
@@ -92,16 +109,32 @@ class ApiService {
         const { done, value } = await reader.read();
         if (done) break;
 
-        buffer += decoder.decode(value, { stream: true });
-        const lines = buffer.split('\n');
-        buffer = lines.pop() || '';
-
-        for (const line of lines) {
-          if (line.startsWith('data: ')) {
-            const data = line.slice(6);
-            if (data === '[DONE]') return;
-            onChunk(data);
+        buffer += decoder.decode(value, { stream: true }).replace(/\r\n?/g, '\n');
+        // Server-sent events are separated by a blank line
+        const events = buffer.split('\n\n');
+        buffer = events.pop() || '';
+
+        for (const event of events) {
+          let type = 'message';
+          const data: string[] = [];
+          for (const line of event.split('\n')) {
+            if (line.startsWith('event:')) {
+              type = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+              data.push(line.slice(line.startsWith('data: ') ? 6 : 5));
+            }
+          }
+          if (data.length === 0) continue;
+          const payload = data.join('\n');
+          if (payload === '[DONE]') return;
+          if (type === 'error') {
+            throw new Error(JSON.parse(payload).error);
           }
+          if (type === 'usage') {
+            onUsage?.(JSON.parse(payload));
+            continue;
+          }
+          onChunk(payload);
         }
       }
     } finally {
@@ -109,6 +142,33 @@ class ApiService {
     }
   }
 
+  /**
+   * Uploads files to the attachment store.
+   *
+   * @param files The files to upload.
+   * @returns The stored attachments, in the order of `files`.
+   */
+  async uploadAttachments(files: File[]): Promise<Attachment[]> {
+    const form = new FormData();
+    for (const file of files) {
+      form.append('file', file, file.name);
+    }
+    const response = await fetch(`${API_BASE}/attachments/`, {
+      method: 'POST',
+      body: form,
+    });
+    if (!response.ok) {
+      throw new Error(`HTTP ${response.status}: ${await response.text()}`);
+    }
+    const data = await response.json();
+    return data.attachments.map((attachment: Record<string, any>) => ({
+      id: attachment.id,
+      type: attachment.type,
+      url: `${API_BASE.replace('/api', '')}${attachment.url}`,
+      filename: attachment.filename,
+    }));
+  }
+
   /**
    * Gets a list of available providers from the API.
    *
@@ -35,8 +35,8 @@ interface ChatStore {
   addMessage: (msg: ChatMessage) => void;
   updateStreamingMessage: (content: string) => void;
   startStreaming: () => void;
-  stopStreaming: () => void;
-  sendMessage: (content: string, attachments?: any[]) => Promise<void>;
+  stopStreaming: (tokens?: number) => void;
+  sendMessage: (content: string, files?: File[]) => Promise<void>;
   updateSettings: (settings: Partial<ChatSettings>) => void;
   loadModels: () => Promise<void>;
   clearMessages: () => void;
@@ -79,7 +79,7 @@ export const useChatStore = create<ChatStore>()()
         set({ isStreaming: true, currentStreamingMessage: '', error: null });
       },
       
-      stopStreaming: () => {
+      stopStreaming: (tokens) => {
         const { currentStreamingMessage } = get();
         if (currentStreamingMessage) {
           const assistantMessage: ChatMessage = {
@@ -89,7 +89,7 @@ export const useChatStore = create<ChatStore>()()
             metadata: {
               model: get().settings.model,
               timestamp: Date.now(),
-              tokens: currentStreamingMessage.split(' ').length,
+              tokens: tokens ?? currentStreamingMessage.split(' ').length,
             },
           };
           set(state => ({ 
@@ -102,8 +102,21 @@ export const useChatStore = create<ChatStore>()()
         }
       },
       
-      sendMessage: async (content: string, attachments?: any[]) => {
+      sendMessage: async (content: string, files?: File[]) => {
         const { settings, messages } = get();
+        set({ isLoading: true, error: null });
+        
+        // Upload files first; messages reference them by ID
+        let attachments: ChatMessage['attachments'];
+        try {
+          attachments = files && files.length > 0 ? await api.uploadAttachments(files) : undefined;
+        } catch (error) {
+          set({ 
+            isLoading: false, 
+            error: error instanceof Error ? `Upload failed: ${error.message}` : 'Upload failed' 
+          });
+          return;
+        }
         
         // Add user message
         const userMessage: ChatMessage = {
@@ -119,14 +132,13 @@ export const useChatStore = create<ChatStore>()()
         
         set(state => ({ 
           messages: [...state.messages, userMessage],
-          isLoading: true,
-          error: null 
         }));
         
         try {
           const chatMessages = [...messages, userMessage].map(msg => ({
             role: msg.role,
             content: msg.content,
+            ...(msg.attachments?.length ? { attachments: msg.attachments.map(a => a.id) } : {}),
           }));
           
           const request: ChatRequest = {
@@ -142,13 +154,16 @@ export const useChatStore = create<ChatStore>()()
             get().startStreaming();
             set({ isLoading: false });
             
+            let completionTokens: number | undefined;
             await api.sendMessageStream(request, (chunk) => {
               set(state => ({ 
                 currentStreamingMessage: state.currentStreamingMessage + chunk 
               }));
+            }, (usage) => {
+              completionTokens = usage.completion_tokens;
             });
             
-            get().stopStreaming();
+            get().stopStreaming(completionTokens);
           } else {
             const response = await api.sendMessage(request);
             
@@ -5,6 +5,7 @@ export interface Attachment {
   id: string;
   type: 'image' | 'audio' | 'file';
   url: string;
+  filename?: string;
 }
 
 /**